@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+音訊分析模組
+以 ffmpeg 把音訊解碼成降低取樣率的 PCM 串流（NumPy 陣列），並提供背景分析的共用架構：
+每首歌只分析一次，結果連同檔案大小與修改時間存放在音樂庫索引中，檔案沒有變動就不會重新分析；
+新下載的歌曲排入背景佇列，由行程池在多個 CPU 核心上分批並行分析
+"""
+
+import os
+import shutil
+import logging
+import importlib
+import threading
+import subprocess
+import multiprocessing
+from itertools import repeat
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, List, Any, Callable, Tuple
+
+from music_library import MusicLibrary, get_library
+
+# 匯入 NumPy（選用）
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    logging.warning("NumPy 未安裝，音訊分析功能無法使用")
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 解碼使用的 ffmpeg 執行檔
+FFMPEG_PATH = shutil.which('ffmpeg')
+
+# 單一檔案解碼的逾時（秒）
+DECODE_TIMEOUT = 300
+
+# 並行分析的行程數量
+DEFAULT_WORKERS = os.cpu_count() or 2
+
+# 每批分析的歌曲數，每批完成後寫入索引，中斷時已完成的結果不會遺失
+DEFAULT_BATCH_SIZE = 32
+
+# 下載完成後要排入背景分析的模組（各模組以 register_analyzer 登記分析器）
+ANALYZER_MODULES = ('fingerprint', 'waveform', 'loudness', 'transcode_cache')
+
+
+class AudioDecodeError(RuntimeError):
+    """音訊解碼失敗"""
+
+
+def analysis_available() -> bool:
+    """是否具備音訊分析所需的 NumPy 與 ffmpeg"""
+    return NUMPY_AVAILABLE and FFMPEG_PATH is not None
+
+
+def decode_audio(file_path, sample_rate: int, channels: int = 1,
+                 max_seconds: Optional[float] = None) -> 'np.ndarray':
+    """
+    以 ffmpeg 解碼音訊（或影片的音軌）
+
+    Args:
+        file_path: 音訊檔案路徑
+        sample_rate: 輸出的取樣率，由 ffmpeg 重新取樣
+        channels: 輸出的聲道數，1 表示混成單聲道
+        max_seconds: 只解碼開頭的秒數，None 表示整首
+
+    Returns:
+        float32 陣列，單聲道時形狀為 (樣本數,)，多聲道時為 (樣本數, 聲道數)
+
+    Raises:
+        AudioDecodeError: 缺少 ffmpeg 或解碼失敗
+    """
+    if FFMPEG_PATH is None:
+        raise AudioDecodeError("找不到 ffmpeg")
+    command = [FFMPEG_PATH, '-nostdin', '-v', 'error', '-i', str(file_path), '-vn',
+               '-ac', str(channels), '-ar', str(sample_rate)]
+    if max_seconds:
+        command += ['-t', str(max_seconds)]
+    command += ['-f', 'f32le', '-']
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 timeout=DECODE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise AudioDecodeError(str(e)) from e
+    if process.returncode != 0:
+        message = process.stderr.decode('utf-8', errors='replace').strip().splitlines()
+        raise AudioDecodeError(message[-1] if message else f"ffmpeg 結束代碼 {process.returncode}")
+
+    samples = np.frombuffer(process.stdout, dtype='<f4')
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+    return samples
+
+
+def _run_analysis(analyze: Callable[..., Any], args: tuple) -> Tuple[Any, Optional[str]]:
+    """在子行程中執行分析，例外轉為錯誤訊息返回，單一檔案失敗不會中斷整批"""
+    try:
+        return analyze(*args), None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+
+
+class TrackAnalyzer:
+    """
+    每首歌分析一次的背景分析器基底類別
+
+    子類別需設定：
+        name: 分析名稱，用於日誌與執行緒名稱
+        table: 結果資料表，至少包含 track_id（主鍵，參照 tracks.id）、file_size、mtime 欄位
+        schema: 建立資料表的 SQL
+        result_column: 分析失敗時為 NULL 的結果欄位
+        analyze: 模組層級的分析函數 (檔案路徑) -> 結果，在子行程中執行；
+                 需要其他參數時覆寫 _analysis_args(track)
+    並實作 _columns(result)，把分析結果轉為資料表的其他欄位；分析失敗時這些欄位為 NULL，
+    同一個檔案不會重複嘗試，直到檔案變動
+    """
+
+    name = "analysis"
+    table = ""
+    schema = ""
+    result_column = ""
+    analyze: Optional[Callable[[str], Any]] = None
+
+    def __init__(self, library: MusicLibrary, max_workers: int = DEFAULT_WORKERS,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        初始化分析器
+
+        Args:
+            library: 音樂庫索引，分析結果存放在同一個資料庫
+            max_workers: 並行分析的行程數量，1 表示在目前的行程中依序分析
+            batch_size: 每批分析的歌曲數
+        """
+        self.library = library
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._scheduled_ids = set()
+        self._scheduled_all = False
+        with library.transaction() as conn:
+            conn.executescript(self.schema)
+
+    def available(self) -> bool:
+        """是否具備分析所需的套件與工具"""
+        return analysis_available()
+
+    def _columns(self, result: Any) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def _analysis_args(self, track: Dict[str, Any]) -> tuple:
+        """傳給分析函數的參數（必須可被 pickle）"""
+        return (track['file_path'],)
+
+    # --- 增量分析 ---
+
+    def pending(self, track_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """取得尚未分析、或分析後檔案已變動的歌曲"""
+        with self.library.transaction() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT t.id FROM tracks t LEFT JOIN {self.table} a ON a.track_id = t.id
+                WHERE a.track_id IS NULL OR a.file_size != t.file_size OR a.mtime != t.mtime
+                ORDER BY t.added_at DESC, t.id DESC
+                """
+            ).fetchall()
+        ids = [row['id'] for row in rows]
+        if track_ids is not None:
+            wanted = set(track_ids)
+            ids = [track_id for track_id in ids if track_id in wanted]
+        return self.library.get_tracks(ids)
+
+    def _store(self, tracks: List[Dict[str, Any]], results: List[Tuple[Any, Optional[str]]]):
+        """在單一交易中寫入一批結果，分析期間已被移除的歌曲略過"""
+        rows = []
+        for track, (result, error) in zip(tracks, results):
+            if error is not None:
+                logging.warning(f"{self.name} 分析失敗 {Path(track['file_path']).name}: {error}")
+                result = None
+            row = {'track_id': track['id'], 'file_size': track['file_size'], 'mtime': track['mtime']}
+            row.update(self._columns(result))
+            rows.append(row)
+        if not rows:
+            return
+        columns = list(rows[0])
+        with self.library.transaction() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} ({', '.join(columns)}) "
+                f"SELECT {', '.join(':' + column for column in columns)} "
+                "WHERE EXISTS (SELECT 1 FROM tracks WHERE id = :track_id)",
+                rows,
+            )
+
+    def update(self, track_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """
+        分析尚未分析的歌曲
+
+        Args:
+            track_ids: 只分析這些歌曲，None 表示整個音樂庫
+
+        Returns:
+            結果字典，包含 success、analyzed 與 failed
+        """
+        tracks = self.pending(track_ids)
+        if not tracks:
+            return {"success": True, "analyzed": 0, "failed": 0}
+        if not self.available():
+            return {"success": False, "error": "缺少 NumPy 或 ffmpeg，無法分析音訊"}
+
+        analyze = type(self).analyze
+        workers = max(1, min(self.max_workers, len(tracks)))
+        executor = None
+        if workers > 1:
+            # 以 spawn 建立子行程，避免在多執行緒的網頁伺服器中 fork
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        analyzed = failed = 0
+        try:
+            for start in range(0, len(tracks), self.batch_size):
+                batch = tracks[start:start + self.batch_size]
+                tasks = [self._analysis_args(track) for track in batch]
+                if executor is None:
+                    results = [_run_analysis(analyze, args) for args in tasks]
+                else:
+                    results = list(executor.map(_run_analysis, repeat(analyze), tasks))
+                self._store(batch, results)
+                batch_failed = sum(1 for _, error in results if error is not None)
+                failed += batch_failed
+                analyzed += len(batch) - batch_failed
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        logging.info(f"{self.name} 分析完成: {analyzed} 首成功，{failed} 首失敗")
+        return {"success": True, "analyzed": analyzed, "failed": failed}
+
+    def coverage(self) -> Dict[str, int]:
+        """已分析、分析失敗與尚未分析的歌曲數"""
+        with self.library.transaction() as conn:
+            total = conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+            row = conn.execute(
+                f"""
+                SELECT COUNT(a.track_id) AS done,
+                       COALESCE(SUM(a.{self.result_column} IS NULL), 0) AS failed
+                FROM tracks t JOIN {self.table} a ON a.track_id = t.id
+                WHERE a.file_size = t.file_size AND a.mtime = t.mtime
+                """
+            ).fetchone()
+        return {"analyzed": row['done'] - row['failed'], "failed": row['failed'], "pending": total - row['done']}
+
+    # --- 背景分析 ---
+
+    def schedule(self, track_ids: Optional[List[int]] = None):
+        """
+        排入背景分析，立即返回；分析進行中排入的歌曲會在目前的批次完成後接著處理
+
+        Args:
+            track_ids: 要分析的歌曲，None 表示整個音樂庫
+        """
+        with self._lock:
+            if track_ids is None:
+                self._scheduled_all = True
+            else:
+                self._scheduled_ids.update(track_id for track_id in track_ids if track_id is not None)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._drain, name=f"{self.name}-analyzer", daemon=True)
+                self._worker.start()
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._scheduled_all and not self._scheduled_ids:
+                    self._worker = None
+                    return
+                track_ids = None if self._scheduled_all else list(self._scheduled_ids)
+                self._scheduled_all = False
+                self._scheduled_ids = set()
+            try:
+                self.update(track_ids)
+            except Exception as e:
+                logging.error(f"{self.name} 背景分析失敗: {e}")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待背景分析完成，返回是否已完成"""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+        return self._worker is None
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker is not None
+
+
+_analyzer_classes: List[type] = []
+_analyzers: Dict[Tuple[type, str], TrackAnalyzer] = {}
+_analyzers_lock = threading.Lock()
+
+
+def register_analyzer(cls: type) -> type:
+    """登記分析器類別，下載完成時由 schedule_analysis 排入背景分析（可作為裝飾器）"""
+    if cls not in _analyzer_classes:
+        _analyzer_classes.append(cls)
+    return cls
+
+
+def get_analyzer(cls: type, music_folder: str = "downloads") -> TrackAnalyzer:
+    """取得音樂資料夾對應的共用分析器"""
+    key = (cls, str(Path(music_folder).resolve()))
+    with _analyzers_lock:
+        analyzer = _analyzers.get(key)
+        if analyzer is None:
+            analyzer = cls(get_library(music_folder))
+            _analyzers[key] = analyzer
+        return analyzer
+
+
+def schedule_analysis(music_folder: str = "downloads", track_ids: Optional[List[int]] = None):
+    """
+    把歌曲排入所有已登記分析器的背景分析
+
+    Args:
+        music_folder: 音樂資料夾
+        track_ids: 要分析的歌曲，None 表示整個音樂庫
+    """
+    if FFMPEG_PATH is None:
+        return
+    for module_name in ANALYZER_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            logging.warning(f"無法載入分析模組 {module_name}: {e}")
+    for cls in list(_analyzer_classes):
+        analyzer = get_analyzer(cls, music_folder)
+        if analyzer.available():
+            analyzer.schedule(track_ids)
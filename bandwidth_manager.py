@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+頻寬管理模組
+對所有進行中的下載與上傳套用全域的總頻寬上限，支援依時段切換設定，
+並在各個工作之間公平分配頻寬：下載端動態調整每個 yt-dlp 工作的 ratelimit，
+上傳端以分塊節流的方式共用同一個權杖桶
+
+yt-dlp 的分段下載器（HLS/DASH）在開始時複製 params，之後調整的 ratelimit 不會生效，
+因此每個下載工作另有一個權杖桶，在進度回調中依已下載的位元組數等待，分段格式也會跟著新的配額節流
+"""
+
+import json
+import time
+import logging
+import itertools
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, List, Tuple, Callable
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 頻寬設定檔
+BANDWIDTH_CONFIG_FILE = "bandwidth_config.json"
+
+# 每隔多久重新分配一次下載頻寬（秒）
+REBALANCE_INTERVAL = 1.0
+
+# 上傳時每次節流的區塊大小（Google Drive 要求 256 KB 的倍數）
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _parse_clock(value: str) -> int:
+    """將 "HH:MM" 轉為當天的分鐘數"""
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+class BandwidthProfile:
+    """某個時段的頻寬上限（位元組/秒，None 代表不限制）"""
+
+    def __init__(self, start: str = "00:00", end: str = "24:00",
+                 download_limit: Optional[int] = None, upload_limit: Optional[int] = None):
+        self.start = _parse_clock(start)
+        self.end = _parse_clock(end)
+        self.download_limit = download_limit
+        self.upload_limit = upload_limit
+
+    def matches(self, minute_of_day: int) -> bool:
+        """判斷時間是否落在此時段內，支援跨越午夜的時段"""
+        if self.start <= self.end:
+            return self.start <= minute_of_day < self.end
+        return minute_of_day >= self.start or minute_of_day < self.end
+
+
+class TokenBucket:
+    """執行緒安全的權杖桶，rate 為 None 時不限制；clock 可替換為測試用的時鐘"""
+
+    def __init__(self, rate: Optional[int] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self._clock = clock
+        self._tokens = 0.0
+        self._updated = clock()
+        self._cond = threading.Condition()
+
+    def set_rate(self, rate: Optional[int]):
+        with self._cond:
+            if rate != self.rate:
+                now = self._clock()
+                if self.rate and rate:
+                    # 先以原本的速率結算累積的權杖，頻繁調整速率時不會損失額度
+                    self._tokens = min(float(rate), self._tokens + (now - self._updated) * self.rate)
+                else:
+                    self._tokens = 0.0
+                self.rate = rate
+                self._updated = now
+                self._cond.notify_all()
+
+    def acquire(self, amount: int):
+        """取得指定數量的權杖，不足時等待"""
+        with self._cond:
+            while True:
+                if not self.rate:
+                    return
+                now = self._clock()
+                # 最多累積一秒的額度，避免閒置後瞬間爆量
+                self._tokens = min(float(self.rate), self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= min(amount, self.rate):
+                    self._tokens -= amount
+                    return
+                self._cond.wait((min(amount, self.rate) - self._tokens) / self.rate)
+
+
+class DownloadJob:
+    """一個進行中的 yt-dlp 下載工作"""
+
+    def __init__(self, job_id: int, params: dict):
+        self.job_id = job_id
+        # 與 YoutubeDL 共用同一個 params 字典，一般的 HTTP 下載每讀一個區塊都會重新讀取 ratelimit
+        self.params = params
+        self.speed: Optional[float] = None
+        self.allocation: Optional[float] = None
+        # 分段下載器不會讀到新的 ratelimit，改在進度回調中以此權杖桶節流
+        self._bucket = TokenBucket()
+        self._filename: Optional[str] = None
+        self._downloaded: Optional[int] = None
+
+    def set_allocation(self, allocation: Optional[float]):
+        """套用新的配額到 ratelimit 與進度回調的權杖桶"""
+        self.allocation = allocation
+        if allocation is None:
+            self.params.pop('ratelimit', None)
+            self._bucket.set_rate(None)
+        else:
+            self.params['ratelimit'] = max(int(allocation), 1024)
+            self._bucket.set_rate(self.params['ratelimit'])
+
+    def on_progress(self, d):
+        """yt-dlp 進度回調，記錄實際下載速度，並依新下載的位元組數等待權杖"""
+        if d.get('status') == 'downloading':
+            if d.get('speed'):
+                self.speed = float(d['speed'])
+            downloaded = d.get('downloaded_bytes')
+            if downloaded is None:
+                return
+            # 換了檔案（例如分開下載的影像與音訊）時重新起算
+            if d.get('filename') == self._filename and self._downloaded is not None \
+                    and downloaded > self._downloaded:
+                self._bucket.acquire(downloaded - self._downloaded)
+            self._filename, self._downloaded = d.get('filename'), downloaded
+        elif d.get('status') == 'finished':
+            self.speed = None
+            self._filename = self._downloaded = None
+
+
+class BandwidthManager:
+    """全域頻寬管理器"""
+
+    def __init__(self, profiles: Optional[List[BandwidthProfile]] = None,
+                 rebalance_interval: float = REBALANCE_INTERVAL):
+        """
+        初始化頻寬管理器
+
+        Args:
+            profiles: 時段設定列表，依序比對，第一個符合的時段生效
+            rebalance_interval: 重新分配下載頻寬的間隔（秒）
+        """
+        self.profiles = profiles or []
+        self.rebalance_interval = rebalance_interval
+        self._jobs: Dict[int, DownloadJob] = {}
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._upload_bucket = TokenBucket()
+        self._rebalancer = None
+
+    @classmethod
+    def from_config(cls, config_file: str = BANDWIDTH_CONFIG_FILE) -> "BandwidthManager":
+        """
+        從設定檔建立管理器，設定檔不存在時不限制頻寬
+
+        設定檔格式（單位為 KB/s）:
+        {"profiles": [{"start": "08:00", "end": "23:00", "download_kb_s": 2048, "upload_kb_s": 512}]}
+        """
+        path = Path(config_file)
+        profiles = []
+        if path.exists():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                for item in config.get('profiles', []):
+                    download = item.get('download_kb_s')
+                    upload = item.get('upload_kb_s')
+                    profiles.append(BandwidthProfile(
+                        start=item.get('start', "00:00"),
+                        end=item.get('end', "24:00"),
+                        download_limit=int(download * 1024) if download else None,
+                        upload_limit=int(upload * 1024) if upload else None,
+                    ))
+                logging.info(f"已載入 {len(profiles)} 個頻寬時段設定")
+            except (OSError, ValueError, KeyError) as e:
+                logging.error(f"讀取頻寬設定檔失敗: {e}")
+        return cls(profiles)
+
+    def current_limits(self, now: Optional[datetime] = None) -> Tuple[Optional[int], Optional[int]]:
+        """
+        取得目前時段的下載與上傳上限
+
+        Returns:
+            (下載上限, 上傳上限)，單位為位元組/秒，None 代表不限制
+        """
+        now = now or datetime.now()
+        minute_of_day = now.hour * 60 + now.minute
+        for profile in self.profiles:
+            if profile.matches(minute_of_day):
+                return profile.download_limit, profile.upload_limit
+        return None, None
+
+    # --- 下載 ---
+
+    def register_download(self, params: dict) -> DownloadJob:
+        """
+        登記一個下載工作，並開始為它分配頻寬
+
+        Args:
+            params: YoutubeDL 實例的 params 字典
+
+        Returns:
+            下載工作，需把 job.on_progress 加入進度回調
+        """
+        with self._lock:
+            job = DownloadJob(next(self._job_ids), params)
+            self._jobs[job.job_id] = job
+            self._rebalance_locked()
+            if self._rebalancer is None or not self._rebalancer.is_alive():
+                self._rebalancer = threading.Thread(target=self._rebalance_loop, daemon=True)
+                self._rebalancer.start()
+        return job
+
+    def unregister_download(self, job: DownloadJob):
+        """移除完成的下載工作，並把頻寬還給其他工作"""
+        with self._lock:
+            self._jobs.pop(job.job_id, None)
+            self._rebalance_locked()
+
+    def _rebalance_loop(self):
+        """背景執行緒：有下載進行時定期重新分配頻寬"""
+        while True:
+            time.sleep(self.rebalance_interval)
+            with self._lock:
+                if not self._jobs:
+                    self._rebalancer = None
+                    return
+                self._rebalance_locked()
+
+    def _rebalance_locked(self):
+        """
+        以 max-min 公平原則分配總下載頻寬
+
+        實際速度明顯低於配額的工作（受限於來源或網路）只保留略高於目前速度的額度，
+        剩餘的頻寬平均分給其他工作，讓總使用量盡量接近上限
+        """
+        cap, _ = self.current_limits()
+        jobs = list(self._jobs.values())
+        if not jobs:
+            return
+        if not cap:
+            for job in jobs:
+                job.set_allocation(None)
+            return
+
+        # 估計每個工作的需求：速度未達配額 80% 者視為需求有限
+        demands = {}
+        for job in jobs:
+            if job.speed is not None and job.allocation and job.speed < job.allocation * 0.8:
+                demands[job.job_id] = job.speed * 1.2
+            else:
+                demands[job.job_id] = float('inf')
+
+        remaining = float(cap)
+        allocations = {}
+        pending = sorted(jobs, key=lambda j: demands[j.job_id])
+        while pending:
+            share = remaining / len(pending)
+            job = pending[0]
+            if demands[job.job_id] <= share:
+                allocations[job.job_id] = demands[job.job_id]
+                remaining -= allocations[job.job_id]
+                pending.pop(0)
+                continue
+            for job in pending:
+                allocations[job.job_id] = share
+            break
+
+        for job in jobs:
+            job.set_allocation(allocations[job.job_id])
+
+    # --- 上傳 ---
+
+    def throttle_upload(self, num_bytes: int):
+        """上傳一個區塊前呼叫，超過目前時段的上傳上限時會等待"""
+        _, cap = self.current_limits()
+        self._upload_bucket.set_rate(cap)
+        self._upload_bucket.acquire(num_bytes)
+
+
+class ThrottledFile:
+    """包裝檔案物件，每次讀取都經過上傳節流，可直接作為 requests 的上傳內容"""
+
+    def __init__(self, file_obj, size: int, manager: BandwidthManager):
+        self._file = file_obj
+        self._size = size
+        self._manager = manager
+
+    def __len__(self):
+        return self._size
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > UPLOAD_CHUNK_SIZE:
+            size = UPLOAD_CHUNK_SIZE
+        data = self._file.read(size)
+        if data:
+            self._manager.throttle_upload(len(data))
+        return data
+
+
+_manager: Optional[BandwidthManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_bandwidth_manager() -> BandwidthManager:
+    """取得全域共用的頻寬管理器（第一次呼叫時讀取設定檔）"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = BandwidthManager.from_config()
+        return _manager
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令列批次下載工具
+從檔案或標準輸入讀取 YouTube 網址或搜尋關鍵字，以多執行緒並行下載，
+並把每一筆結果寫成 JSON Lines 記錄，適合排程在夜間執行；
+播放列表與頻道網址以增量同步處理，只下載尚未下載過的影片，中斷後可從檢查點繼續
+
+用法:
+    python -m batch_download urls.txt --format mp3 --workers 4 --log results.jsonl
+    cat queries.txt | python -m batch_download - --format mp3
+    echo https://www.youtube.com/@channel/videos | python -m batch_download - --stop-after-known 20
+"""
+
+import sys
+import json
+import time
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional
+
+from youtube_downloader import YouTubeDownloader
+from yt_dlp_searcher import YtDlpSearcher
+from playlist_sync import PlaylistSyncer, is_playlist_url
+
+
+def read_items(source) -> List[str]:
+    """讀取輸入，每行一個網址或搜尋關鍵字，略過空行與 # 開頭的註解"""
+    items = []
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            items.append(line)
+    return items
+
+
+def is_url(item: str) -> bool:
+    """判斷輸入是網址還是搜尋關鍵字"""
+    return item.startswith(('http://', 'https://')) or 'youtube.com/' in item or 'youtu.be/' in item
+
+
+def format_bytes(size: float) -> str:
+    """格式化位元組數"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}"
+        size /= 1024.0
+
+
+class BatchProgress:
+    """彙整所有並行下載的進度，輸出單行狀態到標準錯誤"""
+
+    def __init__(self, total: int, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.done = 0
+        self.failed = 0
+        self._bytes: Dict[str, float] = {}
+        self._speeds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._last_render = 0.0
+
+    def hook(self, d):
+        """yt-dlp 進度回調"""
+        key = d.get('tmpfilename') or d.get('filename')
+        if not key:
+            return
+        with self._lock:
+            self._bytes[key] = d.get('downloaded_bytes') or 0
+            if d.get('status') == 'downloading':
+                self._speeds[key] = d.get('speed') or 0
+            else:
+                self._speeds.pop(key, None)
+        self.render()
+
+    def item_finished(self, success: bool):
+        with self._lock:
+            self.done += 1
+            if not success:
+                self.failed += 1
+        self.render(force=True)
+
+    def render(self, force: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_render < 0.5:
+                return
+            self._last_render = now
+            line = (f"\r📦 {self.done}/{self.total} 完成"
+                    f"（失敗 {self.failed}）｜已下載 {format_bytes(sum(self._bytes.values()))}"
+                    f"｜速度 {format_bytes(sum(self._speeds.values()))}/s   ")
+        self.stream.write(line)
+        self.stream.flush()
+
+
+class BatchDownloader:
+    """批次下載器"""
+
+    def __init__(self, file_format: str = "mp3", workers: int = 3, download_dir: str = "downloads",
+                 auto_upload: bool = False, search_results: int = 1, stop_after_known: Optional[int] = None):
+        """
+        初始化批次下載器
+
+        Args:
+            file_format: "mp3" 或 "mp4"
+            workers: 同時下載的數量
+            download_dir: 下載目錄
+            auto_upload: 是否自動上傳到雲端硬碟
+            search_results: 每個搜尋關鍵字下載前幾個結果
+            stop_after_known: 同步頻道時連續遇到幾支已下載的影片後停止列舉
+        """
+        self.file_format = file_format
+        self.workers = workers
+        self.search_results = search_results
+        self.stop_after_known = stop_after_known
+        self.downloader = YouTubeDownloader(download_dir=download_dir, auto_upload=auto_upload)
+        self.searcher = YtDlpSearcher(max_results=search_results)
+
+    def _resolve(self, item: str) -> List[Dict[str, str]]:
+        """把輸入轉成要下載的網址列表"""
+        if is_url(item):
+            return [{'url': item, 'title': None}]
+        results = self.searcher.search(item, max_results=self.search_results)
+        return [{'url': r['url'], 'title': r['title']} for r in results]
+
+    def _sync(self, item: str, started: float) -> List[Dict[str, Any]]:
+        """增量同步播放列表或頻道，每支新下載的影片一筆記錄"""
+        records = []
+
+        def on_result(report):
+            records.append({
+                'input': item, 'url': report['url'], 'title': report['title'], 'success': report['success'],
+                'file_paths': report['file_paths'], 'error': report['error'],
+                'elapsed': round(time.time() - started, 2),
+            })
+
+        syncer = PlaylistSyncer(self.downloader, max_workers=self.workers)
+        try:
+            summary = syncer.sync(item, file_format=self.file_format,
+                                  stop_after_known=self.stop_after_known, on_result=on_result)
+        except Exception as e:
+            return records + [{'input': item, 'url': item, 'title': None, 'success': False, 'file_paths': [],
+                               'error': str(e), 'elapsed': round(time.time() - started, 2)}]
+        if summary['listed'] == 0:
+            return [{'input': item, 'url': item, 'title': None, 'success': False, 'file_paths': [],
+                     'error': "播放列表沒有任何影片", 'elapsed': round(time.time() - started, 2)}]
+        logging.info(f"{summary['title']}: 略過 {summary['skipped']} 支已下載的影片")
+        return records
+
+    def _process(self, item: str) -> List[Dict[str, Any]]:
+        """處理一筆輸入，返回一或多筆結果記錄"""
+        started = time.time()
+        if is_playlist_url(item):
+            return self._sync(item, started)
+        error = "搜尋沒有結果"
+        try:
+            targets = self._resolve(item)
+        except Exception as e:
+            targets, error = [], str(e)
+        if not targets:
+            return [{'input': item, 'url': None, 'title': None, 'success': False,
+                     'file_paths': [], 'error': error, 'elapsed': round(time.time() - started, 2)}]
+
+        records = []
+        download = self.downloader.download_mp4 if self.file_format == "mp4" else self.downloader.download_mp3
+        for target in targets:
+            record = {'input': item, 'url': target['url'], 'title': target['title']}
+            try:
+                result = download(target['url'])
+                record.update({
+                    'success': bool(result.get('file_path')),
+                    'file_paths': result.get('file_paths', []),
+                    'upload_result': result.get('upload_result'),
+                    'error': None if result.get('file_path') else "沒有產生任何檔案",
+                })
+            except Exception as e:
+                record.update({'success': False, 'file_paths': [], 'error': str(e)})
+            record['elapsed'] = round(time.time() - started, 2)
+            records.append(record)
+        return records
+
+    def run(self, items: List[str], log_file: Optional[str] = None) -> Dict[str, int]:
+        """
+        並行處理所有輸入
+
+        Args:
+            items: 網址或搜尋關鍵字列表
+            log_file: JSON Lines 結果記錄檔，None 時輸出到標準輸出
+
+        Returns:
+            成功與失敗的數量
+        """
+        progress = BatchProgress(len(items))
+        self.downloader.add_progress_hook(progress.hook)
+        log = open(log_file, 'a', encoding='utf-8') if log_file else sys.stdout
+        summary = {'success': 0, 'failed': 0}
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self._process, item) for item in items]
+                for future in as_completed(futures):
+                    records = future.result()
+                    for record in records:
+                        record['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+                        log.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        summary['success' if record['success'] else 'failed'] += 1
+                    log.flush()
+                    progress.item_finished(all(r['success'] for r in records))
+        finally:
+            if log_file:
+                log.close()
+        sys.stderr.write("\n")
+        return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="YouTube 批次下載工具")
+    parser.add_argument('input', nargs='?', default='-', help="網址／關鍵字清單檔案，- 代表標準輸入")
+    parser.add_argument('-f', '--format', choices=('mp3', 'mp4'), default='mp3', help="下載格式")
+    parser.add_argument('-w', '--workers', type=int, default=3, help="同時下載的數量")
+    parser.add_argument('-o', '--download-dir', default='downloads', help="下載目錄")
+    parser.add_argument('-l', '--log', default='batch_results.jsonl',
+                        help="JSON Lines 結果記錄檔（附加寫入），- 代表標準輸出")
+    parser.add_argument('-n', '--search-results', type=int, default=1, help="每個搜尋關鍵字下載前幾個結果")
+    parser.add_argument('-k', '--stop-after-known', type=int, default=None,
+                        help="同步頻道時連續遇到幾支已下載的影片後停止（頻道由新到舊排列）")
+    parser.add_argument('--upload', action='store_true', help="下載後自動上傳到雲端硬碟")
+    parser.add_argument('-q', '--quiet', action='store_true', help="只顯示警告與錯誤")
+    args = parser.parse_args(argv)
+
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    if args.input == '-':
+        items = read_items(sys.stdin)
+    else:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            items = read_items(f)
+    if not items:
+        print("沒有任何要下載的項目", file=sys.stderr)
+        return 1
+
+    batch = BatchDownloader(
+        file_format=args.format,
+        workers=args.workers,
+        download_dir=args.download_dir,
+        auto_upload=args.upload,
+        search_results=args.search_results,
+        stop_after_known=args.stop_after_known,
+    )
+    summary = batch.run(items, log_file=None if args.log == '-' else args.log)
+    print(f"✅ 成功 {summary['success']}、❌ 失敗 {summary['failed']}", file=sys.stderr)
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+歌曲資料結構效能測試
+比較舊版 dataclass 與使用 __slots__、字串共用與快取欄位的 Song，
+量測大型音樂庫的記憶體用量、逐列顯示與排序的耗時
+
+用法:
+    python benchmark_song.py --songs 50000
+"""
+
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+from dataclasses import dataclass
+
+from music_player import Song, song_sort_key
+
+
+@dataclass
+class LegacySong:
+    """舊版的歌曲資訊類別（每次存取都重新計算衍生欄位）"""
+    file_path: str
+    title: str
+    artist: str
+    album: str
+    duration: float
+    file_size: int
+
+    @property
+    def filename(self) -> str:
+        return Path(self.file_path).name
+
+    @property
+    def duration_str(self) -> str:
+        minutes = int(self.duration // 60)
+        seconds = int(self.duration % 60)
+        return f"{minutes:02d}:{seconds:02d}"
+
+
+def make_songs(cls, count: int):
+    """建立假的歌曲資料，每首歌的字串都是新物件（與讀取標籤時相同）"""
+    songs = []
+    for i in range(count):
+        songs.append(cls(
+            file_path=f"downloads/歌手{i % 500}/歌曲_{i:06d}_abcdefghijk.mp3",
+            title=f"歌曲 {i}",
+            artist="".join(["歌手", str(i % 500)]),
+            album="".join(["專輯", str(i % 1000)]),
+            duration=float(120 + i % 240),
+            file_size=4_000_000 + i,
+        ))
+    return songs
+
+
+def measure(cls, count: int, renders: int):
+    """量測單一實作，返回 (記憶體 MB, 顯示耗時, 排序耗時)"""
+    tracemalloc.start()
+    songs = make_songs(cls, count)
+    # 包含第一次顯示後快取的欄位
+    for song in songs:
+        song.filename
+        song.duration_str
+        song.sort_key if cls is Song else None
+    memory = tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for _ in range(renders):
+        for song in songs:
+            song.filename
+            song.duration_str
+    render_time = time.perf_counter() - started
+
+    key = song_sort_key if cls is Song else (lambda x: x.filename.lower())
+    started = time.perf_counter()
+    for _ in range(renders):
+        sorted(songs, key=key)
+    sort_time = time.perf_counter() - started
+    return memory, render_time, sort_time
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="歌曲資料結構效能測試")
+    parser.add_argument('--songs', type=int, default=50000, help="歌曲數量")
+    parser.add_argument('--renders', type=int, default=5, help="模擬重新顯示的次數")
+    args = parser.parse_args(argv)
+
+    print(f"🚀 歌曲資料結構效能測試（{args.songs} 首，顯示 {args.renders} 次）")
+    print("=" * 60)
+    results = {}
+    for name, cls in (("舊版 dataclass", LegacySong), ("__slots__ + 快取", Song)):
+        results[name] = measure(cls, args.songs, args.renders)
+        memory, render_time, sort_time = results[name]
+        print(f"📊 {name:<16} 記憶體 {memory:7.1f} MB｜顯示 {render_time:6.3f} 秒｜排序 {sort_time:6.3f} 秒")
+
+    old, new = results.values()
+    print("-" * 60)
+    print(f"✅ 記憶體減少 {1 - new[0] / old[0]:.0%}，顯示加快 {old[1] / new[1]:.1f} 倍，排序加快 {old[2] / new[2]:.1f} 倍")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,8 @@ from pathlib import Path
 from typing import Optional, Dict, Any
 import json
 
+from bandwidth_manager import get_bandwidth_manager, ThrottledFile, UPLOAD_CHUNK_SIZE
+
 # Google Drive
 try:
     from google.auth.transport.requests import Request
@@ -46,6 +48,8 @@ class CloudUploader:
     def __init__(self):
         self.config_dir = Path("cloud_config")
         self.config_dir.mkdir(exist_ok=True)
+        # 所有上傳共用全域上傳頻寬上限
+        self.bandwidth = get_bandwidth_manager()
     
     def upload_file(self, file_path: str, remote_path: str = None) -> Dict[str, Any]:
         """
@@ -120,13 +124,22 @@ class GoogleDriveUploader(CloudUploader):
             file_metadata = {'name': remote_path}
             if target_folder_id:
                 file_metadata['parents'] = [target_folder_id]
-            media = MediaFileUpload(str(file_path), resumable=True)
+            media = MediaFileUpload(str(file_path), chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
             # 直接上傳新檔案到指定資料夾
-            file = self.service.files().create(
+            request = self.service.files().create(
                 body=file_metadata,
                 media_body=media,
                 fields='id,name,webViewLink'
-            ).execute()
+            )
+            # 分塊上傳，每塊上傳前先經過頻寬節流
+            file_size = file_path.stat().st_size
+            sent = 0
+            file = None
+            while file is None:
+                chunk = min(UPLOAD_CHUNK_SIZE, max(file_size - sent, 0))
+                self.bandwidth.throttle_upload(chunk)
+                _, file = request.next_chunk()
+                sent += chunk
             logging.info(f"已上傳到 Google Drive: {file.get('name')}")
             return {
                 "success": True,
@@ -181,9 +194,25 @@ class DropboxUploader(CloudUploader):
             elif not remote_path.startswith('/'):
                 remote_path = f"/{remote_path}"
             
-            # 上傳檔案
+            # 分塊上傳檔案，每塊上傳前先經過頻寬節流
+            file_size = file_path.stat().st_size
             with open(file_path, 'rb') as f:
-                result = self.dbx.files_upload(f.read(), remote_path, mode=dropbox.files.WriteMode.overwrite)
+                chunk = f.read(UPLOAD_CHUNK_SIZE)
+                self.bandwidth.throttle_upload(len(chunk))
+                if file_size <= UPLOAD_CHUNK_SIZE:
+                    result = self.dbx.files_upload(chunk, remote_path, mode=dropbox.files.WriteMode.overwrite)
+                else:
+                    session = self.dbx.files_upload_session_start(chunk)
+                    cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=f.tell())
+                    commit = dropbox.files.CommitInfo(path=remote_path, mode=dropbox.files.WriteMode.overwrite)
+                    while True:
+                        chunk = f.read(UPLOAD_CHUNK_SIZE)
+                        self.bandwidth.throttle_upload(len(chunk))
+                        if f.tell() >= file_size:
+                            result = self.dbx.files_upload_session_finish(chunk, cursor, commit)
+                            break
+                        self.dbx.files_upload_session_append_v2(chunk, cursor)
+                        cursor.offset = f.tell()
             
             # 建立分享連結
             shared_link = self.dbx.sharing_create_shared_link(remote_path)
@@ -265,7 +294,9 @@ class OneDriveUploader(CloudUploader):
             }
             
             with open(file_path, 'rb') as f:
-                response = requests.put(upload_url, headers=headers, data=f)
+                # 讀取時經過頻寬節流
+                throttled = ThrottledFile(f, file_path.stat().st_size, self.bandwidth)
+                response = requests.put(upload_url, headers=headers, data=throttled)
             
             if response.status_code == 200 or response.status_code == 201:
                 file_info = response.json()
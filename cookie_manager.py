@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cookies 管理模組
+只讀取一次 cookies.txt，所有下載與搜尋共用同一個執行緒安全的 cookie jar，
+檔案被更新時自動重新載入，並把伺服器更新過的 cookies 以原子方式寫回
+"""
+
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Dict
+
+try:
+    from yt_dlp.cookies import YoutubeDLCookieJar
+    YT_DLP_AVAILABLE = True
+except ImportError:
+    YT_DLP_AVAILABLE = False
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 檢查 cookies 檔案是否變動的最短間隔（秒）
+WATCH_INTERVAL = 5.0
+
+
+class CookieManager:
+    """共用的 cookie jar，負責載入、監看與寫回 cookies.txt"""
+
+    def __init__(self, cookies_file: str = "cookies.txt", watch_interval: float = WATCH_INTERVAL):
+        """
+        初始化 cookies 管理器
+
+        Args:
+            cookies_file: Netscape 格式的 cookies 檔案路徑
+            watch_interval: 檢查檔案變動的最短間隔（秒）
+        """
+        self.cookies_file = Path(cookies_file)
+        self.watch_interval = watch_interval
+        self._lock = threading.RLock()
+        self._jar = None
+        self._file_mtime: Optional[float] = None
+        self._last_check = 0.0
+        self._saved_snapshot = None
+
+    def _snapshot(self, jar) -> frozenset:
+        """取得 cookie jar 內容的快照，用來判斷是否需要寫回"""
+        return frozenset((c.domain, c.path, c.name, c.value, c.expires) for c in jar)
+
+    def _load(self):
+        """從檔案載入 cookie jar"""
+        try:
+            stat = self.cookies_file.stat()
+        except OSError:
+            if self._jar is not None:
+                logging.info("cookies 檔案已移除，停止使用 cookies")
+            self._jar = None
+            self._file_mtime = None
+            return
+
+        jar = YoutubeDLCookieJar(str(self.cookies_file))
+        try:
+            jar.load(ignore_discard=True, ignore_expires=True)
+        except Exception as e:
+            logging.error(f"讀取 cookies 檔案失敗: {e}")
+            return
+
+        if self._jar is None:
+            logging.info("使用 cookies 檔案來避免 403 錯誤")
+        else:
+            logging.info("偵測到 cookies 檔案更新，已重新載入")
+            # 保留同一個 jar 物件，讓使用中的下載也能拿到新 cookies
+            self._jar.clear()
+            for cookie in jar:
+                self._jar.set_cookie(cookie)
+            jar = self._jar
+        self._jar = jar
+        self._file_mtime = stat.st_mtime
+        self._saved_snapshot = self._snapshot(jar)
+
+    def _refresh_if_changed(self):
+        """節流地檢查檔案是否變動"""
+        now = time.monotonic()
+        if self._jar is not None and now - self._last_check < self.watch_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = self.cookies_file.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._file_mtime or (self._jar is None and mtime is not None):
+            self._load()
+
+    @property
+    def jar(self):
+        """取得共用的 cookie jar，沒有 cookies 檔案時返回 None"""
+        if not YT_DLP_AVAILABLE:
+            return None
+        with self._lock:
+            self._refresh_if_changed()
+            return self._jar
+
+    def attach(self, ydl):
+        """
+        讓 YoutubeDL 實例使用共用的 cookie jar
+
+        必須在實例發出任何請求之前呼叫
+        """
+        jar = self.jar
+        if jar is None:
+            return ydl
+        try:
+            ydl.cookiejar = jar
+        except AttributeError:
+            # 舊版 yt-dlp 不允許替換 cookiejar，改為讓它自行讀取檔案
+            ydl.params['cookiefile'] = str(self.cookies_file)
+        return ydl
+
+    def persist(self) -> bool:
+        """
+        若 cookies 有變動則以原子方式寫回檔案
+
+        Returns:
+            是否有寫入檔案
+        """
+        with self._lock:
+            if self._jar is None:
+                return False
+            snapshot = self._snapshot(self._jar)
+            if snapshot == self._saved_snapshot:
+                return False
+
+            tmp_file = self.cookies_file.with_name(self.cookies_file.name + ".tmp")
+            try:
+                self._jar.save(str(tmp_file), ignore_discard=True, ignore_expires=True)
+                os.replace(tmp_file, self.cookies_file)
+            except Exception as e:
+                logging.error(f"寫回 cookies 檔案失敗: {e}")
+                return False
+            self._file_mtime = self.cookies_file.stat().st_mtime
+            self._saved_snapshot = snapshot
+            logging.debug("已寫回更新後的 cookies")
+            return True
+
+
+_managers: Dict[str, CookieManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_cookie_manager(cookies_file: str = "cookies.txt") -> CookieManager:
+    """
+    取得 cookies 檔案對應的共用管理器
+
+    Args:
+        cookies_file: cookies 檔案路徑
+
+    Returns:
+        cookies 管理器實例
+    """
+    key = str(Path(cookies_file).resolve())
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = CookieManager(cookies_file)
+            _managers[key] = manager
+        return manager
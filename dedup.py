@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重複檔案偵測模組
+以內容雜湊找出下載資料夾中位元組完全相同的檔案（例如重複下載、從垃圾桶還原的副本）：
+先以檔案大小分組，大小相同才計算部分雜湊（開頭與結尾），部分雜湊相同才計算完整雜湊；
+雜湊依檔案大小與修改時間快取在音樂庫索引中，檔案沒有變動就不需要再讀取
+
+用法:
+    python -m dedup --folder downloads
+    python -m dedup --folder downloads --reclaim hardlink
+"""
+
+import os
+import sys
+import hashlib
+import argparse
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Any, Iterable
+
+from music_library import MusicLibrary, AUDIO_EXTENSIONS, iter_audio_files, get_library
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 參與比對的檔案格式（音訊與下載的影片）
+MEDIA_EXTENSIONS = AUDIO_EXTENSIONS | {'.mp4', '.webm', '.mkv'}
+
+# 部分雜湊讀取檔案開頭與結尾各多少位元組
+PARTIAL_HASH_BYTES = 64 * 1024
+
+# 完整雜湊每次讀取的區塊大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 並行計算雜湊的執行緒數量
+DEFAULT_WORKERS = 4
+
+# 釋放空間的方式
+RECLAIM_MODES = ('trash', 'hardlink', 'symlink')
+
+
+def _digest() -> 'hashlib._Hash':
+    return hashlib.blake2b(digest_size=16)
+
+
+def compute_partial_hash(file_path: Path, file_size: int) -> str:
+    """計算檔案大小加上開頭與結尾區塊的雜湊"""
+    digest = _digest()
+    digest.update(str(file_size).encode())
+    with open(file_path, 'rb') as f:
+        digest.update(f.read(PARTIAL_HASH_BYTES))
+        if file_size > PARTIAL_HASH_BYTES * 2:
+            f.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+            digest.update(f.read(PARTIAL_HASH_BYTES))
+    return digest.hexdigest()
+
+
+def compute_full_hash(file_path: Path) -> str:
+    """計算整個檔案的雜湊"""
+    digest = _digest()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DuplicateFinder:
+    """找出內容相同的檔案，並以移到垃圾桶或連結的方式釋放空間"""
+
+    def __init__(self, library: MusicLibrary, max_workers: int = DEFAULT_WORKERS):
+        """
+        初始化重複檔案偵測
+
+        Args:
+            library: 音樂庫索引，雜湊快取存放在同一個資料庫
+            max_workers: 並行計算雜湊的執行緒數量
+        """
+        self.library = library
+        self.max_workers = max_workers
+
+    # --- 雜湊快取 ---
+
+    @staticmethod
+    def _cache_key(file_path: Path) -> str:
+        return str(Path(file_path).resolve())
+
+    def _cached(self, file_paths: List[Path], stats: Dict[Path, os.stat_result]) -> Dict[Path, Dict[str, Any]]:
+        """取得大小與修改時間都沒有變動的快取雜湊"""
+        keys = {self._cache_key(path): path for path in file_paths}
+        cached = {}
+        key_list = list(keys)
+        with self.library.transaction() as conn:
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start:start + 500]
+                rows = conn.execute(
+                    "SELECT path, file_size, mtime, partial_hash, full_hash FROM content_hashes "
+                    f"WHERE path IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for row in rows:
+                    path = keys[row['path']]
+                    stat = stats[path]
+                    if (row['file_size'], row['mtime']) == (stat.st_size, stat.st_mtime):
+                        cached[path] = dict(row)
+        return cached
+
+    def _store(self, entries: List[Dict[str, Any]]):
+        if not entries:
+            return
+        with self.library.transaction() as conn:
+            conn.executemany(
+                """
+                INSERT INTO content_hashes (path, file_size, mtime, partial_hash, full_hash)
+                VALUES (:path, :file_size, :mtime, :partial_hash, :full_hash)
+                ON CONFLICT(path) DO UPDATE SET
+                    file_size = excluded.file_size,
+                    mtime = excluded.mtime,
+                    partial_hash = excluded.partial_hash,
+                    full_hash = COALESCE(excluded.full_hash,
+                        CASE WHEN content_hashes.partial_hash = excluded.partial_hash
+                             THEN content_hashes.full_hash END)
+                """,
+                entries,
+            )
+
+    def _hash_stage(self, file_paths: List[Path], stats: Dict[Path, os.stat_result],
+                    field: str) -> Dict[Path, str]:
+        """取得一組檔案的部分或完整雜湊，快取中沒有的才並行計算"""
+        cached = self._cached(file_paths, stats)
+        result = {path: cached[path][field] for path in file_paths if path in cached and cached[path][field]}
+        missing = [path for path in file_paths if path not in result]
+
+        def compute(path: Path) -> Optional[str]:
+            try:
+                if field == 'partial_hash':
+                    return compute_partial_hash(path, stats[path].st_size)
+                return compute_full_hash(path)
+            except OSError as e:
+                logging.warning(f"無法讀取檔案 {path.name}: {e}")
+                return None
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(missing)))) as executor:
+                computed = dict(zip(missing, executor.map(compute, missing)))
+            entries = []
+            for path, value in computed.items():
+                if value is None:
+                    continue
+                result[path] = value
+                entry = {
+                    'path': self._cache_key(path),
+                    'file_size': stats[path].st_size,
+                    'mtime': stats[path].st_mtime,
+                    'partial_hash': cached.get(path, {}).get('partial_hash'),
+                    'full_hash': None,
+                }
+                entry[field] = value
+                entries.append(entry)
+            self._store(entries)
+        return result
+
+    def _prune(self, scanned: set):
+        """移除完整掃描時已不在資料夾中的檔案（已刪除、移到垃圾桶或改名）的快取雜湊"""
+        prefix = str(self.library.music_folder.resolve()) + os.sep
+        with self.library.transaction() as conn:
+            stale = [(row['path'],) for row in conn.execute("SELECT path FROM content_hashes")
+                     if row['path'].startswith(prefix) and row['path'] not in scanned]
+            conn.executemany("DELETE FROM content_hashes WHERE path = ?", stale)
+        if stale:
+            logging.info(f"已移除 {len(stale)} 筆過期的內容雜湊")
+
+    # --- 偵測 ---
+
+    def find_duplicates(self, file_paths: Optional[Iterable] = None) -> List[List[Path]]:
+        """
+        找出內容完全相同的檔案
+
+        Args:
+            file_paths: 要比對的檔案，預設為音樂資料夾中所有的音訊與影片檔案
+
+        Returns:
+            重複檔案群組的列表；每組第一個是建議保留的檔案（最早下載、檔名最短）
+        """
+        full_scan = file_paths is None
+        if full_scan:
+            file_paths = iter_audio_files(self.library.music_folder, MEDIA_EXTENSIONS)
+
+        # 依大小分組，只有大小相同的檔案才需要讀取內容；已經互相硬連結的檔案只算一次
+        stats: Dict[Path, os.stat_result] = {}
+        by_size: Dict[int, List[Path]] = {}
+        seen_inodes = set()
+        scanned = set()
+        for path in file_paths:
+            path = Path(path)
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            scanned.add(self._cache_key(path))
+            inode = (stat.st_dev, stat.st_ino)
+            if stat.st_size == 0 or inode in seen_inodes:
+                continue
+            seen_inodes.add(inode)
+            stats[path] = stat
+            by_size.setdefault(stat.st_size, []).append(path)
+        candidates = [path for group in by_size.values() if len(group) > 1 for path in group]
+        if full_scan:
+            self._prune(scanned)
+
+        groups = []
+        for field in ('partial_hash', 'full_hash'):
+            hashes = self._hash_stage(candidates, stats, field)
+            buckets: Dict[str, List[Path]] = {}
+            for path in candidates:
+                if path in hashes:
+                    buckets.setdefault(hashes[path], []).append(path)
+            groups = [group for group in buckets.values() if len(group) > 1]
+            candidates = [path for group in groups for path in group]
+
+        for group in groups:
+            group.sort(key=lambda path: (stats[path].st_mtime, len(path.name), path.name))
+        groups.sort(key=lambda group: group[0].name.lower())
+        logging.info(f"找到 {len(groups)} 組重複檔案")
+        return groups
+
+    def find_existing(self, file_path) -> Optional[Path]:
+        """
+        檢查某個檔案（例如剛下載的檔案）是否與資料夾中已有的檔案內容相同，返回已有的檔案
+
+        候選檔案只從索引中大小相同的歌曲與已計算過雜湊的檔案取得，不掃描整個資料夾
+        """
+        file_path = Path(file_path)
+        try:
+            size = file_path.stat().st_size
+        except OSError:
+            return None
+        target = file_path.resolve()
+        with self.library.transaction() as conn:
+            tracks = [row['path'] for row in conn.execute("SELECT path FROM tracks WHERE file_size = ?", (size,))]
+            hashed = [row['path'] for row in conn.execute("SELECT path FROM content_hashes WHERE file_size = ?", (size,))]
+        candidates = [file_path]
+        for path in dict.fromkeys([self.library.music_folder / key for key in tracks] + [Path(key) for key in hashed]):
+            if path.resolve() != target and path.exists():
+                candidates.append(path)
+        if len(candidates) == 1:
+            return None
+        for group in self.find_duplicates(candidates):
+            if any(path.resolve() == target for path in group):
+                return next(path for path in group if path.resolve() != target)
+        return None
+
+    # --- 釋放空間 ---
+
+    def reclaim(self, groups: List[List[Path]], mode: str = 'trash') -> Dict[str, Any]:
+        """
+        處理重複檔案，保留每組的第一個檔案
+
+        Args:
+            groups: find_duplicates() 的結果
+            mode: trash（其餘檔案移到垃圾桶）、hardlink 或 symlink（其餘檔案換成指向保留檔案的連結，
+                  檔名不變，播放清單與下載紀錄仍然有效）
+
+        Returns:
+            結果字典，包含 success、reclaimed（釋放的位元組）、processed、failed 與每個檔案的 results
+        """
+        if mode not in RECLAIM_MODES:
+            return {"success": False, "error": f"未知的處理方式: {mode}"}
+        duplicates = [(group[0], path) for group in groups for path in group[1:]]
+
+        if mode == 'trash':
+            from file_operations import batch_move_to_trash
+            sizes = {str(path): keep.stat().st_size for keep, path in duplicates}
+            report = batch_move_to_trash([path for _, path in duplicates], music_folder=str(self.library.music_folder))
+            reclaimed = sum(sizes[r['file_path']] for r in report['results'] if r['success'])
+            return {"success": report['success'], "reclaimed": reclaimed, "processed": report['succeeded'],
+                    "failed": report['failed'], "results": report['results']}
+
+        results = []
+        reclaimed = 0
+        for keep, path in duplicates:
+            temp_path = path.with_name(f".{path.name}.link")
+            try:
+                size = path.stat().st_size
+                if mode == 'hardlink':
+                    os.link(keep, temp_path)
+                else:
+                    os.symlink(os.path.relpath(keep.resolve(), path.resolve().parent), temp_path)
+                # 先建立連結再取代原檔，任何時候原本的檔名都存在
+                os.replace(temp_path, path)
+                reclaimed += size
+                results.append({"file_path": str(path), "success": True, "target": str(keep)})
+            except OSError as e:
+                temp_path.unlink(missing_ok=True)
+                results.append({"file_path": str(path), "success": False, "error": str(e)})
+        failed = sum(1 for result in results if not result['success'])
+        logging.info(f"重複檔案處理完成: 釋放 {reclaimed} 位元組，失敗 {failed} 個")
+        return {"success": failed == 0, "reclaimed": reclaimed, "processed": len(results) - failed,
+                "failed": failed, "results": results}
+
+
+def get_duplicate_finder(music_folder: str = "downloads") -> DuplicateFinder:
+    """取得音樂資料夾對應的重複檔案偵測"""
+    return DuplicateFinder(get_library(music_folder))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="找出並處理內容相同的檔案")
+    parser.add_argument('--folder', default='downloads', help="音樂資料夾")
+    parser.add_argument('--reclaim', choices=RECLAIM_MODES, help="處理方式（未指定時只列出重複檔案）")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="並行計算雜湊的執行緒數量")
+    args = parser.parse_args(argv)
+
+    finder = DuplicateFinder(get_library(args.folder), max_workers=args.workers)
+    groups = finder.find_duplicates()
+    wasted = sum(group[0].stat().st_size * (len(group) - 1) for group in groups)
+    for group in groups:
+        print(f"📄 {group[0]}")
+        for path in group[1:]:
+            print(f"   ↳ {path}")
+    print(f"共 {len(groups)} 組重複檔案，可釋放 {wasted / (1024 * 1024):.1f} MB")
+
+    if args.reclaim and groups:
+        result = finder.reclaim(groups, args.reclaim)
+        print(f"✅ 已處理 {result['processed']} 個檔案，釋放 {result['reclaimed'] / (1024 * 1024):.1f} MB")
+        return 0 if result['success'] else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
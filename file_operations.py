@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批次檔案操作模組
+一次刪除或移動多個音樂檔案到垃圾桶：檔案操作以執行緒池並行（適合網路磁碟等較慢的檔案系統），
+完成後在單一交易中更新音樂庫索引，並返回每個檔案的結果，不需要重新掃描資料夾
+"""
+
+import shutil
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable
+
+from music_library import MusicLibrary, get_library
+from trash_bin import get_trash_bin
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 並行處理的執行緒數量
+DEFAULT_WORKERS = 8
+
+
+def _run_batch(file_paths, operation: Callable[[Path], Dict[str, Any]],
+               library: Optional[MusicLibrary], max_workers: int) -> Dict[str, Any]:
+    """並行執行檔案操作，並把成功的檔案一次從音樂庫移除"""
+    file_paths = [Path(path) for path in file_paths]
+    if not file_paths:
+        return {"success": True, "succeeded": 0, "failed": 0, "results": []}
+
+    workers = max(1, min(max_workers, len(file_paths)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(operation, file_paths))
+
+    done = [Path(result['file_path']) for result in results if result['success']]
+    if library is not None and done:
+        library.remove_files(done)
+
+    failed = len(results) - len(done)
+    if failed:
+        logging.warning(f"批次檔案操作有 {failed} 個檔案失敗")
+    return {"success": failed == 0, "succeeded": len(done), "failed": failed, "results": results}
+
+
+def batch_delete(file_paths, music_folder: str = "downloads",
+                 max_workers: int = DEFAULT_WORKERS) -> Dict[str, Any]:
+    """
+    永久刪除多個檔案
+
+    Args:
+        file_paths: 要刪除的檔案路徑
+        music_folder: 音樂資料夾，刪除的檔案會從它的音樂庫索引移除
+        max_workers: 並行處理的執行緒數量
+
+    Returns:
+        結果字典，包含 success、succeeded、failed 與每個檔案的 results
+        （每筆包含 file_path、success，失敗時另有 error）
+    """
+    def delete(file_path: Path) -> Dict[str, Any]:
+        try:
+            file_path.unlink()
+            return {"file_path": str(file_path), "success": True}
+        except FileNotFoundError:
+            # 已經不存在的檔案視為刪除成功，讓索引一併清除
+            return {"file_path": str(file_path), "success": True}
+        except OSError as e:
+            return {"file_path": str(file_path), "success": False, "error": str(e)}
+
+    return _run_batch(file_paths, delete, get_library(music_folder), max_workers)
+
+
+def batch_move_to_trash(file_paths, music_folder: str = "downloads",
+                        max_workers: int = DEFAULT_WORKERS) -> Dict[str, Any]:
+    """
+    將多個檔案移動到垃圾桶
+
+    Args:
+        file_paths: 要移動的檔案路徑
+        music_folder: 音樂資料夾，使用它的垃圾桶
+        max_workers: 並行處理的執行緒數量
+
+    Returns:
+        結果字典，格式與 batch_delete 相同，成功的項目另有 trash_id（垃圾桶項目 ID）
+    """
+    trash = get_trash_bin(music_folder)
+    entries = {}
+
+    def move(file_path: Path) -> Dict[str, Any]:
+        try:
+            entries[str(file_path)] = trash.move_in(file_path)
+            return {"file_path": str(file_path), "success": True}
+        except (OSError, shutil.Error) as e:
+            return {"file_path": str(file_path), "success": False, "error": str(e)}
+
+    report = _run_batch(file_paths, move, get_library(music_folder), max_workers)
+    # 所有檔案搬完後一次寫入垃圾桶清單
+    done = [result for result in report['results'] if result['success']]
+    trash_ids = trash.record([entries[result['file_path']] for result in done])
+    for result, trash_id in zip(done, trash_ids):
+        result['trash_id'] = trash_id
+    return report
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+聲學指紋模組
+找出同一首歌的不同版本（不同上傳者、MP3 與 M4A 等），這些檔案的位元組不同，內容雜湊比對不出來：
+把音訊解碼成 8 kHz 單聲道，在頻譜圖上取局部峰值，再把相鄰的峰值兩兩配對成
+(頻率 1, 頻率 2, 時間差) 雜湊；雜湊只與峰值的相對位置有關，不受開頭長度、音量與編碼格式影響。
+指紋在背景計算並存放在音樂庫索引中，比對時以共同雜湊的比例判斷是否為同一段錄音
+
+用法:
+    python -m fingerprint --folder downloads
+    python -m fingerprint --folder downloads --threshold 0.3
+"""
+
+import os
+import sys
+import argparse
+import logging
+from typing import Optional, Dict, List, Any, Tuple
+
+from music_library import get_library
+from audio_analysis import (
+    TrackAnalyzer, NUMPY_AVAILABLE, DEFAULT_WORKERS, decode_audio, register_analyzer, get_analyzer,
+)
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 解碼的取樣率與長度：只取開頭的 90 秒，足以辨識同一段錄音
+SAMPLE_RATE = 8000
+FINGERPRINT_SECONDS = 90
+
+# 頻譜圖的視窗大小與間距（樣本數）
+FFT_SIZE = 1024
+HOP_SIZE = 256
+
+# 局部峰值的鄰域（時間框數、頻率格數），與至少需高出頻譜中位數的分貝數
+PEAK_NEIGHBORHOOD = (8, 10)
+PEAK_THRESHOLD_DB = 10.0
+
+# 每秒最多保留的峰值數，讓指紋大小與歌曲長度成正比，不受編曲密度影響
+PEAKS_PER_SECOND = 8
+
+# 每個峰值與之後幾個峰值配對，以及配對的最大時間差（時間框數）
+FAN_OUT = 3
+MAX_TIME_DELTA = 63
+
+# 判定為同一段錄音的共同雜湊比例（相對於較短的指紋）
+DEFAULT_THRESHOLD = 0.25
+
+# 出現在太多歌曲中的雜湊（例如靜音、單一音調）沒有辨識力，分組時略過
+MAX_HASH_TRACKS = 20
+
+
+def _max_filter(values: 'np.ndarray', size_t: int, size_f: int) -> 'np.ndarray':
+    """二維最大值濾波（先時間軸、再頻率軸）"""
+    padded = np.pad(values, ((size_t, size_t), (0, 0)), constant_values=-np.inf)
+    values = sliding_window_view(padded, 2 * size_t + 1, axis=0).max(axis=-1)
+    padded = np.pad(values, ((0, 0), (size_f, size_f)), constant_values=-np.inf)
+    return sliding_window_view(padded, 2 * size_f + 1, axis=1).max(axis=-1)
+
+
+def fingerprint_samples(samples: 'np.ndarray', sample_rate: int = SAMPLE_RATE) -> 'np.ndarray':
+    """
+    計算單聲道樣本的指紋
+
+    Args:
+        samples: float32 單聲道樣本
+        sample_rate: 樣本的取樣率
+
+    Returns:
+        排序且不重複的 uint32 雜湊陣列
+    """
+    if len(samples) < FFT_SIZE:
+        return np.empty(0, dtype=np.uint32)
+
+    # 頻譜圖（分貝），去掉直流成分後剩下 512 個頻率格
+    frames = sliding_window_view(samples, FFT_SIZE)[::HOP_SIZE] * np.hanning(FFT_SIZE).astype(np.float32)
+    spectrum = 20 * np.log10(np.abs(np.fft.rfft(frames, axis=1))[:, 1:] + 1e-6)
+
+    # 局部峰值，且需明顯高於整體的背景
+    local_max = _max_filter(spectrum, *PEAK_NEIGHBORHOOD)
+    threshold = np.median(spectrum) + PEAK_THRESHOLD_DB
+    times, freqs = np.nonzero((spectrum == local_max) & (spectrum > threshold))
+    if len(times) < 2:
+        return np.empty(0, dtype=np.uint32)
+
+    # 每秒只保留最強的幾個峰值
+    frames_per_second = sample_rate / HOP_SIZE
+    seconds = (times / frames_per_second).astype(np.int64)
+    order = np.lexsort((-spectrum[times, freqs], seconds))
+    seconds = seconds[order]
+    group_start = np.r_[0, np.flatnonzero(np.diff(seconds)) + 1]
+    rank = np.arange(len(order)) - np.repeat(group_start, np.diff(np.r_[group_start, len(order)]))
+    keep = order[rank < PEAKS_PER_SECOND]
+    keep = keep[np.lexsort((freqs[keep], times[keep]))]
+    times, freqs = times[keep], freqs[keep] >> 1
+
+    # 每個峰值與之後的峰值配對：(頻率 1, 頻率 2, 時間差) 共 22 位元
+    hashes = []
+    for offset in range(1, FAN_OUT + 1):
+        delta = times[offset:] - times[:-offset]
+        valid = (delta > 0) & (delta <= MAX_TIME_DELTA)
+        hashes.append((freqs[:-offset][valid].astype(np.uint32) << 14)
+                      | (freqs[offset:][valid].astype(np.uint32) << 6)
+                      | delta[valid].astype(np.uint32))
+    return np.unique(np.concatenate(hashes))
+
+
+def compute_fingerprint(file_path: str) -> 'np.ndarray':
+    """解碼檔案開頭並計算指紋（在背景行程中執行）"""
+    samples = decode_audio(file_path, SAMPLE_RATE, channels=1, max_seconds=FINGERPRINT_SECONDS)
+    return fingerprint_samples(samples)
+
+
+def similarity(hashes_a: 'np.ndarray', hashes_b: 'np.ndarray') -> float:
+    """兩個指紋共同雜湊佔較短指紋的比例"""
+    if len(hashes_a) == 0 or len(hashes_b) == 0:
+        return 0.0
+    shared = len(np.intersect1d(hashes_a, hashes_b, assume_unique=True))
+    return shared / min(len(hashes_a), len(hashes_b))
+
+
+@register_analyzer
+class FingerprintIndex(TrackAnalyzer):
+    """存放在音樂庫索引中的聲學指紋，提供相似歌曲查詢"""
+
+    name = "fingerprint"
+    table = "fingerprints"
+    schema = """
+    CREATE TABLE IF NOT EXISTS fingerprints (
+        track_id INTEGER PRIMARY KEY REFERENCES tracks(id) ON DELETE CASCADE,
+        file_size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        hash_count INTEGER NOT NULL DEFAULT 0,
+        hashes BLOB
+    );
+    """
+    result_column = "hashes"
+    analyze = staticmethod(compute_fingerprint)
+
+    def _columns(self, result) -> Dict[str, Any]:
+        if result is None:
+            return {'hashes': None, 'hash_count': 0}
+        return {'hashes': result.astype('<u4').tobytes(), 'hash_count': len(result)}
+
+    def _load(self, track_ids: Optional[List[int]] = None) -> Dict[int, 'np.ndarray']:
+        """讀取目前有效（檔案未變動）的指紋"""
+        query = (
+            "SELECT f.track_id, f.hashes FROM fingerprints f JOIN tracks t ON t.id = f.track_id "
+            "WHERE f.hashes IS NOT NULL AND f.file_size = t.file_size AND f.mtime = t.mtime"
+        )
+        with self.library.transaction() as conn:
+            rows = conn.execute(query).fetchall()
+        wanted = set(track_ids) if track_ids is not None else None
+        return {
+            row['track_id']: np.frombuffer(row['hashes'], dtype='<u4')
+            for row in rows if wanted is None or row['track_id'] in wanted
+        }
+
+    def get(self, track_id: int) -> Optional['np.ndarray']:
+        """取得單首歌曲的指紋，尚未計算時返回 None"""
+        return self._load([track_id]).get(track_id)
+
+    def find_similar(self, track_id: int, threshold: float = DEFAULT_THRESHOLD,
+                     limit: int = 10) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        找出與指定歌曲相似的歌曲
+
+        Returns:
+            (歌曲資訊, 相似度) 列表，相似度由高到低
+        """
+        fingerprints = self._load()
+        target = fingerprints.pop(track_id, None)
+        if target is None or len(target) == 0 or not fingerprints:
+            return []
+        ids = np.fromiter(fingerprints, dtype=np.int64, count=len(fingerprints))
+        lengths = np.array([len(fingerprints[i]) for i in ids])
+        owners = np.repeat(np.arange(len(ids)), lengths)
+        matched = np.isin(np.concatenate(list(fingerprints.values())), target, assume_unique=False)
+        shared = np.bincount(owners[matched], minlength=len(ids))
+        scores = shared / np.maximum(np.minimum(lengths, len(target)), 1)
+        best = [i for i in np.argsort(-scores, kind='stable')[:limit] if scores[i] >= threshold]
+        tracks = {track['id']: track for track in self.library.get_tracks([int(ids[i]) for i in best])}
+        return [(tracks[int(ids[i])], float(scores[i])) for i in best if int(ids[i]) in tracks]
+
+    def find_near_duplicates(self, threshold: float = DEFAULT_THRESHOLD) -> List[List[Dict[str, Any]]]:
+        """
+        把整個音樂庫中相似的歌曲分組
+
+        以雜湊排序找出共用雜湊的歌曲配對並計數，不需要兩兩比對所有歌曲
+
+        Returns:
+            相似歌曲群組的列表；每組第一首是檔案最大（通常音質最好）的版本
+        """
+        fingerprints = {track_id: hashes for track_id, hashes in self._load().items() if len(hashes)}
+        if len(fingerprints) < 2:
+            return []
+        ids = np.fromiter(fingerprints, dtype=np.int64, count=len(fingerprints))
+        lengths = np.array([len(fingerprints[i]) for i in ids], dtype=np.int64)
+
+        # (雜湊, 歌曲) 合成一個 64 位元的值排序，相同雜湊的歌曲會相鄰
+        keys = np.concatenate(list(fingerprints.values())).astype(np.uint64) << np.uint64(32)
+        keys |= np.repeat(np.arange(len(ids), dtype=np.uint64), lengths)
+        keys.sort()
+        hashes = keys >> np.uint64(32)
+        owners = (keys & np.uint64(0xFFFFFFFF)).astype(np.int64)
+        starts = np.r_[0, np.flatnonzero(np.diff(hashes)) + 1]
+        counts = np.diff(np.r_[starts, len(keys)])
+
+        # 依共用同一雜湊的歌曲數分批產生配對，每個配對編碼為 較小索引 * 歌曲數 + 較大索引
+        pair_codes = []
+        for size in range(2, MAX_HASH_TRACKS + 1):
+            group_starts = starts[counts == size]
+            if len(group_starts) == 0:
+                continue
+            group_owners = owners[group_starts[:, None] + np.arange(size)]
+            first, second = np.triu_indices(size, 1)
+            pair_codes.append((group_owners[:, first] * len(ids) + group_owners[:, second]).ravel())
+        if not pair_codes:
+            return []
+        codes, shared = np.unique(np.concatenate(pair_codes), return_counts=True)
+        first, second = codes // len(ids), codes % len(ids)
+        scores = shared / np.minimum(lengths[first], lengths[second])
+        matches = scores >= threshold
+
+        # 以併查集把相似的配對合併成群組
+        parent = list(range(len(ids)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for a, b in zip(first[matches].tolist(), second[matches].tolist()):
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+        members: Dict[int, List[int]] = {}
+        for i in set(first[matches].tolist()) | set(second[matches].tolist()):
+            members.setdefault(find(i), []).append(int(ids[i]))
+        groups = []
+        for track_ids in members.values():
+            tracks = self.library.get_tracks(track_ids)
+            if len(tracks) > 1:
+                tracks.sort(key=lambda track: (-track['file_size'], track['added_at']))
+                groups.append(tracks)
+        groups.sort(key=lambda group: group[0]['title'].lower())
+        logging.info(f"找到 {len(groups)} 組相似的錄音")
+        return groups
+
+
+def removable_copies(group: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    相似錄音群組中可以移除的其他版本
+
+    與保留的版本（群組第一首）是同一個實體檔案（硬連結）的路徑不列入，
+    移除它們不會釋放空間，反而會讓保留的版本少一個路徑
+    """
+    keeper = group[0]['file_path']
+    removable = []
+    for track in group[1:]:
+        try:
+            same = os.path.samefile(keeper, track['file_path'])
+        except OSError:
+            same = False
+        if not same:
+            removable.append(track)
+    return removable
+
+
+def get_fingerprint_index(music_folder: str = "downloads") -> FingerprintIndex:
+    """取得音樂資料夾對應的共用指紋索引"""
+    return get_analyzer(FingerprintIndex, music_folder)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="以聲學指紋找出同一首歌的不同版本")
+    parser.add_argument('--folder', default='downloads', help="音樂資料夾")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="判定為相同錄音的共同雜湊比例")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="並行計算指紋的行程數量")
+    args = parser.parse_args(argv)
+
+    if not NUMPY_AVAILABLE:
+        print("❌ 需要安裝 NumPy")
+        return 1
+    index = FingerprintIndex(get_library(args.folder), max_workers=args.workers)
+    result = index.update()
+    if not result['success']:
+        print(f"❌ {result['error']}")
+        return 1
+    print(f"🎼 新計算 {result['analyzed']} 首歌曲的指紋（{result['failed']} 首失敗）")
+
+    groups = index.find_near_duplicates(args.threshold)
+    for group in groups:
+        print(f"🎵 {group[0]['file_path']}")
+        for track in group[1:]:
+            print(f"   ↳ {track['file_path']}")
+    print(f"共 {len(groups)} 組相似的錄音")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
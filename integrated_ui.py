@@ -13,6 +13,7 @@ import traceback
 
 # 匯入下載器模組
 from youtube_downloader import YouTubeDownloader
+from selection import Selection
 
 # 匯入搜尋器模組
 try:
@@ -32,12 +33,30 @@ except ImportError as e:
 
 # 匯入音樂播放器模組
 try:
-    from music_player import MusicPlayer, PlaybackState, Song, create_music_player
+    from music_player import MusicPlayer, PlaybackState, Song, create_music_player, song_from_track
     MUSIC_PLAYER_AVAILABLE = True
 except ImportError as e:
     st.warning(f"⚠️ 音樂播放器功能不可用: {e}")
     MUSIC_PLAYER_AVAILABLE = False
 
+# 匯入播放清單儲存模組（與網頁播放器共用已儲存的播放清單）
+try:
+    from playlist_store import get_playlist_store
+    PLAYLIST_STORE_AVAILABLE = True
+except ImportError:
+    PLAYLIST_STORE_AVAILABLE = False
+
+# 匯入播放服務模組（所有工作階段共用同一個播放器）
+try:
+    from playback_daemon import ensure_daemon, PlaybackDaemonError
+    PLAYBACK_DAEMON_AVAILABLE = True
+except ImportError:
+    PLAYBACK_DAEMON_AVAILABLE = False
+    PlaybackDaemonError = ConnectionError
+
+# 播放中更新進度區塊的間隔（秒）
+PROGRESS_REFRESH_INTERVAL = 1.0
+
 # --- 頁面設定 ---
 st.set_page_config(
     page_title="🎬 YouTube 下載器 & 🎵 音樂播放器",
@@ -59,7 +78,7 @@ if 'auto_upload' not in st.session_state:
 if 'search_results' not in st.session_state:
     st.session_state.search_results = []
 if 'selected_videos' not in st.session_state:
-    st.session_state.selected_videos = []
+    st.session_state.selected_videos = Selection()
 
 # 音樂播放器狀態
 if 'music_player' not in st.session_state:
@@ -80,23 +99,32 @@ if 'is_repeat' not in st.session_state:
     st.session_state.is_repeat = False
 
 # --- 輔助函數 ---
+def video_key(video):
+    """搜尋結果的選取鍵值：影片 ID，沒有 ID 時使用網址"""
+    return video.get('video_id') or video.get('url')
+
 def init_music_player():
     """初始化音樂播放器"""
     if not MUSIC_PLAYER_AVAILABLE:
         return False
     
     try:
+        if st.session_state.music_player is None and PLAYBACK_DAEMON_AVAILABLE:
+            # 優先連線到共用的播放服務，只需要一次輕量的 RPC
+            st.session_state.music_player = ensure_daemon("downloads")
+        
         if st.session_state.music_player is None:
-            st.session_state.music_player = create_music_player("downloads")
+            # 播放服務無法使用時，退回在此工作階段內建立播放器
+            st.session_state.music_player = create_music_player("downloads", persist_queue=True)
+            # 還原上次的播放佇列，沒有時等待使用者掃描資料夾
+            st.session_state.music_player.restore_queue()
             
             # 設定回調函數
             def on_song_change(song: Song):
                 st.session_state.current_song = song
-                st.rerun()
             
             def on_state_change(state: PlaybackState):
                 st.session_state.playback_state = state
-                st.rerun()
             
             def on_progress(progress: float):
                 st.session_state.current_progress = progress
@@ -105,11 +133,77 @@ def init_music_player():
             st.session_state.music_player.on_state_change = on_state_change
             st.session_state.music_player.on_progress = on_progress
         
+        sync_player_state()
         return True
+    except PlaybackDaemonError as e:
+        # 播放服務已停止，下次重新整理時重新連線或重新啟動
+        st.session_state.music_player = None
+        st.error(f"播放服務連線中斷: {e}")
+        return False
     except Exception as e:
         st.error(f"初始化音樂播放器失敗: {e}")
         return False
 
+def sync_player_state():
+    """從播放器取得最新狀態（播放服務可能被其他工作階段操作過）"""
+    player = st.session_state.music_player
+    snap = player.snapshot()
+    st.session_state.current_song = snap['current_song']
+    st.session_state.playback_state = snap['state']
+    st.session_state.current_progress = snap['progress']
+    st.session_state.volume = snap['volume']
+    st.session_state.is_shuffle = snap['shuffle']
+    st.session_state.is_repeat = snap['repeat']
+    st.session_state.playlist = player.playlist
+
+def open_saved_playlist(name: str) -> int:
+    """開啟已儲存的播放清單，保留清單中的順序（不讀取音訊檔案）"""
+    tracks, position = get_playlist_store("downloads").load_playlist(name)
+    st.session_state.music_player.set_playlist([song_from_track(track) for track in tracks], position)
+    st.session_state.playlist = st.session_state.music_player.playlist
+    return len(tracks)
+
+def show_saved_playlists():
+    """側邊欄：開啟已儲存的播放清單"""
+    playlists = get_playlist_store("downloads").list_playlists()
+    if not playlists:
+        return
+    st.markdown("---")
+    st.subheader("💾 播放清單")
+    counts = {p['name']: p['track_count'] for p in playlists}
+    selected = st.selectbox(
+        "已儲存的播放清單",
+        list(counts),
+        format_func=lambda name: f"{name}（{counts[name]} 首）",
+        key="saved_playlist_selector"
+    )
+    if st.button("📂 開啟", use_container_width=True, key="open_saved_playlist"):
+        try:
+            st.success(f"✅ 已載入 {open_saved_playlist(selected)} 首歌曲")
+        except Exception as e:
+            st.error(f"開啟播放清單失敗: {e}")
+
+def _playback_progress(song: Song):
+    """播放進度區塊，換歌或狀態改變時才重新執行整個頁面"""
+    snap = st.session_state.music_player.snapshot()
+    if snap['current_song'] != song or snap['state'] != st.session_state.playback_state:
+        st.rerun()
+    
+    progress = snap['progress']
+    st.session_state.current_progress = progress
+    st.write(f"**進度:** {format_time(progress * song.duration)} / {song.duration_str}")
+    st.progress(progress, text=f"{progress:.1%}")
+
+def render_playback_progress(song: Song):
+    """
+    顯示播放進度
+    
+    以 fragment 定時只重新執行進度區塊，不再每秒重跑整個頁面；
+    暫停或停止時不會定時執行，閒置的分頁不佔用伺服器資源
+    """
+    playing = st.session_state.playback_state == PlaybackState.PLAYING
+    st.fragment(run_every=PROGRESS_REFRESH_INTERVAL if playing else None)(_playback_progress)(song)
+
 def scan_music_folder():
     """掃描音樂資料夾"""
     if st.session_state.music_player:
@@ -123,6 +217,18 @@ def scan_music_folder():
             return False
     return False
 
+def add_downloaded_songs(file_paths):
+    """將下載完成的檔案直接加入播放清單，已有清單時不需重新掃描"""
+    if not file_paths or not init_music_player():
+        return False
+    
+    player = st.session_state.music_player
+    if not player.playlist:
+        return scan_music_folder()
+    player.add_files(file_paths)
+    st.session_state.playlist = player.playlist
+    return True
+
 def format_time(seconds: float) -> str:
     """格式化時間顯示"""
     if seconds <= 0:
@@ -193,6 +299,9 @@ with st.sidebar:
             st.write(f"**隨機播放:** {'開啟' if info['shuffle'] else '關閉'}")
             st.write(f"**重複播放:** {'開啟' if info['repeat'] else '關閉'}")
 
+            if PLAYLIST_STORE_AVAILABLE:
+                show_saved_playlists()
+
 # 主要標籤頁
 tab1, tab2, tab3, tab4 = st.tabs([
     "🔗 直接下載", 
@@ -276,10 +385,9 @@ with tab1:
                     st.session_state.download_result = result
                     st.session_state.is_downloading = False
                     
-                    # 如果下載的是 MP3，自動掃描播放清單
+                    # 如果下載的是 MP3，直接加入播放清單
                     if format_choice == "MP3 音訊" and result.get('file_path') and MUSIC_PLAYER_AVAILABLE:
-                        if init_music_player():
-                            scan_music_folder()
+                        add_downloaded_songs(result.get('file_paths') or [result['file_path']])
                     
                 except Exception as e:
                     st.error(f"下載失敗: {e}")
@@ -321,8 +429,7 @@ with tab1:
                 st.markdown("---")
                 st.subheader("🎵 立即播放")
                 if st.button("▶️ 在播放器中播放此歌曲", use_container_width=True):
-                    if init_music_player():
-                        scan_music_folder()
+                    if add_downloaded_songs([file_path]):
                         # 找到剛下載的歌曲並播放
                         for i, song in enumerate(st.session_state.playlist):
                             if song.file_path == file_path:
@@ -349,6 +456,8 @@ with tab2:
                         searcher = YtDlpSearcher()
                         results = searcher.search(search_query, max_results=5)
                         st.session_state.search_results = results
+                        # 以影片 ID 記錄選取，重新搜尋後仍出現的影片保持選取
+                        st.session_state.selected_videos.retain({video_key(video) for video in results})
                         if results:
                             st.success(f"找到 {len(results)} 個影片")
                         else:
@@ -374,10 +483,12 @@ with tab2:
             col1, col2 = st.columns([1, 3])
             with col1:
                 if st.button("全選", key="select_all_2"):
-                    st.session_state.selected_videos = [i for i in range(len(st.session_state.search_results))]
+                    st.session_state.selected_videos.select_all(
+                        video_key(video) for video in st.session_state.search_results
+                    )
                     st.rerun()
                 if st.button("取消全選", key="deselect_all_2"):
-                    st.session_state.selected_videos = []
+                    st.session_state.selected_videos.clear()
                     st.rerun()
             
             # 顯示搜尋結果
@@ -386,13 +497,12 @@ with tab2:
                     col1, col2, col3 = st.columns([1, 4, 1])
                     
                     with col1:
-                        is_selected = i in st.session_state.selected_videos
-                        if st.checkbox(f"選擇 {i+1}", value=is_selected, key=f"select_{i}_2"):
-                            if i not in st.session_state.selected_videos:
-                                st.session_state.selected_videos.append(i)
-                        else:
-                            if i in st.session_state.selected_videos:
-                                st.session_state.selected_videos.remove(i)
+                        selection = st.session_state.selected_videos
+                        key = video_key(video)
+                        checked = st.checkbox(f"選擇 {i+1}", value=key in selection,
+                                              key=f"select_{key}_{selection.version}_2")
+                        if checked != (key in selection):
+                            selection.set(key, checked)
                     
                     with col2:
                         st.write(f"**{video.get('title', '無標題')}**")
@@ -418,10 +528,9 @@ with tab2:
                                 
                                 if result.get('file_path'):
                                     st.success("✅ 下載成功！")
-                                    # 如果是 MP3，自動掃描播放清單
+                                    # 如果是 MP3，直接加入播放清單
                                     if batch_format == "MP3 音訊" and MUSIC_PLAYER_AVAILABLE:
-                                        if init_music_player():
-                                            scan_music_folder()
+                                        add_downloaded_songs(result.get('file_paths') or [result['file_path']])
                                 else:
                                     st.error("❌ 下載失敗")
                                 
@@ -438,7 +547,8 @@ with tab2:
                 st.info(f"已選擇 {len(st.session_state.selected_videos)} 個影片進行下載")
                 
                 if st.button(f"開始批量下載 {batch_format.split(' ')[0]}", type="primary", use_container_width=True, key="batch_download_btn_2"):
-                    selected_videos = [st.session_state.search_results[i] for i in st.session_state.selected_videos]
+                    selected_videos = [video for video in st.session_state.search_results
+                                       if video_key(video) in st.session_state.selected_videos]
                     
                     progress_bar = st.progress(0, text="準備開始批量下載...")
                     status_text = st.empty()
@@ -486,10 +596,10 @@ with tab2:
                     success_count = sum(1 for r in results if r.get('file_path'))
                     st.success(f"✅ 批量下載完成！成功下載 {success_count}/{len(selected_videos)} 個檔案")
                     
-                    # 如果是 MP3，自動掃描播放清單
+                    # 如果是 MP3，直接加入播放清單
                     if batch_format == "MP3 音訊" and MUSIC_PLAYER_AVAILABLE:
-                        if init_music_player():
-                            scan_music_folder()
+                        downloaded_paths = [p for r in results for p in (r.get('file_paths') or [])]
+                        if add_downloaded_songs(downloaded_paths):
                             st.info("🎵 播放清單已更新，可以在音樂播放器標籤頁中查看")
 
 # 標籤頁 3: 音樂播放器
@@ -597,11 +707,16 @@ with tab3:
                 # 播放進度條
                 if song.duration > 0:
                     st.markdown("### 📊 播放進度")
+                    render_playback_progress(song)
                     progress = st.session_state.current_progress
-                    current_time = progress * song.duration
                     
-                    st.write(f"**進度:** {format_time(current_time)} / {song.duration_str}")
-                    st.progress(progress, text=f"{progress:.1%}")
+                    # 跳轉
+                    seek_col1, seek_col2 = st.columns([3, 1])
+                    with seek_col1:
+                        seek_target = st.slider("跳轉到", min_value=0.0, max_value=1.0, value=float(progress), step=0.01, format="%.2f", key="seek_target")
+                    with seek_col2:
+                        if st.button("⏩ 跳轉", use_container_width=True):
+                            st.session_state.music_player.seek(seek_target)
             
             # 播放清單
             if st.session_state.playlist:
@@ -623,9 +738,11 @@ with tab3:
                 # 歌曲列表
                 st.markdown("#### 🎵 歌曲列表")
                 
+                # 只查詢一次目前的索引（使用播放服務時每次查詢都是一次請求）
+                playing_index = st.session_state.music_player.current_index
                 for i, song in enumerate(st.session_state.playlist):
                     # 高亮當前播放的歌曲
-                    is_current = (i == st.session_state.music_player.current_index)
+                    is_current = (i == playing_index)
                     
                     with st.container():
                         col1, col2, col3, col4 = st.columns([1, 3, 1, 1])
@@ -757,8 +874,3 @@ st.markdown("""
 ### 📱 iPhone 背景播放
 本播放器支援 iPhone 背景播放功能，讓您可以在使用其他應用程式時繼續聽音樂。
 """)
-
-# 自動重新整理（用於更新播放進度）
-if st.session_state.music_player and st.session_state.playback_state == PlaybackState.PLAYING:
-    time.sleep(1)
-    st.rerun() 
\ No newline at end of file
@@ -6,6 +6,7 @@
 """
 
 import streamlit as st
+import streamlit.components.v1 as components
 from pathlib import Path
 import re
 import time
@@ -14,6 +15,14 @@ import base64
 
 # 匯入下載器模組
 from youtube_downloader import YouTubeDownloader
+from selection import Selection
+from shuffle_order import ShuffleBag
+from music_library import get_library, iter_audio_files
+from playlist_pager import render_pager, visible_track_info
+from file_operations import batch_delete
+from waveform import peaks_for_file, waveform_player_html
+from loudness import gain_for_file
+from transcode_cache import choose_variant, playable_file
 
 # 匯入搜尋器模組
 try:
@@ -31,6 +40,14 @@ except ImportError as e:
     st.warning(f"⚠️ 雲端上傳功能不可用: {e}")
     CLOUD_UPLOAD_AVAILABLE = False
 
+# 匯入播放清單儲存模組
+try:
+    from playlist_store import get_playlist_store
+    PLAYLIST_STORE_AVAILABLE = True
+except ImportError as e:
+    st.warning(f"⚠️ 播放清單儲存功能不可用: {e}")
+    PLAYLIST_STORE_AVAILABLE = False
+
 # 匯入密碼驗證模組
 try:
     from password_auth import (
@@ -93,7 +110,7 @@ if 'auto_upload' not in st.session_state:
 if 'search_results' not in st.session_state:
     st.session_state.search_results = []
 if 'selected_videos' not in st.session_state:
-    st.session_state.selected_videos = []
+    st.session_state.selected_videos = Selection()
 
 # 音樂播放器狀態
 if 'selected_audio_file' not in st.session_state:
@@ -106,8 +123,18 @@ if 'current_playlist_index' not in st.session_state:
     st.session_state.current_playlist_index = 0
 if 'play_mode' not in st.session_state:
     st.session_state.play_mode = "順序播放"  # 順序播放, 隨機播放, 單曲循環
+if 'saved_queue_files' not in st.session_state:
+    st.session_state.saved_queue_files = None
+if 'shuffle_bag' not in st.session_state:
+    st.session_state.shuffle_bag = ShuffleBag()
+    st.session_state.shuffle_synced_files = None
+    st.session_state.shuffle_index = {}
 
 # --- 輔助函數 ---
+def video_key(video):
+    """搜尋結果的選取鍵值：影片 ID，沒有 ID 時使用網址"""
+    return video.get('video_id') or video.get('url')
+
 def scan_music_folder():
     """掃描音樂資料夾"""
     downloads_dir = Path("downloads")
@@ -115,14 +142,48 @@ def scan_music_folder():
         return []
     
     supported_extensions = {'.mp3', '.wav', '.ogg', '.flac', '.m4a'}
-    music_files = []
-    
-    for file_path in downloads_dir.rglob("*"):
-        if file_path.is_file() and file_path.suffix.lower() in supported_extensions:
-            music_files.append(file_path)
+    # 略過垃圾桶與下載暫存區等隱藏資料夾
+    music_files = list(iter_audio_files(downloads_dir, supported_extensions))
     
     return sorted(music_files, key=lambda x: x.name)
 
+def add_downloaded_files(file_paths):
+    """將下載完成的檔案直接加入播放清單，不需重新掃描資料夾"""
+    supported_extensions = {'.mp3', '.wav', '.ogg', '.flac', '.m4a'}
+    known = set(st.session_state.music_files)
+    new_files = [Path(p) for p in file_paths if Path(p).suffix.lower() in supported_extensions and Path(p) not in known]
+    if new_files:
+        st.session_state.music_files = sorted(st.session_state.music_files + new_files, key=lambda x: x.name)
+        st.session_state.playlist_updated = True
+
+def remove_from_playlist(index):
+    """從播放清單移除一首已刪除的歌曲，並修正目前播放的位置"""
+    music_files = list(st.session_state.music_files)
+    removed = music_files.pop(index)
+    st.session_state.music_files = music_files
+    if st.session_state.selected_audio_file == removed:
+        st.session_state.selected_audio_file = None
+    if st.session_state.current_playlist_index > index:
+        st.session_state.current_playlist_index -= 1
+    st.session_state.current_playlist_index = min(st.session_state.current_playlist_index,
+                                                  max(len(music_files) - 1, 0))
+
+def get_playlist_totals():
+    """
+    播放清單的總大小與總時長
+
+    從音樂庫索引批次讀取，並快取到播放清單被替換為止，不會在每次重新執行時讀取所有檔案的標籤
+    """
+    music_files = st.session_state.music_files
+    cached = st.session_state.get('playlist_totals')
+    if cached and cached[0] is music_files:
+        return cached[1]
+    # 尚未登記的檔案只在第一次讀取標籤並登記到音樂庫
+    tracks = visible_track_info(get_library("downloads"), music_files)
+    totals = (sum(track['file_size'] for track in tracks), sum(track['duration'] for track in tracks))
+    st.session_state.playlist_totals = (music_files, totals)
+    return totals
+
 def format_time(seconds: float) -> str:
     """格式化時間顯示"""
     if seconds <= 0:
@@ -194,19 +255,42 @@ def get_audio_mime_type(file_path):
     }
     return mime_map.get(suffix, 'audio/mpeg')
 
-def create_iphone_audio_player(audio_bytes, mime_type, filename):
-    """創建 iPhone 優化的音訊播放器"""
+# 播放版本：自動依瀏覽器與網路狀況選擇，也可以手動指定
+PLAYBACK_VARIANTS = {
+    "自動": "auto",
+    "原始檔案": None,
+    "iPhone 相容 (AAC 160k)": "iphone",
+    "省流量 (AAC 64k)": "cellular",
+}
+
+def get_playback_file(file_path):
+    """取得要播放的檔案與 MIME 類型：手機或行動網路改用預先轉檔的版本，尚未轉檔時使用原始檔案"""
+    variant = PLAYBACK_VARIANTS[st.session_state.get('playback_variant', "自動")]
+    if variant == "auto":
+        context = getattr(st, 'context', None)
+        variant = choose_variant(context.headers if context is not None else None)
+    path, mime_type = playable_file(file_path, variant)
+    return path, mime_type or get_audio_mime_type(file_path)
+
+def create_iphone_audio_player(audio_bytes, mime_type, filename, peaks=None, gain=1.0):
+    """創建 iPhone 優化的音訊播放器（有預先計算的波形峰值時顯示可點擊跳轉的波形，並套用響度正規化增益）"""
     import base64
     
+    audio_src = f"data:{mime_type};base64,{base64.b64encode(audio_bytes).decode()}"
+    
     # 使用 HTML5 audio 元素，對 iPhone 更友好
     audio_html = f"""
     <audio controls style="width: 100%; max-width: 500px;">
-        <source src="data:{mime_type};base64,{base64.b64encode(audio_bytes).decode()}" type="{mime_type}">
+        <source src="{audio_src}" type="{mime_type}">
         您的瀏覽器不支援音訊播放。
     </audio>
     """
     
-    st.markdown(audio_html, unsafe_allow_html=True)
+    if peaks is not None or gain < 1.0:
+        components.html(waveform_player_html(audio_src, mime_type, peaks, gain=gain),
+                        height=150 if peaks is not None else 80)
+    else:
+        st.markdown(audio_html, unsafe_allow_html=True)
     
     # 添加 iPhone 特定的提示
     st.info("📱 **iPhone 用戶提示**: 如果無法播放，請嘗試：\n"
@@ -215,6 +299,18 @@ def create_iphone_audio_player(audio_bytes, mime_type, filename):
             "3. 嘗試使用 Safari 瀏覽器\n"
             "4. 檢查是否允許自動播放")
 
+def get_shuffle_bag() -> ShuffleBag:
+    """取得隨機播放順序，播放清單被替換過時只同步差異"""
+    bag = st.session_state.shuffle_bag
+    if st.session_state.shuffle_synced_files is not st.session_state.music_files:
+        files = st.session_state.music_files
+        st.session_state.shuffle_index = {path: i for i, path in enumerate(files)}
+        bag.sync(st.session_state.shuffle_index)
+        st.session_state.shuffle_synced_files = files
+    if 0 <= st.session_state.current_playlist_index < len(st.session_state.music_files):
+        bag.set_current(st.session_state.music_files[st.session_state.current_playlist_index])
+    return bag
+
 def get_next_song():
     """獲取下一首歌曲"""
     if not st.session_state.music_files:
@@ -226,8 +322,7 @@ def get_next_song():
     if st.session_state.play_mode == "順序播放":
         next_index = (current_index + 1) % total_songs
     elif st.session_state.play_mode == "隨機播放":
-        import random
-        next_index = random.randint(0, total_songs - 1)
+        next_index = st.session_state.shuffle_index.get(get_shuffle_bag().next(), current_index)
     else:  # 單曲循環
         next_index = current_index
     
@@ -244,8 +339,8 @@ def get_previous_song():
     if st.session_state.play_mode == "順序播放":
         prev_index = (current_index - 1) % total_songs
     elif st.session_state.play_mode == "隨機播放":
-        import random
-        prev_index = random.randint(0, total_songs - 1)
+        # 回到上一首聽過的歌，沒有紀錄時停在目前的歌
+        prev_index = st.session_state.shuffle_index.get(get_shuffle_bag().previous(), current_index)
     else:  # 單曲循環
         prev_index = current_index
     
@@ -256,9 +351,132 @@ def play_song_by_index(index):
     if 0 <= index < len(st.session_state.music_files):
         st.session_state.current_playlist_index = index
         st.session_state.selected_audio_file = st.session_state.music_files[index]
+        save_play_queue()
         return True
     return False
 
+def save_play_queue():
+    """保存播放佇列；清單沒有被替換時只更新目前位置"""
+    if not PLAYLIST_STORE_AVAILABLE:
+        return
+    try:
+        store = get_playlist_store("downloads")
+        if st.session_state.saved_queue_files is st.session_state.music_files:
+            store.save_queue_position(st.session_state.current_playlist_index)
+        else:
+            files = st.session_state.music_files
+            store.save_queue(store.track_ids_for_files(files), st.session_state.current_playlist_index)
+            st.session_state.saved_queue_files = files
+    except Exception as e:
+        st.warning(f"⚠️ 無法保存播放佇列: {e}")
+
+def load_saved_tracks(tracks, position: int = 0):
+    """把從播放清單儲存讀出的歌曲設為目前的播放清單（不讀取音訊檔案）"""
+    st.session_state.music_files = [Path(track['file_path']) for track in tracks]
+    st.session_state.current_playlist_index = position
+    st.session_state.saved_queue_files = None
+    st.session_state.playlist_updated = True
+
+def restore_play_queue():
+    """工作階段開始時還原上次的播放佇列，不需要掃描資料夾"""
+    if not PLAYLIST_STORE_AVAILABLE or st.session_state.music_files:
+        return
+    try:
+        store = get_playlist_store("downloads")
+        tracks, position = store.load_queue()
+    except Exception as e:
+        st.warning(f"⚠️ 無法讀取播放佇列: {e}")
+        return
+    if tracks:
+        load_saved_tracks(tracks, position)
+        st.session_state.saved_queue_files = st.session_state.music_files
+
+def show_saved_playlists():
+    """側邊欄：開啟、儲存、匯入與匯出播放清單"""
+    st.markdown("---")
+    st.subheader("💾 播放清單")
+    store = get_playlist_store("downloads")
+    playlists = store.list_playlists()
+    
+    if playlists:
+        names = [p['name'] for p in playlists]
+        selected = st.selectbox(
+            "已儲存的播放清單",
+            names,
+            format_func=lambda n: f"{n}（{next(p['track_count'] for p in playlists if p['name'] == n)} 首）",
+            key="saved_playlist_selector"
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("📂 開啟", use_container_width=True):
+                tracks, position = store.load_playlist(selected)
+                load_saved_tracks(tracks, position)
+                st.rerun()
+        with col2:
+            if st.button("🗑️ 刪除", use_container_width=True, key="delete_saved_playlist"):
+                store.delete_playlist(selected)
+                st.rerun()
+        st.download_button(
+            "📤 匯出 M3U8",
+            data=store.m3u8_text(selected).encode('utf-8'),
+            file_name=f"{selected}.m3u8",
+            mime="audio/x-mpegurl",
+            use_container_width=True
+        )
+    
+    if st.session_state.music_files:
+        new_name = st.text_input("儲存目前的清單為", key="new_playlist_name")
+        if st.button("💾 儲存", use_container_width=True) and new_name.strip():
+            track_ids = store.track_ids_for_files(st.session_state.music_files)
+            store.save_playlist(new_name.strip(), track_ids, st.session_state.current_playlist_index)
+            st.success(f"✅ 已儲存 {sum(1 for t in track_ids if t is not None)} 首歌曲")
+    
+    uploaded = st.file_uploader("📥 匯入 M3U8", type=["m3u8", "m3u"], key="m3u_uploader")
+    if uploaded is not None and st.button("匯入", use_container_width=True):
+        result = store.import_m3u8_text(uploaded.getvalue().decode('utf-8-sig'),
+                                        fallback_name=Path(uploaded.name).stem)
+        st.success(f"✅ 已匯入「{result['name']}」{result['imported']} 首歌曲")
+        if result['missing']:
+            st.warning(f"⚠️ {len(result['missing'])} 首歌曲找不到")
+
+def show_library_search():
+    """搜尋音樂庫（標題、藝術家、專輯、檔名），點選結果直接播放"""
+    query = st.text_input("🔍 搜尋音樂庫", placeholder="歌名、歌手、專輯或檔名", key="library_search")
+    if not query.strip():
+        return
+    
+    library = get_playlist_store("downloads").library
+    if not st.session_state.get('library_synced'):
+        # 每個工作階段第一次搜尋前增量同步一次，之後由下載流程即時登記
+        with st.spinner("正在更新音樂庫索引..."):
+            library.sync()
+        st.session_state.library_synced = True
+    
+    results = library.search(query, limit=30)
+    if not results:
+        st.info("找不到符合的歌曲")
+        return
+    if results[0]['match'] == "fuzzy":
+        st.caption("沒有完全符合的結果，以下為相近的歌曲")
+    
+    for i, track in enumerate(results):
+        col1, col2, col3 = st.columns([4, 1, 1])
+        with col1:
+            st.markdown(f"**{track['title']}**")
+            st.caption(f"{track['artist']} - {track['album']}")
+        with col2:
+            st.write(format_time(track['duration']))
+        with col3:
+            if st.button("▶️", key=f"search_play_{i}", help="播放此歌曲"):
+                path = Path(track['file_path'])
+                if path not in st.session_state.music_files:
+                    st.session_state.music_files = st.session_state.music_files + [path]
+                play_song_by_index(st.session_state.music_files.index(path))
+                st.rerun()
+
+# 還原上次的播放佇列
+restore_play_queue()
+
 # --- 主介面 ---
 st.title("🎬 YouTube 下載器 & 🎵 網頁播放器")
 st.markdown("下載 YouTube 影片並立即播放，享受完整的音樂體驗！")
@@ -279,6 +497,12 @@ with st.sidebar:
     
     # 音樂播放器設定
     st.subheader("🎵 音樂播放器")
+    st.selectbox(
+        "📶 播放版本",
+        list(PLAYBACK_VARIANTS),
+        key="playback_variant",
+        help="自動：手機播放 iPhone 相容的 AAC，省流量模式或慢速網路播放低位元率版本"
+    )
     
     # 掃描音樂資料夾
     if st.button("📁 掃描音樂資料夾", type="primary", use_container_width=True):
@@ -287,13 +511,16 @@ with st.sidebar:
         st.session_state.playlist_updated = True
         st.success(f"✅ 掃描完成，找到 {len(music_files)} 首歌曲")
     
+    # 已儲存的播放清單
+    if PLAYLIST_STORE_AVAILABLE:
+        show_saved_playlists()
+    
     # 播放器狀態
     if st.session_state.music_files:
         st.markdown("---")
         st.subheader("📊 播放清單資訊")
         
-        total_size = sum(f.stat().st_size for f in st.session_state.music_files)
-        total_duration = sum(get_audio_file_info(f)['duration'] for f in st.session_state.music_files)
+        total_size, total_duration = get_playlist_totals()
         
         st.write(f"**總歌曲數:** {len(st.session_state.music_files)}")
         st.write(f"**總時長:** {format_time(total_duration)}")
@@ -387,11 +614,9 @@ with tab1:
                     st.session_state.download_result = result
                     st.session_state.is_downloading = False
                     
-                    # 如果下載的是 MP3，自動掃描播放清單
+                    # 如果下載的是 MP3，直接加入播放清單
                     if format_choice == "MP3 音訊" and result.get('file_path'):
-                        music_files = scan_music_folder()
-                        st.session_state.music_files = music_files
-                        st.session_state.playlist_updated = True
+                        add_downloaded_files(result.get('file_paths') or [result['file_path']])
                     
                 except Exception as e:
                     st.error(f"下載失敗: {e}")
@@ -455,6 +680,8 @@ with tab2:
                         searcher = YtDlpSearcher()
                         results = searcher.search(search_query, max_results=5)
                         st.session_state.search_results = results
+                        # 以影片 ID 記錄選取，重新搜尋後仍出現的影片保持選取
+                        st.session_state.selected_videos.retain({video_key(video) for video in results})
                         if results:
                             st.success(f"找到 {len(results)} 個影片")
                         else:
@@ -480,10 +707,12 @@ with tab2:
             col1, col2 = st.columns([1, 3])
             with col1:
                 if st.button("全選", key="select_all_2"):
-                    st.session_state.selected_videos = [i for i in range(len(st.session_state.search_results))]
+                    st.session_state.selected_videos.select_all(
+                        video_key(video) for video in st.session_state.search_results
+                    )
                     st.rerun()
                 if st.button("取消全選", key="deselect_all_2"):
-                    st.session_state.selected_videos = []
+                    st.session_state.selected_videos.clear()
                     st.rerun()
             
             # 顯示搜尋結果
@@ -492,13 +721,12 @@ with tab2:
                     col1, col2, col3 = st.columns([1, 4, 1])
                     
                     with col1:
-                        is_selected = i in st.session_state.selected_videos
-                        if st.checkbox(f"選擇 {i+1}", value=is_selected, key=f"select_{i}_2"):
-                            if i not in st.session_state.selected_videos:
-                                st.session_state.selected_videos.append(i)
-                        else:
-                            if i in st.session_state.selected_videos:
-                                st.session_state.selected_videos.remove(i)
+                        selection = st.session_state.selected_videos
+                        key = video_key(video)
+                        checked = st.checkbox(f"選擇 {i+1}", value=key in selection,
+                                              key=f"select_{key}_{selection.version}_2")
+                        if checked != (key in selection):
+                            selection.set(key, checked)
                     
                     with col2:
                         st.write(f"**{video.get('title', '無標題')}**")
@@ -529,11 +757,9 @@ with tab2:
                                 
                                 if result.get('file_path'):
                                     st.success("✅ 下載成功！")
-                                    # 如果是 MP3，自動掃描播放清單
+                                    # 如果是 MP3，直接加入播放清單
                                     if batch_format == "MP3 音訊":
-                                        music_files = scan_music_folder()
-                                        st.session_state.music_files = music_files
-                                        st.session_state.playlist_updated = True
+                                        add_downloaded_files(result.get('file_paths') or [result['file_path']])
                                 else:
                                     st.error("❌ 下載失敗")
                                 
@@ -550,7 +776,8 @@ with tab2:
                 st.info(f"已選擇 {len(st.session_state.selected_videos)} 個影片進行下載")
                 
                 if st.button(f"開始批量下載 {batch_format.split(' ')[0]}", type="primary", use_container_width=True, key="batch_download_btn_2"):
-                    selected_videos = [st.session_state.search_results[i] for i in st.session_state.selected_videos]
+                    selected_videos = [video for video in st.session_state.search_results
+                                       if video_key(video) in st.session_state.selected_videos]
                     
                     progress_bar = st.progress(0, text="準備開始批量下載...")
                     status_text = st.empty()
@@ -598,11 +825,9 @@ with tab2:
                     success_count = sum(1 for r in results if r.get('file_path'))
                     st.success(f"✅ 批量下載完成！成功下載 {success_count}/{len(selected_videos)} 個檔案")
                     
-                    # 如果是 MP3，自動掃描播放清單
+                    # 如果是 MP3，直接加入播放清單
                     if batch_format == "MP3 音訊":
-                        music_files = scan_music_folder()
-                        st.session_state.music_files = music_files
-                        st.session_state.playlist_updated = True
+                        add_downloaded_files([p for r in results for p in (r.get('file_paths') or [])])
                         st.info("🎵 播放清單已更新，可以在音樂播放器標籤頁中查看")
 
 # 標籤頁 3: 音樂播放器
@@ -618,6 +843,10 @@ with tab3:
             st.session_state.playlist_updated = True
             st.success(f"✅ 掃描完成，找到 {len(music_files)} 首歌曲")
     
+    # 搜尋音樂庫
+    if PLAYLIST_STORE_AVAILABLE:
+        show_library_search()
+    
     if st.session_state.music_files:
         # 側邊欄：檔案選擇
         with st.sidebar:
@@ -697,11 +926,19 @@ with tab3:
             with open(selected_file, "rb") as f:
                 audio_bytes = f.read()
             
-            # 獲取正確的 MIME 類型
-            mime_type = get_audio_mime_type(selected_file)
+            # 手機播放預先轉檔的版本，下載按鈕仍提供原始檔案
+            play_path, mime_type = get_playback_file(selected_file)
+            play_bytes = audio_bytes
+            if play_path != selected_file:
+                try:
+                    play_bytes = play_path.read_bytes()
+                except OSError:
+                    # 轉檔版本可能在取得路徑後剛好被快取淘汰，改播原始檔案
+                    mime_type = get_audio_mime_type(selected_file)
             
             # 創建 iPhone 優化播放器
-            create_iphone_audio_player(audio_bytes, mime_type, selected_file.name)
+            create_iphone_audio_player(play_bytes, mime_type, selected_file.name,
+                                       peaks_for_file(selected_file), gain_for_file(selected_file))
             
             # 下載按鈕
             st.markdown("---")
@@ -719,16 +956,22 @@ with tab3:
         st.markdown("---")
         st.subheader("📋 播放清單")
         
-        # 顯示所有音樂檔案
-        for i, file_path in enumerate(st.session_state.music_files, 1):
+        # 只顯示目前這一頁的歌曲，切換歌曲時自動跳到它所在的頁面
+        start, end = render_pager(
+            len(st.session_state.music_files), key="playlist",
+            follow_index=st.session_state.current_playlist_index
+        )
+        page_files = st.session_state.music_files[start:end]
+        page_infos = visible_track_info(get_library("downloads"), page_files)
+        
+        for i, (file_path, file_info) in enumerate(zip(page_files, page_infos), start + 1):
             with st.container():
-                col1, col2, col3, col4, col5 = st.columns([1, 3, 1, 1, 1])
+                col1, col2, col3, col4 = st.columns([1, 3, 1, 1])
                 
                 with col1:
                     st.write(f"{i}")
                 
                 with col2:
-                    file_info = get_audio_file_info(file_path)
                     st.write(f"**{file_info['title']}**")
                     st.caption(f"{file_info['artist']} • {format_time(file_info['duration'])} • {format_file_size(file_info['file_size'])}")
                 
@@ -739,30 +982,15 @@ with tab3:
                         st.rerun()
                 
                 with col4:
-                    # 下載按鈕
-                    with open(file_path, "rb") as f:
-                        file_bytes = f.read()
-                    
-                    st.download_button(
-                        label="📥",
-                        data=file_bytes,
-                        file_name=file_path.name,
-                        mime=f"audio/{file_path.suffix[1:]}",
-                        key=f"download_{i}"
-                    )
-                
-                with col5:
-                    # 刪除按鈕
+                    # 刪除按鈕（下載請使用上方播放器的下載按鈕，不再為每一列傳送整個檔案）
                     if st.button("🗑️", key=f"delete_{i}", help="刪除此歌曲"):
-                        try:
-                            file_path.unlink()
-                            st.success("✅ 已刪除")
-                            # 重新掃描播放清單
-                            music_files = scan_music_folder()
-                            st.session_state.music_files = music_files
+                        result = batch_delete([file_path])
+                        if result['success']:
+                            # 直接從播放清單移除，不重新掃描資料夾
+                            remove_from_playlist(i - 1)
                             st.rerun()
-                        except Exception as e:
-                            st.error(f"刪除失敗: {e}")
+                        else:
+                            st.error(f"刪除失敗: {result['results'][0]['error']}")
                 
                 st.markdown("---")
     else:
@@ -6,6 +6,7 @@ iPhone 優化音訊播放器
 """
 
 import streamlit as st
+import streamlit.components.v1 as components
 from pathlib import Path
 import base64
 import io
@@ -13,6 +14,11 @@ from mutagen import File
 from mutagen.mp3 import MP3
 import time
 
+from music_library import iter_audio_files
+from waveform import peaks_for_file, waveform_player_html
+from loudness import gain_for_file
+from transcode_cache import choose_variant, playable_file
+
 # 導入密碼驗證模組
 try:
     from password_auth import (
@@ -33,11 +39,8 @@ def scan_music_folder():
         return []
     
     music_extensions = {'.mp3', '.wav', '.ogg', '.flac', '.m4a', '.aac'}
-    music_files = []
-    
-    for file_path in downloads_dir.rglob("*"):
-        if file_path.is_file() and file_path.suffix.lower() in music_extensions:
-            music_files.append(file_path)
+    # 略過垃圾桶與下載暫存區等隱藏資料夾
+    music_files = list(iter_audio_files(downloads_dir, music_extensions))
     
     return sorted(music_files, key=lambda x: x.name)
 
@@ -127,17 +130,40 @@ def get_audio_mime_type(file_path):
     }
     return mime_map.get(suffix, 'audio/mpeg')
 
-def create_iphone_audio_player(audio_bytes, mime_type, filename):
-    """創建 iPhone 優化的音訊播放器"""
+# 播放版本：自動依瀏覽器與網路狀況選擇，也可以手動指定
+PLAYBACK_VARIANTS = {
+    "自動": "auto",
+    "原始檔案": None,
+    "iPhone 相容 (AAC 160k)": "iphone",
+    "省流量 (AAC 64k)": "cellular",
+}
+
+def get_playback_file(file_path):
+    """取得要播放的檔案與 MIME 類型：手機或行動網路改用預先轉檔的版本，尚未轉檔時使用原始檔案"""
+    variant = PLAYBACK_VARIANTS[st.session_state.get('playback_variant', "自動")]
+    if variant == "auto":
+        context = getattr(st, 'context', None)
+        variant = choose_variant(context.headers if context is not None else None)
+    path, mime_type = playable_file(file_path, variant)
+    return path, mime_type or get_audio_mime_type(file_path)
+
+def create_iphone_audio_player(audio_bytes, mime_type, filename, peaks=None, gain=1.0):
+    """創建 iPhone 優化的音訊播放器（有預先計算的波形峰值時顯示可點擊跳轉的波形，並套用響度正規化增益）"""
+    audio_src = f"data:{mime_type};base64,{base64.b64encode(audio_bytes).decode()}"
+    
     # 使用 HTML5 audio 元素，對 iPhone 更友好
     audio_html = f"""
     <audio controls style="width: 100%; max-width: 500px;">
-        <source src="data:{mime_type};base64,{base64.b64encode(audio_bytes).decode()}" type="{mime_type}">
+        <source src="{audio_src}" type="{mime_type}">
         您的瀏覽器不支援音訊播放。
     </audio>
     """
     
-    st.markdown(audio_html, unsafe_allow_html=True)
+    if peaks is not None or gain < 1.0:
+        components.html(waveform_player_html(audio_src, mime_type, peaks, gain=gain),
+                        height=150 if peaks is not None else 80)
+    else:
+        st.markdown(audio_html, unsafe_allow_html=True)
     
     # 添加 iPhone 特定的提示
     st.info("📱 **iPhone 用戶提示**: 如果無法播放，請嘗試：\n"
@@ -204,6 +230,13 @@ def main():
                 key="audio_file_selector"
             )
             
+            st.selectbox(
+                "📶 播放版本",
+                list(PLAYBACK_VARIANTS),
+                key="playback_variant",
+                help="自動：手機播放 iPhone 相容的 AAC，省流量模式或慢速網路播放低位元率版本"
+            )
+            
             if selected_file:
                 st.session_state.selected_file = selected_file
                 
@@ -232,8 +265,20 @@ def main():
                 # 獲取 MIME 類型
                 mime_type = get_audio_mime_type(st.session_state.selected_file)
                 
+                # 手機播放預先轉檔的版本，下載按鈕仍提供原始檔案
+                play_path, play_mime_type = get_playback_file(st.session_state.selected_file)
+                play_bytes = audio_bytes
+                if play_path != st.session_state.selected_file:
+                    try:
+                        play_bytes = play_path.read_bytes()
+                    except OSError:
+                        # 轉檔版本可能在取得路徑後剛好被快取淘汰，改播原始檔案
+                        play_mime_type = mime_type
+                
                 # 創建 iPhone 優化播放器
-                create_iphone_audio_player(audio_bytes, mime_type, st.session_state.selected_file.name)
+                create_iphone_audio_player(play_bytes, play_mime_type, st.session_state.selected_file.name,
+                                           peaks_for_file(st.session_state.selected_file),
+                                           gain_for_file(st.session_state.selected_file))
                 
                 # 下載按鈕
                 st.markdown("---")
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+響度分析模組
+依 EBU R128 / ITU-R BS.1770 計算每首歌的整合響度（LUFS）與峰值，在背景分析一次並存放在音樂庫索引中；
+播放時依響度換算增益，不同頻道下載的歌曲音量一致，不需要每首歌手動調整音量
+
+K 加權濾波以頻域方式套用在每個 100 毫秒的區塊上（區塊能量只與頻率響應的大小有關），
+整首歌的所有區塊一次以 NumPy 計算，不需要逐樣本執行濾波器
+
+用法:
+    python -m loudness --folder downloads
+"""
+
+import sys
+import argparse
+import logging
+from typing import Optional, Dict, Any
+
+from music_library import get_library
+from audio_analysis import (
+    TrackAnalyzer, NUMPY_AVAILABLE, DEFAULT_WORKERS, decode_audio, register_analyzer, get_analyzer,
+)
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 解碼的取樣率：12 kHz 以上的成分對響度的影響很小，降低取樣率可減少一半的運算量
+SAMPLE_RATE = 24000
+
+# 響度區塊：400 毫秒的區塊，每 100 毫秒一個（75% 重疊）
+SUBBLOCK_SECONDS = 0.1
+SUBBLOCKS_PER_BLOCK = 4
+
+# 一次轉換的子區塊數，限制長歌曲的記憶體用量
+SUBBLOCK_BATCH = 600
+
+# 閘門：絕對閘門 -70 LUFS，相對閘門比第一次平均低 10 LU
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# 無聲的歌曲記為絕對閘門的響度
+SILENCE_LOUDNESS = ABSOLUTE_GATE
+
+# 正規化的目標響度（ReplayGain 2.0 的參考響度）
+TARGET_LOUDNESS = -18.0
+
+# 播放器的音量上限是 1.0，只能降低較大聲的歌曲；較小聲的歌曲以原音量播放
+MAX_GAIN = 1.0
+
+# BS.1770 K 加權濾波器（48 kHz 的係數）：高架濾波器與高通濾波器
+_K_WEIGHTING_RATE = 48000
+_K_WEIGHTING_STAGES = (
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285), (1.0, -1.69065929318241, 0.73248077421585)),
+    ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621)),
+)
+
+
+def k_weighting_power(freqs: 'np.ndarray') -> 'np.ndarray':
+    """K 加權濾波器在各頻率的功率響應 |H(f)|²"""
+    z = np.exp(-2j * np.pi * freqs / _K_WEIGHTING_RATE)
+    response = np.ones_like(z)
+    for b, a in _K_WEIGHTING_STAGES:
+        response *= (b[0] + b[1] * z + b[2] * z ** 2) / (a[0] + a[1] * z + a[2] * z ** 2)
+    return np.abs(response) ** 2
+
+
+def subblock_powers(samples: 'np.ndarray', sample_rate: int = SAMPLE_RATE) -> 'np.ndarray':
+    """
+    計算每個 100 毫秒子區塊的 K 加權均方值（各聲道相加）
+
+    Args:
+        samples: 形狀為 (樣本數,) 或 (樣本數, 聲道數) 的 float32 樣本
+
+    Returns:
+        每個子區塊的功率
+    """
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    size = int(sample_rate * SUBBLOCK_SECONDS)
+    count = len(samples) // size
+    if count == 0:
+        return np.empty(0)
+    # 依 Parseval 定理，加權後的能量等於頻譜功率乘上濾波器的功率響應
+    weights = k_weighting_power(np.fft.rfftfreq(size, 1 / sample_rate))
+    weights[1:(size + 1) // 2] *= 2
+    blocks = samples[:count * size].reshape(count, size, -1)
+    powers = []
+    for start in range(0, count, SUBBLOCK_BATCH):
+        spectrum = np.fft.rfft(blocks[start:start + SUBBLOCK_BATCH], axis=1)
+        energy = np.einsum('bfc,f->b', spectrum.real ** 2 + spectrum.imag ** 2, weights)
+        powers.append(energy / (size * size))
+    return np.concatenate(powers)
+
+
+def _loudness(power) -> 'np.ndarray':
+    return -0.691 + 10 * np.log10(np.maximum(power, 1e-12))
+
+
+def integrated_loudness(samples: 'np.ndarray', sample_rate: int = SAMPLE_RATE) -> float:
+    """計算整合響度（LUFS），經過絕對與相對閘門"""
+    powers = subblock_powers(samples, sample_rate)
+    if len(powers) < SUBBLOCKS_PER_BLOCK:
+        return SILENCE_LOUDNESS
+    # 400 毫秒的區塊功率是相鄰四個子區塊的平均
+    cumulative = np.concatenate([[0.0], np.cumsum(powers)])
+    blocks = (cumulative[SUBBLOCKS_PER_BLOCK:] - cumulative[:-SUBBLOCKS_PER_BLOCK]) / SUBBLOCKS_PER_BLOCK
+    gated = blocks[_loudness(blocks) > ABSOLUTE_GATE]
+    if len(gated) == 0:
+        return SILENCE_LOUDNESS
+    threshold = _loudness(gated.mean()) + RELATIVE_GATE
+    gated = gated[_loudness(gated) > threshold]
+    return float(_loudness(gated.mean()))
+
+
+def compute_loudness(file_path: str) -> Dict[str, float]:
+    """解碼整首歌並計算整合響度與峰值（在背景行程中執行）"""
+    samples = decode_audio(file_path, SAMPLE_RATE, channels=2)
+    peak = float(np.abs(samples).max()) if samples.size else 0.0
+    return {'integrated': integrated_loudness(samples), 'peak': peak}
+
+
+def gain_for(loudness: float, peak: float = 0.0, target: float = TARGET_LOUDNESS) -> float:
+    """
+    把歌曲調整到目標響度的線性增益
+
+    Args:
+        loudness: 整合響度（LUFS）
+        peak: 樣本峰值（1.0 = 滿刻度），增益不會讓峰值超過滿刻度
+        target: 目標響度（LUFS）
+
+    Returns:
+        0 到 MAX_GAIN 之間的增益，直接乘上播放音量
+    """
+    gain = 10 ** ((target - loudness) / 20)
+    if peak > 0:
+        gain = min(gain, 1.0 / peak)
+    return max(0.0, min(gain, MAX_GAIN))
+
+
+@register_analyzer
+class LoudnessIndex(TrackAnalyzer):
+    """存放在音樂庫索引中的響度分析結果"""
+
+    name = "loudness"
+    table = "loudness"
+    schema = """
+    CREATE TABLE IF NOT EXISTS loudness (
+        track_id INTEGER PRIMARY KEY REFERENCES tracks(id) ON DELETE CASCADE,
+        file_size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        integrated REAL,
+        peak REAL
+    );
+    """
+    result_column = "integrated"
+    analyze = staticmethod(compute_loudness)
+
+    def _columns(self, result) -> Dict[str, Any]:
+        if result is None:
+            return {'integrated': None, 'peak': None}
+        return {'integrated': result['integrated'], 'peak': result['peak']}
+
+    def get(self, track_id: int) -> Optional[Dict[str, float]]:
+        """取得歌曲的響度與峰值，尚未分析或檔案已變動時返回 None"""
+        with self.library.transaction() as conn:
+            row = conn.execute(
+                """
+                SELECT l.integrated, l.peak FROM loudness l JOIN tracks t ON t.id = l.track_id
+                WHERE l.track_id = ? AND l.integrated IS NOT NULL
+                  AND l.file_size = t.file_size AND l.mtime = t.mtime
+                """,
+                (track_id,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def gain_for_path(self, file_path, target: float = TARGET_LOUDNESS) -> float:
+        """
+        取得檔案播放時的增益；尚未分析的歌曲以原音量播放並排入背景分析
+
+        Args:
+            file_path: 音訊檔案路徑
+            target: 目標響度（LUFS）
+        """
+        track = self.library.get_by_path(file_path)
+        if track is None:
+            return 1.0
+        result = self.get(track['id'])
+        if result is None:
+            if self.available():
+                self.schedule([track['id']])
+            return 1.0
+        return gain_for(result['integrated'], result['peak'], target)
+
+
+def get_loudness_index(music_folder: str = "downloads") -> LoudnessIndex:
+    """取得音樂資料夾對應的共用響度索引"""
+    return get_analyzer(LoudnessIndex, music_folder)
+
+
+def gain_for_file(file_path, music_folder: str = "downloads") -> float:
+    """取得檔案播放時的增益，缺少 NumPy 時一律為 1.0"""
+    if not NUMPY_AVAILABLE:
+        return 1.0
+    return get_loudness_index(music_folder).gain_for_path(file_path)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="分析音樂庫的響度（EBU R128）")
+    parser.add_argument('--folder', default='downloads', help="音樂資料夾")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="並行分析的行程數量")
+    args = parser.parse_args(argv)
+
+    if not NUMPY_AVAILABLE:
+        print("❌ 需要安裝 NumPy")
+        return 1
+    index = LoudnessIndex(get_library(args.folder), max_workers=args.workers)
+    result = index.update()
+    if not result['success']:
+        print(f"❌ {result['error']}")
+        return 1
+    print(f"🔊 新分析 {result['analyzed']} 首歌曲的響度（{result['failed']} 首失敗）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,756 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+音樂庫索引模組
+以 SQLite 保存音樂資料夾中每首歌曲的資訊，下載完成後直接登記，
+播放器與管理介面可以直接讀取索引，不需要每次重新掃描資料夾
+"""
+
+import os
+import re
+import difflib
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, List, Any
+
+try:
+    from mutagen import File
+    MUTAGEN_AVAILABLE = True
+except ImportError:
+    MUTAGEN_AVAILABLE = False
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 音樂庫收錄的音訊格式
+AUDIO_EXTENSIONS = {'.mp3', '.wav', '.ogg', '.flac', '.m4a', '.aac'}
+
+# 掃描時略過的資料夾：隱藏資料夾（下載暫存區、垃圾桶）之外，另外略過音樂資料夾第一層的舊版垃圾桶；
+# 子資料夾中同名的資料夾（例如名為 trash 的專輯）照常掃描
+EXCLUDED_DIRS = {'trash'}
+
+# 索引資料庫檔名（放在音樂資料夾內）
+LIBRARY_DB_NAME = ".library.db"
+
+DEFAULT_ARTIST = "未知藝術家"
+DEFAULT_ALBUM = "未知專輯"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    album TEXT NOT NULL,
+    duration REAL NOT NULL DEFAULT 0,
+    file_size INTEGER NOT NULL DEFAULT 0,
+    mtime REAL NOT NULL DEFAULT 0,
+    video_id TEXT,
+    added_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tracks_video_id ON tracks(video_id);
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    current_position INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS playlist_items (
+    playlist_id INTEGER NOT NULL REFERENCES playlists(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    track_id INTEGER NOT NULL REFERENCES tracks(id) ON DELETE CASCADE,
+    PRIMARY KEY (playlist_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_playlist_items_track ON playlist_items(track_id);
+CREATE TABLE IF NOT EXISTS trash_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    trash_name TEXT NOT NULL UNIQUE,
+    original_path TEXT NOT NULL,
+    deleted_at REAL NOT NULL,
+    file_size INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_trash_items_deleted_at ON trash_items(deleted_at);
+CREATE TABLE IF NOT EXISTS content_hashes (
+    path TEXT PRIMARY KEY,
+    file_size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    partial_hash TEXT,
+    full_hash TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_content_hashes_full ON content_hashes(full_hash);
+"""
+
+_TRACK_COLUMNS = "id, path, title, artist, album, duration, file_size, mtime, video_id, added_at"
+
+# 全文檢索索引：rowid 與 tracks.id 相同，中日韓文字會先拆成單字再交給 unicode61 斷詞
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+    title, artist, album, filename,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '1 2 3'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts_vocab USING fts5vocab(tracks_fts, 'row');
+"""
+
+# 統計資料：每個維度（all、artist、album、format）的歌曲數、大小與時長，
+# 由觸發器在歌曲新增、更新、移除時累加，查詢統計不需要掃描資料夾或讀取標籤
+_STATS_DIMENSIONS = ('artist', 'album', 'format')
+
+# 取出路徑的副檔名（小寫、不含點），沒有副檔名時為空字串
+_FORMAT_EXPR = (
+    "CASE WHEN instr(replace({path}, rtrim({path}, replace({path}, '.', '')), ''), '/') > 0 "
+    "OR instr({path}, '.') = 0 THEN '' "
+    "ELSE lower(replace({path}, rtrim({path}, replace({path}, '.', '')), '')) END"
+)
+
+
+def _stats_statements(row: str, sign: str) -> str:
+    """產生觸發器內更新統計的語句，row 為 NEW 或 OLD，sign 為 + 或 -"""
+    values = [("'all'", "''"), ("'artist'", f"{row}.artist"), ("'album'", f"{row}.album"),
+              ("'format'", _FORMAT_EXPR.format(path=f"{row}.path"))]
+    return "\n".join(
+        f"""    INSERT INTO library_stats (dimension, value, track_count, total_size, total_duration)
+    VALUES ({dimension}, {value}, {sign}1, {sign}{row}.file_size, {sign}{row}.duration)
+    ON CONFLICT (dimension, value) DO UPDATE SET
+        track_count = track_count + excluded.track_count,
+        total_size = total_size + excluded.total_size,
+        total_duration = total_duration + excluded.total_duration;"""
+        for dimension, value in values
+    )
+
+
+_STATS_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS library_stats (
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    track_count INTEGER NOT NULL DEFAULT 0,
+    total_size INTEGER NOT NULL DEFAULT 0,
+    total_duration REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, value)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS tracks_stats_insert AFTER INSERT ON tracks BEGIN
+{_stats_statements('NEW', '+')}
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_stats_delete AFTER DELETE ON tracks BEGIN
+{_stats_statements('OLD', '-')}
+    DELETE FROM library_stats WHERE track_count <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_stats_update
+AFTER UPDATE OF path, artist, album, file_size, duration ON tracks BEGIN
+{_stats_statements('OLD', '-')}
+{_stats_statements('NEW', '+')}
+    DELETE FROM library_stats WHERE track_count <= 0;
+END;
+"""
+
+# 搜尋排序時各欄位的權重（標題最重要）
+_FTS_WEIGHTS = "10.0, 5.0, 3.0, 1.0"
+
+# 中日韓文字（假名、漢字、韓文）
+_CJK_RE = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af])')
+_WORD_RE = re.compile(r'\w+')
+
+
+def iter_audio_files(folder, extensions=AUDIO_EXTENSIONS):
+    """
+    走訪資料夾中的音訊檔案
+
+    略過隱藏資料夾與第一層的 EXCLUDED_DIRS，不會進入這些資料夾，垃圾桶再大也不影響掃描時間
+
+    Args:
+        folder: 要掃描的資料夾（音樂資料夾的根目錄）
+        extensions: 收錄的副檔名（小寫，含點）
+    """
+    top_level = True
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [d for d in dirs if not d.startswith('.') and not (top_level and d in EXCLUDED_DIRS)]
+        top_level = False
+        for name in files:
+            if os.path.splitext(name)[1].lower() in extensions:
+                yield Path(root) / name
+
+
+def split_cjk(text: str) -> str:
+    """在每個中日韓字元前後加上空白，讓 unicode61 斷詞器把它們視為獨立的詞"""
+    return _CJK_RE.sub(r' \1 ', text)
+
+
+def search_terms(query: str) -> List[List[str]]:
+    """
+    將搜尋字串拆成詞組
+
+    連續的中日韓文字成為一組（需要相鄰出現），其他文字每個詞各自一組
+
+    Returns:
+        詞組列表，例如 "周杰倫 live" → [["周", "杰", "倫"], ["live"]]
+    """
+    groups = []
+    for word in _WORD_RE.findall(query.lower()):
+        cjk_run = []
+        for token in split_cjk(word).split():
+            if _CJK_RE.fullmatch(token):
+                cjk_run.append(token)
+                continue
+            if cjk_run:
+                groups.append(cjk_run)
+                cjk_run = []
+            groups.append([token])
+        if cjk_run:
+            groups.append(cjk_run)
+    return groups
+
+
+def read_audio_metadata(file_path: Path) -> Dict[str, Any]:
+    """
+    讀取音訊檔案的標籤與時長
+
+    同時支援 ID3 標籤（TIT2/TPE1/TALB）與 mutagen 的通用標籤（title/artist/album）
+
+    Args:
+        file_path: 音訊檔案路徑
+
+    Returns:
+        包含 title、artist、album、duration 的字典
+    """
+    info = {
+        'title': file_path.stem,
+        'artist': DEFAULT_ARTIST,
+        'album': DEFAULT_ALBUM,
+        'duration': 0.0,
+    }
+    if not MUTAGEN_AVAILABLE:
+        return info
+
+    try:
+        audio = File(str(file_path))
+    except Exception as e:
+        logging.debug(f"無法讀取音訊標籤 {file_path}: {e}")
+        return info
+    if audio is None:
+        return info
+
+    if getattr(audio, 'info', None) is not None and hasattr(audio.info, 'length'):
+        info['duration'] = float(audio.info.length or 0.0)
+
+    tags = getattr(audio, 'tags', None)
+    if tags:
+        for field, keys in (('title', ('TIT2', 'title', '\xa9nam')),
+                            ('artist', ('TPE1', 'artist', '\xa9ART')),
+                            ('album', ('TALB', 'album', '\xa9alb'))):
+            for key in keys:
+                try:
+                    if key in tags and tags[key]:
+                        info[field] = str(tags[key][0])
+                        break
+                except (KeyError, ValueError, TypeError):
+                    continue
+    return info
+
+
+class MusicLibrary:
+    """音樂庫索引，執行緒安全，可同時被下載器與播放器共用"""
+
+    def __init__(self, music_folder: str = "downloads", db_path: Optional[str] = None):
+        """
+        初始化音樂庫索引
+
+        Args:
+            music_folder: 音樂檔案資料夾路徑
+            db_path: 索引資料庫路徑，預設為音樂資料夾內的 .library.db
+        """
+        self.music_folder = Path(music_folder)
+        self.music_folder.mkdir(exist_ok=True)
+        self.db_path = Path(db_path) if db_path else self.music_folder / LIBRARY_DB_NAME
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # 歌曲被移除時，播放清單中的對應項目一併刪除
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(_SCHEMA)
+            self._init_fts()
+            self._init_stats()
+            self._conn.commit()
+
+    def _init_stats(self):
+        """建立統計資料表與觸發器，舊版索引（或統計與歌曲數不一致時）重新計算一次"""
+        self._conn.executescript(_STATS_SCHEMA)
+        row = self._conn.execute(
+            "SELECT track_count FROM library_stats WHERE dimension = 'all' AND value = ''"
+        ).fetchone()
+        track_count = self._conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+        if (row['track_count'] if row else 0) != track_count:
+            self._rebuild_stats()
+
+    def _rebuild_stats(self):
+        """從歌曲資料重新計算所有統計（呼叫者需持有鎖）"""
+        self._conn.execute("DELETE FROM library_stats")
+        columns = {'all': "''", 'artist': 'artist', 'album': 'album', 'format': _FORMAT_EXPR.format(path='path')}
+        for dimension, expr in columns.items():
+            self._conn.execute(
+                f"""
+                INSERT INTO library_stats (dimension, value, track_count, total_size, total_duration)
+                SELECT '{dimension}', {expr} AS value, COUNT(*), SUM(file_size), SUM(duration)
+                FROM tracks GROUP BY value
+                """
+            )
+        logging.info("已重新計算音樂庫統計")
+
+    def _init_fts(self):
+        """建立全文檢索索引，SQLite 沒有 FTS5 時改用 LIKE 搜尋"""
+        try:
+            self._conn.executescript(_FTS_SCHEMA)
+            # 設定預設排序使用加權的 bm25，ORDER BY rank 時直接在索引內計算
+            self._conn.execute(f"INSERT INTO tracks_fts (tracks_fts, rank) VALUES ('rank', 'bm25({_FTS_WEIGHTS})')")
+            self.fts_available = True
+        except sqlite3.OperationalError as e:
+            logging.warning(f"SQLite 不支援 FTS5，搜尋將使用較慢的方式: {e}")
+            self.fts_available = False
+            return
+        # 舊版索引沒有全文檢索資料時補建
+        fts_count = self._conn.execute("SELECT COUNT(*) FROM tracks_fts").fetchone()[0]
+        track_count = self._conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+        if fts_count != track_count:
+            self._conn.execute("DELETE FROM tracks_fts")
+            rows = self._conn.execute("SELECT id, path, title, artist, album FROM tracks").fetchall()
+            for row in rows:
+                self._index_track(row['id'], row['path'], row['title'], row['artist'], row['album'])
+            logging.info(f"已建立 {len(rows)} 首歌曲的搜尋索引")
+
+    def _index_track(self, track_id: int, key: str, title: str, artist: str, album: str):
+        """更新單一歌曲的全文檢索資料（呼叫者需持有鎖）"""
+        if not self.fts_available:
+            return
+        self._conn.execute("DELETE FROM tracks_fts WHERE rowid = ?", (track_id,))
+        self._conn.execute(
+            "INSERT INTO tracks_fts (rowid, title, artist, album, filename) VALUES (?, ?, ?, ?, ?)",
+            (track_id, split_cjk(title), split_cjk(artist), split_cjk(album), split_cjk(Path(key).stem)),
+        )
+
+    def _unindex_keys(self, keys: List[str]):
+        """移除歌曲的全文檢索資料（呼叫者需持有鎖，且在刪除 tracks 之前呼叫）"""
+        if not self.fts_available or not keys:
+            return
+        self._conn.executemany(
+            "DELETE FROM tracks_fts WHERE rowid = (SELECT id FROM tracks WHERE path = ?)", [(key,) for key in keys]
+        )
+
+    # --- 路徑轉換 ---
+
+    def _relative_key(self, file_path) -> str:
+        """將檔案路徑轉為相對於音樂資料夾的索引鍵"""
+        path = Path(file_path)
+        try:
+            return path.resolve().relative_to(self.music_folder.resolve()).as_posix()
+        except ValueError:
+            return path.resolve().as_posix()
+
+    def _row_to_track(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """將資料列轉為歌曲資訊字典"""
+        track = dict(row)
+        rel = Path(track.pop('path'))
+        track['file_path'] = str(rel if rel.is_absolute() else self.music_folder / rel)
+        return track
+
+    # --- 登記與移除 ---
+
+    def add_file(self, file_path, video_id: Optional[str] = None) -> Optional[int]:
+        """
+        將檔案登記到音樂庫（已存在則更新）
+
+        Args:
+            file_path: 音訊檔案路徑
+            video_id: 來源 YouTube 影片 ID
+
+        Returns:
+            歌曲 ID，非音訊檔案或讀取失敗時返回 None
+        """
+        path = Path(file_path)
+        if path.suffix.lower() not in AUDIO_EXTENSIONS:
+            return None
+        try:
+            stat = path.stat()
+        except OSError as e:
+            logging.error(f"無法登記到音樂庫 {path}: {e}")
+            return None
+
+        meta = read_audio_metadata(path)
+        key = self._relative_key(path)
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO tracks (path, title, artist, album, duration, file_size, mtime, video_id, added_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    title = excluded.title,
+                    artist = excluded.artist,
+                    album = excluded.album,
+                    duration = excluded.duration,
+                    file_size = excluded.file_size,
+                    mtime = excluded.mtime,
+                    video_id = COALESCE(excluded.video_id, tracks.video_id)
+                """,
+                (key, meta['title'], meta['artist'], meta['album'], meta['duration'],
+                 stat.st_size, stat.st_mtime, video_id, time.time()),
+            )
+            row = self._conn.execute("SELECT id FROM tracks WHERE path = ?", (key,)).fetchone()
+            if row:
+                self._index_track(row['id'], key, meta['title'], meta['artist'], meta['album'])
+            self._conn.commit()
+        logging.info(f"已登記到音樂庫: {path.name}")
+        return row['id'] if row else None
+
+    def remove_file(self, file_path) -> bool:
+        """
+        從音樂庫移除檔案（不會刪除實體檔案）
+
+        Returns:
+            是否有資料被移除
+        """
+        key = self._relative_key(file_path)
+        with self._lock:
+            self._unindex_keys([key])
+            cursor = self._conn.execute("DELETE FROM tracks WHERE path = ?", (key,))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def remove_files(self, file_paths) -> int:
+        """
+        一次從音樂庫移除多個檔案（單一交易，不會刪除實體檔案）
+
+        Returns:
+            被移除的歌曲數量
+        """
+        keys = [self._relative_key(path) for path in file_paths]
+        if not keys:
+            return 0
+        with self._lock:
+            self._unindex_keys(keys)
+            removed = self._conn.total_changes
+            self._conn.executemany("DELETE FROM tracks WHERE path = ?", [(key,) for key in keys])
+            removed = self._conn.total_changes - removed
+            self._conn.commit()
+        return removed
+
+    # --- 查詢 ---
+
+    def get_track(self, track_id: int) -> Optional[Dict[str, Any]]:
+        """依 ID 取得歌曲資訊"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_TRACK_COLUMNS} FROM tracks WHERE id = ?", (track_id,)
+            ).fetchone()
+        return self._row_to_track(row) if row else None
+
+    def get_by_path(self, file_path) -> Optional[Dict[str, Any]]:
+        """依檔案路徑取得歌曲資訊"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_TRACK_COLUMNS} FROM tracks WHERE path = ?", (self._relative_key(file_path),)
+            ).fetchone()
+        return self._row_to_track(row) if row else None
+
+    def get_tracks(self, track_ids: List[int]) -> List[Dict[str, Any]]:
+        """依 ID 批次取得歌曲資訊，保持傳入的順序並略過已不存在的歌曲"""
+        found = {}
+        unique_ids = list(dict.fromkeys(track_ids))
+        with self._lock:
+            # SQLite 單一查詢的參數數量有上限，分批查詢
+            for start in range(0, len(unique_ids), 500):
+                chunk = unique_ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT {_TRACK_COLUMNS} FROM tracks WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for row in rows:
+                    found[row['id']] = row
+        return [self._row_to_track(found[track_id]) for track_id in track_ids if track_id in found]
+
+    def get_by_paths(self, file_paths) -> List[Optional[Dict[str, Any]]]:
+        """依檔案路徑批次取得歌曲資訊，結果與傳入的順序對應，未登記的檔案為 None"""
+        keys = [self._relative_key(path) for path in file_paths]
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT {_TRACK_COLUMNS} FROM tracks WHERE path IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for row in rows:
+                    found[row['path']] = row
+        return [self._row_to_track(found[key]) if key in found else None for key in keys]
+
+    def ids_for_paths(self, file_paths) -> List[Optional[int]]:
+        """將檔案路徑列表轉為歌曲 ID 列表，未登記的檔案為 None"""
+        with self._lock:
+            ids = {row['path']: row['id'] for row in self._conn.execute("SELECT id, path FROM tracks")}
+        return [ids.get(self._relative_key(path)) for path in file_paths]
+
+    def tracks(self) -> List[Dict[str, Any]]:
+        """取得所有歌曲，依檔案名稱排序"""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {_TRACK_COLUMNS} FROM tracks").fetchall()
+        tracks = [self._row_to_track(row) for row in rows]
+        tracks.sort(key=lambda t: Path(t['file_path']).name.lower())
+        return tracks
+
+    # --- 搜尋 ---
+
+    def search(self, query: str, limit: int = 50, strict: bool = False) -> List[Dict[str, Any]]:
+        """
+        搜尋標題、藝術家、專輯與檔名
+
+        先做精確搜尋（最後一個詞可以只輸入開頭）；沒有結果時放寬條件：
+        中文不要求相鄰、英文詞以拼字相近的詞代替，最後再改為符合任一詞即可
+
+        Args:
+            query: 搜尋字串
+            limit: 最多返回的數量
+            strict: 只返回精確結果，不放寬條件（用於批次選取檔案）
+
+        Returns:
+            歌曲資訊列表，依相關程度排序，每筆包含 match（"exact" 或 "fuzzy"）
+        """
+        groups = search_terms(query)
+        if not groups:
+            return []
+        if not self.fts_available:
+            return self._search_like(groups, limit)
+
+        exact = " ".join(self._fts_group(group) for group in groups)
+        results = self._search_fts(exact, limit)
+        if results or strict:
+            return [dict(track, match="exact") for track in results]
+
+        relaxed_groups = []
+        for group in groups:
+            if len(group) > 1:
+                relaxed_groups.append(" ".join(f'"{char}"' for char in group))
+            else:
+                similar = self._similar_terms(group[0])
+                relaxed_groups.append("(" + " OR ".join(f'"{term}"' for term in similar) + ")")
+        for fts_query in (" ".join(relaxed_groups), " OR ".join(relaxed_groups)):
+            results = self._search_fts(fts_query, limit)
+            if results:
+                return [dict(track, match="fuzzy") for track in results]
+        return []
+
+    @staticmethod
+    def _fts_group(group: List[str]) -> str:
+        """將詞組轉為 FTS5 查詢：中文為相鄰片語，英文詞允許前綴比對"""
+        if len(group) > 1:
+            return '"' + " ".join(group) + '"'
+        return f'"{group[0]}"*'
+
+    def _similar_terms(self, term: str, max_terms: int = 5) -> List[str]:
+        """從索引的詞彙表找出拼字相近的詞（包含以它開頭的詞）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT term FROM tracks_fts_vocab WHERE term >= ? AND term < ? ORDER BY doc DESC",
+                (term[:1], term[:1] + '\uffff'),
+            ).fetchall()
+        vocab = [row['term'] for row in rows]
+        similar = [word for word in vocab if word.startswith(term)][:max_terms]
+        similar += difflib.get_close_matches(term, vocab, n=max_terms, cutoff=0.7)
+        return list(dict.fromkeys([term] + similar))
+
+    def _search_fts(self, fts_query: str, limit: int) -> List[Dict[str, Any]]:
+        columns = ", ".join(f"t.{column}" for column in _TRACK_COLUMNS.split(", "))
+        with self._lock:
+            try:
+                # 先在全文檢索索引內排序取前幾筆，再與歌曲資料合併
+                rows = self._conn.execute(
+                    f"""
+                    SELECT {columns} FROM (
+                        SELECT rowid, rank FROM tracks_fts WHERE tracks_fts MATCH ? ORDER BY rank LIMIT ?
+                    ) AS hits
+                    JOIN tracks t ON t.id = hits.rowid
+                    ORDER BY hits.rank
+                    """,
+                    (fts_query, limit),
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                logging.debug(f"搜尋語法錯誤 {fts_query}: {e}")
+                return []
+        return [self._row_to_track(row) for row in rows]
+
+    def _search_like(self, groups: List[List[str]], limit: int) -> List[Dict[str, Any]]:
+        """沒有 FTS5 時的備用搜尋：每個詞組都要出現在任一欄位"""
+        conditions, params = [], []
+        for group in groups:
+            pattern = f"%{''.join(group)}%"
+            conditions.append("(title LIKE ? OR artist LIKE ? OR album LIKE ? OR path LIKE ?)")
+            params.extend([pattern] * 4)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_TRACK_COLUMNS} FROM tracks WHERE {' AND '.join(conditions)} LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        return [dict(self._row_to_track(row), match="exact") for row in rows]
+
+    def has_video(self, video_id: str) -> bool:
+        """檢查某個 YouTube 影片是否已下載過"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM tracks WHERE video_id = ? LIMIT 1", (video_id,)
+            ).fetchone()
+        return row is not None
+
+    def video_ids(self) -> set:
+        """取得所有已下載的 YouTube 影片 ID"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT video_id FROM tracks WHERE video_id IS NOT NULL"
+            ).fetchall()
+        return {row['video_id'] for row in rows}
+
+    # --- 統計 ---
+
+    def stats(self, top: int = 10, refresh: bool = False) -> Dict[str, Any]:
+        """
+        取得音樂庫統計（讀取觸發器維護的累計值，成本與音樂庫大小無關）
+
+        Args:
+            top: 每個分類最多列出的項目數
+            refresh: 先增量同步資料夾，讓從未掃描過或在應用程式外變動的資料夾也反映實際內容
+                    （檔案沒有變動時只比對大小與修改時間）
+
+        Returns:
+            包含 total_tracks、total_size、total_duration，
+            以及 artists、albums、formats（依歌曲數排序的分類統計）的字典
+        """
+        if refresh:
+            self.sync()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT track_count, total_size, total_duration FROM library_stats "
+                "WHERE dimension = 'all' AND value = ''"
+            ).fetchone()
+        result = {
+            'total_tracks': row['track_count'] if row else 0,
+            'total_size': row['total_size'] if row else 0,
+            'total_duration': row['total_duration'] if row else 0.0,
+        }
+        for dimension in _STATS_DIMENSIONS:
+            result[dimension + 's'] = self.stats_breakdown(dimension, top)
+        return result
+
+    def stats_breakdown(self, dimension: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        取得單一分類的統計
+
+        Args:
+            dimension: artist、album 或 format
+            limit: 最多返回的項目數，-1 表示全部
+
+        Returns:
+            依歌曲數排序的列表，每筆包含 value、track_count、total_size、total_duration
+        """
+        if dimension not in _STATS_DIMENSIONS:
+            raise ValueError(f"未知的統計分類: {dimension}")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT value, track_count, total_size, total_duration FROM library_stats "
+                "WHERE dimension = ? ORDER BY track_count DESC, value LIMIT ?",
+                (dimension, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    # --- 同步 ---
+
+    def sync(self) -> Dict[str, int]:
+        """
+        增量同步音樂資料夾與索引
+
+        只重新讀取大小或修改時間有變動的檔案，並移除已不存在的項目
+
+        Returns:
+            新增、更新、移除的數量
+        """
+        with self._lock:
+            known = {
+                row['path']: (row['file_size'], row['mtime'])
+                for row in self._conn.execute("SELECT path, file_size, mtime FROM tracks")
+            }
+
+        added = updated = 0
+        seen = set()
+        for file_path in iter_audio_files(self.music_folder):
+            key = self._relative_key(file_path)
+            seen.add(key)
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
+            if key not in known:
+                if self.add_file(file_path) is not None:
+                    added += 1
+            elif known[key] != (stat.st_size, stat.st_mtime):
+                if self.add_file(file_path) is not None:
+                    updated += 1
+
+        missing = [key for key in known if key not in seen]
+        if missing:
+            with self._lock:
+                self._unindex_keys(missing)
+                self._conn.executemany("DELETE FROM tracks WHERE path = ?", [(key,) for key in missing])
+                self._conn.commit()
+
+        logging.info(f"音樂庫同步完成: 新增 {added}、更新 {updated}、移除 {len(missing)}")
+        return {'added': added, 'updated': updated, 'removed': len(missing)}
+
+    @contextmanager
+    def transaction(self):
+        """
+        取得資料庫連線並在同一把鎖內執行交易，讓其他模組（如播放清單）共用同一個索引
+
+        區塊正常結束時提交，發生例外時回復
+        """
+        with self._lock:
+            try:
+                yield self._conn
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def close(self):
+        """關閉索引資料庫"""
+        with self._lock:
+            self._conn.close()
+
+
+_libraries: Dict[str, MusicLibrary] = {}
+_libraries_lock = threading.Lock()
+
+
+def get_library(music_folder: str = "downloads") -> MusicLibrary:
+    """
+    取得音樂資料夾對應的共用音樂庫實例
+
+    同一個行程中的下載器、播放器與管理介面共用同一個索引
+
+    Args:
+        music_folder: 音樂檔案資料夾路徑
+
+    Returns:
+        音樂庫實例
+    """
+    key = str(Path(music_folder).resolve())
+    with _libraries_lock:
+        library = _libraries.get(key)
+        if library is None:
+            library = MusicLibrary(music_folder)
+            _libraries[key] = library
+        return library
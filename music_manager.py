@@ -8,10 +8,18 @@
 import streamlit as st
 from pathlib import Path
 import os
-import shutil
 from mutagen import File
 import time
 
+from music_library import get_library, iter_audio_files
+from playlist_pager import render_pager, visible_track_info
+from selection import Selection
+from file_operations import batch_delete, batch_move_to_trash
+from trash_bin import get_trash_bin
+from dedup import get_duplicate_finder
+from audio_analysis import analysis_available
+from fingerprint import get_fingerprint_index, removable_copies
+
 # 導入密碼驗證模組
 try:
     from password_auth import (
@@ -32,11 +40,8 @@ def scan_music_folder():
         return []
     
     music_extensions = {'.mp3', '.wav', '.ogg', '.flac', '.m4a', '.aac', '.webm'}
-    music_files = []
-    
-    for file_path in downloads_dir.rglob("*"):
-        if file_path.is_file() and file_path.suffix.lower() in music_extensions:
-            music_files.append(file_path)
+    # 略過垃圾桶與下載暫存區等隱藏資料夾
+    music_files = list(iter_audio_files(downloads_dir, music_extensions))
     
     return sorted(music_files, key=lambda x: x.name)
 
@@ -114,56 +119,95 @@ def format_file_size(size_bytes: int) -> str:
     return f"{size_bytes:.1f} {size_names[i]}"
 
 def delete_file(file_path):
-    """刪除檔案"""
-    try:
-        file_path.unlink()
+    """刪除檔案（並從音樂庫索引移除）"""
+    result = batch_delete([file_path])['results'][0]
+    if result['success']:
         return True, f"成功刪除: {file_path.name}"
-    except Exception as e:
-        return False, f"刪除失敗: {e}"
+    return False, f"刪除失敗: {result['error']}"
 
 def move_to_trash(file_path):
-    """移動檔案到垃圾桶"""
-    try:
-        trash_dir = Path("downloads/trash")
-        trash_dir.mkdir(exist_ok=True)
-        
-        new_path = trash_dir / file_path.name
-        # 如果檔案已存在，添加時間戳
-        if new_path.exists():
-            timestamp = int(time.time())
-            new_path = trash_dir / f"{file_path.stem}_{timestamp}{file_path.suffix}"
-        
-        shutil.move(str(file_path), str(new_path))
+    """移動檔案到垃圾桶（並從音樂庫索引移除）"""
+    result = batch_move_to_trash([file_path])['results'][0]
+    if result['success']:
         return True, f"已移動到垃圾桶: {file_path.name}"
-    except Exception as e:
-        return False, f"移動失敗: {e}"
+    return False, f"移動失敗: {result['error']}"
 
 def clean_trash():
     """清空垃圾桶"""
     try:
-        trash_dir = Path("downloads/trash")
-        if trash_dir.exists():
-            shutil.rmtree(trash_dir)
-            trash_dir.mkdir(exist_ok=True)
-        return True, "垃圾桶已清空"
+        result = get_trash_bin("downloads").empty()
+        return True, f"垃圾桶已清空（{result['removed']} 個檔案，釋放 {format_file_size(result['freed'])}）"
     except Exception as e:
         return False, f"清空垃圾桶失敗: {e}"
 
+def add_music_file(file_path, track_id):
+    """把還原的檔案加回列表（依檔名排序），不重新掃描資料夾"""
+    key = track_id if track_id is not None else str(file_path)
+    entries = sorted(
+        zip(st.session_state.music_files + [Path(file_path)], st.session_state.music_file_keys + [key]),
+        key=lambda entry: entry[0].name
+    )
+    st.session_state.music_files = [path for path, _ in entries]
+    st.session_state.music_file_keys = [key for _, key in entries]
+
 def get_folder_stats():
-    """獲取資料夾統計資訊"""
-    downloads_dir = Path("downloads")
-    if not downloads_dir.exists():
-        return {"total_files": 0, "total_size": 0, "total_duration": 0}
-    
+    """獲取資料夾統計資訊（先增量同步音樂庫，只重新讀取有變動的檔案，再讀取累計的統計）"""
+    stats = get_library("downloads").stats(top=5, refresh=True)
+    stats["total_files"] = stats["total_tracks"]
+    return stats
+
+def refresh_music_files():
+    """重新掃描音樂資料夾，並以音樂庫歌曲 ID 作為選取的鍵值（無法登記的檔案使用路徑）"""
     music_files = scan_music_folder()
-    total_size = sum(f.stat().st_size for f in music_files)
-    total_duration = sum(get_audio_file_info(f)['duration'] for f in music_files)
-    
-    return {
-        "total_files": len(music_files),
-        "total_size": total_size,
-        "total_duration": total_duration
-    }
+    library = get_library("downloads")
+    library.sync()
+    track_ids = library.ids_for_paths(music_files)
+    keys = [track_id if track_id is not None else str(path) for path, track_id in zip(music_files, track_ids)]
+    st.session_state.music_files = music_files
+    st.session_state.music_file_keys = keys
+    st.session_state.selected_files.retain(set(keys))
+    return music_files
+
+def apply_file_report(report, action):
+    """依批次操作結果直接從列表與選取中移除處理完成的檔案，不重新掃描資料夾"""
+    done = {result['file_path'] for result in report['results'] if result['success']}
+    if done:
+        kept = [(path, key) for path, key in zip(st.session_state.music_files, st.session_state.music_file_keys)
+                if str(path) not in done]
+        st.session_state.music_files = [path for path, _ in kept]
+        st.session_state.music_file_keys = [key for _, key in kept]
+        st.session_state.selected_files.retain(set(st.session_state.music_file_keys))
+    report['action'] = action
+    st.session_state.last_file_report = report
+
+def show_file_report():
+    """顯示上一次批次操作的結果"""
+    report = st.session_state.pop('last_file_report', None)
+    if not report:
+        return
+    if report['succeeded']:
+        st.success(f"✅ 成功{report['action']} {report['succeeded']} 個檔案")
+    if report['failed']:
+        st.error(f"❌ {report['failed']} 個檔案{report['action']}失敗")
+        with st.expander("查看失敗的檔案"):
+            for result in report['results']:
+                if not result['success']:
+                    st.write(f"**{Path(result['file_path']).name}**: {result['error']}")
+
+def selected_music_files():
+    """依列表順序取得已選取的檔案"""
+    selection = st.session_state.selected_files
+    return [path for path, key in zip(st.session_state.music_files, st.session_state.music_file_keys)
+            if key in selection]
+
+def on_file_checkbox(key, widget_key):
+    """勾選框變更：範圍選取模式下從上一次勾選的檔案一路選到這個檔案"""
+    selection = st.session_state.selected_files
+    checked = st.session_state[widget_key]
+    if checked and st.session_state.get('range_select_mgr'):
+        selection.extend_to(st.session_state.music_file_keys, key)
+    else:
+        selection.set(key, checked)
 
 def main():
     # 密碼驗證檢查
@@ -200,26 +244,117 @@ def main():
     # 初始化 session state
     if 'music_files' not in st.session_state:
         st.session_state.music_files = []
+    if 'music_file_keys' not in st.session_state:
+        st.session_state.music_file_keys = []
     if 'selected_files' not in st.session_state:
-        st.session_state.selected_files = []
+        st.session_state.selected_files = Selection()
     
     # 側邊欄：統計資訊
     with st.sidebar:
         st.header("📊 統計資訊")
         
-        if st.button("🔄 重新整理統計", type="primary", use_container_width=True):
-            stats = get_folder_stats()
-            st.session_state.stats = stats
+        # 每個工作階段第一次顯示時就同步一次，不必先掃描音樂檔案
+        if st.button("🔄 重新整理統計", type="primary", use_container_width=True) or 'stats' not in st.session_state:
+            st.session_state.stats = get_folder_stats()
         
         if 'stats' in st.session_state:
             stats = st.session_state.stats
             st.metric("總檔案數", stats["total_files"])
             st.metric("總大小", format_file_size(stats["total_size"]))
             st.metric("總時長", format_time(stats["total_duration"]))
+            
+            with st.expander("📂 分類統計"):
+                for title, key in (("格式", "formats"), ("藝術家", "artists"), ("專輯", "albums")):
+                    st.markdown(f"**{title}**")
+                    for entry in stats[key]:
+                        st.caption(f"{entry['value'] or '（無）'}: {entry['track_count']} 首 • "
+                                   f"{format_file_size(entry['total_size'])} • {format_time(entry['total_duration'])}")
+        
+        st.markdown("---")
+        st.header("🧬 重複檔案")
+        
+        if st.button("🔍 尋找重複檔案", use_container_width=True):
+            with st.spinner("正在比對檔案內容..."):
+                st.session_state.duplicate_groups = get_duplicate_finder("downloads").find_duplicates()
+        
+        groups = st.session_state.get('duplicate_groups')
+        if groups is not None:
+            if not groups:
+                st.success("✅ 沒有內容重複的檔案")
+            else:
+                wasted = sum(group[0].stat().st_size * (len(group) - 1) for group in groups if group[0].exists())
+                st.warning(f"找到 {len(groups)} 組重複檔案，可釋放 {format_file_size(wasted)}")
+                with st.expander("查看重複檔案"):
+                    for group in groups:
+                        st.write(f"**{group[0].name}**")
+                        for path in group[1:]:
+                            st.caption(f"↳ {path.name}")
+                mode = st.radio(
+                    "處理方式", ("trash", "hardlink"), key="dedup_mode",
+                    format_func=lambda m: {"trash": "移到垃圾桶", "hardlink": "換成硬連結（保留檔名）"}[m]
+                )
+                if st.button("🧹 釋放空間", use_container_width=True):
+                    result = get_duplicate_finder("downloads").reclaim(groups, mode)
+                    st.session_state.duplicate_groups = None
+                    if mode == "trash":
+                        apply_file_report({"succeeded": result['processed'], "failed": result['failed'],
+                                           "results": result['results']}, "移動到垃圾桶")
+                    st.success(f"✅ 已釋放 {format_file_size(result['reclaimed'])}")
+        
+        st.markdown("---")
+        st.header("🎼 相似錄音")
+        
+        if not analysis_available():
+            st.info("需要安裝 NumPy 與 FFmpeg 才能比對錄音內容")
+        else:
+            index = get_fingerprint_index("downloads")
+            coverage = index.coverage()
+            st.caption(f"已計算指紋 {coverage['analyzed']} 首，尚未計算 {coverage['pending']} 首，"
+                       f"無法解碼 {coverage['failed']} 首")
+            if index.is_running:
+                st.info("⏳ 正在背景計算指紋...")
+            elif coverage['pending'] and st.button("🎼 計算指紋", use_container_width=True):
+                index.schedule()
+                st.rerun()
+            
+            if st.button("🔍 尋找相似錄音", use_container_width=True):
+                with st.spinner("正在比對指紋..."):
+                    st.session_state.similar_groups = index.find_near_duplicates()
+            
+            similar_groups = st.session_state.get('similar_groups')
+            if similar_groups is not None:
+                if not similar_groups:
+                    st.success("✅ 沒有相似的錄音")
+                else:
+                    st.warning(f"找到 {len(similar_groups)} 組相似的錄音")
+                    # 指紋相似不代表是同一首歌，每一組都要由使用者勾選確認後才移除
+                    selected = []
+                    with st.expander("查看相似錄音", expanded=True):
+                        for group in similar_groups:
+                            extras = removable_copies(group)
+                            st.write(f"**{Path(group[0]['file_path']).name}** ({format_file_size(group[0]['file_size'])})")
+                            for track in group[1:]:
+                                note = "" if track in extras else "（與保留的版本是同一個檔案，不會移除）"
+                                st.caption(f"↳ {Path(track['file_path']).name} ({format_file_size(track['file_size'])}){note}")
+                            if extras and st.checkbox(f"移除這組的 {len(extras)} 個其他版本",
+                                                      key=f"similar_group_{group[0]['id']}"):
+                                selected.append(extras)
+                    paths = [track['file_path'] for extras in selected for track in extras]
+                    if st.button(f"🧹 只保留最大的版本（已選 {len(selected)} 組）", use_container_width=True,
+                                 disabled=not paths):
+                        report = batch_move_to_trash(paths)
+                        st.session_state.similar_groups = None
+                        apply_file_report(report, "移動到垃圾桶")
+                        st.rerun()
         
         st.markdown("---")
         st.header("🗑️ 垃圾桶管理")
         
+        trash = get_trash_bin("downloads")
+        st.metric("垃圾桶大小", format_file_size(trash.total_size()))
+        st.caption(f"共 {len(trash)} 個檔案；超過 {trash.max_age_days} 天或總大小超過 {format_file_size(trash.max_bytes)} 時，"
+                   f"會自動從最舊的檔案開始永久刪除")
+        
         if st.button("🗑️ 清空垃圾桶", use_container_width=True):
             success, message = clean_trash()
             if success:
@@ -233,8 +368,7 @@ def main():
     with col1:
         st.subheader("📁 掃描音樂資料夾")
         if st.button("🔍 掃描音樂檔案", type="primary", use_container_width=True):
-            music_files = scan_music_folder()
-            st.session_state.music_files = music_files
+            music_files = refresh_music_files()
             st.success(f"✅ 掃描完成，找到 {len(music_files)} 個音樂檔案")
     
     with col2:
@@ -244,16 +378,8 @@ def main():
             with col2a:
                 if st.button("🗑️ 刪除選中檔案", use_container_width=True):
                     if st.session_state.selected_files:
-                        deleted_count = 0
-                        for file_path in st.session_state.selected_files:
-                            success, message = delete_file(file_path)
-                            if success:
-                                deleted_count += 1
-                        st.success(f"✅ 成功刪除 {deleted_count} 個檔案")
-                        # 重新掃描
-                        music_files = scan_music_folder()
-                        st.session_state.music_files = music_files
-                        st.session_state.selected_files = []
+                        with st.spinner("正在刪除檔案..."):
+                            apply_file_report(batch_delete(selected_music_files()), "刪除")
                         st.rerun()
                     else:
                         st.warning("請先選擇要刪除的檔案")
@@ -261,138 +387,148 @@ def main():
             with col2b:
                 if st.button("📦 移動到垃圾桶", use_container_width=True):
                     if st.session_state.selected_files:
-                        moved_count = 0
-                        for file_path in st.session_state.selected_files:
-                            success, message = move_to_trash(file_path)
-                            if success:
-                                moved_count += 1
-                        st.success(f"✅ 成功移動 {moved_count} 個檔案到垃圾桶")
-                        # 重新掃描
-                        music_files = scan_music_folder()
-                        st.session_state.music_files = music_files
-                        st.session_state.selected_files = []
+                        with st.spinner("正在移動檔案..."):
+                            apply_file_report(batch_move_to_trash(selected_music_files()), "移動到垃圾桶")
                         st.rerun()
                     else:
                         st.warning("請先選擇要移動的檔案")
+        
+        show_file_report()
     
     # 顯示音樂檔案列表
     if st.session_state.music_files:
         st.markdown("---")
         st.subheader("📋 音樂檔案列表")
         
-        # 全選/取消全選
+        # 批次選取：全選、取消全選、反向選取、範圍與依條件選取都是一次集合運算
+        selection = st.session_state.selected_files
+        keys = st.session_state.music_file_keys
         col_select, col_info = st.columns([1, 3])
         with col_select:
             if st.button("全選", key="select_all_mgr"):
-                st.session_state.selected_files = st.session_state.music_files.copy()
+                selection.select_all(keys)
                 st.rerun()
             if st.button("取消全選", key="deselect_all_mgr"):
-                st.session_state.selected_files = []
+                selection.clear()
+                st.rerun()
+            if st.button("反向選取", key="invert_select_mgr"):
+                selection.invert(keys)
                 st.rerun()
         
         with col_info:
-            if st.session_state.selected_files:
-                st.info(f"已選擇 {len(st.session_state.selected_files)} 個檔案")
+            if selection:
+                st.info(f"已選擇 {len(selection)} 個檔案")
+            st.checkbox("範圍選取（勾選時從上一次勾選的檔案一路選到此檔案）", key="range_select_mgr")
+        
+        with st.expander("🎯 進階選取"):
+            col_from, col_to, col_range = st.columns([1, 1, 1])
+            with col_from:
+                range_from = st.number_input("從第", min_value=1, max_value=len(keys), value=1, key="range_from_mgr")
+            with col_to:
+                range_to = st.number_input("到第", min_value=1, max_value=len(keys), value=len(keys), key="range_to_mgr")
+            with col_range:
+                if st.button("選取範圍", key="select_range_mgr", use_container_width=True):
+                    selection.select_range(keys, range_from - 1, range_to - 1)
+                    st.rerun()
+            
+            col_query, col_match = st.columns([3, 1])
+            with col_query:
+                select_query = st.text_input("依條件選取", placeholder="歌名、歌手、專輯或檔名", key="select_query_mgr")
+            with col_match:
+                if st.button("選取符合的檔案", key="select_query_btn_mgr", use_container_width=True):
+                    library = get_library("downloads")
+                    # 只選取精確符合的檔案，放寬條件的相近結果可能包含不相關的檔案
+                    matched = [track['id'] for track in library.search(select_query, limit=len(library), strict=True)]
+                    selection.update(matched)
+                    st.success(f"✅ 已選取 {len(matched)} 個符合的檔案")
+                    st.rerun()
+        
+        # 下載按鈕只為使用者選擇的檔案準備，避免每一列都把整個檔案送到瀏覽器
+        download_target = st.session_state.get('download_target')
+        if download_target and Path(download_target).exists():
+            try:
+                with open(download_target, "rb") as f:
+                    file_bytes = f.read()
+                st.download_button(
+                    label=f"📥 下載 {download_target.name}",
+                    data=file_bytes,
+                    file_name=download_target.name,
+                    mime="audio/mpeg" if download_target.suffix.lower() == '.mp3' else "audio/mp4",
+                    key="download_target_mgr"
+                )
+            except Exception as e:
+                st.error(f"❌ 無法讀取檔案: {e}")
+        
+        # 只顯示目前這一頁的檔案，歌曲資訊從音樂庫索引批次讀取
+        start, end = render_pager(len(st.session_state.music_files), key="files_mgr")
+        page_files = st.session_state.music_files[start:end]
+        page_infos = visible_track_info(get_library("downloads"), page_files)
         
         # 顯示檔案列表
-        for i, file_path in enumerate(st.session_state.music_files, 1):
+        page_keys = keys[start:end]
+        for i, (file_path, key, file_info) in enumerate(zip(page_files, page_keys, page_infos), start + 1):
             with st.container():
                 col1, col2, col3, col4, col5 = st.columns([0.5, 3, 1, 1, 1])
                 
                 with col1:
-                    is_selected = file_path in st.session_state.selected_files
-                    if st.checkbox(f"{i}", value=is_selected, key=f"select_{i}_mgr"):
-                        if file_path not in st.session_state.selected_files:
-                            st.session_state.selected_files.append(file_path)
-                    else:
-                        if file_path in st.session_state.selected_files:
-                            st.session_state.selected_files.remove(file_path)
+                    # 鍵值包含選取版本，批次選取後勾選框會依新的選取狀態重新建立
+                    widget_key = f"select_{key}_{selection.version}_mgr"
+                    st.checkbox(f"{i}", value=key in selection, key=widget_key,
+                                on_change=on_file_checkbox, args=(key, widget_key))
                 
                 with col2:
-                    file_info = get_audio_file_info(file_path)
                     st.write(f"**{file_info['title']}**")
                     st.caption(f"{file_info['artist']} • {format_time(file_info['duration'])} • {format_file_size(file_info['file_size'])}")
                     st.caption(f"檔案: {file_path.name}")
                 
                 with col3:
                     if st.button("🗑️", key=f"delete_{i}_mgr", help="直接刪除"):
-                        success, message = delete_file(file_path)
-                        if success:
-                            st.success("✅")
-                            # 重新掃描
-                            music_files = scan_music_folder()
-                            st.session_state.music_files = music_files
-                            st.rerun()
-                        else:
-                            st.error("❌")
+                        apply_file_report(batch_delete([file_path]), "刪除")
+                        st.rerun()
                 
                 with col4:
                     if st.button("📦", key=f"trash_{i}_mgr", help="移動到垃圾桶"):
-                        success, message = move_to_trash(file_path)
-                        if success:
-                            st.success("✅")
-                            # 重新掃描
-                            music_files = scan_music_folder()
-                            st.session_state.music_files = music_files
-                            st.rerun()
-                        else:
-                            st.error("❌")
+                        apply_file_report(batch_move_to_trash([file_path]), "移動到垃圾桶")
+                        st.rerun()
                 
                 with col5:
-                    # 下載按鈕
-                    try:
-                        with open(file_path, "rb") as f:
-                            file_bytes = f.read()
-                        
-                        st.download_button(
-                            label="📥",
-                            data=file_bytes,
-                            file_name=file_path.name,
-                            mime="audio/mpeg" if file_path.suffix.lower() == '.mp3' else "audio/mp4",
-                            key=f"download_{i}_mgr"
-                        )
-                    except Exception as e:
-                        st.error("❌")
+                    if st.button("📥", key=f"download_{i}_mgr", help="準備下載"):
+                        st.session_state.download_target = file_path
+                        st.rerun()
                 
                 st.markdown("---")
     else:
         st.info("📁 沒有找到音樂檔案，請先下載一些音樂或掃描資料夾")
     
-    # 垃圾桶內容
-    trash_dir = Path("downloads/trash")
-    if trash_dir.exists() and any(trash_dir.iterdir()):
+    # 垃圾桶內容（從垃圾桶清單讀取，不存取檔案系統）
+    trash = get_trash_bin("downloads")
+    trash_count = len(trash)
+    if trash_count:
         st.markdown("---")
         st.subheader("🗑️ 垃圾桶內容")
         
-        trash_files = list(trash_dir.iterdir())
-        for i, file_path in enumerate(trash_files, 1):
+        start, end = render_pager(trash_count, key="trash_mgr")
+        for i, item in enumerate(trash.items(offset=start, limit=end - start), start + 1):
             col1, col2, col3 = st.columns([3, 1, 1])
             
             with col1:
-                st.write(f"{i}. {file_path.name}")
-                st.caption(f"大小: {format_file_size(file_path.stat().st_size)}")
+                st.write(f"{i}. {item['name']}")
+                deleted_at = time.strftime('%Y-%m-%d %H:%M', time.localtime(item['deleted_at']))
+                st.caption(f"大小: {format_file_size(item['file_size'])} • 刪除時間: {deleted_at}")
             
             with col2:
-                if st.button("🔄 還原", key=f"restore_{i}"):
-                    try:
-                        new_path = Path("downloads") / file_path.name
-                        if new_path.exists():
-                            timestamp = int(time.time())
-                            new_path = Path("downloads") / f"{file_path.stem}_{timestamp}{file_path.suffix}"
-                        shutil.move(str(file_path), str(new_path))
-                        st.success("✅ 已還原")
+                if st.button("🔄 還原", key=f"restore_{item['id']}"):
+                    result = trash.restore(item['id'])
+                    if result['success']:
+                        add_music_file(result['file_path'], result['track_id'])
                         st.rerun()
-                    except Exception as e:
-                        st.error(f"還原失敗: {e}")
+                    else:
+                        st.error(f"還原失敗: {result['error']}")
             
             with col3:
-                if st.button("🗑️ 永久刪除", key=f"perm_delete_{i}"):
-                    try:
-                        file_path.unlink()
-                        st.success("✅ 已永久刪除")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"刪除失敗: {e}")
+                if st.button("🗑️ 永久刪除", key=f"perm_delete_{item['id']}"):
+                    trash.delete(item['id'])
+                    st.rerun()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -6,8 +6,15 @@
 """
 
 import os
+import io
+import sys
 import time
+import operator
+import queue
+import struct
+import functools
 import threading
+from collections import deque
 import logging
 from pathlib import Path
 from typing import List, Dict, Optional, Callable
@@ -30,18 +37,179 @@ try:
 except ImportError:
     MUTAGEN_AVAILABLE = False
 
+from shuffle_order import ShuffleBag
+from music_library import iter_audio_files
+
+# 播放佇列保存（選用）：與網頁播放器共用音樂庫中的播放佇列
+try:
+    from playlist_store import get_playlist_store
+    PLAYLIST_STORE_AVAILABLE = True
+except ImportError:
+    PLAYLIST_STORE_AVAILABLE = False
+
+# 響度正規化（選用）：依音樂庫中的響度分析結果調整每首歌的音量
+try:
+    from loudness import gain_for_file
+    LOUDNESS_AVAILABLE = True
+except ImportError:
+    LOUDNESS_AVAILABLE = False
+
 # 設定日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 支援的音樂格式
+SUPPORTED_EXTENSIONS = {'.mp3', '.wav', '.ogg', '.flac', '.m4a'}
+
+# 播放中回報進度的間隔（秒），只有設定 on_progress 時才會定時喚醒
+PROGRESS_INTERVAL = 1.0
+
+# 歌曲時長未知時，檢查是否播放結束的間隔（秒）
+UNKNOWN_DURATION_CHECK_INTERVAL = 0.5
+
+# 預估結束時間到了但音訊仍在播放時，再等待的時間（秒）
+END_GRACE_INTERVAL = 0.05
+
+# 預載下一首時先讀進快取的檔案開頭大小（位元組）
+PREFETCH_HEAD_BYTES = 1024 * 1024
+
+# 牆鐘時間比 get_pos() 多出超過此秒數，代表已經切換到佇列中的下一首
+QUEUE_SWITCH_THRESHOLD = 1.0
+
+# 可以直接用 pygame.mixer.music.play(start=...) 跳轉的格式
+START_SEEK_EXTENSIONS = {'.mp3', '.ogg', '.flac'}
+
+class WavSeekTable:
+    """
+    WAV 檔案的跳轉表
+    
+    解析一次 RIFF 標頭，記錄音訊資料的位置與每個取樣框的大小，
+    跳轉時直接換算位元組位置，不需要從頭解碼
+    """
+    
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        with open(file_path, 'rb') as f:
+            riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+            if riff != b'RIFF' or wave != b'WAVE':
+                raise ValueError(f"不是有效的 WAV 檔案: {file_path}")
+            self.byte_rate = self.block_align = None
+            while True:
+                chunk_header = f.read(8)
+                if len(chunk_header) < 8:
+                    raise ValueError(f"WAV 檔案缺少 data 區塊: {file_path}")
+                chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+                if chunk_id == b'fmt ':
+                    fmt = f.read(chunk_size)
+                    self.byte_rate, self.block_align = struct.unpack('<IH', fmt[8:14])
+                    if chunk_size % 2:
+                        f.seek(1, io.SEEK_CUR)
+                elif chunk_id == b'data':
+                    self.data_start = f.tell()
+                    self.data_size = chunk_size
+                    break
+                else:
+                    f.seek(chunk_size + chunk_size % 2, io.SEEK_CUR)
+            if not self.byte_rate or not self.block_align:
+                raise ValueError(f"WAV 檔案缺少 fmt 區塊: {file_path}")
+            f.seek(0)
+            self.header = bytearray(f.read(self.data_start))
+    
+    def offset_for(self, seconds: float) -> int:
+        """換算指定秒數在音訊資料中的位元組位置（對齊取樣框）"""
+        frame = int(max(seconds, 0.0) * self.byte_rate) // self.block_align
+        return min(frame * self.block_align, self.data_size)
+    
+    def open_at(self, seconds: float) -> "_WavSliceStream":
+        """建立從指定秒數開始的 WAV 串流，可直接交給 pygame 載入"""
+        offset = self.offset_for(seconds)
+        remaining = self.data_size - offset
+        header = bytearray(self.header)
+        struct.pack_into('<I', header, 4, len(header) + remaining - 8)
+        struct.pack_into('<I', header, len(header) - 4, remaining)
+        return _WavSliceStream(self.file_path, bytes(header), self.data_start + offset, remaining)
+
+class _WavSliceStream(io.RawIOBase):
+    """由新的 WAV 標頭加上原檔案部分音訊資料組成的唯讀串流"""
+    
+    def __init__(self, file_path: str, header: bytes, data_offset: int, data_size: int):
+        super().__init__()
+        self._file = open(file_path, 'rb')
+        self._header = header
+        self._data_offset = data_offset
+        self._size = len(header) + data_size
+        self._pos = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def tell(self):
+        return self._pos
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._size}[whence]
+        self._pos = max(0, min(base + offset, self._size))
+        return self._pos
+    
+    def readinto(self, buffer):
+        want = min(len(buffer), self._size - self._pos)
+        if want <= 0:
+            return 0
+        written = 0
+        if self._pos < len(self._header):
+            part = self._header[self._pos:self._pos + want]
+            buffer[:len(part)] = part
+            written = len(part)
+        if written < want:
+            self._file.seek(self._data_offset + self._pos + written - len(self._header))
+            data = self._file.read(want - written)
+            buffer[written:written + len(data)] = data
+            written += len(data)
+        self._pos += written
+        return written
+    
+    def close(self):
+        self._file.close()
+        super().close()
+
+@functools.lru_cache(maxsize=64)
+def _cached_wav_seek_table(file_path: str, mtime: float, size: int) -> WavSeekTable:
+    return WavSeekTable(file_path)
+
+def get_wav_seek_table(file_path: str) -> WavSeekTable:
+    """取得 WAV 檔案的跳轉表，每個檔案（依修改時間與大小）只建立一次"""
+    stat = os.stat(file_path)
+    return _cached_wav_seek_table(file_path, stat.st_mtime, stat.st_size)
+
 class PlaybackState(Enum):
     """播放狀態枚舉"""
     STOPPED = "stopped"
     PLAYING = "playing"
     PAUSED = "paused"
 
+# 播放狀態允許的轉換（PLAYING → PLAYING 代表換歌或跳轉後繼續播放）
+STATE_TRANSITIONS = {
+    PlaybackState.STOPPED: {PlaybackState.PLAYING, PlaybackState.STOPPED},
+    PlaybackState.PLAYING: {PlaybackState.PLAYING, PlaybackState.PAUSED, PlaybackState.STOPPED},
+    PlaybackState.PAUSED: {PlaybackState.PLAYING, PlaybackState.PAUSED, PlaybackState.STOPPED},
+}
+
+# 連續送出時會合併處理的換歌命令，只載入最後決定的那一首
+NAVIGATION_COMMANDS = {'play', 'next', 'previous'}
+
 @dataclass
 class Song:
-    """歌曲資訊類別"""
+    """
+    歌曲資訊類別
+    
+    使用 __slots__ 省去每個實例的 __dict__，藝術家與專輯名稱共用同一個字串物件；
+    介面逐列顯示時常用的檔名、時長字串與排序鍵在第一次存取後快取
+    """
+    __slots__ = ('file_path', 'title', 'artist', 'album', 'duration', 'file_size',
+                 '_filename', '_duration_str', '_sort_key')
+    
     file_path: str
     title: str
     artist: str
@@ -49,30 +217,69 @@ class Song:
     duration: float
     file_size: int
     
+    def __post_init__(self):
+        # 同一位藝術家／同一張專輯的歌曲通常很多，共用字串可大幅減少記憶體
+        self.artist = sys.intern(self.artist)
+        self.album = sys.intern(self.album)
+        self._filename = None
+        self._duration_str = None
+        self._sort_key = None
+    
     @property
     def filename(self) -> str:
         """獲取檔案名稱"""
-        return Path(self.file_path).name
+        if self._filename is None:
+            self._filename = os.path.basename(self.file_path)
+        return self._filename
     
     @property
     def duration_str(self) -> str:
         """獲取格式化的時長字串"""
-        minutes = int(self.duration // 60)
-        seconds = int(self.duration % 60)
-        return f"{minutes:02d}:{seconds:02d}"
+        if self._duration_str is None:
+            minutes = int(self.duration // 60)
+            seconds = int(self.duration % 60)
+            # 不同的時長字串只有幾千種，共用同一個物件
+            self._duration_str = sys.intern(f"{minutes:02d}:{seconds:02d}")
+        return self._duration_str
+    
+    @property
+    def sort_key(self) -> str:
+        """播放清單的排序鍵（不分大小寫的檔名）"""
+        if self._sort_key is None:
+            filename = self.filename
+            lowered = filename.lower()
+            # 檔名本來就沒有大寫字母時直接共用，不另外佔用記憶體
+            self._sort_key = filename if lowered == filename else lowered
+        return self._sort_key
+
+# 依檔名排序播放清單
+song_sort_key = operator.attrgetter('sort_key')
+
+def song_from_track(track: Dict) -> Song:
+    """將音樂庫的歌曲資訊轉為 Song，不需要讀取音訊檔案"""
+    return Song(
+        file_path=track['file_path'],
+        title=track['title'],
+        artist=track['artist'],
+        album=track['album'],
+        duration=track['duration'],
+        file_size=track['file_size'],
+    )
 
 class MusicPlayer:
     """音樂播放器核心類別"""
     
-    def __init__(self, music_folder: str = "downloads"):
+    def __init__(self, music_folder: str = "downloads", persist_queue: bool = False):
         """
         初始化音樂播放器
         
         Args:
             music_folder: 音樂檔案資料夾路徑
+            persist_queue: 是否把播放清單與目前位置保存為播放佇列，下次啟動時可以還原
         """
         self.music_folder = Path(music_folder)
         self.music_folder.mkdir(exist_ok=True)
+        self.persist_queue = persist_queue and PLAYLIST_STORE_AVAILABLE
         
         # 播放器狀態
         self.current_song: Optional[Song] = None
@@ -82,11 +289,32 @@ class MusicPlayer:
         self.volume = 0.7
         self.is_shuffle = False
         self.is_repeat = False
+        # 響度正規化：實際音量 = 使用者音量 × 目前歌曲的增益
+        self.normalize_loudness = LOUDNESS_AVAILABLE
+        self._track_gain = 1.0
+        # 隨機播放順序，以檔案路徑為鍵；路徑到索引的對照表讓換歌不必搜尋整個清單
+        self._shuffle_bag = ShuffleBag()
+        self._index_by_path: Dict[str, int] = {}
         
-        # 播放控制
+        # 播放控制：所有播放操作都交給同一個常駐的播放引擎執行緒依序執行
         self._pygame_initialized = False
-        self._play_thread = None
-        self._stop_event = threading.Event()
+        self._commands: "queue.Queue" = queue.Queue()
+        # 合併換歌命令時多取出的下一個命令，只由引擎存取，下一輪優先執行以保持順序
+        self._deferred: deque = deque()
+        self._engine_thread: Optional[threading.Thread] = None
+        self._engine_lock = threading.Lock()
+        # 引擎修改狀態時持有此鎖，其他執行緒透過 snapshot() 取得一致的狀態
+        self._state_lock = threading.RLock()
+        self._track_started_at = 0.0
+        self._paused_at: Optional[float] = None
+        # 最近一次 play(start=...) 或跳轉的起始秒數，get_pos() 從這裡開始計時
+        self._seek_offset = 0.0
+        # 無縫播放：已排入 pygame 佇列的下一首索引與它的增益
+        self._queued_index: Optional[int] = None
+        self._queued_gain = 1.0
+        # 播放世代：每次換歌、停止或跳轉都會遞增，帶著舊世代的背景事件會被忽略
+        self._generation = 0
+        self._prefetch_thread: Optional[threading.Thread] = None
         
         # 回調函數
         self.on_song_change: Optional[Callable[[Song], None]] = None
@@ -114,28 +342,144 @@ class MusicPlayer:
         Returns:
             歌曲列表
         """
-        supported_extensions = {'.mp3', '.wav', '.ogg', '.flac', '.m4a'}
         songs = []
         
         if not self.music_folder.exists():
             logging.warning(f"音樂資料夾不存在: {self.music_folder}")
             return songs
         
-        for file_path in self.music_folder.rglob("*"):
-            if file_path.is_file() and file_path.suffix.lower() in supported_extensions:
-                try:
-                    song = self._extract_song_info(file_path)
-                    if song:
-                        songs.append(song)
-                except Exception as e:
-                    logging.error(f"無法讀取歌曲資訊 {file_path}: {e}")
+        # 略過垃圾桶與下載暫存區等隱藏資料夾
+        for file_path in iter_audio_files(self.music_folder, SUPPORTED_EXTENSIONS):
+            try:
+                song = self._extract_song_info(file_path)
+                if song:
+                    songs.append(song)
+            except Exception as e:
+                logging.error(f"無法讀取歌曲資訊 {file_path}: {e}")
         
         # 按檔案名稱排序
-        songs.sort(key=lambda x: x.filename.lower())
-        self.playlist = songs
+        songs.sort(key=song_sort_key)
+        with self._state_lock:
+            self.playlist = songs
+            self._queued_index = None
+            self._reindex_playlist()
+        self._submit('reschedule_prefetch', wait=False)
+        self.save_queue()
         logging.info(f"掃描完成，找到 {len(songs)} 首歌曲")
         return songs
     
+    def add_files(self, file_paths: List[str]) -> List[Song]:
+        """
+        將新下載的檔案加入播放清單，不需重新掃描整個資料夾
+        
+        Args:
+            file_paths: 檔案路徑列表
+            
+        Returns:
+            新加入的歌曲列表
+        """
+        known = {song.file_path for song in self.playlist}
+        added = []
+        for file_path in file_paths:
+            path = Path(file_path)
+            if str(path) in known or path.suffix.lower() not in SUPPORTED_EXTENSIONS:
+                continue
+            song = self._extract_song_info(path)
+            if song:
+                added.append(song)
+                known.add(song.file_path)
+        
+        if added:
+            with self._state_lock:
+                queued = self.playlist[self._queued_index] if self._queued_index is not None else None
+                self.playlist.extend(added)
+                self.playlist.sort(key=song_sort_key)
+                # 排序後重新定位目前播放與已排入佇列的歌曲
+                if self.current_song in self.playlist:
+                    self.current_index = self.playlist.index(self.current_song)
+                if queued is not None:
+                    self._queued_index = self.playlist.index(queued)
+                self._reindex_playlist()
+            # 新歌曲可能排在目前歌曲之後，已排入佇列的下一首不一定還是下一首
+            self._submit('reschedule_prefetch', wait=False)
+            self.save_queue()
+            logging.info(f"已加入 {len(added)} 首歌曲到播放清單")
+        return added
+    
+    def set_playlist(self, songs: List[Song], current_index: int = -1):
+        """
+        直接設定播放清單並保留傳入的順序（例如開啟已儲存的播放清單）
+        
+        Args:
+            songs: 歌曲列表
+            current_index: 下次播放的位置；目前播放中的歌曲若在新清單中則改為它的位置
+        """
+        with self._state_lock:
+            self.playlist = list(songs)
+            self._queued_index = None
+            self._reindex_playlist()
+            playing = self._index_by_path.get(self.current_song.file_path) if self.current_song else None
+            self.current_index = playing if playing is not None else current_index
+        # 原本排入佇列的下一首可能已不在清單中
+        self._submit('reschedule_prefetch', wait=False)
+        self.save_queue()
+        logging.info(f"已載入播放清單，共 {len(songs)} 首歌曲")
+    
+    def restore_queue(self) -> bool:
+        """
+        還原上次保存的播放佇列（不需要掃描資料夾，也不讀取音訊檔案）
+        
+        Returns:
+            是否有可還原的播放佇列
+        """
+        if not PLAYLIST_STORE_AVAILABLE:
+            return False
+        try:
+            tracks, position = get_playlist_store(str(self.music_folder)).load_queue()
+        except Exception as e:
+            logging.warning(f"無法讀取播放佇列: {e}")
+            return False
+        if not tracks:
+            return False
+        self.set_playlist([song_from_track(track) for track in tracks], position)
+        return True
+    
+    def save_queue(self):
+        """保存目前的播放清單與位置為播放佇列（未開啟 persist_queue 時不做任何事）"""
+        if not self.persist_queue:
+            return
+        with self._state_lock:
+            file_paths = [song.file_path for song in self.playlist]
+            current_index = self.current_index
+        try:
+            store = get_playlist_store(str(self.music_folder))
+            track_ids = store.track_ids_for_files(file_paths)
+            # 已不存在的檔案不會保存，目前位置依實際保存的歌曲重新計算
+            position = sum(1 for track_id in track_ids[:max(current_index, 0)] if track_id is not None)
+            store.save_queue([track_id for track_id in track_ids if track_id is not None], position)
+        except Exception as e:
+            logging.warning(f"無法保存播放佇列: {e}")
+    
+    def _save_queue_position(self):
+        """換歌後只更新播放佇列的目前位置"""
+        if not self.persist_queue:
+            return
+        try:
+            get_playlist_store(str(self.music_folder)).save_queue_position(max(self.current_index, 0))
+        except Exception as e:
+            logging.debug(f"無法保存播放位置: {e}")
+    
+    def _reindex_playlist(self):
+        """播放清單變動後更新路徑索引與隨機播放順序"""
+        self._index_by_path = {song.file_path: i for i, song in enumerate(self.playlist)}
+        self._shuffle_bag.sync(self._index_by_path)
+    
+    def _shuffle_index(self, file_path: Optional[str]) -> Optional[int]:
+        """把隨機播放順序返回的路徑轉成播放清單索引"""
+        if file_path is None:
+            return None
+        return self._index_by_path.get(file_path)
+    
     def _extract_song_info(self, file_path: Path) -> Optional[Song]:
         """
         從音樂檔案中提取歌曲資訊
@@ -196,6 +540,202 @@ class MusicPlayer:
             logging.error(f"提取歌曲資訊失敗 {file_path}: {e}")
             return None
     
+    # --- 播放引擎 ---
+    
+    def _ensure_engine(self):
+        """啟動常駐的播放引擎執行緒（只會啟動一次）"""
+        with self._engine_lock:
+            if self._engine_thread is None or not self._engine_thread.is_alive():
+                self._engine_thread = threading.Thread(
+                    target=self._engine_loop, name="MusicPlayerEngine", daemon=True
+                )
+                self._engine_thread.start()
+    
+    def _submit(self, command: str, *args, wait: bool = True, timeout: float = 5.0):
+        """
+        將命令送進播放引擎的命令佇列
+        
+        Args:
+            command: 命令名稱，對應 _do_<command> 方法
+            wait: 是否等待引擎執行完畢
+            timeout: 等待的最長時間（秒）
+        """
+        # 回調函數在引擎執行緒中呼叫播放器方法時，直接執行以免互相等待
+        if threading.current_thread() is self._engine_thread:
+            return getattr(self, f"_do_{command}")(*args)
+        
+        self._ensure_engine()
+        done = threading.Event()
+        result = {}
+        self._commands.put((command, args, done, result))
+        if wait:
+            done.wait(timeout)
+        return result.get('value')
+    
+    def _engine_loop(self):
+        """
+        播放引擎主迴圈
+        
+        阻塞等待命令佇列，等待的逾時時間依歌曲剩餘時間計算，
+        因此播放中不需要輪詢，只有歌曲結束或需要回報進度時才會喚醒
+        """
+        while True:
+            if self._deferred:
+                command, args, done, result = self._deferred.popleft()
+            else:
+                try:
+                    command, args, done, result = self._commands.get(timeout=self._next_wakeup())
+                except queue.Empty:
+                    with self._state_lock:
+                        self._on_wakeup()
+                    continue
+            
+            if command == 'shutdown':
+                done.set()
+                return
+            
+            batch = [(command, args, done, result)]
+            if command in NAVIGATION_COMMANDS:
+                batch.extend(self._drain_navigation())
+            try:
+                with self._state_lock:
+                    if len(batch) > 1:
+                        self._do_navigate_batch(batch)
+                    else:
+                        result['value'] = getattr(self, f"_do_{command}")(*args)
+            except Exception as e:
+                logging.error(f"執行播放命令 {command} 時發生錯誤: {e}")
+            finally:
+                for _, _, batch_done, _ in batch:
+                    batch_done.set()
+    
+    def _drain_navigation(self) -> list:
+        """
+        取出佇列最前面連續的換歌命令，讓快速連按下一首只載入一次
+
+        遇到的第一個其他命令放進 _deferred，下一輪先執行它，不會排到之後送出的命令後面
+        """
+        drained = []
+        while True:
+            try:
+                item = self._commands.get_nowait()
+            except queue.Empty:
+                break
+            if item[0] not in NAVIGATION_COMMANDS:
+                self._deferred.append(item)
+                break
+            drained.append(item)
+        return drained
+    
+    def _do_navigate_batch(self, batch: list):
+        """依序計算一連串換歌命令的目標歌曲，最後只播放一次"""
+        if not self.playlist:
+            return
+        target = None
+        for command, args, _, _ in batch:
+            if command == 'play':
+                song_index = args[0] if args else None
+                if song_index is not None and 0 <= song_index < len(self.playlist):
+                    target = song_index
+                elif song_index is not None:
+                    logging.error(f"無效的歌曲索引: {song_index}")
+            else:
+                if target is not None:
+                    # 和 _do_play 一樣記入隨機播放歷史，之後的上一首才能回到這首；
+                    # 預載的是原本那首的下一首，不再適用
+                    self.current_index = target
+                    self._shuffle_bag.set_current(self.playlist[target].file_path)
+                    self._queued_index = None
+                target = self._next_index() if command == 'next' else self._previous_index()
+                # 預載的下一首只適用於第一次換歌
+                self._queued_index = None
+        logging.info(f"合併 {len(batch)} 個換歌命令")
+        self._do_play(target)
+    
+    def _elapsed(self) -> float:
+        """目前歌曲已播放的秒數（以牆鐘時間估算，扣除暫停時間）"""
+        if self.state == PlaybackState.STOPPED:
+            return 0.0
+        end = self._paused_at if self._paused_at is not None else time.monotonic()
+        return max(0.0, end - self._track_started_at)
+    
+    def _position(self) -> float:
+        """
+        目前歌曲的播放位置（秒）
+        
+        以 pygame.mixer.music.get_pos() 為準，它只計算實際輸出的音訊，
+        暫停期間不會增加；再加上最近一次跳轉的起始位置
+        """
+        if self.state == PlaybackState.STOPPED:
+            return 0.0
+        if self._pygame_initialized:
+            try:
+                pos_ms = pygame.mixer.music.get_pos()
+            except Exception:
+                pos_ms = -1
+            if pos_ms >= 0:
+                return self._seek_offset + pos_ms / 1000.0
+        return self._elapsed()
+    
+    def _next_wakeup(self) -> Optional[float]:
+        """計算引擎下一次需要醒來的時間，None 代表一直等到有命令為止"""
+        if self.state != PlaybackState.PLAYING:
+            return None
+        
+        if self.current_song and self.current_song.duration > 0:
+            wakeup = max(self.current_song.duration - self._position(), 0.0) + END_GRACE_INTERVAL
+        else:
+            wakeup = UNKNOWN_DURATION_CHECK_INTERVAL
+        if self.on_progress:
+            wakeup = min(wakeup, PROGRESS_INTERVAL)
+        return wakeup
+    
+    def _on_wakeup(self):
+        """逾時喚醒：檢查歌曲是否已播放完畢或已切換到佇列中的下一首，並回報進度"""
+        if self.state != PlaybackState.PLAYING:
+            return
+        
+        try:
+            finished = not pygame.mixer.music.get_busy()
+        except Exception as e:
+            logging.error(f"檢查播放狀態時發生錯誤: {e}")
+            finished = True
+        if finished:
+            self._handle_song_end()
+            return
+        
+        # pygame 會在切換到佇列歌曲時把 get_pos() 歸零，牆鐘時間則持續累計
+        if self._queued_index is not None:
+            threshold = QUEUE_SWITCH_THRESHOLD
+            if self.current_song and self.current_song.duration > 0:
+                threshold = min(threshold, self.current_song.duration / 2)
+            if self._elapsed() - self._position() > threshold:
+                self._advance_to_queued()
+        self._report_progress()
+    
+    def _report_progress(self):
+        """呼叫進度回調"""
+        if self.on_progress and self.current_song and self.current_song.duration > 0:
+            self.on_progress(min(self._position() / self.current_song.duration, 1.0))
+    
+    def _set_state(self, state: PlaybackState) -> bool:
+        """
+        依狀態轉換表更新播放狀態並觸發回調
+        
+        Returns:
+            轉換是否合法
+        """
+        if state not in STATE_TRANSITIONS[self.state]:
+            logging.warning(f"忽略不合法的狀態轉換: {self.state.value} → {state.value}")
+            return False
+        changed = state != self.state
+        self.state = state
+        if changed and self.on_state_change:
+            self.on_state_change(self.state)
+        return True
+    
+    # --- 公開的播放控制 ---
+    
     def play(self, song_index: Optional[int] = None):
         """
         播放歌曲
@@ -203,6 +743,50 @@ class MusicPlayer:
         Args:
             song_index: 歌曲索引，如果為 None 則播放當前歌曲
         """
+        self._submit('play', song_index)
+    
+    def pause(self):
+        """暫停播放"""
+        self._submit('pause')
+    
+    def resume(self):
+        """恢復播放"""
+        self._submit('resume')
+    
+    def stop(self):
+        """停止播放"""
+        self._submit('stop')
+    
+    def next(self):
+        """播放下一首歌曲"""
+        self._submit('next')
+    
+    def previous(self):
+        """播放上一首歌曲"""
+        self._submit('previous')
+    
+    def set_volume(self, volume: float):
+        """
+        設定音量
+        
+        Args:
+            volume: 音量值 (0.0 - 1.0)
+        """
+        self._submit('set_volume', volume)
+    
+    def seek(self, position: float):
+        """
+        跳轉到指定位置
+        
+        Args:
+            position: 位置百分比 (0.0 - 1.0)
+        """
+        self._submit('seek', position)
+    
+    # --- 引擎執行緒中的實作 ---
+    
+    def _do_play(self, song_index: Optional[int] = None):
+        """在引擎執行緒中播放歌曲"""
         if not self._pygame_initialized:
             logging.error("Pygame 未初始化，無法播放")
             return
@@ -222,180 +806,319 @@ class MusicPlayer:
         if self.current_index < 0:
             self.current_index = 0
         
-        # 停止當前播放
-        self.stop()
-        
-        # 開始播放新歌曲
         self.current_song = self.playlist[self.current_index]
-        self.state = PlaybackState.PLAYING
+        self._shuffle_bag.set_current(self.current_song.file_path)
+        try:
+            # 載入並播放歌曲（load 會自動取代目前播放的歌曲）
+            pygame.mixer.music.load(self.current_song.file_path)
+            self._track_gain = self._gain_for(self.current_song.file_path)
+            self._apply_volume()
+            pygame.mixer.music.play()
+        except Exception as e:
+            logging.error(f"播放歌曲時發生錯誤: {e}")
+            self._set_state(PlaybackState.STOPPED)
+            return
         
-        # 啟動播放執行緒
-        self._stop_event.clear()
-        self._play_thread = threading.Thread(target=self._play_song)
-        self._play_thread.daemon = True
-        self._play_thread.start()
+        self._track_started_at = time.monotonic()
+        self._paused_at = None
+        self._seek_offset = 0.0
+        self._generation += 1
         
         # 觸發回調
         if self.on_song_change:
             self.on_song_change(self.current_song)
-        if self.on_state_change:
-            self.on_state_change(self.state)
+        self._set_state(PlaybackState.PLAYING)
+        self._save_queue_position()
         
         logging.info(f"開始播放: {self.current_song.title}")
+        self._schedule_prefetch()
     
-    def _play_song(self):
-        """在背景執行緒中播放歌曲"""
+    def _peek_next_index(self) -> Optional[int]:
+        """依重複／隨機模式決定自然播放結束後的下一首"""
+        if not self.playlist:
+            return None
+        if self.is_repeat:
+            return self.current_index
+        if self.is_shuffle:
+            return self._shuffle_index(self._shuffle_bag.peek())
+        return (self.current_index + 1) % len(self.playlist)
+    
+    def _schedule_prefetch(self):
+        """
+        在背景預載下一首
+        
+        背景執行緒只負責把檔案開頭讀進系統快取，真正呼叫 pygame 仍交回引擎執行緒，
+        讓 mixer 始終只由引擎操作
+        """
+        self._queued_index = None
+        next_index = self._peek_next_index()
+        if next_index is None:
+            return
+        generation = self._generation
+        file_path = self.playlist[next_index].file_path
+        
+        def prefetch():
+            try:
+                with open(file_path, 'rb') as f:
+                    f.read(PREFETCH_HEAD_BYTES)
+            except OSError as e:
+                logging.debug(f"預載下一首失敗 {file_path}: {e}")
+                return
+            # 先查好下一首的增益，切換時不需要查詢音樂庫
+            self._submit('queue_next', next_index, generation, self._gain_for(file_path), wait=False)
+        
+        self._prefetch_thread = threading.Thread(target=prefetch, name="MusicPlayerPrefetch", daemon=True)
+        self._prefetch_thread.start()
+    
+    def _do_queue_next(self, next_index: int, generation: int, gain: float = 1.0):
+        """把預載完成的下一首排入 pygame 佇列，目前歌曲結束時會立即接著播放"""
+        if generation != self._generation or self.state == PlaybackState.STOPPED:
+            return
+        if not 0 <= next_index < len(self.playlist):
+            return
         try:
-            # 載入並播放歌曲
-            pygame.mixer.music.load(self.current_song.file_path)
-            pygame.mixer.music.set_volume(self.volume)
-            pygame.mixer.music.play()
-            
-            # 監控播放進度
-            start_time = time.time()
-            while pygame.mixer.music.get_busy() and not self._stop_event.is_set():
-                if self.on_progress and self.current_song.duration > 0:
-                    current_time = time.time() - start_time
-                    progress = min(current_time / self.current_song.duration, 1.0)
-                    self.on_progress(progress)
-                time.sleep(0.1)
-            
-            # 播放結束後的處理
-            if not self._stop_event.is_set():
-                self._handle_song_end()
-                
+            # queue() 會立即開啟並初始化解碼器，切換時不需要再載入
+            pygame.mixer.music.queue(self.playlist[next_index].file_path)
+            self._queued_index = next_index
+            self._queued_gain = gain
         except Exception as e:
-            logging.error(f"播放歌曲時發生錯誤: {e}")
-            self.state = PlaybackState.STOPPED
-            if self.on_state_change:
-                self.on_state_change(self.state)
+            logging.warning(f"無法排入下一首，將在結束時再載入: {e}")
+    
+    def _advance_to_queued(self):
+        """pygame 已自動接著播放佇列中的歌曲，更新播放器狀態"""
+        position = self._position() - self._seek_offset
+        self.current_index = self._queued_index
+        self.current_song = self.playlist[self.current_index]
+        self._shuffle_bag.set_current(self.current_song.file_path)
+        self._track_gain = self._queued_gain
+        self._apply_volume()
+        self._seek_offset = 0.0
+        self._track_started_at = time.monotonic() - position
+        self._generation += 1
+        
+        if self.on_song_change:
+            self.on_song_change(self.current_song)
+        self._save_queue_position()
+        logging.info(f"無縫切換到: {self.current_song.title}")
+        self._schedule_prefetch()
     
     def _handle_song_end(self):
         """處理歌曲播放結束"""
         if self.is_repeat:
             # 重複播放當前歌曲
-            self.play()
+            self._do_play()
         else:
             # 播放下一首
-            self.next()
+            self._do_next()
     
-    def pause(self):
-        """暫停播放"""
+    def _do_pause(self):
         if self.state == PlaybackState.PLAYING:
             pygame.mixer.music.pause()
-            self.state = PlaybackState.PAUSED
-            if self.on_state_change:
-                self.on_state_change(self.state)
+            self._paused_at = time.monotonic()
+            self._set_state(PlaybackState.PAUSED)
             logging.info("播放已暫停")
     
-    def resume(self):
-        """恢復播放"""
+    def _do_resume(self):
         if self.state == PlaybackState.PAUSED:
             pygame.mixer.music.unpause()
-            self.state = PlaybackState.PLAYING
-            if self.on_state_change:
-                self.on_state_change(self.state)
+            if self._paused_at is not None:
+                self._track_started_at += time.monotonic() - self._paused_at
+            self._paused_at = None
+            self._set_state(PlaybackState.PLAYING)
             logging.info("播放已恢復")
     
-    def stop(self):
-        """停止播放"""
-        self._stop_event.set()
-        pygame.mixer.music.stop()
-        self.state = PlaybackState.STOPPED
-        if self.on_state_change:
-            self.on_state_change(self.state)
+    def _do_stop(self):
+        if self._pygame_initialized:
+            pygame.mixer.music.stop()
+        self._paused_at = None
+        self._queued_index = None
+        self._generation += 1
+        self._set_state(PlaybackState.STOPPED)
         logging.info("播放已停止")
     
-    def next(self):
-        """播放下一首歌曲"""
+    def _next_index(self) -> int:
+        """計算下一首的索引"""
+        if self._queued_index is not None and not self.is_repeat:
+            # 使用已預載的下一首，隨機模式下也能保持一致
+            return self._queued_index
+        if self.is_shuffle:
+            # 隨機播放：本輪還沒播過的歌曲中抽一首
+            next_index = self._shuffle_index(self._shuffle_bag.next())
+            if next_index is not None:
+                return next_index
+        # 順序播放
+        return (self.current_index + 1) % len(self.playlist)
+    
+    def _previous_index(self) -> int:
+        """計算上一首的索引"""
+        if self.is_shuffle:
+            # 隨機播放：回到歷史中的上一首，沒有紀錄時重播目前的歌
+            prev_index = self._shuffle_index(self._shuffle_bag.previous())
+            return prev_index if prev_index is not None else max(self.current_index, 0)
+        # 順序播放
+        return (self.current_index - 1) % len(self.playlist)
+    
+    def _do_next(self):
         if not self.playlist:
             return
-        
-        if self.is_shuffle:
-            # 隨機播放
-            import random
-            next_index = random.randint(0, len(self.playlist) - 1)
-        else:
-            # 順序播放
-            next_index = (self.current_index + 1) % len(self.playlist)
-        
-        self.play(next_index)
+        self._do_play(self._next_index())
     
-    def previous(self):
-        """播放上一首歌曲"""
+    def _do_previous(self):
         if not self.playlist:
             return
-        
-        if self.is_shuffle:
-            # 隨機播放
-            import random
-            prev_index = random.randint(0, len(self.playlist) - 1)
-        else:
-            # 順序播放
-            prev_index = (self.current_index - 1) % len(self.playlist)
-        
-        self.play(prev_index)
+        self._do_play(self._previous_index())
     
-    def set_volume(self, volume: float):
-        """
-        設定音量
-        
-        Args:
-            volume: 音量值 (0.0 - 1.0)
-        """
+    def _do_set_volume(self, volume: float):
         self.volume = max(0.0, min(1.0, volume))
-        pygame.mixer.music.set_volume(self.volume)
+        self._apply_volume()
         logging.info(f"音量設定為: {self.volume:.2f}")
     
-    def seek(self, position: float):
-        """
-        跳轉到指定位置
+    def _gain_for(self, file_path: str) -> float:
+        """查詢歌曲的響度正規化增益，未開啟或尚未分析時為 1.0"""
+        if not self.normalize_loudness:
+            return 1.0
+        try:
+            return gain_for_file(file_path, str(self.music_folder))
+        except Exception as e:
+            logging.debug(f"無法取得響度增益 {file_path}: {e}")
+            return 1.0
+    
+    def _apply_volume(self):
+        pygame.mixer.music.set_volume(self.volume * self._track_gain)
+    
+    def _do_seek(self, position: float):
+        if not self.current_song or self.current_song.duration <= 0:
+            return
+        if self.state == PlaybackState.STOPPED:
+            logging.warning("尚未播放，無法跳轉")
+            return
         
-        Args:
-            position: 位置百分比 (0.0 - 1.0)
-        """
-        if self.current_song and self.current_song.duration > 0:
-            target_time = position * self.current_song.duration
-            # 注意：pygame 不支援直接跳轉，這裡只是記錄位置
-            logging.info(f"跳轉到: {target_time:.2f}s")
+        target_time = max(0.0, min(position, 1.0)) * self.current_song.duration
+        file_path = self.current_song.file_path
+        suffix = Path(file_path).suffix.lower()
+        was_paused = self.state == PlaybackState.PAUSED
+        
+        try:
+            if suffix in START_SEEK_EXTENSIONS:
+                # 解碼器支援直接從指定位置開始播放
+                pygame.mixer.music.play(start=target_time)
+            elif suffix == '.wav':
+                # 用跳轉表換算位元組位置，從該處開始串流
+                stream = get_wav_seek_table(file_path).open_at(target_time)
+                pygame.mixer.music.load(stream, 'wav')
+                pygame.mixer.music.play()
+            else:
+                logging.warning(f"此格式不支援跳轉: {suffix}")
+                return
+        except Exception as e:
+            logging.error(f"跳轉失敗: {e}")
+            return
+        
+        self._seek_offset = target_time
+        self._track_started_at = time.monotonic() - target_time
+        self._paused_at = None
+        if was_paused:
+            pygame.mixer.music.pause()
+            self._paused_at = time.monotonic()
+        logging.info(f"跳轉到: {target_time:.2f}s")
+        self._report_progress()
+        # 重新開始播放後 pygame 的佇列會被清除，重新預載
+        self._generation += 1
+        self._schedule_prefetch()
     
     def toggle_shuffle(self):
         """切換隨機播放模式"""
-        self.is_shuffle = not self.is_shuffle
-        logging.info(f"隨機播放: {'開啟' if self.is_shuffle else '關閉'}")
+        self._submit('toggle_shuffle')
     
     def toggle_repeat(self):
         """切換重複播放模式"""
+        self._submit('toggle_repeat')
+    
+    def toggle_normalization(self):
+        """切換響度正規化"""
+        self._submit('toggle_normalization')
+    
+    def _do_toggle_shuffle(self):
+        self.is_shuffle = not self.is_shuffle
+        if self.is_shuffle:
+            # 從目前的歌曲開始新的一輪
+            self._shuffle_bag.reset(self.current_song.file_path if self.current_song else None)
+        logging.info(f"隨機播放: {'開啟' if self.is_shuffle else '關閉'}")
+        self._do_reschedule_prefetch()
+    
+    def _do_toggle_repeat(self):
         self.is_repeat = not self.is_repeat
         logging.info(f"重複播放: {'開啟' if self.is_repeat else '關閉'}")
+        self._do_reschedule_prefetch()
+    
+    def _do_toggle_normalization(self):
+        self.normalize_loudness = LOUDNESS_AVAILABLE and not self.normalize_loudness
+        if self.current_song:
+            self._track_gain = self._gain_for(self.current_song.file_path)
+            self._apply_volume()
+        logging.info(f"響度正規化: {'開啟' if self.normalize_loudness else '關閉'}")
+        # 已排入佇列的下一首增益是在切換前查詢的
+        self._do_reschedule_prefetch()
+    
+    def _do_reschedule_prefetch(self):
+        """播放模式或播放清單改變後，已排入佇列的下一首可能不再正確，重新預載"""
+        if self.state != PlaybackState.STOPPED:
+            self._generation += 1
+            self._schedule_prefetch()
+    
+    def snapshot(self) -> Dict:
+        """
+        取得播放器狀態的一致快照
+        
+        引擎執行命令時持有同一把鎖，因此不會讀到換歌到一半的狀態
+        """
+        with self._state_lock:
+            song = self.current_song
+            position = self._position()
+            duration = song.duration if song else 0.0
+            return {
+                'state': self.state,
+                'generation': self._generation,
+                'current_index': self.current_index,
+                'current_song': song,
+                'position': position,
+                'duration': duration,
+                'progress': min(position / duration, 1.0) if duration > 0 else 0.0,
+                'total_songs': len(self.playlist),
+                'volume': self.volume,
+                'shuffle': self.is_shuffle,
+                'repeat': self.is_repeat,
+                'normalize': self.normalize_loudness,
+                'track_gain': self._track_gain,
+            }
     
     def get_current_progress(self) -> float:
         """獲取當前播放進度"""
-        if not self.current_song or self.current_song.duration <= 0:
-            return 0.0
-        
-        try:
-            # 嘗試獲取當前播放位置
-            # 注意：pygame 不提供直接獲取當前位置的方法
-            return 0.0
-        except:
-            return 0.0
+        return self.snapshot()['progress']
+    
+    def get_position(self) -> float:
+        """獲取當前播放位置（秒）"""
+        return self.snapshot()['position']
     
     def get_playlist_info(self) -> Dict:
         """獲取播放清單資訊"""
+        snap = self.snapshot()
         return {
-            'total_songs': len(self.playlist),
-            'current_index': self.current_index,
-            'current_song': self.current_song.title if self.current_song else None,
-            'state': self.state.value,
-            'volume': self.volume,
-            'shuffle': self.is_shuffle,
-            'repeat': self.is_repeat
+            'total_songs': snap['total_songs'],
+            'current_index': snap['current_index'],
+            'current_song': snap['current_song'].title if snap['current_song'] else None,
+            'state': snap['state'].value,
+            'volume': snap['volume'],
+            'shuffle': snap['shuffle'],
+            'repeat': snap['repeat']
         }
     
     def cleanup(self):
         """清理資源"""
         self.stop()
+        if self._engine_thread is not None and self._engine_thread.is_alive():
+            self._submit('shutdown', wait=False)
+            self._engine_thread.join(timeout=2.0)
         if self._pygame_initialized:
             pygame.mixer.quit()
             self._pygame_initialized = False
@@ -435,12 +1158,13 @@ class iPhoneBackgroundPlayer:
         """停用背景播放"""
         logging.info("背景播放已停用")
 
-def create_music_player(music_folder: str = "downloads") -> MusicPlayer:
+def create_music_player(music_folder: str = "downloads", persist_queue: bool = False) -> MusicPlayer:
     """
     創建音樂播放器實例
     
     Args:
         music_folder: 音樂檔案資料夾路徑
+        persist_queue: 是否保存播放佇列
         
     Returns:
         音樂播放器實例
@@ -448,5 +1172,5 @@ def create_music_player(music_folder: str = "downloads") -> MusicPlayer:
     if not PYGAME_AVAILABLE:
         raise ImportError("需要安裝 pygame 套件: pip install pygame")
     
-    player = MusicPlayer(music_folder)
+    player = MusicPlayer(music_folder, persist_queue=persist_queue)
     return player 
\ No newline at end of file
@@ -6,19 +6,36 @@
 """
 
 import streamlit as st
-import time
 import threading
 from pathlib import Path
 from typing import Optional
 
 # 匯入音樂播放器模組
 try:
-    from music_player import MusicPlayer, PlaybackState, Song, create_music_player
+    from music_player import MusicPlayer, PlaybackState, Song, create_music_player, song_from_track
     MUSIC_PLAYER_AVAILABLE = True
 except ImportError as e:
     st.error(f"❌ 音樂播放器模組載入失敗: {e}")
     MUSIC_PLAYER_AVAILABLE = False
 
+# 匯入播放清單儲存模組（與網頁播放器共用已儲存的播放清單）
+try:
+    from playlist_store import get_playlist_store
+    PLAYLIST_STORE_AVAILABLE = True
+except ImportError:
+    PLAYLIST_STORE_AVAILABLE = False
+
+# 匯入播放服務模組（所有工作階段共用同一個播放器）
+try:
+    from playback_daemon import ensure_daemon, PlaybackDaemonError
+    PLAYBACK_DAEMON_AVAILABLE = True
+except ImportError:
+    PLAYBACK_DAEMON_AVAILABLE = False
+    PlaybackDaemonError = ConnectionError
+
+# 播放中更新進度區塊的間隔（秒）
+PROGRESS_REFRESH_INTERVAL = 1.0
+
 # --- 頁面設定 ---
 st.set_page_config(
     page_title="🎵 音樂播放器",
@@ -44,6 +61,8 @@ if 'is_shuffle' not in st.session_state:
     st.session_state.is_shuffle = False
 if 'is_repeat' not in st.session_state:
     st.session_state.is_repeat = False
+if 'normalize_loudness' not in st.session_state:
+    st.session_state.normalize_loudness = True
 if 'music_folder' not in st.session_state:
     st.session_state.music_folder = "downloads"
 
@@ -53,17 +72,22 @@ def init_music_player():
         return False
     
     try:
+        if st.session_state.music_player is None and PLAYBACK_DAEMON_AVAILABLE:
+            # 優先連線到共用的播放服務，只需要一次輕量的 RPC
+            st.session_state.music_player = ensure_daemon(st.session_state.music_folder)
+        
         if st.session_state.music_player is None:
-            st.session_state.music_player = create_music_player(st.session_state.music_folder)
+            # 播放服務無法使用時，退回在此工作階段內建立播放器
+            st.session_state.music_player = create_music_player(st.session_state.music_folder, persist_queue=True)
+            # 還原上次的播放佇列，沒有時等待使用者掃描資料夾
+            st.session_state.music_player.restore_queue()
             
             # 設定回調函數
             def on_song_change(song: Song):
                 st.session_state.current_song = song
-                st.rerun()
             
             def on_state_change(state: PlaybackState):
                 st.session_state.playback_state = state
-                st.rerun()
             
             def on_progress(progress: float):
                 st.session_state.current_progress = progress
@@ -72,11 +96,78 @@ def init_music_player():
             st.session_state.music_player.on_state_change = on_state_change
             st.session_state.music_player.on_progress = on_progress
         
+        sync_player_state()
         return True
+    except PlaybackDaemonError as e:
+        # 播放服務已停止，下次重新整理時重新連線或重新啟動
+        st.session_state.music_player = None
+        st.error(f"播放服務連線中斷: {e}")
+        return False
     except Exception as e:
         st.error(f"初始化音樂播放器失敗: {e}")
         return False
 
+def sync_player_state():
+    """從播放器取得最新狀態（播放服務可能被其他工作階段操作過）"""
+    player = st.session_state.music_player
+    snap = player.snapshot()
+    st.session_state.current_song = snap['current_song']
+    st.session_state.playback_state = snap['state']
+    st.session_state.current_progress = snap['progress']
+    st.session_state.volume = snap['volume']
+    st.session_state.is_shuffle = snap['shuffle']
+    st.session_state.is_repeat = snap['repeat']
+    st.session_state.normalize_loudness = snap.get('normalize', False)
+    st.session_state.playlist = player.playlist
+
+def open_saved_playlist(name: str) -> int:
+    """開啟已儲存的播放清單，保留清單中的順序（不讀取音訊檔案）"""
+    tracks, position = get_playlist_store(st.session_state.music_folder).load_playlist(name)
+    st.session_state.music_player.set_playlist([song_from_track(track) for track in tracks], position)
+    st.session_state.playlist = st.session_state.music_player.playlist
+    return len(tracks)
+
+def show_saved_playlists():
+    """側邊欄：開啟已儲存的播放清單"""
+    playlists = get_playlist_store(st.session_state.music_folder).list_playlists()
+    if not playlists:
+        return
+    st.markdown("---")
+    st.subheader("💾 播放清單")
+    counts = {p['name']: p['track_count'] for p in playlists}
+    selected = st.selectbox(
+        "已儲存的播放清單",
+        list(counts),
+        format_func=lambda name: f"{name}（{counts[name]} 首）",
+        key="saved_playlist_selector"
+    )
+    if st.button("📂 開啟", use_container_width=True, key="open_saved_playlist"):
+        try:
+            st.success(f"✅ 已載入 {open_saved_playlist(selected)} 首歌曲")
+        except Exception as e:
+            st.error(f"開啟播放清單失敗: {e}")
+
+def _playback_progress(song: Song):
+    """播放進度區塊，換歌或狀態改變時才重新執行整個頁面"""
+    snap = st.session_state.music_player.snapshot()
+    if snap['current_song'] != song or snap['state'] != st.session_state.playback_state:
+        st.rerun()
+    
+    progress = snap['progress']
+    st.session_state.current_progress = progress
+    st.write(f"**進度:** {format_time(progress * song.duration)} / {song.duration_str}")
+    st.progress(progress, text=f"{progress:.1%}")
+
+def render_playback_progress(song: Song):
+    """
+    顯示播放進度
+    
+    以 fragment 定時只重新執行進度區塊，不再每秒重跑整個頁面；
+    暫停或停止時不會定時執行，閒置的分頁不佔用伺服器資源
+    """
+    playing = st.session_state.playback_state == PlaybackState.PLAYING
+    st.fragment(run_every=PROGRESS_REFRESH_INTERVAL if playing else None)(_playback_progress)(song)
+
 def scan_music_folder():
     """掃描音樂資料夾"""
     if st.session_state.music_player:
@@ -157,6 +248,9 @@ with st.sidebar:
         st.write(f"**隨機播放:** {'開啟' if info['shuffle'] else '關閉'}")
         st.write(f"**重複播放:** {'開啟' if info['repeat'] else '關閉'}")
 
+        if PLAYLIST_STORE_AVAILABLE:
+            show_saved_playlists()
+
 # 主要內容區域
 if not MUSIC_PLAYER_AVAILABLE:
     st.error("❌ 音樂播放器功能不可用")
@@ -238,6 +332,15 @@ else:
             if volume != st.session_state.volume:
                 st.session_state.volume = volume
                 st.session_state.music_player.set_volume(volume)
+            
+            normalize = st.checkbox(
+                "🎚️ 響度正規化",
+                value=st.session_state.normalize_loudness,
+                help="依預先分析的響度自動調低較大聲的歌曲，讓每首歌的音量一致"
+            )
+            if normalize != st.session_state.normalize_loudness:
+                st.session_state.normalize_loudness = normalize
+                st.session_state.music_player.toggle_normalization()
         
         # 當前播放資訊
         if st.session_state.current_song:
@@ -262,11 +365,16 @@ else:
             # 播放進度條
             if song.duration > 0:
                 st.markdown("### 📊 播放進度")
+                render_playback_progress(song)
                 progress = st.session_state.current_progress
-                current_time = progress * song.duration
                 
-                st.write(f"**進度:** {format_time(current_time)} / {song.duration_str}")
-                st.progress(progress, text=f"{progress:.1%}")
+                # 跳轉
+                seek_col1, seek_col2 = st.columns([3, 1])
+                with seek_col1:
+                    seek_target = st.slider("跳轉到", min_value=0.0, max_value=1.0, value=float(progress), step=0.01, format="%.2f", key="seek_target")
+                with seek_col2:
+                    if st.button("⏩ 跳轉", use_container_width=True):
+                        st.session_state.music_player.seek(seek_target)
         
         # 播放清單
         if st.session_state.playlist:
@@ -288,9 +396,11 @@ else:
             # 歌曲列表
             st.markdown("#### 🎵 歌曲列表")
             
+            # 只查詢一次目前的索引（使用播放服務時每次查詢都是一次請求）
+            playing_index = st.session_state.music_player.current_index
             for i, song in enumerate(st.session_state.playlist):
                 # 高亮當前播放的歌曲
-                is_current = (i == st.session_state.music_player.current_index)
+                is_current = (i == playing_index)
                 
                 with st.container():
                     col1, col2, col3, col4 = st.columns([1, 3, 1, 1])
@@ -353,8 +463,3 @@ st.markdown("""
 ### 📱 iPhone 背景播放
 本播放器支援 iPhone 背景播放功能，讓您可以在使用其他應用程式時繼續聽音樂。
 """)
-
-# 自動重新整理（用於更新播放進度）
-if st.session_state.music_player and st.session_state.playback_state == PlaybackState.PLAYING:
-    time.sleep(1)
-    st.rerun() 
\ No newline at end of file
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+播放服務模組
+由單一常駐程序擁有音訊裝置與播放清單，透過本機 HTTP API 提供播放控制，
+所有 Streamlit 工作階段都以輕量的用戶端連線，不再各自建立播放器；
+每個請求都必須帶著音樂資料夾中的存取權杖，命令只接受 JSON，
+讓瀏覽器中的其他網頁無法以跨來源請求控制播放或把任意路徑加入播放清單
+
+用法:
+    python -m playback_daemon --folder downloads --port 8765
+"""
+
+import os
+import sys
+import hmac
+import json
+import secrets
+import time
+import logging
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from dataclasses import asdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from music_player import MusicPlayer, PlaybackState, Song, create_music_player
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 只在本機監聽
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = 8765
+
+# 用戶端請求逾時（秒）
+CLIENT_TIMEOUT = 3.0
+
+# 自動啟動播放服務後等待它就緒的最長時間（秒）
+STARTUP_TIMEOUT = 10.0
+
+# 存取權杖檔案（與音樂庫索引一樣放在音樂資料夾內）與請求標頭
+TOKEN_FILE_NAME = ".playback_token"
+TOKEN_HEADER = "X-Playback-Token"
+
+# 可以透過 API 呼叫的播放器方法
+PLAYER_COMMANDS = {
+    'play', 'pause', 'resume', 'stop', 'next', 'previous',
+    'set_volume', 'seek', 'toggle_shuffle', 'toggle_repeat', 'toggle_normalization',
+}
+
+
+def daemon_token(music_folder: str = "downloads") -> str:
+    """
+    取得音樂資料夾的播放服務存取權杖，不存在時建立（只有目前使用者可讀取）
+
+    多個程序同時建立時只有一個會成功寫入，其他的讀取它寫入的權杖
+    """
+    folder = Path(music_folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / TOKEN_FILE_NAME
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50):
+            token = path.read_text(encoding='utf-8').strip()
+            if token:
+                return token
+            # 另一個程序剛建立檔案，還沒寫入內容
+            time.sleep(0.01)
+        raise PlaybackDaemonError(f"播放服務權杖檔案是空的: {path}")
+    token = secrets.token_urlsafe(32)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token)
+    return token
+
+
+def _song_to_dict(song: Optional[Song]) -> Optional[Dict[str, Any]]:
+    return asdict(song) if song else None
+
+
+def _song_from_dict(data: Optional[Dict[str, Any]]) -> Optional[Song]:
+    return Song(**data) if data else None
+
+
+class PlaybackDaemon:
+    """播放服務，包裝一個 MusicPlayer 並提供 HTTP API"""
+
+    def __init__(self, music_folder: str = "downloads", host: str = DAEMON_HOST, port: int = DAEMON_PORT,
+                 player: Optional[MusicPlayer] = None, token: Optional[str] = None):
+        """
+        初始化播放服務
+
+        Args:
+            music_folder: 音樂檔案資料夾
+            host: 監聽位址
+            port: 監聽埠號，0 代表由系統指定（實際埠號在啟動後寫回 port）
+            player: 使用已建立的播放器，None 時在啟動時建立並還原播放佇列
+            token: 存取權杖，None 時使用音樂資料夾中的權杖檔案
+        """
+        self.music_folder = music_folder
+        self.token = token or daemon_token(music_folder)
+        self.player: Optional[MusicPlayer] = player
+        self.host = host
+        self.port = port
+        # 播放清單版本：清單改變時遞增，用戶端只在版本不同時重新下載清單
+        self.playlist_version = 1
+        self._lock = threading.Lock()
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    # --- API 實作 ---
+
+    def state(self) -> Dict[str, Any]:
+        """目前的播放狀態"""
+        snap = self.player.snapshot()
+        snap['state'] = snap['state'].value
+        snap['current_song'] = _song_to_dict(snap['current_song'])
+        snap['playlist_version'] = self.playlist_version
+        return snap
+
+    def playlist(self, since_version: Optional[int] = None) -> Dict[str, Any]:
+        """播放清單，版本未改變時不重送內容"""
+        if since_version == self.playlist_version:
+            return {'version': self.playlist_version, 'unchanged': True}
+        return {'version': self.playlist_version,
+                'songs': [_song_to_dict(song) for song in self.player.playlist]}
+
+    def _outside_folder(self, file_paths: List[str]) -> List[str]:
+        """找出不在音樂資料夾內的路徑"""
+        root = Path(self.music_folder).resolve()
+        outside = []
+        for file_path in file_paths:
+            try:
+                Path(file_path).resolve().relative_to(root)
+            except (TypeError, ValueError):
+                outside.append(str(file_path))
+        return outside
+
+    def command(self, name: str, args: List[Any]) -> Dict[str, Any]:
+        """執行播放命令；加入播放清單的檔案必須位於音樂資料夾內"""
+        if name in ('add_files', 'set_playlist'):
+            items = args[0] if args else []
+            paths = items if name == 'add_files' else [(song or {}).get('file_path') for song in items]
+            outside = self._outside_folder(paths)
+            if outside:
+                return {'success': False, 'error': f"檔案不在音樂資料夾中: {outside[0]}"}
+        if name == 'scan':
+            songs = self.player.scan_music_folder()
+            self._bump_playlist()
+            return {'success': True, 'total_songs': len(songs)}
+        if name == 'add_files':
+            added = self.player.add_files(*args)
+            if added:
+                self._bump_playlist()
+            return {'success': True, 'added': [_song_to_dict(song) for song in added]}
+        if name == 'set_playlist':
+            songs = args[0] if args else []
+            current_index = args[1] if len(args) > 1 else -1
+            self.player.set_playlist([_song_from_dict(song) for song in songs], current_index)
+            self._bump_playlist()
+            return {'success': True, 'total_songs': len(songs)}
+        if name not in PLAYER_COMMANDS:
+            return {'success': False, 'error': f"未知的命令: {name}"}
+        getattr(self.player, name)(*args)
+        return {'success': True}
+
+    def _bump_playlist(self):
+        with self._lock:
+            self.playlist_version += 1
+
+    # --- HTTP 伺服器 ---
+
+    def _make_handler(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _authorized(self) -> bool:
+                """檢查存取權杖，不符合時直接回覆 403"""
+                token = self.headers.get(TOKEN_HEADER, '')
+                if hmac.compare_digest(token.encode('utf-8'), daemon.token.encode('utf-8')):
+                    return True
+                self._reply({'success': False, 'error': "存取權杖錯誤"}, 403)
+                return False
+
+            def _reply(self, payload: Dict[str, Any], status: int = 200):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if not self._authorized():
+                    return
+                path, _, query = self.path.partition('?')
+                if path == '/state':
+                    self._reply(daemon.state())
+                elif path == '/playlist':
+                    params = dict(p.split('=', 1) for p in query.split('&') if '=' in p)
+                    since = params.get('since')
+                    self._reply(daemon.playlist(int(since) if since and since.isdigit() else None))
+                else:
+                    self._reply({'success': False, 'error': "找不到路徑"}, 404)
+
+            def do_POST(self):
+                if self.path != '/command':
+                    self._reply({'success': False, 'error': "找不到路徑"}, 404)
+                    return
+                # 只接受 JSON：瀏覽器送出這種請求前必須先預檢，而播放服務從不允許跨來源請求
+                content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                if content_type != 'application/json':
+                    self._reply({'success': False, 'error': "只接受 application/json"}, 415)
+                    return
+                if not self._authorized():
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                    self._reply(daemon.command(request.get('command', ''), request.get('args', [])))
+                except Exception as e:
+                    logging.error(f"處理播放命令失敗: {e}")
+                    self._reply({'success': False, 'error': str(e)}, 500)
+
+            def log_message(self, format, *args):
+                logging.debug(f"播放服務請求: {format % args}")
+
+        return Handler
+
+    def serve_forever(self):
+        """綁定埠號後才初始化音訊裝置並還原播放佇列（沒有時掃描一次音樂資料夾），接著開始提供服務"""
+        # 埠號已被其他播放服務使用時會在這裡失敗，不會搶占音訊裝置
+        self.server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self.port = self.server.server_address[1]
+        try:
+            if self.player is None:
+                self.player = create_music_player(self.music_folder, persist_queue=True)
+                # 有保存的播放佇列時直接還原，不需要掃描整個資料夾
+                if not self.player.restore_queue():
+                    self.player.scan_music_folder()
+            logging.info(f"播放服務已啟動: http://{self.host}:{self.port}")
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if self.player:
+                self.player.cleanup()
+
+    def shutdown(self):
+        if self.server:
+            self.server.shutdown()
+
+
+class PlaybackDaemonError(ConnectionError):
+    """無法連線到播放服務"""
+
+
+class PlaybackClient:
+    """
+    播放服務的用戶端
+
+    提供與 MusicPlayer 相同的操作介面，介面程式可以直接替換使用；
+    狀態以 snapshot() 查詢，播放清單依版本號快取
+    """
+
+    def __init__(self, host: str = DAEMON_HOST, port: int = DAEMON_PORT, timeout: float = CLIENT_TIMEOUT,
+                 token: str = ""):
+        self.base_url = f"http://{host}:{port}"
+        self.timeout = timeout
+        self.token = token
+        self._playlist: List[Song] = []
+        self._playlist_version: Optional[int] = None
+        # 回調由服務端的播放器觸發，用戶端只保留屬性以相容 MusicPlayer 的介面
+        self.on_song_change = None
+        self.on_state_change = None
+        self.on_progress = None
+
+    def _request(self, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data,
+                                         headers={'Content-Type': 'application/json', TOKEN_HEADER: self.token})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise PlaybackDaemonError(f"無法連線到播放服務: {e}") from e
+
+    def _command(self, name: str, *args) -> Dict[str, Any]:
+        result = self._request('/command', {'command': name, 'args': list(args)})
+        if not result.get('success'):
+            logging.error(f"播放命令失敗: {result.get('error')}")
+        return result
+
+    def ping(self) -> bool:
+        """檢查播放服務是否可用"""
+        try:
+            self._request('/state')
+            return True
+        except PlaybackDaemonError:
+            return False
+
+    # --- 狀態查詢 ---
+
+    def snapshot(self) -> Dict[str, Any]:
+        snap = self._request('/state')
+        snap['state'] = PlaybackState(snap['state'])
+        snap['current_song'] = _song_from_dict(snap['current_song'])
+        return snap
+
+    @property
+    def playlist(self) -> List[Song]:
+        result = self._request(f"/playlist?since={self._playlist_version or ''}")
+        if not result.get('unchanged'):
+            self._playlist = [_song_from_dict(song) for song in result.get('songs', [])]
+            self._playlist_version = result.get('version')
+        return self._playlist
+
+    @property
+    def current_index(self) -> int:
+        return self.snapshot()['current_index']
+
+    @property
+    def current_song(self) -> Optional[Song]:
+        return self.snapshot()['current_song']
+
+    @property
+    def state(self) -> PlaybackState:
+        return self.snapshot()['state']
+
+    def get_current_progress(self) -> float:
+        return self.snapshot()['progress']
+
+    def get_position(self) -> float:
+        return self.snapshot()['position']
+
+    def get_playlist_info(self) -> Dict:
+        snap = self.snapshot()
+        return {
+            'total_songs': snap['total_songs'],
+            'current_index': snap['current_index'],
+            'current_song': snap['current_song'].title if snap['current_song'] else None,
+            'state': snap['state'].value,
+            'volume': snap['volume'],
+            'shuffle': snap['shuffle'],
+            'repeat': snap['repeat']
+        }
+
+    # --- 播放清單 ---
+
+    def scan_music_folder(self) -> List[Song]:
+        self._command('scan')
+        return self.playlist
+
+    def add_files(self, file_paths: List[str]) -> List[Song]:
+        added = self._command('add_files', [str(p) for p in file_paths]).get('added', [])
+        return [_song_from_dict(song) for song in added]
+
+    def set_playlist(self, songs: List[Song], current_index: int = -1):
+        self._command('set_playlist', [_song_to_dict(song) for song in songs], current_index)
+
+    # --- 播放控制 ---
+
+    def play(self, song_index: Optional[int] = None):
+        self._command('play', song_index)
+
+    def pause(self):
+        self._command('pause')
+
+    def resume(self):
+        self._command('resume')
+
+    def stop(self):
+        self._command('stop')
+
+    def next(self):
+        self._command('next')
+
+    def previous(self):
+        self._command('previous')
+
+    def set_volume(self, volume: float):
+        self._command('set_volume', volume)
+
+    def seek(self, position: float):
+        self._command('seek', position)
+
+    def toggle_shuffle(self):
+        self._command('toggle_shuffle')
+
+    def toggle_repeat(self):
+        self._command('toggle_repeat')
+
+    def toggle_normalization(self):
+        self._command('toggle_normalization')
+
+    def cleanup(self):
+        """播放服務由多個工作階段共用，用戶端結束時不停止播放"""
+
+
+def ensure_daemon(music_folder: str = "downloads", host: str = DAEMON_HOST,
+                  port: int = DAEMON_PORT) -> Optional[PlaybackClient]:
+    """
+    取得播放服務的用戶端，服務尚未執行時在背景啟動它
+
+    Returns:
+        可用的用戶端，無法啟動時返回 None
+    """
+    # 權杖在啟動服務前建立，服務與所有用戶端都從音樂資料夾讀取同一個權杖
+    client = PlaybackClient(host, port, token=daemon_token(music_folder))
+    if client.ping():
+        return client
+
+    logging.info("播放服務尚未執行，正在背景啟動...")
+    # 多個工作階段同時啟動時，只有一個能綁定埠號，其他的會自行結束
+    subprocess.Popen(
+        [sys.executable, '-m', 'playback_daemon', '--folder', music_folder,
+         '--host', host, '--port', str(port)],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.2)
+        if client.ping():
+            return client
+    logging.error("播放服務啟動逾時")
+    return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="音樂播放服務")
+    parser.add_argument('--folder', default='downloads', help="音樂資料夾")
+    parser.add_argument('--host', default=DAEMON_HOST, help="監聽位址")
+    parser.add_argument('--port', type=int, default=DAEMON_PORT, help="監聽埠號")
+    args = parser.parse_args(argv)
+
+    daemon = PlaybackDaemon(args.folder, args.host, args.port)
+    try:
+        daemon.serve_forever()
+    except OSError as e:
+        logging.error(f"無法啟動播放服務（可能已在執行）: {e}")
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
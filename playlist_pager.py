@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+播放清單分頁模組
+大型音樂庫只顯示目前這一頁的歌曲，歌曲資訊一次從音樂庫索引批次讀取，
+顯示成本只與可見的列數有關，不會隨音樂庫大小增加
+"""
+
+from pathlib import Path
+from typing import List, Dict, Any, Tuple
+
+from music_library import MusicLibrary
+
+# 匯入 Streamlit（只有分頁控制元件需要）
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+# 每頁顯示的歌曲數量選項
+PAGE_SIZE_OPTIONS = (20, 50, 100)
+DEFAULT_PAGE_SIZE = 20
+
+
+def page_bounds(total: int, page: int, page_size: int) -> Tuple[int, int, int, int]:
+    """
+    計算分頁範圍
+
+    Args:
+        total: 項目總數
+        page: 頁碼（從 1 開始），超出範圍時自動修正
+        page_size: 每頁數量
+
+    Returns:
+        (修正後的頁碼, 起始索引, 結束索引, 總頁數)
+    """
+    page_size = max(1, page_size)
+    page_count = max(1, (total + page_size - 1) // page_size)
+    page = min(max(1, page), page_count)
+    start = (page - 1) * page_size
+    return page, start, min(start + page_size, total), page_count
+
+
+def page_of_index(index: int, page_size: int) -> int:
+    """取得某個索引所在的頁碼（從 1 開始）"""
+    return max(0, index) // max(1, page_size) + 1
+
+
+def visible_track_info(library: MusicLibrary, file_paths: List[Path]) -> List[Dict[str, Any]]:
+    """
+    取得可見歌曲的資訊
+
+    以一次查詢從音樂庫索引讀取；尚未登記的檔案才讀取標籤並登記，之後不需要再讀取
+
+    Returns:
+        與 file_paths 順序對應的資訊字典（title、artist、album、duration、file_size）
+    """
+    tracks = library.get_by_paths(file_paths)
+    infos = []
+    for file_path, track in zip(file_paths, tracks):
+        if track is None and library.add_file(file_path) is not None:
+            track = library.get_by_path(file_path)
+        if track is None:
+            try:
+                file_size = Path(file_path).stat().st_size
+            except OSError:
+                file_size = 0
+            track = {'title': Path(file_path).stem, 'artist': '未知藝術家', 'album': '未知專輯',
+                     'duration': 0, 'file_size': file_size}
+        infos.append(track)
+    return infos
+
+
+def render_pager(total: int, key: str, follow_index: int = -1) -> Tuple[int, int]:
+    """
+    顯示分頁控制元件
+
+    Args:
+        total: 項目總數
+        key: 元件鍵值前綴，同一頁面上的多個清單需使用不同的鍵值
+        follow_index: 此索引改變時自動跳到它所在的頁面（例如目前播放的歌曲），-1 表示不跟隨
+
+    Returns:
+        本頁的 (起始索引, 結束索引)
+    """
+    page_key, size_key, follow_key = f"{key}_page", f"{key}_page_size", f"{key}_follow"
+    if size_key not in st.session_state:
+        st.session_state[size_key] = DEFAULT_PAGE_SIZE
+    if page_key not in st.session_state:
+        st.session_state[page_key] = 1
+    page_size = st.session_state[size_key]
+
+    if follow_index >= 0 and st.session_state.get(follow_key) != follow_index:
+        st.session_state[follow_key] = follow_index
+        st.session_state[page_key] = page_of_index(follow_index, page_size)
+
+    page, start, end, page_count = page_bounds(total, st.session_state[page_key], page_size)
+    st.session_state[page_key] = page
+
+    def go_to(target: int):
+        # 在回調中修改頁碼，頁碼輸入框尚未建立，不會與元件狀態衝突
+        st.session_state[page_key] = target
+
+    col1, col2, col3, col4, col5 = st.columns([1, 1, 2, 1, 1])
+    with col1:
+        st.button("⏮️", key=f"{key}_first", disabled=page <= 1, help="第一頁", on_click=go_to, args=(1,))
+    with col2:
+        st.button("◀️", key=f"{key}_prev", disabled=page <= 1, help="上一頁", on_click=go_to, args=(page - 1,))
+    with col3:
+        st.number_input(
+            f"頁數（共 {page_count} 頁，{total} 首）", min_value=1, max_value=page_count,
+            step=1, key=page_key,
+        )
+    with col4:
+        st.button("▶️", key=f"{key}_next", disabled=page >= page_count, help="下一頁",
+                  on_click=go_to, args=(page + 1,))
+    with col5:
+        st.selectbox("每頁", PAGE_SIZE_OPTIONS, key=size_key)
+
+    st.caption(f"顯示第 {start + 1 if total else 0}-{end} 首")
+    return start, end
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+播放清單儲存模組
+把具名播放清單與播放佇列存放在音樂庫索引中（只記錄歌曲 ID 與順序），
+開啟清單時直接從索引讀取歌曲資訊，不需要掃描資料夾或讀取音訊檔案；
+並支援匯入與匯出 M3U8 格式
+"""
+
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Dict, List, Any, Tuple
+
+from music_library import MusicLibrary, get_library
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 播放佇列以保留名稱存放，不會出現在播放清單列表中
+QUEUE_PLAYLIST_NAME = "__queue__"
+
+# playlists.current_position 記錄目前歌曲那一項的 position 欄位（不是清單中的索引），
+# 歌曲從音樂庫移除、項目被連帶刪除而留下空號時，仍指向同一首歌
+
+
+class PlaylistStore:
+    """具名播放清單與播放佇列"""
+
+    def __init__(self, library: MusicLibrary):
+        """
+        初始化播放清單儲存
+
+        Args:
+            library: 音樂庫索引，播放清單與歌曲存放在同一個資料庫
+        """
+        self.library = library
+
+    # --- 內部工具 ---
+
+    def _playlist_id(self, conn, name: str, create: bool = False) -> Optional[int]:
+        row = conn.execute("SELECT id FROM playlists WHERE name = ?", (name,)).fetchone()
+        if row:
+            return row['id']
+        if not create:
+            return None
+        now = time.time()
+        cursor = conn.execute(
+            "INSERT INTO playlists (name, created_at, updated_at) VALUES (?, ?, ?)", (name, now, now)
+        )
+        return cursor.lastrowid
+
+    def _write_items(self, conn, playlist_id: int, track_ids: List[int], start: int = 0):
+        conn.executemany(
+            "INSERT INTO playlist_items (playlist_id, position, track_id) VALUES (?, ?, ?)",
+            [(playlist_id, start + i, track_id) for i, track_id in enumerate(track_ids)],
+        )
+        conn.execute("UPDATE playlists SET updated_at = ? WHERE id = ?", (time.time(), playlist_id))
+
+    def track_ids_for_files(self, file_paths) -> List[Optional[int]]:
+        """將檔案路徑轉為歌曲 ID，存在但尚未登記的檔案會先登記到音樂庫"""
+        file_paths = [Path(path) for path in file_paths]
+        track_ids = self.library.ids_for_paths(file_paths)
+        for i, (path, track_id) in enumerate(zip(file_paths, track_ids)):
+            if track_id is None and path.exists():
+                track_ids[i] = self.library.add_file(path)
+        return track_ids
+
+    # --- 播放清單 ---
+
+    def list_playlists(self) -> List[Dict[str, Any]]:
+        """列出所有播放清單（不含播放佇列）與歌曲數量"""
+        with self.library.transaction() as conn:
+            rows = conn.execute(
+                """
+                SELECT p.id, p.name, p.updated_at, COUNT(i.track_id) AS track_count
+                FROM playlists p LEFT JOIN playlist_items i ON i.playlist_id = p.id
+                WHERE p.name != ?
+                GROUP BY p.id ORDER BY p.name
+                """,
+                (QUEUE_PLAYLIST_NAME,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def save_playlist(self, name: str, track_ids: List[int], current_position: int = 0) -> int:
+        """
+        儲存播放清單（取代原有內容）
+
+        Args:
+            name: 播放清單名稱
+            track_ids: 依播放順序排列的歌曲 ID
+            current_position: 目前播放到的位置（track_ids 中的索引）
+
+        Returns:
+            播放清單 ID
+        """
+        # 略過的歌曲在目前位置之前時，位置跟著往前移
+        current_position -= sum(1 for track_id in track_ids[:current_position] if track_id is None)
+        track_ids = [track_id for track_id in track_ids if track_id is not None]
+        with self.library.transaction() as conn:
+            playlist_id = self._playlist_id(conn, name, create=True)
+            conn.execute("DELETE FROM playlist_items WHERE playlist_id = ?", (playlist_id,))
+            self._write_items(conn, playlist_id, track_ids)
+            conn.execute("UPDATE playlists SET current_position = ? WHERE id = ?", (current_position, playlist_id))
+        logging.info(f"已儲存播放清單 {name}（{len(track_ids)} 首）")
+        return playlist_id
+
+    def append_tracks(self, name: str, track_ids: List[int]) -> int:
+        """把歌曲加到播放清單最後面，清單不存在時自動建立，返回加入的數量"""
+        track_ids = [track_id for track_id in track_ids if track_id is not None]
+        with self.library.transaction() as conn:
+            playlist_id = self._playlist_id(conn, name, create=True)
+            row = conn.execute(
+                "SELECT COALESCE(MAX(position), -1) FROM playlist_items WHERE playlist_id = ?", (playlist_id,)
+            ).fetchone()
+            self._write_items(conn, playlist_id, track_ids, start=row[0] + 1)
+        return len(track_ids)
+
+    def rename_playlist(self, name: str, new_name: str) -> bool:
+        with self.library.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE playlists SET name = ?, updated_at = ? WHERE name = ?", (new_name, time.time(), name)
+            )
+        return cursor.rowcount > 0
+
+    def delete_playlist(self, name: str) -> bool:
+        with self.library.transaction() as conn:
+            cursor = conn.execute("DELETE FROM playlists WHERE name = ?", (name,))
+        return cursor.rowcount > 0
+
+    def track_ids(self, name: str) -> List[int]:
+        """取得播放清單的歌曲 ID（依順序）"""
+        with self.library.transaction() as conn:
+            playlist_id = self._playlist_id(conn, name)
+            if playlist_id is None:
+                return []
+            rows = conn.execute(
+                "SELECT track_id FROM playlist_items WHERE playlist_id = ? ORDER BY position", (playlist_id,)
+            ).fetchall()
+        return [row['track_id'] for row in rows]
+
+    def load_playlist(self, name: str) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        讀取播放清單
+
+        Returns:
+            (歌曲資訊列表, 目前播放位置)；已從音樂庫移除的歌曲會被略過
+        """
+        with self.library.transaction() as conn:
+            # 目前那一項之前還有幾項，就是它在清單中的索引
+            row = conn.execute(
+                """
+                SELECT (SELECT COUNT(*) FROM playlist_items i
+                        WHERE i.playlist_id = p.id AND i.position < p.current_position) AS current_index
+                FROM playlists p WHERE p.name = ?
+                """,
+                (name,),
+            ).fetchone()
+        if row is None:
+            return [], 0
+        tracks = self.library.get_tracks(self.track_ids(name))
+        return tracks, min(row['current_index'], max(len(tracks) - 1, 0))
+
+    # --- 播放佇列 ---
+
+    def save_queue(self, track_ids: List[int], current_position: int = 0) -> int:
+        """儲存目前的播放佇列與播放位置"""
+        return self.save_playlist(QUEUE_PLAYLIST_NAME, track_ids, current_position)
+
+    def load_queue(self) -> Tuple[List[Dict[str, Any]], int]:
+        """讀取上次儲存的播放佇列"""
+        return self.load_playlist(QUEUE_PLAYLIST_NAME)
+
+    def save_queue_position(self, current_position: int):
+        """只更新播放佇列的目前位置（佇列中的索引）"""
+        with self.library.transaction() as conn:
+            # 將索引轉為該項的 position，超出範圍時保留索引，讀取時會限制在最後一首
+            conn.execute(
+                """
+                UPDATE playlists SET current_position = COALESCE(
+                    (SELECT position FROM playlist_items WHERE playlist_id = playlists.id
+                     ORDER BY position LIMIT 1 OFFSET ?), ?)
+                WHERE name = ?
+                """,
+                (current_position, current_position, QUEUE_PLAYLIST_NAME),
+            )
+
+    # --- M3U8 ---
+
+    def m3u8_text(self, name: str, base_dir=None) -> str:
+        """
+        產生播放清單的 M3U8 內容
+
+        Args:
+            name: 播放清單名稱
+            base_dir: 歌曲路徑盡量寫成相對於此資料夾的路徑，預設為音樂資料夾
+        """
+        tracks, _ = self.load_playlist(name)
+        base = Path(base_dir or self.library.music_folder).resolve()
+        lines = ["#EXTM3U", f"#PLAYLIST:{name}"]
+        for track in tracks:
+            file_path = Path(track['file_path']).resolve()
+            try:
+                entry = os.path.relpath(file_path, base)
+            except ValueError:
+                # Windows 上不同磁碟機無法使用相對路徑
+                entry = str(file_path)
+            lines.append(f"#EXTINF:{int(round(track['duration']))},{track['artist']} - {track['title']}")
+            lines.append(Path(entry).as_posix())
+        return "\n".join(lines) + "\n"
+
+    def export_m3u8(self, name: str, output_path) -> Dict[str, Any]:
+        """
+        將播放清單匯出為 M3U8 檔案，歌曲路徑寫成相對於清單檔的路徑
+
+        Returns:
+            結果字典，包含 success、file_path 或 error
+        """
+        output_path = Path(output_path)
+        try:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            output_path.write_text(self.m3u8_text(name, output_path.resolve().parent), encoding='utf-8')
+        except OSError as e:
+            logging.error(f"匯出播放清單失敗: {e}")
+            return {"success": False, "error": str(e)}
+        return {"success": True, "file_path": str(output_path)}
+
+    def import_m3u8(self, m3u_path, name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        從 M3U/M3U8 檔案匯入播放清單
+
+        相對路徑以清單檔所在的資料夾為基準；存在但尚未登記的檔案會先登記到音樂庫
+
+        Args:
+            m3u_path: 清單檔路徑
+            name: 播放清單名稱，預設使用檔案內的 #PLAYLIST 或檔名
+
+        Returns:
+            結果字典，包含 success、name、imported、missing 或 error
+        """
+        m3u_path = Path(m3u_path)
+        try:
+            text = m3u_path.read_text(encoding='utf-8-sig')
+        except (OSError, UnicodeDecodeError) as e:
+            logging.error(f"讀取播放清單檔失敗: {e}")
+            return {"success": False, "error": str(e)}
+        return self.import_m3u8_text(text, name, base_dir=m3u_path.parent, fallback_name=m3u_path.stem)
+
+    def import_m3u8_text(self, text: str, name: Optional[str] = None, base_dir=None,
+                         fallback_name: str = "匯入的播放清單") -> Dict[str, Any]:
+        """
+        從 M3U8 文字內容匯入播放清單（供網頁上傳的檔案使用）
+
+        Args:
+            text: 清單內容
+            name: 播放清單名稱，None 時使用 #PLAYLIST 或 fallback_name
+            base_dir: 相對路徑的基準資料夾，預設為音樂資料夾
+        """
+        base_dir = Path(base_dir) if base_dir else self.library.music_folder
+        declared_name = None
+        entries = []
+        for line in text.splitlines():
+            line = line.strip()
+            if line.startswith("#PLAYLIST:"):
+                declared_name = line[len("#PLAYLIST:"):].strip() or None
+            elif line and not line.startswith("#"):
+                path = Path(line)
+                entries.append(path if path.is_absolute() else base_dir / path)
+
+        name = name or declared_name or fallback_name
+        track_ids = self.track_ids_for_files(entries)
+        missing = [str(path) for path, track_id in zip(entries, track_ids) if track_id is None]
+
+        self.save_playlist(name, track_ids)
+        if missing:
+            logging.warning(f"播放清單 {name} 有 {len(missing)} 首歌曲找不到")
+        return {"success": True, "name": name, "imported": len(entries) - len(missing), "missing": missing}
+
+
+_stores: Dict[str, PlaylistStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_playlist_store(music_folder: str = "downloads") -> PlaylistStore:
+    """
+    取得音樂資料夾對應的共用播放清單儲存
+
+    Args:
+        music_folder: 音樂檔案資料夾路徑
+
+    Returns:
+        播放清單儲存實例
+    """
+    key = str(Path(music_folder).resolve())
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = PlaylistStore(get_library(music_folder))
+            _stores[key] = store
+        return store
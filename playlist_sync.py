@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+播放列表與頻道同步模組
+逐筆列舉播放列表中的影片，略過已下載的項目，並把新影片即時送進並行下載
+同步進度會寫入檢查點，大型頻道可以分多次增量同步
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable
+
+from youtube_downloader import YouTubeDownloader
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 頻道網址：/@名稱、/channel/ID、/c/名稱、/user/名稱
+_CHANNEL_RE = re.compile(r'youtube\.com/(@[^/?#]+|channel/[^/?#]+|c/[^/?#]+|user/[^/?#]+)')
+
+
+def is_playlist_url(url: str) -> bool:
+    """
+    判斷網址是否為播放列表或頻道
+
+    只有 list 參數而沒有指定影片時才視為播放列表，
+    從播放列表點進去的單一影片網址（watch?v=...&list=...）仍然只下載該影片
+    """
+    if _CHANNEL_RE.search(url) or '/playlist?' in url:
+        return True
+    return 'list=' in url and 'v=' not in url and 'youtu.be/' not in url
+
+
+
+
+class SyncCheckpoint:
+    """單一播放列表的同步檢查點，記錄已完成與失敗的影片 ID"""
+
+    def __init__(self, checkpoint_file: Path):
+        self.checkpoint_file = checkpoint_file
+        self.done = set()
+        self.failed: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """讀取既有的檢查點"""
+        if not self.checkpoint_file.exists():
+            return
+        try:
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.done = set(data.get('done', []))
+            self.failed = dict(data.get('failed', {}))
+        except (OSError, ValueError) as e:
+            logging.warning(f"無法讀取同步檢查點 {self.checkpoint_file}: {e}")
+
+    def _save(self):
+        """以原子方式寫入檢查點（先寫暫存檔再取代）"""
+        self.checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.checkpoint_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'done': sorted(self.done),
+                'failed': self.failed,
+                'updated_at': time.time(),
+            }, f, ensure_ascii=False)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def mark_done(self, video_id: str):
+        with self._lock:
+            self.done.add(video_id)
+            self.failed.pop(video_id, None)
+            self._save()
+
+    def mark_failed(self, video_id: str, error: str):
+        with self._lock:
+            self.failed[video_id] = error
+            self._save()
+
+
+class PlaylistSyncer:
+    """播放列表／頻道增量同步器"""
+
+    def __init__(self, downloader: Optional[YouTubeDownloader] = None, max_workers: int = 3,
+                 checkpoint_dir: Optional[str] = None):
+        """
+        初始化同步器
+
+        Args:
+            downloader: 使用的下載器，預設建立一個不自動上傳的下載器
+            max_workers: 同時下載的數量
+            checkpoint_dir: 檢查點目錄，預設為下載目錄中的 .sync
+        """
+        self.downloader = downloader or YouTubeDownloader()
+        self.max_workers = max_workers
+        self.checkpoint_dir = Path(checkpoint_dir) if checkpoint_dir else self.downloader.download_dir / ".sync"
+
+    def _checkpoint_for(self, playlist_id: str) -> SyncCheckpoint:
+        safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in playlist_id)
+        return SyncCheckpoint(self.checkpoint_dir / f"{safe_id}.json")
+
+    def sync(self, playlist_url: str, file_format: str = "mp3", retry_failed: bool = True,
+             stop_after_known: Optional[int] = None,
+             on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        同步播放列表或頻道，只下載尚未下載過的影片
+
+        Args:
+            playlist_url: 播放列表或頻道網址
+            file_format: "mp3" 或 "mp4"
+            retry_failed: 是否重試上次失敗的影片
+            stop_after_known: 連續遇到幾支已下載的影片後停止列舉（頻道由新到舊排列時適用）
+            on_result: 每支影片處理完成後的回調，參數為結果字典
+
+        Returns:
+            同步摘要，包含列舉、略過、下載成功與失敗的數量
+        """
+        download_func = self.downloader.download_mp4 if file_format == "mp4" else self.downloader.download_mp3
+        known_ids = self.downloader.library.video_ids() if self.downloader.library else set()
+
+        summary = {'playlist_id': None, 'title': None, 'listed': 0, 'skipped': 0,
+                   'downloaded': 0, 'failed': 0}
+        summary_lock = threading.Lock()
+        # 控制同時排隊的工作數量，避免列舉遠遠跑在下載前面
+        slots = threading.BoundedSemaphore(self.max_workers * 2)
+        checkpoint = None
+
+        def run(entry):
+            try:
+                result = download_func(entry['url'])
+                ok = bool(result.get('file_path'))
+                error = None if ok else "沒有產生任何檔案"
+            except Exception as e:
+                ok, error, result = False, str(e), {}
+            finally:
+                slots.release()
+
+            if ok:
+                checkpoint.mark_done(entry['id'])
+            else:
+                checkpoint.mark_failed(entry['id'], error)
+            with summary_lock:
+                summary['downloaded' if ok else 'failed'] += 1
+            report = {'video_id': entry['id'], 'url': entry['url'], 'title': entry['title'], 'success': ok,
+                      'file_paths': result.get('file_paths', []), 'error': error}
+            if on_result:
+                try:
+                    on_result(report)
+                except Exception as e:
+                    logging.error(f"同步回調錯誤: {e}")
+
+        consecutive_known = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for playlist, entry in self.downloader.iter_playlist_entries(playlist_url):
+                if checkpoint is None:
+                    summary['playlist_id'] = playlist['id']
+                    summary['title'] = playlist['title']
+                    checkpoint = self._checkpoint_for(playlist['id'] or playlist_url)
+                summary['listed'] += 1
+
+                video_id = entry['id']
+                already = video_id in known_ids or video_id in checkpoint.done
+                if not already and not retry_failed and video_id in checkpoint.failed:
+                    already = True
+                if already:
+                    summary['skipped'] += 1
+                    consecutive_known += 1
+                    if stop_after_known and consecutive_known >= stop_after_known:
+                        logging.info(f"連續 {consecutive_known} 支影片已下載，停止列舉")
+                        break
+                    continue
+
+                consecutive_known = 0
+                slots.acquire()
+                executor.submit(run, entry)
+
+        logging.info(
+            f"播放列表同步完成: {summary['title']} - 列舉 {summary['listed']}、略過 {summary['skipped']}、"
+            f"成功 {summary['downloaded']}、失敗 {summary['failed']}"
+        )
+        return summary
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+選取模型模組
+以穩定的鍵值（音樂庫歌曲 ID、影片 ID）記錄選取的項目，
+查詢、切換、全選與範圍選取都不需要逐項比對列表，上萬個項目也能即時完成
+"""
+
+from typing import Hashable, Iterable, List, Optional, Sequence
+
+
+class Selection:
+    """
+    一組選取的項目
+
+    內部使用集合，單一項目的查詢與切換為 O(1)；
+    全選、取消全選與依查詢選取只需一次集合運算。
+    每次批次變更都會遞增 version，介面可用它組成勾選框的鍵值，
+    讓已顯示的勾選框跟著批次變更更新
+    """
+
+    def __init__(self, keys: Iterable[Hashable] = ()):
+        self._keys = set(keys)
+        # 最後一次單獨切換的項目，作為範圍選取的起點
+        self.anchor: Optional[Hashable] = None
+        self.version = 0
+
+    def __contains__(self, key) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __bool__(self) -> bool:
+        return bool(self._keys)
+
+    # --- 單一項目 ---
+
+    def set(self, key: Hashable, selected: bool):
+        """設定單一項目是否選取，並記錄為範圍選取的起點"""
+        if selected:
+            self._keys.add(key)
+        else:
+            self._keys.discard(key)
+        self.anchor = key
+
+    def toggle(self, key: Hashable) -> bool:
+        """切換單一項目，返回切換後是否選取"""
+        self.set(key, key not in self._keys)
+        return key in self._keys
+
+    # --- 批次變更 ---
+
+    def _changed(self):
+        self.version += 1
+
+    def update(self, keys: Iterable[Hashable]):
+        """加入多個項目（例如依查詢選取的結果）"""
+        self._keys.update(keys)
+        self._changed()
+
+    def difference_update(self, keys: Iterable[Hashable]):
+        """移除多個項目"""
+        self._keys.difference_update(keys)
+        self._changed()
+
+    def select_all(self, keys: Iterable[Hashable]):
+        """只選取傳入的所有項目"""
+        self._keys = set(keys)
+        self._changed()
+
+    def clear(self):
+        self._keys.clear()
+        self.anchor = None
+        self._changed()
+
+    def invert(self, keys: Iterable[Hashable]):
+        """反向選取：傳入的項目中，已選的取消、未選的選取"""
+        self._keys.symmetric_difference_update(set(keys))
+        self._changed()
+
+    def select_range(self, ordered_keys: Sequence[Hashable], start: int, end: int):
+        """
+        選取顯示順序中的一段範圍
+
+        Args:
+            ordered_keys: 依顯示順序排列的所有鍵值
+            start: 起始位置（包含）
+            end: 結束位置（包含），可以小於 start
+        """
+        if start > end:
+            start, end = end, start
+        start = max(0, start)
+        self._keys.update(ordered_keys[start:end + 1])
+        self._changed()
+
+    def extend_to(self, ordered_keys: Sequence[Hashable], key: Hashable):
+        """從範圍選取的起點選取到指定項目，沒有起點（或起點已不在列表中）時只選取該項目"""
+        end = ordered_keys.index(key)
+        try:
+            start = ordered_keys.index(self.anchor)
+        except ValueError:
+            start = end
+        self.select_range(ordered_keys, start, end)
+        self.anchor = key
+
+    def retain(self, keys: Iterable[Hashable]):
+        """只保留仍然存在的項目（列表重新整理或項目被刪除後呼叫）"""
+        keys = keys if isinstance(keys, (set, frozenset)) else set(keys)
+        if not self._keys <= keys:
+            self._keys &= keys
+            self._changed()
+        if self.anchor not in keys:
+            self.anchor = None
+
+    def ordered(self, ordered_keys: Iterable[Hashable]) -> List[Hashable]:
+        """依顯示順序列出已選取的項目"""
+        return [key for key in ordered_keys if key in self._keys]
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+隨機播放順序模組
+以「抽籤袋」的方式產生隨機順序：每一輪每首歌只會出現一次，
+抽完才重新開始，並保留播放歷史讓「上一首」能真正回到剛才聽過的歌
+"""
+
+import random
+from typing import Optional, Iterable, List, Dict, Hashable
+
+# 播放歷史最多保留的筆數，超過時捨棄最舊的一半
+HISTORY_LIMIT = 1000
+
+
+class ShuffleBag:
+    """
+    隨機播放順序
+
+    以歌曲的唯一鍵（例如檔案路徑）記錄，播放清單重新排序或插入新歌時順序不受影響。
+    尚未播放的歌曲放在抽籤袋中，每次抽出時與最後一個元素交換再移除，
+    因此下一首、上一首、加入與移除都是 O(1)，不需要預先打亂整個清單
+    """
+
+    def __init__(self, keys: Iterable[Hashable] = (), rng: Optional[random.Random] = None):
+        """
+        初始化隨機播放順序
+
+        Args:
+            keys: 所有歌曲的唯一鍵
+            rng: 亂數產生器，測試時可傳入固定種子
+        """
+        self._rng = rng or random.Random()
+        self._keys = set()
+        # 本輪尚未播放的歌曲，以及各自在列表中的位置（用於 O(1) 移除）
+        self._pool: List[Hashable] = []
+        self._pool_pos: Dict[Hashable, int] = {}
+        # 播放歷史與目前位置；cursor 之後的項目是按過上一首後可以再前進的歌
+        self._history: List[Hashable] = []
+        self._cursor = -1
+        for key in keys:
+            self.add(key)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    @property
+    def current(self) -> Optional[Hashable]:
+        """目前播放的歌曲"""
+        if 0 <= self._cursor < len(self._history):
+            return self._history[self._cursor]
+        return None
+
+    # --- 抽籤袋 ---
+
+    def _pool_add(self, key):
+        if key not in self._pool_pos:
+            self._pool_pos[key] = len(self._pool)
+            self._pool.append(key)
+
+    def _pool_remove(self, key):
+        pos = self._pool_pos.pop(key, None)
+        if pos is None:
+            return
+        last = self._pool.pop()
+        if pos < len(self._pool):
+            self._pool[pos] = last
+            self._pool_pos[last] = pos
+
+    def _draw(self) -> Optional[Hashable]:
+        """從抽籤袋隨機抽出一首，抽完時開始新的一輪"""
+        if not self._pool:
+            if not self._keys:
+                return None
+            # 新的一輪，避免緊接著重複播放剛才那首
+            for key in self._keys:
+                if key != self.current or len(self._keys) == 1:
+                    self._pool_add(key)
+        index = self._rng.randrange(len(self._pool))
+        key = self._pool[index]
+        self._pool_remove(key)
+        return key
+
+    def _trim_history(self):
+        if len(self._history) > HISTORY_LIMIT:
+            drop = len(self._history) - HISTORY_LIMIT // 2
+            drop = min(drop, self._cursor)
+            if drop > 0:
+                del self._history[:drop]
+                self._cursor -= drop
+
+    # --- 播放清單變動 ---
+
+    def add(self, key: Hashable):
+        """加入新歌曲，本輪稍後就有機會抽到"""
+        if key in self._keys:
+            return
+        self._keys.add(key)
+        self._pool_add(key)
+
+    def remove(self, key: Hashable):
+        """移除歌曲，歷史中的紀錄會在經過時略過"""
+        if key not in self._keys:
+            return
+        self._keys.discard(key)
+        self._pool_remove(key)
+
+    def sync(self, keys: Iterable[Hashable]):
+        """讓內容與目前的播放清單一致，只處理新增與刪除的差異"""
+        keys = set(keys)
+        for key in self._keys - keys:
+            self.remove(key)
+        for key in keys - self._keys:
+            self.add(key)
+
+    def reset(self, current: Optional[Hashable] = None):
+        """清除歷史並開始新的一輪，可指定目前正在播放的歌曲"""
+        self._pool.clear()
+        self._pool_pos.clear()
+        self._history = []
+        self._cursor = -1
+        for key in self._keys:
+            self._pool_add(key)
+        if current is not None:
+            self.set_current(current)
+
+    # --- 導覽 ---
+
+    def set_current(self, key: Hashable):
+        """使用者直接選了某首歌：記入歷史並從本輪的抽籤袋移除"""
+        if key == self.current:
+            return
+        if self._cursor + 1 < len(self._history) and self._history[self._cursor + 1] == key:
+            # 正好是已預先決定的下一首
+            self._cursor += 1
+            return
+        self._pool_remove(key)
+        del self._history[self._cursor + 1:]
+        self._history.append(key)
+        self._cursor += 1
+        self._trim_history()
+
+    def peek(self) -> Optional[Hashable]:
+        """預先決定下一首但不前進，之後的 next() 會返回同一首"""
+        while self._cursor + 1 < len(self._history):
+            key = self._history[self._cursor + 1]
+            if key in self._keys:
+                return key
+            del self._history[self._cursor + 1]
+        key = self._draw()
+        if key is not None:
+            self._history.append(key)
+        return key
+
+    def next(self) -> Optional[Hashable]:
+        """前進到下一首"""
+        key = self.peek()
+        if key is not None:
+            self._cursor += 1
+            self._trim_history()
+        return key
+
+    def previous(self) -> Optional[Hashable]:
+        """回到上一首聽過的歌，沒有更早的紀錄時返回 None"""
+        while self._cursor > 0:
+            self._cursor -= 1
+            key = self._history[self._cursor]
+            if key in self._keys:
+                return key
+            del self._history[self._cursor]
+        return None
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+頻寬管理測試腳本
+測試權杖桶的補充與上限（以可替換的時鐘控制時間）、下載頻寬的 max-min 公平分配，
+以及分段下載（HLS/DASH）透過進度回調節流
+"""
+
+import threading
+
+from bandwidth_manager import TokenBucket, BandwidthManager, BandwidthProfile
+
+
+class FakeClock:
+    """手動推進的時鐘"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+def test_token_bucket_refill():
+    """測試權杖依經過時間補充、最多累積一秒的額度，不足時等待時鐘推進"""
+    print("🪣 測試權杖桶補充...")
+    clock = FakeClock()
+    bucket = TokenBucket(1000, clock=clock)
+
+    clock.advance(1.0)
+    bucket.acquire(1000)
+    assert bucket._tokens == 0
+
+    clock.advance(0.25)
+    bucket.acquire(250)
+    assert bucket._tokens == 0
+
+    # 閒置很久也只累積一秒的額度
+    clock.advance(60)
+    bucket.acquire(600)
+    assert bucket._tokens == 400
+
+    # 權杖不足時等待，時鐘推進後才取得
+    bucket.acquire(400)
+    done = threading.Event()
+    waiter = threading.Thread(target=lambda: (bucket.acquire(50), done.set()), daemon=True)
+    waiter.start()
+    assert not done.wait(0.1)
+    clock.advance(0.1)
+    assert done.wait(2.0)
+
+    # 調整速率時保留已累積的權杖
+    clock.advance(0.5)
+    bucket.set_rate(2000)
+    bucket.acquire(500)
+    assert abs(bucket._tokens - 50) < 1e-6
+
+    # 不限制時立即返回
+    bucket.set_rate(None)
+    bucket.acquire(10 ** 9)
+    print("✅ 權杖桶補充測試通過")
+
+
+def _manager(cap):
+    # 時段涵蓋整天；重新分配的間隔設得很長，只測試登記與手動觸發的分配
+    return BandwidthManager([BandwidthProfile(download_limit=cap)], rebalance_interval=3600)
+
+
+def _rebalance(manager: BandwidthManager):
+    with manager._lock:
+        manager._rebalance_locked()
+
+
+def test_fair_share_above_cap():
+    """測試需求超過上限時，受限的工作保留略高於實際速度的額度，其餘平分"""
+    print("⚖️ 測試需求超過上限的分配...")
+    manager = _manager(9000)
+    jobs = [manager.register_download({}) for _ in range(3)]
+    assert [job.allocation for job in jobs] == [3000, 3000, 3000]
+    assert all(job.params['ratelimit'] == 3000 for job in jobs)
+
+    # 第一個工作只跑得到 1000（低於配額的 80%），其他兩個用滿配額
+    jobs[0].speed, jobs[1].speed, jobs[2].speed = 1000, 2900, 3000
+    _rebalance(manager)
+    assert jobs[0].allocation == 1200
+    assert jobs[1].allocation == jobs[2].allocation == 3900
+    assert sum(job.allocation for job in jobs) == 9000
+
+    # 工作結束後頻寬還給仍用滿配額的其他工作
+    jobs[1].speed = jobs[2].speed = 3900
+    manager.unregister_download(jobs[0])
+    assert jobs[1].allocation == jobs[2].allocation == 4500
+    print("✅ 需求超過上限的分配測試通過")
+
+
+def test_fair_share_below_cap():
+    """測試所有工作的需求都低於上限時，各自只保留需求的額度"""
+    print("🪶 測試需求低於上限的分配...")
+    manager = _manager(10000)
+    jobs = [manager.register_download({}) for _ in range(2)]
+    jobs[0].speed, jobs[1].speed = 500, 2000
+    _rebalance(manager)
+    assert jobs[0].allocation == 600 and jobs[1].allocation == 2400
+    # ratelimit 至少 1 KB/s，避免極低的速度估計讓下載幾乎停止
+    assert jobs[0].params['ratelimit'] == 1024 and jobs[1].params['ratelimit'] == 2400
+
+    # 沒有上限時移除 ratelimit
+    manager.profiles = []
+    _rebalance(manager)
+    assert all('ratelimit' not in job.params and job.allocation is None for job in jobs)
+    print("✅ 需求低於上限的分配測試通過")
+
+
+def test_fragment_progress_throttle():
+    """測試進度回調依新下載的位元組數等待權杖，分段下載器複製的 params 不影響節流"""
+    print("🧩 測試分段下載節流...")
+    clock = FakeClock()
+    manager = _manager(2000)
+    params = {}
+    job = manager.register_download(params)
+    job._bucket = TokenBucket(clock=clock)
+    _rebalance(manager)
+    assert job._bucket.rate == 2000
+
+    # 分段下載器在開始時複製 params，之後的 ratelimit 調整只會反映在權杖桶上
+    fragment_params = dict(params)
+    clock.advance(1.0)
+    progress = {'status': 'downloading', 'filename': "song.m4a", 'downloaded_bytes': 0}
+    job.on_progress(progress)
+    job.on_progress(dict(progress, downloaded_bytes=2000))
+    assert job._bucket._tokens == 0
+
+    done = threading.Event()
+    waiter = threading.Thread(target=lambda: (job.on_progress(dict(progress, downloaded_bytes=3000)), done.set()),
+                              daemon=True)
+    waiter.start()
+    assert not done.wait(0.1)
+    clock.advance(0.5)
+    assert done.wait(2.0)
+
+    # 新的檔案重新起算，不會為前一個檔案的進度等待
+    job.on_progress({'status': 'downloading', 'filename': "video.mp4", 'downloaded_bytes': 10 ** 9})
+    # 解除上限時立即放行等待中的下載
+    manager.profiles = []
+    _rebalance(manager)
+    job.on_progress({'status': 'downloading', 'filename': "video.mp4", 'downloaded_bytes': 2 * 10 ** 9})
+    assert fragment_params == {'ratelimit': 2000} and 'ratelimit' not in params
+    manager.unregister_download(job)
+    print("✅ 分段下載節流測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始頻寬管理測試")
+    print("=" * 60)
+    test_token_bucket_refill()
+    test_fair_share_above_cap()
+    test_fair_share_below_cap()
+    test_fragment_progress_throttle()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
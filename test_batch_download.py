@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批次下載測試腳本
+測試輸入解析、每筆輸入的結果記錄，以及輸出到標準輸出的 JSON Lines 不會混入搜尋訊息
+"""
+
+import io
+import json
+import tempfile
+import contextlib
+
+import yt_dlp_searcher
+from batch_download import BatchDownloader, read_items, is_url
+
+
+class FakeDownloader:
+    """不連網的下載器：網址含有 fail 時下載失敗"""
+
+    def __init__(self):
+        self.downloaded = []
+
+    def add_progress_hook(self, hook):
+        pass
+
+    def download_mp3(self, url):
+        if 'fail' in url:
+            raise RuntimeError("下載失敗")
+        self.downloaded.append(url)
+        return {'file_path': f"/music/{url[-3:]}.mp3", 'file_paths': [f"/music/{url[-3:]}.mp3"]}
+
+    download_mp4 = download_mp3
+
+
+class FakeYoutubeDL:
+    """取代 yt-dlp 的搜尋：關鍵字 nothing 沒有結果，其他關鍵字最多返回兩部影片"""
+
+    def __init__(self, opts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=False):
+        count, query = url[len('ytsearch'):].split(':', 1)
+        if query == 'nothing':
+            return {'entries': []}
+        return {'entries': [{'id': 'abc', 'title': "第一首"}, {'id': 'def', 'title': "第二首"}][:int(count)]}
+
+
+def _batch(tmp: str, search_results: int = 1) -> BatchDownloader:
+    batch = BatchDownloader(download_dir=tmp, workers=2, search_results=search_results)
+    batch.downloader = FakeDownloader()
+    return batch
+
+
+def test_read_items():
+    """測試略過空行與註解"""
+    print("📄 測試讀取輸入...")
+    source = io.StringIO("# 今晚要下載\nhttps://youtu.be/abc\n\n   周杰倫 晴天  \n#https://youtu.be/skip\n")
+    assert read_items(source) == ["https://youtu.be/abc", "周杰倫 晴天"]
+    assert read_items(io.StringIO("")) == []
+    print("✅ 讀取輸入測試通過")
+
+
+def test_is_url():
+    """測試區分網址與搜尋關鍵字"""
+    print("🔗 測試網址判斷...")
+    assert is_url("https://www.youtube.com/watch?v=abc")
+    assert is_url("youtu.be/abc")
+    assert is_url("www.youtube.com/playlist?list=PL1")
+    assert not is_url("周杰倫 晴天")
+    assert not is_url("youtube music")
+    print("✅ 網址判斷測試通過")
+
+
+def test_records():
+    """測試每筆輸入產生的結果記錄"""
+    print("🧾 測試結果記錄...")
+    original = yt_dlp_searcher.YoutubeDL
+    yt_dlp_searcher.YoutubeDL = FakeYoutubeDL
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            batch = _batch(tmp, search_results=2)
+
+            ok = batch._process("https://youtu.be/xyz")
+            assert len(ok) == 1 and ok[0]['success'] and ok[0]['file_paths'] == ["/music/xyz.mp3"]
+            assert ok[0]['input'] == "https://youtu.be/xyz" and ok[0]['error'] is None
+
+            failed = batch._process("https://youtu.be/fail")
+            assert not failed[0]['success'] and failed[0]['error'] == "下載失敗"
+
+            # 搜尋關鍵字的每個結果各有一筆記錄
+            searched = batch._process("晴天")
+            assert [r['title'] for r in searched] == ["第一首", "第二首"]
+            assert all(r['input'] == "晴天" and r['success'] for r in searched)
+
+            empty = batch._process("nothing")
+            assert len(empty) == 1 and empty[0]['url'] is None and empty[0]['error'] == "搜尋沒有結果"
+    finally:
+        yt_dlp_searcher.YoutubeDL = original
+    print("✅ 結果記錄測試通過")
+
+
+def test_stdout_is_jsonl():
+    """測試 --log - 時標準輸出只有 JSON Lines 記錄"""
+    print("📤 測試標準輸出...")
+    original = yt_dlp_searcher.YoutubeDL
+    yt_dlp_searcher.YoutubeDL = FakeYoutubeDL
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            batch = _batch(tmp)
+            stdout, stderr = io.StringIO(), io.StringIO()
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                summary = batch.run(["晴天", "nothing", "https://youtu.be/fail"])
+            records = [json.loads(line) for line in stdout.getvalue().splitlines()]
+            assert len(records) == 3
+            assert summary == {'success': 1, 'failed': 2}
+            assert all('finished_at' in record for record in records)
+    finally:
+        yt_dlp_searcher.YoutubeDL = original
+    print("✅ 標準輸出測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始批次下載測試")
+    print("=" * 60)
+    test_read_items()
+    test_is_url()
+    test_records()
+    test_stdout_is_jsonl()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cookies 管理測試腳本
+測試 cookies.txt 只載入一次、檔案更新時重新載入，以及以原子方式寫回並能再讀取
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from cookie_manager import CookieManager
+
+NETSCAPE_HEADER = "# Netscape HTTP Cookie File\n"
+
+
+def _write_cookies(path: Path, value: str, mtime: float = None):
+    path.write_text(NETSCAPE_HEADER + f".youtube.com\tTRUE\t/\tTRUE\t2000000000\tSID\t{value}\n",
+                    encoding='utf-8')
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def _values(jar):
+    return {cookie.name: cookie.value for cookie in jar}
+
+
+def test_load_once():
+    """測試多次取得 cookie jar 只讀取檔案一次，且每次都是同一個物件"""
+    print("🍪 測試只載入一次...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "cookies.txt"
+        _write_cookies(path, "first")
+        manager = CookieManager(str(path), watch_interval=60)
+        with mock.patch.object(manager, '_load', wraps=manager._load) as load:
+            jars = [manager.jar for _ in range(5)]
+        assert load.call_count == 1
+        assert all(jar is jars[0] for jar in jars)
+        assert _values(jars[0]) == {'SID': "first"}
+
+        # 沒有 cookies 檔案時不使用 cookies
+        assert CookieManager(str(Path(tmp) / "missing.txt")).jar is None
+    print("✅ 只載入一次測試通過")
+
+
+def test_reload_on_change():
+    """測試檔案修改時間改變後重新載入，並沿用同一個 jar 物件"""
+    print("🔄 測試檔案更新後重新載入...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "cookies.txt"
+        _write_cookies(path, "first", mtime=1_700_000_000)
+        manager = CookieManager(str(path), watch_interval=0)
+        jar = manager.jar
+        assert _values(jar) == {'SID': "first"}
+
+        # 修改時間沒變時不重新讀取
+        with mock.patch.object(manager, '_load', wraps=manager._load) as load:
+            manager.jar
+        assert load.call_count == 0
+
+        _write_cookies(path, "second", mtime=1_700_000_100)
+        assert manager.jar is jar
+        assert _values(jar) == {'SID': "second"}
+
+        # 檔案移除後停止使用 cookies
+        path.unlink()
+        assert manager.jar is None
+    print("✅ 檔案更新後重新載入測試通過")
+
+
+def test_persist_round_trip():
+    """測試 cookies 有變動時才以原子方式寫回，寫回的檔案可以再讀取"""
+    print("💾 測試寫回 cookies...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "cookies.txt"
+        _write_cookies(path, "first")
+        manager = CookieManager(str(path))
+        jar = manager.jar
+        assert not manager.persist()
+
+        # 伺服器更新了 cookie
+        next(iter(jar)).value = "refreshed"
+        assert manager.persist()
+        assert not manager.persist()
+        assert sorted(os.listdir(tmp)) == ["cookies.txt"]
+        assert path.read_text(encoding='utf-8').startswith("# Netscape HTTP Cookie File")
+
+        # 寫回後不會被當成外部更新而重新載入
+        with mock.patch.object(manager, '_load', wraps=manager._load) as load:
+            manager._last_check = 0.0
+            manager.jar
+        assert load.call_count == 0
+
+        assert _values(CookieManager(str(path)).jar) == {'SID': "refreshed"}
+    print("✅ 寫回 cookies 測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始 cookies 管理測試")
+    print("=" * 60)
+    test_load_once()
+    test_reload_on_change()
+    test_persist_round_trip()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
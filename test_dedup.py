@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重複檔案偵測測試腳本
+測試分段雜湊比對、雜湊快取與釋放空間
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+from music_library import MusicLibrary
+from dedup import DuplicateFinder, PARTIAL_HASH_BYTES
+
+
+def _write(folder: Path, name: str, data: bytes) -> Path:
+    path = folder / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_find_duplicates():
+    """測試只有內容完全相同的檔案被歸為一組"""
+    print("🧬 測試重複檔案偵測...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library = MusicLibrary(tmp)
+        big = os.urandom(PARTIAL_HASH_BYTES * 4)
+        # 開頭與結尾相同、只有中間不同：部分雜湊相同，完整雜湊才分得出來
+        middle_changed = big[:PARTIAL_HASH_BYTES] + bytes(PARTIAL_HASH_BYTES) + big[PARTIAL_HASH_BYTES * 2:]
+        original = _write(folder, "歌曲_abc.mp3", big)
+        copy = _write(folder, "sub/歌曲_abc_1700000000.mp3", big)
+        _write(folder, "不同.mp3", middle_changed)
+        _write(folder, "影片.mp4", b"x" * 100)
+        _write(folder, "trash/歌曲_abc.mp3", big)
+        os.utime(copy, (original.stat().st_mtime + 10,) * 2)
+
+        finder = DuplicateFinder(library)
+        groups = finder.find_duplicates()
+        assert groups == [[original, copy]]
+        assert finder.find_existing(copy) == original
+
+        # 第二次比對直接使用快取的雜湊
+        with library.transaction() as conn:
+            cached = conn.execute("SELECT COUNT(*) FROM content_hashes WHERE full_hash IS NOT NULL").fetchone()[0]
+        assert cached == 3
+        assert finder.find_duplicates() == groups
+        library.close()
+    print("✅ 重複檔案偵測測試通過")
+
+
+def test_find_existing_and_prune():
+    """測試新檔案只與索引中的檔案比對，以及完整掃描時移除已不存在檔案的快取雜湊"""
+    print("📥 測試新下載檔案比對與快取清理...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library = MusicLibrary(tmp)
+        data = os.urandom(4096)
+        indexed = _write(folder, "已登記.mp3", data)
+        library.add_file(indexed)
+        # 沒有登記也沒有雜湊的檔案不會被當成候選，不需要掃描整個資料夾
+        _write(folder, "未登記.mp3", data)
+
+        finder = DuplicateFinder(library)
+        downloaded = _write(folder, "新下載.mp3", data)
+        assert finder.find_existing(downloaded) == indexed
+        assert finder.find_existing(_write(folder, "另一首.mp3", os.urandom(4096))) is None
+        assert finder.find_existing(_write(folder, "長度不同.mp3", os.urandom(100))) is None
+
+        assert len(finder.find_duplicates()) == 1
+        downloaded.unlink()
+        finder.find_duplicates()
+        with library.transaction() as conn:
+            paths = {Path(row['path']).name for row in conn.execute("SELECT path FROM content_hashes")}
+        assert "新下載.mp3" not in paths and "已登記.mp3" in paths
+        library.close()
+    print("✅ 新下載檔案比對與快取清理測試通過")
+
+
+def test_reclaim_hardlink():
+    """測試以硬連結取代重複檔案後，檔名保留且不再被視為重複"""
+    print("🔗 測試硬連結釋放空間...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library = MusicLibrary(tmp)
+        data = os.urandom(4096)
+        keep = _write(folder, "a.mp3", data)
+        dup = _write(folder, "a_copy.mp3", data)
+
+        finder = DuplicateFinder(library)
+        result = finder.reclaim(finder.find_duplicates(), mode='hardlink')
+        assert result['success'] and result['reclaimed'] == 4096
+        assert dup.read_bytes() == data
+        assert os.path.samefile(keep, dup)
+        assert finder.find_duplicates() == []
+        library.close()
+    print("✅ 硬連結釋放空間測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始重複檔案偵測測試")
+    print("=" * 60)
+    test_find_duplicates()
+    test_find_existing_and_prune()
+    test_reclaim_hardlink()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
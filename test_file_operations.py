@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批次檔案操作測試腳本
+測試批次刪除、移動到垃圾桶與音樂庫索引更新
+"""
+
+import tempfile
+from pathlib import Path
+
+from music_library import get_library
+from file_operations import batch_delete, batch_move_to_trash
+from trash_bin import get_trash_bin
+
+
+def _make_files(folder: Path, names):
+    """建立假的音訊檔案並登記到音樂庫"""
+    library = get_library(str(folder))
+    paths = []
+    for name in names:
+        path = folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"\0" * 64)
+        library.add_file(path)
+        paths.append(path)
+    return library, paths
+
+
+def test_batch_delete():
+    """測試批次刪除與逐項結果"""
+    print("🗑️ 測試批次刪除...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library, paths = _make_files(folder, [f"song{i}.mp3" for i in range(30)])
+        blocked = folder / "blocked"
+        blocked.mkdir()
+
+        report = batch_delete(paths[:20] + [blocked], music_folder=tmp, max_workers=4)
+        assert report['succeeded'] == 20 and report['failed'] == 1
+        assert not report['success']
+        assert [r['file_path'] for r in report['results']][:2] == [str(paths[0]), str(paths[1])]
+        assert report['results'][-1]['error']
+
+        assert not any(path.exists() for path in paths[:20])
+        assert len(library) == 10
+        library.close()
+    print("✅ 批次刪除測試通過")
+
+
+def test_batch_move_to_trash():
+    """測試同名檔案移到垃圾桶時不會互相覆蓋"""
+    print("📦 測試批次移動到垃圾桶...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library, paths = _make_files(folder, ["a.mp3", "sub/a.mp3", "b.mp3"])
+
+        report = batch_move_to_trash(paths, music_folder=tmp)
+        assert report['success'] and report['succeeded'] == 3
+        trash = get_trash_bin(tmp)
+        items = trash.items()
+        assert sorted(item['id'] for item in items) == sorted(r['trash_id'] for r in report['results'])
+        assert len({item['trash_path'] for item in items}) == 3
+        assert all(Path(item['trash_path']).exists() for item in items)
+        assert len(library) == 0
+        trash.stop_purger()
+        library.close()
+    print("✅ 批次移動到垃圾桶測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始批次檔案操作測試")
+    print("=" * 60)
+    test_batch_delete()
+    test_batch_move_to_trash()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+聲學指紋測試腳本
+測試峰值雜湊對不同版本的辨識、指紋的增量計算與相似錄音分組
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from music_library import MusicLibrary
+from fingerprint import (
+    FingerprintIndex, fingerprint_samples, similarity, removable_copies, SAMPLE_RATE, DEFAULT_THRESHOLD,
+)
+
+
+def _song(seed: int, seconds: float = 30.0) -> np.ndarray:
+    """以隨機音符合成一段「歌曲」，每 0.25 秒彈一組逐漸衰減的音"""
+    rng = np.random.default_rng(seed)
+    note_length = SAMPLE_RATE // 4
+    t = np.arange(note_length) / SAMPLE_RATE
+    envelope = np.exp(-t * 12)
+    notes = []
+    for _ in range(int(seconds * 4)):
+        freqs = rng.uniform(200, 3500, size=3)
+        notes.append(envelope * sum(np.sin(2 * np.pi * f * t) for f in freqs))
+    return (np.concatenate(notes) / 3).astype(np.float32)
+
+
+def _other_version(samples: np.ndarray) -> np.ndarray:
+    """模擬另一個上傳版本：前面多 3 秒靜音、音量減半、加上雜訊"""
+    rng = np.random.default_rng(0)
+    padded = np.concatenate([np.zeros(SAMPLE_RATE * 3, dtype=np.float32), samples * 0.5])
+    return (padded + rng.normal(0, 0.01, len(padded))).astype(np.float32)
+
+
+def _analyze_fake(file_path: str) -> np.ndarray:
+    """測試用的分析函數：檔案內容是歌曲的亂數種子與是否為另一個版本"""
+    seed, variant = Path(file_path).read_text().split()
+    samples = _song(int(seed))
+    return fingerprint_samples(_other_version(samples) if variant == "b" else samples)
+
+
+class FakeFingerprintIndex(FingerprintIndex):
+    """不需要 ffmpeg 的指紋索引"""
+
+    analyze = staticmethod(_analyze_fake)
+
+    def available(self) -> bool:
+        return True
+
+
+def test_fingerprint_similarity():
+    """測試同一首歌的不同版本相似度高，不同歌曲相似度低"""
+    print("🎼 測試指紋比對...")
+    song = _song(1)
+    original = fingerprint_samples(song)
+    assert original.dtype == np.uint32 and len(original) > 100
+    assert np.all(np.diff(original.astype(np.int64)) > 0)
+
+    version = fingerprint_samples(_other_version(song))
+    other = fingerprint_samples(_song(2))
+    assert similarity(original, version) > DEFAULT_THRESHOLD
+    assert similarity(original, other) < 0.05
+    assert len(fingerprint_samples(np.zeros(SAMPLE_RATE * 5, dtype=np.float32))) == 0
+    print("✅ 指紋比對測試通過")
+
+
+def test_near_duplicate_groups():
+    """測試指紋只計算一次，並把不同版本分在同一組"""
+    print("🔎 測試相似錄音分組...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library = MusicLibrary(tmp)
+        files = {"a.mp3": "1 a", "a (live upload).m4a": "1 b", "b.mp3": "2 a", "c.mp3": "3 a"}
+        ids = {}
+        for name, content in files.items():
+            (folder / name).write_text(content)
+            ids[name] = library.add_file(folder / name)
+
+        index = FakeFingerprintIndex(library, max_workers=1, batch_size=2)
+        assert len(index.pending()) == 4
+        assert index.update() == {"success": True, "analyzed": 4, "failed": 0}
+        assert index.update()['analyzed'] == 0
+        assert index.coverage() == {"analyzed": 4, "failed": 0, "pending": 0}
+
+        groups = index.find_near_duplicates()
+        assert [sorted(track['id'] for track in group) for group in groups] == \
+            [sorted([ids["a.mp3"], ids["a (live upload).m4a"]])]
+        similar = index.find_similar(ids["a.mp3"])
+        assert [track['id'] for track, _ in similar] == [ids["a (live upload).m4a"]]
+
+        # 檔案變動後重新計算，移除歌曲時指紋一併刪除
+        path = folder / "c.mp3"
+        path.write_text("1 b")
+        os.utime(path, (path.stat().st_mtime + 10,) * 2)
+        library.add_file(path)
+        assert [track['id'] for track in index.pending()] == [ids["c.mp3"]]
+        index.update([ids["c.mp3"]])
+        assert len(index.find_near_duplicates()[0]) == 3
+
+        library.remove_file(folder / "a.mp3")
+        with library.transaction() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0] == 3
+        library.close()
+    print("✅ 相似錄音分組測試通過")
+
+
+def test_removable_copies():
+    """測試與保留版本為同一個實體檔案的硬連結不會被列為可移除"""
+    print("🔗 測試略過硬連結...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        (folder / "best.flac").write_bytes(b"\0" * 64)
+        (folder / "other.mp3").write_bytes(b"\0" * 32)
+        os.link(folder / "best.flac", folder / "best (link).flac")
+        group = [{'file_path': str(folder / name)} for name in ("best.flac", "best (link).flac", "other.mp3")]
+        assert [Path(track['file_path']).name for track in removable_copies(group)] == ["other.mp3"]
+    print("✅ 略過硬連結測試通過")
+
+
+def test_background_schedule():
+    """測試背景分析在完成後結束執行緒"""
+    print("⏳ 測試背景計算...")
+    with tempfile.TemporaryDirectory() as tmp:
+        library = MusicLibrary(tmp)
+        (Path(tmp) / "a.mp3").write_text("4 a")
+        track_id = library.add_file(Path(tmp) / "a.mp3")
+        index = FakeFingerprintIndex(library, max_workers=1)
+        index.schedule([track_id])
+        assert index.wait(timeout=60)
+        assert not index.is_running
+        assert index.get(track_id) is not None
+        library.close()
+    print("✅ 背景計算測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始聲學指紋測試")
+    print("=" * 60)
+    test_fingerprint_similarity()
+    test_near_duplicate_groups()
+    test_removable_copies()
+    test_background_schedule()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
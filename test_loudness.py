@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+響度分析測試腳本
+測試 BS.1770 整合響度、閘門、增益換算與播放器套用增益
+"""
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from music_library import get_library
+from music_player import MusicPlayer
+from loudness import (
+    LoudnessIndex, SAMPLE_RATE, TARGET_LOUDNESS, SILENCE_LOUDNESS,
+    integrated_loudness, gain_for,
+)
+
+
+def _sine(dbfs: float, seconds: float = 10.0, freq: float = 997.0) -> np.ndarray:
+    """產生指定電平的立體聲正弦波"""
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    wave = (10 ** (dbfs / 20) * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+    return np.stack([wave, wave], axis=1)
+
+
+def _analyze_fake(file_path: str):
+    """測試用的分析函數：檔案內容是正弦波的電平"""
+    samples = _sine(float(Path(file_path).read_text()))
+    return {'integrated': integrated_loudness(samples), 'peak': float(np.abs(samples).max())}
+
+
+class FakeLoudnessIndex(LoudnessIndex):
+    """不需要 ffmpeg 的響度索引"""
+
+    analyze = staticmethod(_analyze_fake)
+
+    def available(self) -> bool:
+        return True
+
+
+def test_integrated_loudness():
+    """測試 EBU 參考訊號與閘門"""
+    print("🔊 測試整合響度...")
+    # EBU Tech 3341：-23 dBFS、997 Hz 的立體聲正弦波應為 -23 LUFS
+    assert abs(integrated_loudness(_sine(-23.0)) - (-23.0)) < 0.1
+    assert abs(integrated_loudness(_sine(-33.0)) - (-33.0)) < 0.1
+
+    # 靜音段落被絕對閘門排除，不會拉低整首歌的響度
+    with_silence = np.concatenate([_sine(-20.0), np.zeros((SAMPLE_RATE * 10, 2), dtype=np.float32)])
+    assert abs(integrated_loudness(with_silence) - integrated_loudness(_sine(-20.0))) < 0.1
+    assert integrated_loudness(np.zeros((SAMPLE_RATE * 5, 2), dtype=np.float32)) == SILENCE_LOUDNESS
+    print("✅ 整合響度測試通過")
+
+
+def test_gain():
+    """測試增益只會降低較大聲的歌曲，且不會讓峰值超過滿刻度"""
+    print("🎚️ 測試增益換算...")
+    assert abs(gain_for(TARGET_LOUDNESS + 6) - 10 ** (-6 / 20)) < 1e-9
+    assert gain_for(TARGET_LOUDNESS - 6) == 1.0
+    assert gain_for(TARGET_LOUDNESS + 6, peak=2.0) == 0.5
+    print("✅ 增益換算測試通過")
+
+
+def test_player_gain():
+    """測試分析結果存入索引後，播放器依響度調整音量"""
+    print("🎵 測試播放器套用增益...")
+    with tempfile.TemporaryDirectory() as tmp:
+        library = get_library(tmp)
+        loud, quiet = Path(tmp) / "loud.mp3", Path(tmp) / "quiet.mp3"
+        loud.write_text("-8")
+        quiet.write_text("-30")
+        library.add_file(loud)
+        library.add_file(quiet)
+
+        index = FakeLoudnessIndex(library, max_workers=1)
+        assert index.update()['analyzed'] == 2
+        assert abs(index.get(library.get_by_path(loud)['id'])['integrated'] - (-8.0)) < 0.1
+
+        player = MusicPlayer(tmp)
+        assert abs(player._gain_for(str(loud)) - 10 ** ((TARGET_LOUDNESS + 8) / 20)) < 0.01
+        assert player._gain_for(str(quiet)) == 1.0
+        player.normalize_loudness = False
+        assert player._gain_for(str(loud)) == 1.0
+    print("✅ 播放器套用增益測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始響度分析測試")
+    print("=" * 60)
+    test_integrated_loudness()
+    test_gain()
+    test_player_gain()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+音樂庫索引測試腳本
+測試登記、查詢與增量同步功能
+"""
+
+import tempfile
+from pathlib import Path
+
+from music_library import MusicLibrary, search_terms
+
+
+def _make_file(folder: Path, name: str, size: int = 128) -> Path:
+    """建立假的音訊檔案"""
+    path = folder / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"\0" * size)
+    return path
+
+
+def test_add_and_query():
+    """測試登記與查詢"""
+    print("📋 測試登記與查詢...")
+    with tempfile.TemporaryDirectory() as tmp:
+        library = MusicLibrary(tmp)
+        song = _make_file(Path(tmp), "慢冷_abc123.mp3")
+        video = _make_file(Path(tmp), "影片.mp4")
+
+        track_id = library.add_file(song, video_id="abc123")
+        assert track_id is not None
+        assert library.add_file(video) is None, "影片檔不應登記到音樂庫"
+
+        track = library.get_track(track_id)
+        assert Path(track['file_path']) == song
+        assert track['title'] == "慢冷_abc123"
+        assert track['file_size'] == 128
+        assert library.has_video("abc123")
+        assert library.video_ids() == {"abc123"}
+
+        # 重複登記只會更新，不會新增
+        assert library.add_file(song) == track_id
+        assert len(library) == 1
+        assert library.get_by_path(song)['video_id'] == "abc123"
+
+        assert library.remove_file(song)
+        assert len(library) == 0
+        library.close()
+    print("✅ 登記與查詢測試通過")
+
+
+def test_incremental_sync():
+    """測試增量同步"""
+    print("🔄 測試增量同步...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library = MusicLibrary(tmp)
+        a = _make_file(folder, "a.mp3")
+        _make_file(folder, "sub/b.flac")
+        _make_file(folder, ".tmp/partial.mp3")
+
+        assert library.sync() == {'added': 2, 'updated': 0, 'removed': 0}
+        assert library.sync() == {'added': 0, 'updated': 0, 'removed': 0}
+
+        _make_file(folder, "sub/b.flac", size=256)
+        a.unlink()
+        _make_file(folder, "c.ogg")
+        result = library.sync()
+        assert result == {'added': 1, 'updated': 1, 'removed': 1}
+
+        names = [Path(t['file_path']).name for t in library.tracks()]
+        assert names == ["b.flac", "c.ogg"]
+        library.close()
+    print("✅ 增量同步測試通過")
+
+
+def test_stats():
+    """測試統計隨登記、同步與移除累計，並在重新開啟時保持一致"""
+    print("📊 測試音樂庫統計...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library = MusicLibrary(tmp)
+        _make_file(folder, "a.mp3", size=100)
+        _make_file(folder, "sub/b.MP3", size=200)
+        c = _make_file(folder, "c.flac", size=50)
+        library.sync()
+
+        stats = library.stats()
+        assert (stats['total_tracks'], stats['total_size']) == (3, 350)
+        assert [(f['value'], f['track_count'], f['total_size']) for f in stats['formats']] == [
+            ("mp3", 2, 300), ("flac", 1, 50)
+        ]
+        assert stats['artists'][0]['track_count'] == 3
+
+        # 檔案變大與被移除時只調整差異
+        _make_file(folder, "a.mp3", size=150)
+        c.unlink()
+        library.sync()
+        stats = library.stats()
+        assert (stats['total_tracks'], stats['total_size']) == (2, 350)
+        assert library.stats_breakdown('format') == [
+            {'value': "mp3", 'track_count': 2, 'total_size': 350, 'total_duration': 0.0}
+        ]
+        library.close()
+
+        # 重新開啟時統計仍然正確
+        library = MusicLibrary(tmp)
+        assert library.stats()['total_size'] == 350
+        library.close()
+
+    # 從未掃描過的資料夾：refresh 時先同步，顯示實際的檔案數
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        _make_file(folder, "a.mp3", size=100)
+        _make_file(folder, "sub/b.mp3", size=200)
+        library = MusicLibrary(tmp)
+        assert library.stats()['total_tracks'] == 0
+        stats = library.stats(refresh=True)
+        assert (stats['total_tracks'], stats['total_size']) == (2, 300)
+
+        # 在應用程式外刪除的檔案也會反映在統計中
+        (folder / "a.mp3").unlink()
+        assert library.stats(refresh=True)['total_tracks'] == 1
+        library.close()
+    print("✅ 音樂庫統計測試通過")
+
+
+def test_search():
+    """測試全文檢索"""
+    print("🔍 測試搜尋...")
+    assert search_terms("周杰倫 Live版") == [["周", "杰", "倫"], ["live"], ["版"]]
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library = MusicLibrary(tmp)
+        for name in ("晴天_周杰倫.mp3", "稻香.mp3", "Love Story.mp3", "Shape of You.mp3"):
+            library.add_file(_make_file(folder, name))
+
+        assert [Path(t['file_path']).name for t in library.search("周杰")] == ["晴天_周杰倫.mp3"]
+        assert [t['title'] for t in library.search("lov")] == ["Love Story"]
+        assert library.search("shape you")[0]['match'] == "exact"
+
+        # 拼錯字與不相鄰的中文會以相近結果返回
+        fuzzy = library.search("stroy")
+        assert fuzzy and fuzzy[0]['title'] == "Love Story" and fuzzy[0]['match'] == "fuzzy"
+        assert library.search("周倫")[0]['match'] == "fuzzy"
+
+        # 批次選取使用的精確模式不會返回相近結果
+        assert library.search("stroy", strict=True) == []
+        assert library.search("周倫", strict=True) == []
+        assert [t['title'] for t in library.search("lov", strict=True)] == ["Love Story"]
+
+        # 移除後不會再被搜尋到
+        library.remove_file(folder / "稻香.mp3")
+        assert library.search("稻香") == []
+        library.close()
+    print("✅ 搜尋測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始音樂庫索引測試")
+    print("=" * 60)
+    test_add_and_query()
+    test_incremental_sync()
+    test_stats()
+    test_search()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
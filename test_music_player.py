@@ -6,7 +6,9 @@
 """
 
 import os
+import io
 import time
+import threading
 from pathlib import Path
 
 def test_music_player():
@@ -207,6 +209,239 @@ def check_music_files():
     
     return True
 
+def test_wav_seek_table():
+    """測試 WAV 跳轉表的位元組位置換算，以及從中間開始的串流仍是有效的 WAV"""
+    import wave
+    import struct
+    import tempfile
+    from music_player import get_wav_seek_table
+    
+    print("\n⏩ 測試 WAV 跳轉表...")
+    with tempfile.TemporaryDirectory() as tmp:
+        # 8 kHz、16 位元、立體聲：每個取樣框 4 位元組，每秒 32000 位元組
+        frames = b"".join(struct.pack('<hh', i, -i) for i in range(8000))
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as w:
+            w.setnchannels(2)
+            w.setsampwidth(2)
+            w.setframerate(8000)
+            w.writeframes(frames)
+        data = buffer.getvalue()
+        # 在 fmt 與 data 之間插入奇數長度的 LIST 區塊，測試區塊對齊
+        extra = b"LIST" + struct.pack('<I', 5) + b"hello\0"
+        data = data[:36] + extra + data[36:]
+        data = data[:4] + struct.pack('<I', len(data) - 8) + data[8:]
+        path = os.path.join(tmp, "tone.wav")
+        with open(path, 'wb') as f:
+            f.write(data)
+        
+        table = get_wav_seek_table(path)
+        assert get_wav_seek_table(path) is table
+        assert (table.byte_rate, table.block_align, table.data_size) == (32000, 4, 32000)
+        assert table.data_start == 44 + len(extra)
+        assert table.offset_for(0) == 0
+        assert table.offset_for(0.5) == 16000
+        assert table.offset_for(0.50001) % 4 == 0
+        assert table.offset_for(-1) == 0
+        assert table.offset_for(10) == 32000
+        
+        stream = table.open_at(0.25)
+        with wave.open(io.BufferedReader(stream), 'rb') as w:
+            assert w.getnframes() == 6000
+            assert w.readframes(1) == struct.pack('<hh', 2000, -2000)
+        stream.close()
+    print("✅ WAV 跳轉表測試通過")
+
+def _mock_pygame():
+    """取代 pygame 的 mock：播放位置固定在開頭，歌曲一直在播放"""
+    from unittest import mock
+    
+    pygame_mock = mock.MagicMock()
+    pygame_mock.mixer.music.get_pos.return_value = 0
+    pygame_mock.mixer.music.get_busy.return_value = True
+    return pygame_mock
+
+def _mock_player(folder, count=8):
+    """建立以 mock 取代 pygame.mixer 的播放器，播放清單有 count 首不存在的歌曲"""
+    from music_player import MusicPlayer, Song
+    
+    player = MusicPlayer(folder)
+    player._pygame_initialized = True
+    player.normalize_loudness = False
+    player.playlist = [Song(file_path=os.path.join(folder, f"{i:02d}.mp3"), title=f"歌曲 {i}", artist="測試",
+                            album="測試", duration=180.0, file_size=0) for i in range(count)]
+    player._reindex_playlist()
+    return player
+
+def test_state_transitions():
+    """測試狀態轉換表：不合法的轉換被忽略，狀態改變時才觸發回調"""
+    import tempfile
+    from unittest import mock
+    import music_player
+    from music_player import PlaybackState, STATE_TRANSITIONS
+    
+    print("\n🚦 測試播放狀態轉換...")
+    assert set(STATE_TRANSITIONS) == set(PlaybackState)
+    assert PlaybackState.PAUSED not in STATE_TRANSITIONS[PlaybackState.STOPPED]
+    
+    with tempfile.TemporaryDirectory() as tmp, \
+            mock.patch.object(music_player, 'pygame', _mock_pygame(), create=True):
+        player = _mock_player(tmp)
+        changes = []
+        player.on_state_change = changes.append
+        
+        assert not player._set_state(PlaybackState.PAUSED)
+        assert player.state == PlaybackState.STOPPED and changes == []
+        
+        player.play(0)
+        player.pause()
+        player.pause()
+        player.resume()
+        player.stop()
+        assert changes == [PlaybackState.PLAYING, PlaybackState.PAUSED, PlaybackState.PLAYING, PlaybackState.STOPPED]
+        
+        # 停止時暫停不會改變狀態
+        player.pause()
+        assert player.state == PlaybackState.STOPPED and len(changes) == 4
+        player.cleanup()
+    print("✅ 播放狀態轉換測試通過")
+
+def test_coalesced_navigation():
+    """測試引擎忙碌時連續送出的下一首／上一首只載入最後決定的歌曲一次"""
+    import tempfile
+    from unittest import mock
+    import music_player
+    
+    print("\n⏭️ 測試合併換歌命令...")
+    mixer_mock = _mock_pygame()
+    busy = threading.Event()
+    release = threading.Event()
+    
+    def slow_load(path):
+        # 第一次載入時卡住引擎，讓後續命令在佇列中累積
+        if not busy.is_set():
+            busy.set()
+            release.wait(5)
+    
+    mixer_mock.mixer.music.load.side_effect = slow_load
+    with tempfile.TemporaryDirectory() as tmp, \
+            mock.patch.object(music_player, 'pygame', mixer_mock, create=True):
+        player = _mock_player(tmp)
+        player._submit('play', 0, wait=False)
+        assert busy.wait(5)
+        for command in ('next', 'next', 'next', 'previous', 'next', 'next'):
+            player._submit(command, wait=False)
+        player._submit('play', None, wait=False)
+        release.set()
+        player._submit('set_volume', 0.5)
+        
+        loaded = [call.args[0] for call in mixer_mock.mixer.music.load.call_args_list]
+        assert [os.path.basename(path) for path in loaded] == ["00.mp3", "04.mp3"]
+        assert player.current_index == 4
+        
+        # 換歌命令之間夾著其他命令時，其他命令照原本的順序執行，前後的換歌不合併
+        events = []
+        busy.clear()
+        release.clear()
+        # 記錄載入每首歌時的音量，確認夾在中間的 set_volume 在後一個換歌命令之前執行
+        mixer_mock.mixer.music.load.side_effect = lambda path: (
+            events.append((os.path.basename(path), player.volume)), slow_load(path))
+        player._submit('next', wait=False)
+        assert busy.wait(5)
+        player._submit('next', wait=False)
+        player._submit('set_volume', 0.3, wait=False)
+        player._submit('next', wait=False)
+        release.set()
+        player._submit('set_volume', 0.5)
+        assert events == [("05.mp3", 0.5), ("06.mp3", 0.5), ("07.mp3", 0.3)]
+        assert player.current_index == 7
+        
+        # 隨機播放時，合併的 play(i) 之後接下一首，i 仍記在歷史中，上一首會回到 i
+        player._submit('toggle_shuffle')
+        busy.clear()
+        release.clear()
+        player._submit('play', 0, wait=False)
+        assert busy.wait(5)
+        player._submit('play', 3, wait=False)
+        player._submit('next', wait=False)
+        release.set()
+        player._submit('set_volume', 0.5)
+        assert player.current_index not in (0, 3)
+        player._submit('previous')
+        assert player.current_index == 3
+        
+        # 順序播放時 play(i) 之後的下一首是 i + 1，不沿用原本那首預載的下一首
+        player._submit('toggle_shuffle')
+        busy.clear()
+        release.clear()
+        player._submit('play', 0, wait=False)
+        assert busy.wait(5)
+        player._submit('play', 3, wait=False)
+        player._submit('next', wait=False)
+        release.set()
+        player._submit('set_volume', 0.5)
+        assert player.current_index == 4
+        player.cleanup()
+    print("✅ 合併換歌命令測試通過")
+
+def test_engine_thread():
+    """測試多個執行緒同時送出命令時，pygame.mixer 只由播放引擎執行緒操作"""
+    import tempfile
+    from unittest import mock
+    import music_player
+    
+    print("\n🧵 測試播放引擎執行緒...")
+    pygame_mock = _mock_pygame()
+    callers = set()
+    pygame_mock.mixer.music.set_volume.side_effect = lambda volume: callers.add(threading.current_thread().name)
+    with tempfile.TemporaryDirectory() as tmp, \
+            mock.patch.object(music_player, 'pygame', pygame_mock, create=True):
+        player = _mock_player(tmp)
+        threads = [threading.Thread(target=player.set_volume, args=(i / 10,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert callers == {"MusicPlayerEngine"}
+        assert pygame_mock.mixer.music.set_volume.call_count == 10
+        engine = player._engine_thread
+        player.cleanup()
+        assert not engine.is_alive()
+    print("✅ 播放引擎執行緒測試通過")
+
+def test_gapless_queue():
+    """測試預載完成後下一首排入 pygame 佇列，換歌後過期的預載結果被忽略"""
+    import tempfile
+    from unittest import mock
+    import music_player
+    
+    print("\n🔗 測試無縫播放佇列...")
+    pygame_mock = _mock_pygame()
+    with tempfile.TemporaryDirectory() as tmp, \
+            mock.patch.object(music_player, 'pygame', pygame_mock, create=True):
+        player = _mock_player(tmp, count=4)
+        for song in player.playlist:
+            with open(song.file_path, 'wb') as f:
+                f.write(b"\0" * 1024)
+        
+        player.play(0)
+        player._prefetch_thread.join(5)
+        # 預載執行緒把 queue_next 送進命令佇列，以同步命令等它執行完畢
+        player.set_volume(0.5)
+        assert player._queued_index == 1
+        assert os.path.basename(pygame_mock.mixer.music.queue.call_args.args[0]) == "01.mp3"
+        
+        # 帶著舊世代的預載結果不會取代佇列中的下一首
+        player._submit('queue_next', 3, player._generation - 1)
+        assert player._queued_index == 1
+        
+        # pygame 自動接著播放佇列中的歌曲後，播放器跟著切換
+        with player._state_lock:
+            player._advance_to_queued()
+        assert player.current_index == 1 and player.current_song.title == "歌曲 1"
+        player.cleanup()
+    print("✅ 無縫播放佇列測試通過")
+
 def main():
     """主測試函數"""
     print("🚀 開始音樂播放器測試")
@@ -221,6 +456,13 @@ def main():
     # 測試 iPhone 背景播放
     background_test_success = test_iphone_background_playback()
     
+    # 不需要音訊裝置的單元測試
+    test_engine_thread()
+    test_gapless_queue()
+    test_wav_seek_table()
+    test_state_transitions()
+    test_coalesced_navigation()
+    
     # 總結
     print("\n" + "=" * 60)
     print("🏁 測試總結")
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+播放服務測試腳本
+以不需要音訊裝置的假播放器啟動播放服務，測試狀態查詢、播放清單快取、命令檢查、存取控制與連線失敗
+"""
+
+import os
+import json
+import time
+import socket
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from dataclasses import asdict
+
+from music_player import PlaybackState, Song
+from playback_daemon import PlaybackDaemon, PlaybackClient, PlaybackDaemonError, TOKEN_HEADER, daemon_token
+
+
+def _song(folder: str, name: str) -> Song:
+    return Song(file_path=os.path.join(folder, f"{name}.mp3"), title=name, artist="測試歌手", album="測試專輯",
+                duration=180.0, file_size=1024)
+
+
+class StubPlayer:
+    """記錄收到的命令，不播放任何聲音"""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.playlist = [_song(folder, "a"), _song(folder, "b")]
+        self.current_index = -1
+        self.state = PlaybackState.STOPPED
+        self.volume = 0.7
+        self.calls = []
+
+    def snapshot(self):
+        song = self.playlist[self.current_index] if self.current_index >= 0 else None
+        return {
+            'state': self.state, 'generation': 1, 'current_index': self.current_index, 'current_song': song,
+            'position': 0.0, 'duration': song.duration if song else 0.0, 'progress': 0.0,
+            'total_songs': len(self.playlist), 'volume': self.volume, 'shuffle': False, 'repeat': False,
+            'normalize': False, 'track_gain': 1.0,
+        }
+
+    def scan_music_folder(self):
+        return self.playlist
+
+    def add_files(self, file_paths):
+        added = [_song(self.folder, os.path.splitext(os.path.basename(path))[0]) for path in file_paths]
+        self.playlist.extend(added)
+        return added
+
+    def set_playlist(self, songs, current_index=-1):
+        self.playlist = list(songs)
+        self.current_index = current_index
+
+    def play(self, song_index=None):
+        self.calls.append(('play', song_index))
+        self.current_index = song_index if song_index is not None else 0
+        self.state = PlaybackState.PLAYING
+
+    def set_volume(self, volume):
+        self.calls.append(('set_volume', volume))
+        self.volume = volume
+
+    def cleanup(self):
+        self.calls.append(('cleanup',))
+
+
+def _start(player: StubPlayer):
+    """在背景執行緒以系統指定的埠號啟動播放服務，返回服務與用戶端"""
+    daemon = PlaybackDaemon(player.folder, port=0, player=player)
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    # port 在綁定後才寫回實際的埠號
+    for _ in range(100):
+        if daemon.port and PlaybackClient(port=daemon.port, token=daemon.token).ping():
+            break
+        time.sleep(0.02)
+    client = PlaybackClient(port=daemon.port, token=daemon.token)
+    assert client.ping(), "播放服務沒有啟動"
+    return daemon, thread, client
+
+
+def test_state_and_commands():
+    """測試狀態查詢、播放命令與未知命令"""
+    print("🎛️ 測試狀態與命令...")
+    tmp = tempfile.TemporaryDirectory()
+    player = StubPlayer(tmp.name)
+    daemon, thread, client = _start(player)
+    try:
+        snap = client.snapshot()
+        assert snap['state'] == PlaybackState.STOPPED and snap['current_song'] is None
+        assert snap['total_songs'] == 2
+
+        client.play(1)
+        client.set_volume(0.3)
+        snap = client.snapshot()
+        assert snap['state'] == PlaybackState.PLAYING and snap['current_song'].title == "b"
+        assert snap['volume'] == 0.3
+        assert player.calls == [('play', 1), ('set_volume', 0.3)]
+
+        # 不在允許清單中的方法不能透過 API 呼叫
+        result = client._command('cleanup')
+        assert not result['success'] and "未知的命令" in result['error']
+        assert ('cleanup',) not in player.calls
+    finally:
+        daemon.shutdown()
+        thread.join(timeout=2.0)
+        tmp.cleanup()
+    print("✅ 狀態與命令測試通過")
+
+
+def test_playlist_cache():
+    """測試播放清單依版本快取，清單改變時才重新下載"""
+    print("📋 測試播放清單快取...")
+    tmp = tempfile.TemporaryDirectory()
+    player = StubPlayer(tmp.name)
+    daemon, thread, client = _start(player)
+    try:
+        assert [song.title for song in client.playlist] == ["a", "b"]
+        version = daemon.playlist_version
+        assert client._request(f"/playlist?since={version}") == {'version': version, 'unchanged': True}
+        assert 'songs' in client._request(f"/playlist?since={version - 1}")
+
+        # add_files 與 MusicPlayer 一樣返回新加入的歌曲
+        added = client.add_files([os.path.join(tmp.name, "c.mp3")])
+        assert [song.title for song in added] == ["c"] and isinstance(added[0], Song)
+        assert daemon.playlist_version == version + 1
+        assert [song.title for song in client.playlist] == ["a", "b", "c"]
+
+        client.set_playlist([_song(tmp.name, "x"), _song(tmp.name, "y")], 1)
+        assert daemon.playlist_version == version + 2
+        assert [song.title for song in client.playlist] == ["x", "y"]
+        assert client.current_index == 1
+    finally:
+        daemon.shutdown()
+        thread.join(timeout=2.0)
+        tmp.cleanup()
+    assert ('cleanup',) in player.calls
+    print("✅ 播放清單快取測試通過")
+
+
+def _raw_status(url: str, body: bytes = None, headers: dict = None) -> int:
+    """不經過用戶端直接送出請求（模擬瀏覽器中的其他網頁），返回 HTTP 狀態碼"""
+    request = urllib.request.Request(url, data=body, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=3) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_access_control():
+    """測試沒有權杖、不是 JSON 的請求被拒絕，以及不能加入音樂資料夾以外的檔案"""
+    print("🔒 測試存取控制...")
+    tmp = tempfile.TemporaryDirectory()
+    player = StubPlayer(tmp.name)
+    daemon, thread, client = _start(player)
+    try:
+        # 權杖存放在音樂資料夾中，之後取得的都是同一個
+        assert daemon_token(tmp.name) == daemon.token
+        url = f"http://127.0.0.1:{daemon.port}"
+        body = json.dumps({'command': 'play', 'args': [0]}).encode('utf-8')
+
+        # 跨來源的「簡單請求」只能送出 text/plain 等類型，帶著正確權杖也不接受
+        assert _raw_status(url + "/command", body, {'Content-Type': 'text/plain', TOKEN_HEADER: daemon.token}) == 415
+        assert _raw_status(url + "/command", body, {'Content-Type': 'application/json'}) == 403
+        assert _raw_status(url + "/command", body, {'Content-Type': 'application/json', TOKEN_HEADER: "wrong"}) == 403
+        assert _raw_status(url + "/state") == 403
+        assert player.calls == []
+        assert not PlaybackClient(port=daemon.port).ping()
+
+        # 音樂資料夾以外的路徑（包含以 .. 跳出的路徑）不能加入播放清單
+        version = daemon.playlist_version
+        result = client._command('add_files', ["/etc/passwd"])
+        assert not result['success'] and "/etc/passwd" in result['error']
+        result = client._command('add_files', [os.path.join(tmp.name, "..", "outside.mp3")])
+        assert not result['success']
+        outside = Song(file_path="/etc/passwd", title="x", artist="x", album="x", duration=0.0, file_size=0)
+        assert not client._command('set_playlist', [asdict(outside)])['success']
+        assert daemon.playlist_version == version
+        assert [song.title for song in client.playlist] == ["a", "b"]
+    finally:
+        daemon.shutdown()
+        thread.join(timeout=2.0)
+        tmp.cleanup()
+    print("✅ 存取控制測試通過")
+
+
+def test_connection_failure():
+    """測試播放服務沒有執行時用戶端拋出 PlaybackDaemonError"""
+    print("🔌 測試連線失敗...")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    client = PlaybackClient(port=port, timeout=0.5)
+    assert not client.ping()
+    try:
+        client.snapshot()
+        assert False, "應該拋出 PlaybackDaemonError"
+    except PlaybackDaemonError:
+        pass
+    print("✅ 連線失敗測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始播放服務測試")
+    print("=" * 60)
+    test_state_and_commands()
+    test_playlist_cache()
+    test_access_control()
+    test_connection_failure()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+播放清單分頁測試腳本
+測試分頁範圍計算與可見歌曲資訊的批次讀取
+"""
+
+import tempfile
+from pathlib import Path
+
+from music_library import MusicLibrary
+from playlist_pager import page_bounds, page_of_index, visible_track_info
+
+
+def test_page_bounds():
+    """測試分頁範圍與頁碼修正"""
+    print("📄 測試分頁範圍...")
+    assert page_bounds(45, 1, 20) == (1, 0, 20, 3)
+    assert page_bounds(45, 3, 20) == (3, 40, 45, 3)
+    # 超出範圍的頁碼會修正到最後一頁，空清單仍有一頁
+    assert page_bounds(45, 9, 20) == (3, 40, 45, 3)
+    assert page_bounds(0, 2, 20) == (1, 0, 0, 1)
+    assert page_of_index(0, 20) == 1
+    assert page_of_index(40, 20) == 3
+    print("✅ 分頁範圍測試通過")
+
+
+def test_visible_track_info():
+    """測試只讀取可見歌曲，未登記的檔案自動登記"""
+    print("🎵 測試可見歌曲資訊...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library = MusicLibrary(tmp)
+        paths = []
+        for name in ["a.mp3", "b.mp3", "c.mp3"]:
+            path = folder / name
+            path.write_bytes(b"\0" * 64)
+            paths.append(path)
+        library.add_file(paths[0])
+
+        infos = visible_track_info(library, paths[:2])
+        assert [info['title'] for info in infos] == ["a", "b"]
+        assert infos[1]['file_size'] == 64
+        # 不在目前頁面的歌曲不會被讀取
+        assert library.get_by_paths(paths)[2] is None
+        assert len(library) == 2
+        library.close()
+    print("✅ 可見歌曲資訊測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始播放清單分頁測試")
+    print("=" * 60)
+    test_page_bounds()
+    test_visible_track_info()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+播放清單儲存測試腳本
+測試播放清單、播放佇列與 M3U8 匯入匯出
+"""
+
+import tempfile
+from pathlib import Path
+
+from music_library import MusicLibrary
+from playlist_store import PlaylistStore, get_playlist_store
+from music_player import MusicPlayer, song_from_track
+
+
+def _make_store(folder: Path, names):
+    """建立音樂庫並登記假的音訊檔案"""
+    library = MusicLibrary(str(folder))
+    ids = []
+    for name in names:
+        path = folder / name
+        path.write_bytes(b"\0" * 64)
+        ids.append(library.add_file(path))
+    return PlaylistStore(library), ids
+
+
+def test_playlists_and_queue():
+    """測試儲存、讀取與歌曲移除"""
+    print("💾 測試播放清單與播放佇列...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        store, ids = _make_store(folder, ["a.mp3", "b.mp3", "c.mp3"])
+
+        store.save_playlist("最愛", [ids[2], ids[0], ids[1]], current_position=1)
+        store.append_tracks("最愛", [ids[2]])
+        tracks, position = store.load_playlist("最愛")
+        assert [Path(t['file_path']).name for t in tracks] == ["c.mp3", "a.mp3", "b.mp3", "c.mp3"]
+        assert position == 1
+
+        store.save_queue([ids[1], ids[0]], current_position=0)
+        store.save_queue_position(1)
+        assert [p['name'] for p in store.list_playlists()] == ["最愛"], "播放佇列不應出現在清單列表"
+        queue, position = store.load_queue()
+        assert [Path(t['file_path']).name for t in queue] == ["b.mp3", "a.mp3"]
+        assert position == 1
+
+        # 從音樂庫移除的歌曲會一併從播放清單移除
+        store.library.remove_file(folder / "c.mp3")
+        assert store.track_ids("最愛") == [ids[0], ids[1]]
+
+        assert store.rename_playlist("最愛", "通勤")
+        assert store.delete_playlist("通勤")
+        assert store.list_playlists() == []
+        store.library.close()
+    print("✅ 播放清單與播放佇列測試通過")
+
+
+def test_position_after_track_removal():
+    """測試目前位置前面的歌曲被移除後，讀取的位置仍指向同一首歌"""
+    print("📍 測試移除歌曲後的播放位置...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        store, ids = _make_store(folder, ["a.mp3", "b.mp3", "c.mp3", "d.mp3"])
+        store.save_playlist("最愛", ids, current_position=2)
+        store.save_queue(ids, current_position=0)
+        store.save_queue_position(2)
+
+        store.library.remove_file(folder / "a.mp3")
+        for tracks, position in (store.load_playlist("最愛"), store.load_queue()):
+            assert [Path(t['file_path']).name for t in tracks] == ["b.mp3", "c.mp3", "d.mp3"]
+            assert Path(tracks[position]['file_path']).name == "c.mp3"
+
+        # 留下空號後更新位置，仍以佇列中的索引計算
+        store.save_queue_position(2)
+        queue, position = store.load_queue()
+        assert Path(queue[position]['file_path']).name == "d.mp3"
+
+        # 目前的歌曲本身被移除時，指向原本的下一首
+        store.library.remove_file(folder / "c.mp3")
+        tracks, position = store.load_playlist("最愛")
+        assert Path(tracks[position]['file_path']).name == "d.mp3"
+
+        # 儲存時略過的歌曲不影響目前位置
+        store.save_playlist("略過", [None, ids[1], None, ids[3]], current_position=3)
+        tracks, position = store.load_playlist("略過")
+        assert Path(tracks[position]['file_path']).name == "d.mp3"
+        store.library.close()
+    print("✅ 移除歌曲後的播放位置測試通過")
+
+
+def test_m3u8_round_trip():
+    """測試 M3U8 匯出後再匯入"""
+    print("📤 測試 M3U8 匯入匯出...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        store, ids = _make_store(folder, ["一.mp3", "二.mp3"])
+        store.save_playlist("測試", [ids[1], ids[0]])
+
+        result = store.export_m3u8("測試", folder / "lists" / "測試.m3u8")
+        assert result['success']
+        text = Path(result['file_path']).read_text(encoding='utf-8')
+        assert "../二.mp3" in text
+
+        (folder / "三.mp3").write_bytes(b"\0" * 64)
+        with open(result['file_path'], 'a', encoding='utf-8') as f:
+            f.write("../三.mp3\n../不存在.mp3\n")
+
+        imported = store.import_m3u8(result['file_path'], name="匯入")
+        assert imported['imported'] == 3
+        assert imported['missing'] == [str(folder / "lists" / ".." / "不存在.mp3")]
+        tracks, _ = store.load_playlist("匯入")
+        assert [Path(t['file_path']).name for t in tracks] == ["二.mp3", "一.mp3", "三.mp3"]
+
+        # 沒有指定名稱時使用檔案內的 #PLAYLIST
+        assert store.import_m3u8(result['file_path'])['name'] == "測試"
+        store.library.close()
+    print("✅ M3U8 匯入匯出測試通過")
+
+
+def test_player_restores_queue():
+    """測試播放器保存播放佇列，下次啟動時不掃描資料夾即可依原順序還原"""
+    print("⏯️ 測試播放器還原播放佇列...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        store = get_playlist_store(tmp)
+        local, ids = _make_store(folder, ["c.mp3", "a.mp3", "b.mp3"])
+        songs = [song_from_track(track) for track in store.library.get_tracks(ids)]
+
+        player = MusicPlayer(tmp, persist_queue=True)
+        player.set_playlist(songs, 2)
+        player.cleanup()
+
+        restored = MusicPlayer(tmp, persist_queue=True)
+        assert restored.restore_queue()
+        assert [Path(song.file_path).name for song in restored.playlist] == ["c.mp3", "a.mp3", "b.mp3"]
+        assert restored.current_index == 2
+        restored.cleanup()
+
+        # 沒有開啟 persist_queue 的播放器不會覆寫播放佇列
+        other = MusicPlayer(tmp)
+        other.set_playlist(songs[:1])
+        other.cleanup()
+        assert len(store.load_queue()[0]) == 3
+        local.library.close()
+        store.library.close()
+    print("✅ 播放器還原播放佇列測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始播放清單儲存測試")
+    print("=" * 60)
+    test_playlists_and_queue()
+    test_position_after_track_removal()
+    test_m3u8_round_trip()
+    test_player_restores_queue()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
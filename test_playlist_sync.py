@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+播放列表同步測試腳本
+測試從檢查點繼續同步、略過音樂庫中已有的影片，以及批次下載把播放列表網址交給同步器
+"""
+
+import tempfile
+from pathlib import Path
+
+from music_library import MusicLibrary
+from playlist_sync import PlaylistSyncer, is_playlist_url
+from batch_download import BatchDownloader
+
+PLAYLIST_URL = "https://www.youtube.com/playlist?list=PLtest"
+
+
+class FakeDownloader:
+    """不連網的下載器：播放列表有 v1 到 v5 五支影片，failing 中的影片下載失敗"""
+
+    def __init__(self, download_dir: str, library=None, failing=()):
+        self.download_dir = Path(download_dir)
+        self.library = library
+        self.failing = set(failing)
+        self.downloaded = []
+
+    def add_progress_hook(self, hook):
+        pass
+
+    def iter_playlist_entries(self, url):
+        playlist = {'id': 'PLtest', 'title': "測試播放列表", 'uploader': None}
+        for i in range(1, 6):
+            video_id = f"v{i}"
+            yield playlist, {'id': video_id, 'title': f"歌曲 {i}",
+                             'url': f"https://www.youtube.com/watch?v={video_id}"}
+
+    def download_mp3(self, url):
+        video_id = url.rsplit('=', 1)[-1]
+        if video_id in self.failing:
+            raise RuntimeError("下載失敗")
+        self.downloaded.append(video_id)
+        return {'file_path': f"{video_id}.mp3", 'file_paths': [f"{video_id}.mp3"]}
+
+    download_mp4 = download_mp3
+
+
+def test_is_playlist_url():
+    """測試只有播放列表與頻道網址交給同步器"""
+    print("🔗 測試播放列表網址判斷...")
+    assert is_playlist_url(PLAYLIST_URL)
+    assert is_playlist_url("https://www.youtube.com/@someone/videos")
+    assert is_playlist_url("https://www.youtube.com/channel/UC123")
+    assert not is_playlist_url("https://www.youtube.com/watch?v=abc&list=PLtest")
+    assert not is_playlist_url("https://youtu.be/abc")
+    print("✅ 播放列表網址判斷測試通過")
+
+
+def test_resume_from_checkpoint():
+    """測試中斷或失敗後再次同步，只處理檢查點中尚未完成的影片"""
+    print("⏯️ 測試從檢查點繼續...")
+    with tempfile.TemporaryDirectory() as tmp:
+        first = FakeDownloader(tmp, failing={'v2', 'v4'})
+        summary = PlaylistSyncer(first, max_workers=2).sync(PLAYLIST_URL)
+        assert summary['downloaded'] == 3 and summary['failed'] == 2
+        assert (Path(tmp) / ".sync" / "PLtest.json").exists()
+
+        # 新的下載器（沒有音樂庫）只能依檢查點判斷，已完成的影片不會重新下載
+        second = FakeDownloader(tmp)
+        summary = PlaylistSyncer(second, max_workers=2).sync(PLAYLIST_URL, retry_failed=False)
+        assert summary['skipped'] == 5 and second.downloaded == []
+
+        summary = PlaylistSyncer(second, max_workers=2).sync(PLAYLIST_URL)
+        assert sorted(second.downloaded) == ['v2', 'v4']
+        assert summary['skipped'] == 3 and summary['failed'] == 0
+    print("✅ 從檢查點繼續測試通過")
+
+
+def test_skip_library_videos():
+    """測試音樂庫中已有的影片不會再下載，且連續已下載的影片達到門檻時停止列舉"""
+    print("📚 測試略過已下載的影片...")
+    with tempfile.TemporaryDirectory() as tmp:
+        library = MusicLibrary(tmp)
+        for video_id in ('v1', 'v2', 'v3'):
+            path = Path(tmp) / f"{video_id}.mp3"
+            path.write_bytes(b"\0" * 16)
+            library.add_file(path, video_id=video_id)
+
+        downloader = FakeDownloader(tmp, library=library)
+        summary = PlaylistSyncer(downloader, max_workers=1).sync(PLAYLIST_URL)
+        assert sorted(downloader.downloaded) == ['v4', 'v5']
+        assert summary['listed'] == 5 and summary['skipped'] == 3
+
+        # 由新到舊排列的頻道：開頭就連續遇到已下載的影片時提早停止
+        downloader = FakeDownloader(tmp, library=library)
+        summary = PlaylistSyncer(downloader, max_workers=1, checkpoint_dir=str(Path(tmp) / "other")).sync(
+            PLAYLIST_URL, stop_after_known=2)
+        assert summary['listed'] == 2 and downloader.downloaded == []
+        library.close()
+    print("✅ 略過已下載的影片測試通過")
+
+
+def test_batch_routes_playlists():
+    """測試批次下載把播放列表網址交給同步器，每支新影片一筆記錄"""
+    print("📦 測試批次下載同步播放列表...")
+    with tempfile.TemporaryDirectory() as tmp:
+        batch = BatchDownloader(download_dir=tmp, workers=2)
+        batch.downloader = FakeDownloader(tmp, failing={'v3'})
+        records = batch._process(PLAYLIST_URL)
+        assert len(records) == 5
+        assert {r['url'].rsplit('=', 1)[-1] for r in records if not r['success']} == {'v3'}
+        assert all(r['input'] == PLAYLIST_URL for r in records)
+
+        # 再次執行只重試上次失敗的影片
+        batch.downloader = FakeDownloader(tmp)
+        records = batch._process(PLAYLIST_URL)
+        assert [r['url'] for r in records] == ["https://www.youtube.com/watch?v=v3"] and records[0]['success']
+    print("✅ 批次下載同步播放列表測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始播放列表同步測試")
+    print("=" * 60)
+    test_is_playlist_url()
+    test_resume_from_checkpoint()
+    test_skip_library_videos()
+    test_batch_routes_playlists()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
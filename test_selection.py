@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+選取模型測試腳本
+測試單一切換、範圍選取與大量項目的批次選取
+"""
+
+import time
+
+from selection import Selection
+
+
+def test_toggle_and_range():
+    """測試單一切換與從起點選取到指定項目"""
+    print("☑️ 測試切換與範圍選取...")
+    keys = list(range(100, 110))
+    selection = Selection()
+
+    assert selection.toggle(102)
+    selection.extend_to(keys, 105)
+    assert selection.ordered(keys) == [102, 103, 104, 105]
+    assert selection.anchor == 105
+
+    # 往回選取也可以
+    selection.extend_to(keys, 100)
+    assert selection.ordered(keys) == keys[:6]
+
+    selection.set(103, False)
+    selection.select_range(keys, 9, 8)
+    assert selection.ordered(keys) == [100, 101, 102, 104, 105, 108, 109]
+
+    # 項目被刪除後只保留仍存在的項目
+    version = selection.version
+    selection.retain(keys[:3])
+    assert sorted(selection) == [100, 101, 102]
+    assert selection.version > version
+    assert selection.anchor is None
+    print("✅ 切換與範圍選取測試通過")
+
+
+def test_bulk_operations():
+    """測試一萬個項目的全選、反向與取消全選"""
+    print("⚡ 測試大量項目批次選取...")
+    keys = list(range(10000))
+    selection = Selection()
+
+    started = time.perf_counter()
+    selection.select_all(keys)
+    assert len(selection) == 10000
+    selection.invert(keys[:5000])
+    assert len(selection) == 5000 and 0 not in selection and 9999 in selection
+    selection.update(range(0, 5000, 2))
+    assert len(selection) == 7500
+    selection.clear()
+    elapsed = time.perf_counter() - started
+
+    assert not selection
+    assert elapsed < 0.1, f"批次選取太慢: {elapsed:.3f} 秒"
+    print(f"✅ 大量項目批次選取測試通過（{elapsed * 1000:.1f} 毫秒）")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始選取模型測試")
+    print("=" * 60)
+    test_toggle_and_range()
+    test_bulk_operations()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
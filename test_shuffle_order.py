@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+隨機播放順序測試腳本
+測試不重複抽歌、上一首歷史與播放清單變動
+"""
+
+import random
+
+from shuffle_order import ShuffleBag
+
+
+def test_no_repeat_until_exhausted():
+    """測試每一輪每首歌只出現一次"""
+    print("🔀 測試不重複抽歌...")
+    songs = [f"song{i}.mp3" for i in range(50)]
+    bag = ShuffleBag(songs, rng=random.Random(1))
+
+    first_round = [bag.next() for _ in songs]
+    assert sorted(first_round) == sorted(songs)
+
+    # 新的一輪不會緊接著重播剛才那首
+    assert bag.next() != first_round[-1]
+    print("✅ 不重複抽歌測試通過")
+
+
+def test_previous_and_peek():
+    """測試上一首會回到聽過的歌，前進時重播同樣的順序"""
+    print("⏮️ 測試播放歷史...")
+    bag = ShuffleBag(range(10), rng=random.Random(2))
+    played = [bag.next() for _ in range(4)]
+
+    assert bag.previous() == played[2]
+    assert bag.previous() == played[1]
+    assert bag.next() == played[2]
+    assert bag.next() == played[3]
+
+    upcoming = bag.peek()
+    assert bag.peek() == upcoming
+    assert bag.next() == upcoming
+
+    # 直接選歌會成為目前的歌，上一首回到選歌前的那首
+    bag.set_current(played[0])
+    assert bag.current == played[0]
+    assert bag.previous() == upcoming
+    print("✅ 播放歷史測試通過")
+
+
+def test_playlist_changes():
+    """測試播放清單新增與刪除歌曲"""
+    print("📝 測試播放清單變動...")
+    bag = ShuffleBag(["a", "b", "c"], rng=random.Random(3))
+    first = bag.next()
+    bag.sync(["a", "b", "c", "d"])
+    bag.remove(first)
+
+    rest = [bag.next() for _ in range(3)]
+    assert sorted(rest) == sorted({"a", "b", "c", "d"} - {first})
+    # 已移除的歌曲不會出現在上一首
+    assert bag.previous() == rest[1]
+    assert bag.previous() == rest[0]
+    assert bag.previous() is None
+    print("✅ 播放清單變動測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始隨機播放順序測試")
+    print("=" * 60)
+    test_no_repeat_until_exhausted()
+    test_previous_and_peek()
+    test_playlist_changes()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
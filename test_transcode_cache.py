@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+手機轉檔快取測試腳本
+測試依請求標頭選擇版本、轉檔紀錄、最近使用時間與容量淘汰
+"""
+
+import os
+import time
+import tempfile
+from pathlib import Path
+
+from music_library import MusicLibrary
+from transcode_cache import (
+    TranscodeCache, VARIANTS, VARIANT_DIR_NAME, ORPHAN_GRACE_SECONDS,
+    choose_variant, needs_transcode, variant_file_name,
+)
+
+IPHONE_UA = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148"
+DESKTOP_UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36"
+
+
+def _transcode_fake(file_path: str, output_dir: str, track_id: int):
+    """測試用的轉檔函數：每個版本寫入 1000 位元組的檔案"""
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    result = {}
+    for variant in VARIANTS:
+        name = variant_file_name(track_id, variant)
+        (Path(output_dir) / name).write_bytes(b"\0" * 1000)
+        result[variant] = {'file': name, 'size': 1000}
+    return result
+
+
+class FakeTranscodeCache(TranscodeCache):
+    """不需要 ffmpeg 的轉檔快取"""
+
+    analyze = staticmethod(_transcode_fake)
+
+    def available(self) -> bool:
+        return True
+
+
+def _library_with_tracks(tmp: str, count: int):
+    library = MusicLibrary(tmp)
+    paths = []
+    for i in range(count):
+        path = Path(tmp) / f"song{i}.flac"
+        path.write_bytes(b"\0" * 64)
+        library.add_file(path)
+        paths.append(path)
+    return library, paths
+
+
+def test_choose_variant():
+    """測試依裝置與網路狀況選擇版本"""
+    print("📶 測試選擇播放版本...")
+    assert choose_variant({'User-Agent': DESKTOP_UA}) is None
+    assert choose_variant({'User-Agent': IPHONE_UA}) == 'iphone'
+    assert choose_variant({'user-agent': IPHONE_UA, 'Save-Data': 'on'}) == 'cellular'
+    assert choose_variant({'User-Agent': IPHONE_UA, 'ECT': '3g'}) == 'cellular'
+    assert choose_variant({'User-Agent': IPHONE_UA, 'ECT': '4g'}) == 'iphone'
+    assert choose_variant(None) is None
+
+    # iPhone 可以直接播放的小檔案不需要轉成 iphone 版本
+    with tempfile.TemporaryDirectory() as tmp:
+        mp3, flac = Path(tmp) / "a.mp3", Path(tmp) / "a.flac"
+        mp3.write_bytes(b"\0" * 64)
+        flac.write_bytes(b"\0" * 64)
+        assert not needs_transcode(str(mp3), 'iphone')
+        assert needs_transcode(str(mp3), 'cellular')
+        assert needs_transcode(str(flac), 'iphone')
+    print("✅ 選擇播放版本測試通過")
+
+
+def test_variant_path():
+    """測試轉檔結果存入索引，取得版本時更新最近使用時間"""
+    print("📱 測試轉檔版本...")
+    with tempfile.TemporaryDirectory() as tmp:
+        library, paths = _library_with_tracks(tmp, 2)
+        cache = FakeTranscodeCache(library, max_bytes=0, max_workers=1)
+        # 尚未轉檔時返回 None 並排入背景轉檔
+        assert cache.variant_path(paths[0], 'iphone') is None
+        cache.wait(10)
+        assert cache.update()['analyzed'] == 1
+        assert cache.update()['analyzed'] == 0
+
+        path = cache.variant_path(paths[0], 'cellular')
+        assert path == Path(tmp) / VARIANT_DIR_NAME / variant_file_name(library.get_by_path(paths[0])['id'], 'cellular')
+        assert path.exists()
+        assert cache.total_size() == 4000
+
+        # 轉檔版本被手動刪除時重新轉檔
+        path.unlink()
+        assert cache.variant_path(paths[0], 'cellular') is None
+        cache.wait(10)
+        assert cache.variant_path(paths[0], 'cellular').exists()
+        library.close()
+    print("✅ 轉檔版本測試通過")
+
+
+def test_evict():
+    """測試超過容量上限時從最久沒有使用的歌曲開始淘汰，並清除殘留檔案"""
+    print("🧹 測試容量淘汰...")
+    with tempfile.TemporaryDirectory() as tmp:
+        library, paths = _library_with_tracks(tmp, 3)
+        cache = FakeTranscodeCache(library, max_bytes=0, max_workers=1)
+        assert cache.update()['analyzed'] == 3
+        # 每首歌 2000 位元組；第一首最近播放過，其他兩首較久沒有使用
+        with library.transaction() as conn:
+            for i, path in enumerate(paths):
+                conn.execute("UPDATE transcodes SET last_used = ? WHERE track_id = ?",
+                             (1000 - i, library.get_by_path(path)['id']))
+        cache.variant_path(paths[0], 'iphone')
+
+        cache.max_bytes = 2500
+        result = cache.evict()
+        assert result['removed'] == 2 and result['freed'] == 4000
+        assert cache.total_size() == 2000
+        assert cache.variant_path(paths[0], 'iphone') is not None
+
+        # 被淘汰的歌曲不會在整個音樂庫轉檔時被轉回來
+        assert cache.update()['analyzed'] == 0
+        assert len(list(cache.variant_dir.iterdir())) == 2
+
+        # 沒有紀錄的舊檔案被清除，剛寫入的檔案保留
+        stale, fresh = cache.variant_dir / "999.iphone.m4a", cache.variant_dir / "998.iphone.m4a.part"
+        stale.write_bytes(b"\0")
+        fresh.write_bytes(b"\0")
+        old = time.time() - ORPHAN_GRACE_SECONDS - 10
+        os.utime(stale, (old, old))
+        cache.evict()
+        assert not stale.exists() and fresh.exists()
+        library.close()
+    print("✅ 容量淘汰測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始手機轉檔快取測試")
+    print("=" * 60)
+    test_choose_variant()
+    test_variant_path()
+    test_evict()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+垃圾桶測試腳本
+測試垃圾桶清單、還原、掃描排除與保留政策
+"""
+
+import time
+import tempfile
+from pathlib import Path
+
+from music_library import MusicLibrary, iter_audio_files
+from trash_bin import TrashBin, LEGACY_TRASH_DIR_NAME, ORPHAN_GRACE_SECONDS
+
+
+def _make_file(folder: Path, name: str, size: int = 100) -> Path:
+    """建立假的音訊檔案"""
+    path = folder / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"\0" * size)
+    return path
+
+
+def test_restore_and_scan_exclusion():
+    """測試移到垃圾桶的檔案不會被掃描到，且可以還原到原始位置"""
+    print("♻️ 測試還原與掃描排除...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library = MusicLibrary(tmp)
+        song = _make_file(folder, "album/歌曲.mp3")
+        _make_file(folder, LEGACY_TRASH_DIR_NAME + "/舊的.mp3")
+        trash = TrashBin(library)
+
+        # 舊版垃圾桶的檔案已被搬進新的垃圾桶
+        assert [item['name'] for item in trash.items()] == ["舊的.mp3"]
+        assert not (folder / LEGACY_TRASH_DIR_NAME).exists()
+
+        item_id = trash.add(song)
+        assert not song.exists()
+        assert list(iter_audio_files(folder)) == []
+
+        # 只有第一層的舊版垃圾桶被略過，子資料夾中同名的資料夾照常掃描
+        nested = _make_file(folder, "專輯/" + LEGACY_TRASH_DIR_NAME + "/歌曲.mp3")
+        _make_file(folder, LEGACY_TRASH_DIR_NAME + "/還沒搬的.mp3")
+        assert list(iter_audio_files(folder)) == [nested]
+        nested.unlink()
+        (folder / LEGACY_TRASH_DIR_NAME / "還沒搬的.mp3").unlink()
+        assert len(trash) == 2 and trash.total_size() == 200
+
+        result = trash.restore(item_id)
+        assert result['success'] and Path(result['file_path']) == song.resolve()
+        assert song.exists() and result['track_id'] is not None
+        assert len(trash) == 1
+        library.close()
+    print("✅ 還原與掃描排除測試通過")
+
+
+def test_retention_policy():
+    """測試超過保留天數與容量上限的項目會被清理"""
+    print("⏳ 測試保留政策...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library = MusicLibrary(tmp)
+        trash = TrashBin(library, max_age_days=7, max_bytes=250)
+
+        now = time.time()
+        entries = []
+        for i, age_days in enumerate([10, 3, 2, 1]):
+            entry = trash.move_in(_make_file(folder, f"song{i}.mp3"))
+            entry['deleted_at'] = now - age_days * 86400
+            entries.append(entry)
+        trash.record(entries)
+
+        # song0 太舊；剩下 300 位元組超過上限，再刪除最舊的 song1
+        remaining = [item['name'] for item in trash.items()]
+        assert remaining == ["song3.mp3", "song2.mp3"]
+        assert trash.total_size() == 200
+        assert len(list((folder / ".trash").iterdir())) == 2
+
+        assert trash.purge(now=now + 30 * 86400)['removed'] == 2
+        assert len(trash) == 0
+        library.close()
+    print("✅ 保留政策測試通過")
+
+
+def test_adopt_orphans():
+    """測試移入後尚未寫入清單就中斷留下的檔案，清理時補登記到清單並可還原"""
+    print("🧹 測試補登記沒有紀錄的檔案...")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        library = MusicLibrary(tmp)
+        trash = TrashBin(library)
+
+        # 模擬 move_in 之後、record 之前中斷
+        entry = trash.move_in(_make_file(folder, "orphan.mp3"))
+        (folder / ".trash" / "album").mkdir()
+        assert len(trash) == 0
+
+        # 剛移入的檔案可能正要寫入清單，寬限時間內不補登記
+        now = time.time()
+        trash.purge(now=now)
+        assert len(trash) == 0
+
+        later = now + ORPHAN_GRACE_SECONDS + 1
+        assert trash.purge(now=later)['removed'] == 0
+        items = trash.items()
+        assert [(item['trash_name'], item['name']) for item in items] == [(entry['trash_name'], "orphan.mp3")]
+        assert items[0]['deleted_at'] == later and items[0]['file_size'] == entry['file_size']
+
+        # 再次清理不會重複登記
+        trash.purge(now=later + 1)
+        assert len(trash) == 1
+
+        assert trash.restore(items[0]['id'])['success']
+        assert (folder / "orphan.mp3").exists()
+        library.close()
+    print("✅ 補登記沒有紀錄的檔案測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始垃圾桶測試")
+    print("=" * 60)
+    test_restore_and_scan_exclusion()
+    test_retention_policy()
+    test_adopt_orphans()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+波形峰值測試腳本
+測試區段最小/最大值、縮放層級與從索引讀取單一層級
+"""
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from music_library import MusicLibrary
+from waveform import WaveformIndex, WAVEFORM_LEVELS, compute_peaks, build_levels, level_for_width
+
+
+def _samples(seed: int = 0, length: int = 8000 * 10 + 123) -> np.ndarray:
+    return np.random.default_rng(seed).uniform(-1, 1, length).astype(np.float32)
+
+
+def _analyze_fake(file_path: str):
+    """測試用的分析函數：不解碼，直接以亂數樣本計算"""
+    samples = _samples()
+    levels = build_levels(compute_peaks(samples))
+    return {'duration': len(samples) / 8000, 'peaks': b''.join(level.tobytes() for level in levels)}
+
+
+class FakeWaveformIndex(WaveformIndex):
+    """不需要 ffmpeg 的波形索引"""
+
+    analyze = staticmethod(_analyze_fake)
+
+    def available(self) -> bool:
+        return True
+
+
+def test_compute_peaks():
+    """測試向量化的區段峰值與逐段計算的結果相同"""
+    print("🌊 測試波形峰值...")
+    samples = _samples()
+    peaks = compute_peaks(samples, 100)
+    assert peaks.shape == (100, 2) and peaks.dtype == np.int8
+    edges = np.linspace(0, len(samples), 101).astype(np.int64)
+    for i in (0, 37, 99):
+        chunk = samples[edges[i]:edges[i + 1]]
+        assert peaks[i, 0] == round(chunk.min() * 127) and peaks[i, 1] == round(chunk.max() * 127)
+
+    # 比區段數還短的音訊也有固定數量的區段
+    assert compute_peaks(np.ones(10, dtype=np.float32), 100).shape == (100, 2)
+
+    levels = build_levels(compute_peaks(samples))
+    assert [len(level) for level in levels] == list(WAVEFORM_LEVELS)
+    assert np.array_equal(levels[1][5], [levels[0][10:12, 0].min(), levels[0][10:12, 1].max()])
+    assert level_for_width(200) == len(WAVEFORM_LEVELS) - 1
+    assert WAVEFORM_LEVELS[level_for_width(600)] == 1024
+    assert level_for_width(10000) == 0
+    print("✅ 波形峰值測試通過")
+
+
+def test_waveform_index():
+    """測試峰值只計算一次，並依顯示寬度讀取對應的層級"""
+    print("📦 測試波形索引...")
+    with tempfile.TemporaryDirectory() as tmp:
+        library = MusicLibrary(tmp)
+        (Path(tmp) / "a.mp3").write_bytes(b"\0" * 64)
+        track_id = library.add_file(Path(tmp) / "a.mp3")
+
+        index = FakeWaveformIndex(library, max_workers=1)
+        assert index.get_peaks(track_id) is None
+        assert index.update()['analyzed'] == 1
+        assert index.update()['analyzed'] == 0
+
+        levels = build_levels(compute_peaks(_samples()))
+        for width in (200, 512, 3000):
+            peaks = index.get_peaks(track_id, width)
+            assert np.array_equal(peaks, levels[level_for_width(width)])
+        library.close()
+    print("✅ 波形索引測試通過")
+
+
+def main():
+    """主測試函數"""
+    print("🚀 開始波形峰值測試")
+    print("=" * 60)
+    test_compute_peaks()
+    test_waveform_index()
+    print("\n🎉 所有測試完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+手機轉檔快取模組
+下載完成後在背景把每首歌轉成 iPhone 可直接播放的 AAC/M4A（以及給行動網路使用的低位元率版本），
+存放在音樂資料夾內的隱藏資料夾（不會被掃描到音樂庫），清單記錄在音樂庫索引中；
+總大小超過上限時，從最久沒有播放的歌曲開始刪除。網頁播放器依瀏覽器與網路狀況選擇版本，
+手機開始播放不再受原始格式（webm/opus 等）或位元率影響
+
+用法:
+    python -m transcode_cache --folder downloads
+    python -m transcode_cache --folder downloads --evict
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import logging
+import subprocess
+from pathlib import Path
+from typing import Optional, Dict, Any, Mapping, Tuple
+
+from music_library import MusicLibrary, get_library
+from audio_analysis import (
+    TrackAnalyzer, FFMPEG_PATH, DECODE_TIMEOUT, DEFAULT_WORKERS, register_analyzer, get_analyzer,
+)
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 轉檔版本存放的資料夾（隱藏資料夾，掃描時自動略過）
+VARIANT_DIR_NAME = ".variants"
+
+# 轉檔版本：iphone 為 iPhone 相容的 AAC，cellular 為行動網路使用的低位元率版本
+VARIANTS = {
+    'iphone': {'bitrate': '160k', 'sample_rate': 44100},
+    'cellular': {'bitrate': '64k', 'sample_rate': 44100},
+}
+VARIANT_EXTENSION = ".m4a"
+VARIANT_MIME_TYPE = "audio/mp4"
+
+# iPhone 可以直接播放、且不太大的原始檔案不需要另外轉成 iphone 版本
+IPHONE_SAFE_EXTENSIONS = {'.mp3', '.m4a', '.aac'}
+IPHONE_MAX_SOURCE_BYTES = 20 * 1024 * 1024
+
+# 快取的容量上限，超過時從最久沒有使用的歌曲開始刪除
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# 沒有紀錄的檔案超過此秒數才清除，避免刪除轉檔完成但尚未寫入索引的檔案
+ORPHAN_GRACE_SECONDS = 3600
+
+# 行動裝置與慢速網路的判斷
+_MOBILE_RE = re.compile(r'iPhone|iPad|iPod|Android|Mobile', re.IGNORECASE)
+_SLOW_CONNECTIONS = {'slow-2g', '2g', '3g'}
+
+
+def variant_file_name(track_id: int, variant: str) -> str:
+    return f"{track_id}.{variant}{VARIANT_EXTENSION}"
+
+
+def needs_transcode(file_path: str, variant: str) -> bool:
+    """原始檔案是否需要轉成指定版本（iPhone 可直接播放的檔案直接使用原檔）"""
+    if variant != 'iphone':
+        return True
+    path = Path(file_path)
+    return path.suffix.lower() not in IPHONE_SAFE_EXTENSIONS or path.stat().st_size > IPHONE_MAX_SOURCE_BYTES
+
+
+def transcode_track(file_path: str, output_dir: str, track_id: int) -> Dict[str, Dict[str, Any]]:
+    """
+    把一首歌轉成所有版本（在背景行程中執行）
+
+    Returns:
+        {版本: {'file': 檔名, 'size': 位元組}}；file 為 None 表示直接使用原始檔案
+
+    Raises:
+        RuntimeError: 缺少 ffmpeg 或轉檔失敗
+    """
+    if FFMPEG_PATH is None:
+        raise RuntimeError("找不到 ffmpeg")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    result = {}
+    for variant, options in VARIANTS.items():
+        if not needs_transcode(file_path, variant):
+            result[variant] = {'file': None, 'size': 0}
+            continue
+        name = variant_file_name(track_id, variant)
+        part = output_dir / f"{name}.part"
+        # faststart 把索引放在檔案開頭，手機不需要下載整個檔案就能開始播放
+        command = [FFMPEG_PATH, '-nostdin', '-v', 'error', '-y', '-i', file_path, '-vn',
+                   '-map_metadata', '0', '-c:a', 'aac', '-b:a', options['bitrate'],
+                   '-ar', str(options['sample_rate']), '-ac', '2',
+                   '-movflags', '+faststart', '-f', 'ipod', str(part)]
+        try:
+            process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                     timeout=DECODE_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            part.unlink(missing_ok=True)
+            raise RuntimeError(str(e)) from e
+        if process.returncode != 0:
+            part.unlink(missing_ok=True)
+            message = process.stderr.decode('utf-8', errors='replace').strip().splitlines()
+            raise RuntimeError(message[-1] if message else f"ffmpeg 結束代碼 {process.returncode}")
+        os.replace(part, output_dir / name)
+        result[variant] = {'file': name, 'size': (output_dir / name).stat().st_size}
+    return result
+
+
+def choose_variant(headers: Optional[Mapping[str, str]]) -> Optional[str]:
+    """
+    依瀏覽器的請求標頭選擇播放版本
+
+    Args:
+        headers: HTTP 請求標頭（User-Agent、Save-Data、ECT）
+
+    Returns:
+        行動裝置在省流量模式或慢速網路時為 cellular，其他行動裝置為 iphone，電腦為 None（原始檔案）
+    """
+    headers = {key.lower(): value for key, value in (headers or {}).items()}
+    if not _MOBILE_RE.search(headers.get('user-agent', '')):
+        return None
+    if headers.get('save-data', '').lower() == 'on' or headers.get('ect', '').lower() in _SLOW_CONNECTIONS:
+        return 'cellular'
+    return 'iphone'
+
+
+@register_analyzer
+class TranscodeCache(TrackAnalyzer):
+    """每首歌的手機轉檔版本，依最近使用時間淘汰"""
+
+    name = "transcode"
+    table = "transcodes"
+    schema = """
+    CREATE TABLE IF NOT EXISTS transcodes (
+        track_id INTEGER PRIMARY KEY REFERENCES tracks(id) ON DELETE CASCADE,
+        file_size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        variants TEXT,
+        total_size INTEGER NOT NULL DEFAULT 0,
+        last_used REAL NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_transcodes_last_used ON transcodes(last_used);
+    """
+    result_column = "variants"
+    analyze = staticmethod(transcode_track)
+
+    def __init__(self, library: MusicLibrary, max_bytes: int = DEFAULT_MAX_BYTES, **kwargs):
+        """
+        初始化轉檔快取
+
+        Args:
+            library: 音樂庫索引，快取清單存放在同一個資料庫
+            max_bytes: 快取的容量上限（位元組），0 表示不限
+        """
+        super().__init__(library, **kwargs)
+        self.variant_dir = library.music_folder / VARIANT_DIR_NAME
+        self.max_bytes = max_bytes
+
+    def available(self) -> bool:
+        """轉檔只需要 ffmpeg"""
+        return FFMPEG_PATH is not None
+
+    def _analysis_args(self, track: Dict[str, Any]) -> tuple:
+        return (track['file_path'], str(self.variant_dir), track['id'])
+
+    def _columns(self, result) -> Dict[str, Any]:
+        if result is None:
+            return {'variants': None, 'total_size': 0, 'last_used': time.time()}
+        return {'variants': json.dumps(result), 'total_size': sum(entry['size'] for entry in result.values()),
+                'last_used': time.time()}
+
+    def update(self, track_ids=None) -> Dict[str, Any]:
+        """轉檔尚未轉檔的歌曲，完成後依容量上限淘汰"""
+        result = super().update(track_ids)
+        if result.get('analyzed'):
+            self.evict()
+        return result
+
+    # --- 取得版本 ---
+
+    def variant_path(self, file_path, variant: str) -> Optional[Path]:
+        """
+        取得檔案的轉檔版本並更新最近使用時間；尚未轉檔（或已被淘汰）時排入背景轉檔並返回 None
+
+        Args:
+            file_path: 原始檔案路徑
+            variant: 版本名稱（VARIANTS 的鍵）
+
+        Returns:
+            可播放的檔案路徑，原始檔案已經相容時返回原始檔案
+        """
+        track = self.library.get_by_path(file_path)
+        if track is None or variant not in VARIANTS:
+            return None
+        with self.library.transaction() as conn:
+            row = conn.execute(
+                """
+                SELECT c.variants FROM transcodes c JOIN tracks t ON t.id = c.track_id
+                WHERE c.track_id = ? AND c.file_size = t.file_size AND c.mtime = t.mtime
+                """,
+                (track['id'],),
+            ).fetchone()
+        if row is not None and row['variants'] is None:
+            return None
+        entry = json.loads(row['variants']).get(variant) if row is not None else None
+        path = None
+        if entry is not None:
+            path = Path(file_path) if entry['file'] is None else self.variant_dir / entry['file']
+        if path is None or not path.exists():
+            # 尚未轉檔、已被淘汰或檔案被手動刪除：清除紀錄後排入背景轉檔
+            with self.library.transaction() as conn:
+                conn.execute("DELETE FROM transcodes WHERE track_id = ?", (track['id'],))
+            if self.available():
+                self.schedule([track['id']])
+            return None
+        with self.library.transaction() as conn:
+            conn.execute("UPDATE transcodes SET last_used = ? WHERE track_id = ?", (time.time(), track['id']))
+        return path
+
+    # --- 容量管理 ---
+
+    def total_size(self) -> int:
+        with self.library.transaction() as conn:
+            return conn.execute("SELECT COALESCE(SUM(total_size), 0) FROM transcodes").fetchone()[0]
+
+    def _delete_files(self, variants: Optional[str]):
+        for entry in (json.loads(variants) if variants else {}).values():
+            if entry['file']:
+                (self.variant_dir / entry['file']).unlink(missing_ok=True)
+
+    def evict(self) -> Dict[str, Any]:
+        """
+        從最久沒有使用的歌曲開始刪除轉檔版本直到低於容量上限，並清除沒有紀錄的殘留檔案
+
+        被淘汰的歌曲不會自動重新轉檔，直到再次被播放
+
+        Returns:
+            結果字典，包含 removed（歌曲數）與 freed（位元組）
+        """
+        removed = freed = 0
+        if self.max_bytes:
+            total = self.total_size()
+            if total > self.max_bytes:
+                with self.library.transaction() as conn:
+                    rows = conn.execute(
+                        "SELECT track_id, variants, total_size FROM transcodes "
+                        "WHERE total_size > 0 ORDER BY last_used"
+                    ).fetchall()
+                evicted = []
+                for row in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self._delete_files(row['variants'])
+                    evicted.append((row['track_id'],))
+                    total -= row['total_size']
+                    freed += row['total_size']
+                # 保留空的紀錄，整個音樂庫重新轉檔時不會把被淘汰的歌曲又轉回來
+                with self.library.transaction() as conn:
+                    conn.executemany("UPDATE transcodes SET variants = '{}', total_size = 0 WHERE track_id = ?",
+                                     evicted)
+                removed = len(evicted)
+        self._remove_orphans()
+        if removed:
+            logging.info(f"轉檔快取淘汰 {removed} 首歌曲，釋放 {freed} 位元組")
+        return {"success": True, "removed": removed, "freed": freed}
+
+    def _remove_orphans(self):
+        """刪除沒有紀錄的轉檔（歌曲已被移除）與中斷轉檔留下的暫存檔"""
+        if not self.variant_dir.is_dir():
+            return
+        with self.library.transaction() as conn:
+            rows = conn.execute("SELECT variants FROM transcodes WHERE variants IS NOT NULL").fetchall()
+        known = {entry['file'] for row in rows for entry in json.loads(row['variants']).values() if entry['file']}
+        now = time.time()
+        for path in self.variant_dir.iterdir():
+            try:
+                if path.name not in known and now - path.stat().st_mtime > ORPHAN_GRACE_SECONDS:
+                    path.unlink()
+            except OSError as e:
+                logging.warning(f"無法刪除轉檔殘留檔案 {path.name}: {e}")
+
+
+def get_transcode_cache(music_folder: str = "downloads") -> TranscodeCache:
+    """取得音樂資料夾對應的共用轉檔快取"""
+    return get_analyzer(TranscodeCache, music_folder)
+
+
+def playable_file(file_path, variant: Optional[str], music_folder: str = "downloads") -> Tuple[Path, Optional[str]]:
+    """
+    取得要交給瀏覽器播放的檔案
+
+    Args:
+        file_path: 原始檔案路徑
+        variant: choose_variant() 選擇的版本，None 表示原始檔案
+        music_folder: 音樂資料夾
+
+    Returns:
+        (檔案路徑, MIME 類型)；使用原始檔案時 MIME 類型為 None，由呼叫者依副檔名決定
+    """
+    file_path = Path(file_path)
+    if variant is None:
+        return file_path, None
+    path = get_transcode_cache(music_folder).variant_path(file_path, variant)
+    if path is None or path == file_path:
+        return file_path, None
+    return path, VARIANT_MIME_TYPE
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="預先產生手機播放用的轉檔版本")
+    parser.add_argument('--folder', default='downloads', help="音樂資料夾")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="並行轉檔的行程數量")
+    parser.add_argument('--max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="快取的容量上限（MB）")
+    parser.add_argument('--evict', action='store_true', help="只依容量上限淘汰，不轉檔")
+    args = parser.parse_args(argv)
+
+    cache = TranscodeCache(get_library(args.folder), max_bytes=args.max_mb * 1024 * 1024, max_workers=args.workers)
+    if not args.evict:
+        if not cache.available():
+            print("❌ 需要安裝 FFmpeg")
+            return 1
+        result = cache.update()
+        print(f"📱 新轉檔 {result['analyzed']} 首歌曲（{result['failed']} 首失敗）")
+    result = cache.evict()
+    print(f"🧹 快取大小 {cache.total_size() / (1024 * 1024):.1f} MB，淘汰 {result['removed']} 首歌曲")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
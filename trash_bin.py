@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+垃圾桶模組
+移到垃圾桶的檔案放在音樂資料夾內的隱藏資料夾（不會被掃描到音樂庫），
+原始路徑、刪除時間與大小記錄在音樂庫索引中，列出與還原都不需要讀取檔案系統；
+背景清理執行緒依保留天數與容量上限自動永久刪除最舊的項目；
+移入後尚未寫入清單就中斷而留下的檔案，清理時會補登記到清單
+"""
+
+import re
+import time
+import uuid
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Dict, List, Any
+
+from music_library import MusicLibrary, get_library
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 垃圾桶資料夾（隱藏資料夾，掃描時自動略過）
+TRASH_DIR_NAME = ".trash"
+
+# 舊版的垃圾桶資料夾（掃描時同樣略過），裡面的檔案會在第一次使用時搬進新的垃圾桶
+LEGACY_TRASH_DIR_NAME = "trash"
+
+# 預設保留政策：超過 30 天或總大小超過 1 GB 時，從最舊的項目開始永久刪除
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# 背景清理的間隔（秒）
+PURGE_INTERVAL = 3600
+
+# 沒有清單紀錄的檔案超過此秒數才補登記，避免搶先登記已移入、正要寫入清單的檔案
+ORPHAN_GRACE_SECONDS = 3600
+
+# move_in() 為檔名加上的隨機前綴
+_TRASH_PREFIX = re.compile(r"^[0-9a-f]{12}_")
+
+_ITEM_COLUMNS = "id, trash_name, original_path, deleted_at, file_size"
+
+
+class TrashBin:
+    """具有清單與保留政策的垃圾桶"""
+
+    def __init__(self, library: MusicLibrary, max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        初始化垃圾桶
+
+        Args:
+            library: 音樂庫索引，垃圾桶清單與歌曲存放在同一個資料庫
+            max_age_days: 項目保留的天數，0 表示不限
+            max_bytes: 垃圾桶的容量上限（位元組），0 表示不限
+        """
+        self.library = library
+        self.trash_dir = library.music_folder / TRASH_DIR_NAME
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self._stop_event = threading.Event()
+        self._purger: Optional[threading.Thread] = None
+        self._adopt_legacy_trash()
+
+    # --- 放入垃圾桶 ---
+
+    def move_in(self, file_path) -> Dict[str, Any]:
+        """
+        把檔案移到垃圾桶資料夾（尚未寫入清單，可由多個執行緒同時呼叫）
+
+        Returns:
+            清單項目，交給 record() 寫入
+        """
+        file_path = Path(file_path)
+        self.trash_dir.mkdir(parents=True, exist_ok=True)
+        # 以隨機前綴命名，同名檔案不會互相覆蓋，也不需要檢查檔案是否存在
+        trash_name = f"{uuid.uuid4().hex[:12]}_{file_path.name}"
+        file_size = file_path.stat().st_size
+        shutil.move(str(file_path), str(self.trash_dir / trash_name))
+        return {
+            'trash_name': trash_name,
+            'original_path': str(file_path.resolve()),
+            'deleted_at': time.time(),
+            'file_size': file_size,
+        }
+
+    def record(self, entries: List[Dict[str, Any]]) -> List[int]:
+        """在單一交易中把多個項目寫入清單，超過容量上限時立即清理，返回項目 ID"""
+        with self.library.transaction() as conn:
+            ids = self._insert_entries(conn, entries)
+        if self.max_bytes and self.total_size() > self.max_bytes:
+            self.purge()
+        return ids
+
+    @staticmethod
+    def _insert_entries(conn, entries: List[Dict[str, Any]]) -> List[int]:
+        ids = []
+        for entry in entries:
+            cursor = conn.execute(
+                "INSERT INTO trash_items (trash_name, original_path, deleted_at, file_size) VALUES (?, ?, ?, ?)",
+                (entry['trash_name'], entry['original_path'], entry['deleted_at'], entry['file_size']),
+            )
+            ids.append(cursor.lastrowid)
+        return ids
+
+    def add(self, file_path) -> int:
+        """把單一檔案移到垃圾桶，返回項目 ID"""
+        return self.record([self.move_in(file_path)])[0]
+
+    # --- 查詢 ---
+
+    def _row_to_item(self, row) -> Dict[str, Any]:
+        item = dict(row)
+        item['trash_path'] = str(self.trash_dir / item['trash_name'])
+        item['name'] = Path(item['original_path']).name
+        return item
+
+    def items(self, offset: int = 0, limit: int = -1) -> List[Dict[str, Any]]:
+        """列出垃圾桶中的項目（最新的在前），只讀取清單，不存取檔案"""
+        with self.library.transaction() as conn:
+            rows = conn.execute(
+                f"SELECT {_ITEM_COLUMNS} FROM trash_items ORDER BY deleted_at DESC, id DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [self._row_to_item(row) for row in rows]
+
+    def get_item(self, item_id: int) -> Optional[Dict[str, Any]]:
+        with self.library.transaction() as conn:
+            row = conn.execute(f"SELECT {_ITEM_COLUMNS} FROM trash_items WHERE id = ?", (item_id,)).fetchone()
+        return self._row_to_item(row) if row else None
+
+    def total_size(self) -> int:
+        with self.library.transaction() as conn:
+            return conn.execute("SELECT COALESCE(SUM(file_size), 0) FROM trash_items").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self.library.transaction() as conn:
+            return conn.execute("SELECT COUNT(*) FROM trash_items").fetchone()[0]
+
+    # --- 還原與刪除 ---
+
+    def restore(self, item_id: int) -> Dict[str, Any]:
+        """
+        還原項目到原始位置（原位置已有檔案時加上時間戳記），並重新登記到音樂庫
+
+        Returns:
+            結果字典，包含 success、file_path、track_id 或 error
+        """
+        item = self.get_item(item_id)
+        if item is None:
+            return {"success": False, "error": "找不到垃圾桶項目"}
+        destination = Path(item['original_path'])
+        if destination.exists():
+            destination = destination.with_name(f"{destination.stem}_{int(time.time())}{destination.suffix}")
+        try:
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(item['trash_path'], str(destination))
+        except (OSError, shutil.Error) as e:
+            logging.error(f"還原失敗 {item['name']}: {e}")
+            return {"success": False, "error": str(e)}
+        with self.library.transaction() as conn:
+            conn.execute("DELETE FROM trash_items WHERE id = ?", (item_id,))
+        track_id = self.library.add_file(destination)
+        return {"success": True, "file_path": str(destination), "track_id": track_id}
+
+    def _remove_items(self, items: List[Dict[str, Any]]) -> int:
+        """永久刪除項目的檔案並從清單移除，返回釋放的位元組數"""
+        freed = 0
+        removed = []
+        for item in items:
+            try:
+                Path(item['trash_path']).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # 刪除失敗的項目留在清單中，下次清理時再試
+                logging.error(f"無法永久刪除 {item['name']}: {e}")
+                continue
+            freed += item['file_size']
+            removed.append((item['id'],))
+        with self.library.transaction() as conn:
+            conn.executemany("DELETE FROM trash_items WHERE id = ?", removed)
+        return freed
+
+    def delete(self, item_id: int) -> bool:
+        """永久刪除單一項目"""
+        item = self.get_item(item_id)
+        if item is None:
+            return False
+        self._remove_items([item])
+        return True
+
+    def empty(self) -> Dict[str, Any]:
+        """清空垃圾桶"""
+        items = self.items()
+        freed = self._remove_items(items)
+        logging.info(f"已清空垃圾桶: {len(items)} 個檔案，釋放 {freed} 位元組")
+        return {"success": True, "removed": len(items), "freed": freed}
+
+    def purge(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        依保留政策清理：刪除超過保留天數的項目，再從最舊的開始刪除直到低於容量上限
+
+        Returns:
+            結果字典，包含 removed 與 freed（位元組）
+        """
+        now = time.time() if now is None else now
+        self._adopt_orphans(now)
+        expired = []
+        kept_size = 0
+        over_quota = False
+        # 從最新的項目開始累加大小，一旦超過上限，之後較舊的項目全部刪除
+        for item in self.items():
+            over_quota = over_quota or bool(self.max_bytes and kept_size + item['file_size'] > self.max_bytes)
+            too_old = self.max_age_days and item['deleted_at'] < now - self.max_age_days * 86400
+            if over_quota or too_old:
+                expired.append(item)
+            else:
+                kept_size += item['file_size']
+        if not expired:
+            return {"success": True, "removed": 0, "freed": 0}
+        freed = self._remove_items(expired)
+        logging.info(f"垃圾桶自動清理: 刪除 {len(expired)} 個檔案，釋放 {freed} 位元組")
+        return {"success": True, "removed": len(expired), "freed": freed}
+
+    def _adopt_orphans(self, now: float):
+        """
+        補登記垃圾桶資料夾中沒有清單紀錄的檔案（move_in 之後、record 之前中斷留下的）
+
+        原始路徑只知道檔名，視為音樂資料夾；刪除時間以補登記的時間計算，保留天數從現在起算
+        """
+        if not self.trash_dir.is_dir():
+            return
+        with self.library.transaction() as conn:
+            known = {row['trash_name'] for row in conn.execute("SELECT trash_name FROM trash_items")}
+        entries = []
+        for path in self.trash_dir.iterdir():
+            if path.name in known:
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            # 移入時 rename 會更新 ctime；跨磁碟搬移則是新檔案
+            if not path.is_file() or now - max(stat.st_mtime, stat.st_ctime) <= ORPHAN_GRACE_SECONDS:
+                continue
+            entries.append({
+                'trash_name': path.name,
+                'original_path': str((self.library.music_folder / _TRASH_PREFIX.sub("", path.name)).resolve()),
+                'deleted_at': now,
+                'file_size': stat.st_size,
+            })
+        if entries:
+            with self.library.transaction() as conn:
+                self._insert_entries(conn, entries)
+            logging.info(f"已補登記垃圾桶中 {len(entries)} 個沒有紀錄的檔案")
+
+    # --- 背景清理 ---
+
+    def start_purger(self, interval: float = PURGE_INTERVAL):
+        """啟動背景清理執行緒（啟動時先清理一次）"""
+        if self._purger and self._purger.is_alive():
+            return
+        self._stop_event.clear()
+
+        def loop():
+            while True:
+                try:
+                    self.purge()
+                except Exception as e:
+                    logging.error(f"垃圾桶自動清理失敗: {e}")
+                if self._stop_event.wait(interval):
+                    break
+
+        self._purger = threading.Thread(target=loop, name="trash-purger", daemon=True)
+        self._purger.start()
+
+    def stop_purger(self):
+        self._stop_event.set()
+        if self._purger:
+            self._purger.join(timeout=5)
+            self._purger = None
+
+    # --- 舊版垃圾桶 ---
+
+    def _adopt_legacy_trash(self):
+        """把舊版 trash 資料夾中的檔案搬進垃圾桶並寫入清單（原始位置視為音樂資料夾）"""
+        legacy_dir = self.library.music_folder / LEGACY_TRASH_DIR_NAME
+        if not legacy_dir.is_dir():
+            return
+        entries = []
+        for file_path in legacy_dir.iterdir():
+            if not file_path.is_file():
+                continue
+            try:
+                deleted_at = file_path.stat().st_mtime
+                entry = self.move_in(file_path)
+            except OSError as e:
+                logging.error(f"無法搬移舊版垃圾桶檔案 {file_path.name}: {e}")
+                continue
+            entry['original_path'] = str((self.library.music_folder / file_path.name).resolve())
+            entry['deleted_at'] = deleted_at
+            entries.append(entry)
+        if entries:
+            self.record(entries)
+            logging.info(f"已將舊版垃圾桶的 {len(entries)} 個檔案搬進新的垃圾桶")
+        try:
+            legacy_dir.rmdir()
+        except OSError:
+            pass
+
+
+_trash_bins: Dict[str, TrashBin] = {}
+_trash_bins_lock = threading.Lock()
+
+
+def get_trash_bin(music_folder: str = "downloads") -> TrashBin:
+    """
+    取得音樂資料夾對應的共用垃圾桶，第一次取得時啟動背景清理
+
+    Args:
+        music_folder: 音樂檔案資料夾路徑
+
+    Returns:
+        垃圾桶實例
+    """
+    key = str(Path(music_folder).resolve())
+    with _trash_bins_lock:
+        trash = _trash_bins.get(key)
+        if trash is None:
+            trash = TrashBin(get_library(music_folder))
+            trash.start_purger()
+            _trash_bins[key] = trash
+        return trash
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+波形峰值模組
+在背景把每首歌解碼一次，計算每個區段的最小值與最大值（多個縮放層級），
+以 int8 陣列存放在音樂庫索引中；網頁播放器顯示波形進度條時只需讀取一小段陣列，不需要解碼音訊
+
+用法:
+    python -m waveform --folder downloads
+"""
+
+import sys
+import json
+import argparse
+import logging
+from typing import Optional, Dict, List, Any
+
+from music_library import get_library
+from audio_analysis import (
+    TrackAnalyzer, NUMPY_AVAILABLE, DEFAULT_WORKERS, decode_audio, register_analyzer, get_analyzer,
+)
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 解碼的取樣率：波形只需要振幅包絡，不需要完整的頻寬
+SAMPLE_RATE = 8000
+
+# 縮放層級的區段數，由細到粗，每一層是上一層相鄰兩段合併
+WAVEFORM_LEVELS = (4096, 2048, 1024, 512, 256)
+
+# 每個區段存放 (最小值, 最大值) 兩個 int8
+_BYTES_PER_BUCKET = 2
+
+
+def compute_peaks(samples: 'np.ndarray', buckets: int = WAVEFORM_LEVELS[0]) -> 'np.ndarray':
+    """
+    把樣本切成固定數量的區段，計算每段的最小值與最大值
+
+    Args:
+        samples: float32 單聲道樣本（-1.0 到 1.0）
+        buckets: 區段數
+
+    Returns:
+        形狀為 (區段數, 2) 的 int8 陣列，每列為 (最小值, 最大值)，比例為 127 = 滿刻度
+    """
+    if len(samples) < buckets:
+        samples = np.pad(samples, (0, buckets - len(samples)))
+    edges = np.linspace(0, len(samples), buckets + 1).astype(np.int64)[:-1]
+    peaks = np.stack([np.minimum.reduceat(samples, edges), np.maximum.reduceat(samples, edges)], axis=1)
+    return np.round(np.clip(peaks, -1.0, 1.0) * 127).astype(np.int8)
+
+
+def build_levels(peaks: 'np.ndarray') -> List['np.ndarray']:
+    """由最細的峰值逐層合併出所有縮放層級"""
+    levels = [peaks]
+    for buckets in WAVEFORM_LEVELS[1:]:
+        pairs = levels[-1].reshape(buckets, 2, 2)
+        levels.append(np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1))
+    return levels
+
+
+def _level_offset(level: int) -> int:
+    """縮放層級在資料中的位元組位置"""
+    return sum(WAVEFORM_LEVELS[:level]) * _BYTES_PER_BUCKET
+
+
+def level_for_width(width: int) -> int:
+    """取得區段數不少於顯示寬度（像素）的最粗層級"""
+    for level in range(len(WAVEFORM_LEVELS) - 1, -1, -1):
+        if WAVEFORM_LEVELS[level] >= width:
+            return level
+    return 0
+
+
+def compute_waveform(file_path: str) -> Dict[str, Any]:
+    """解碼整首歌並計算所有縮放層級的峰值（在背景行程中執行）"""
+    samples = decode_audio(file_path, SAMPLE_RATE, channels=1)
+    levels = build_levels(compute_peaks(samples))
+    return {'duration': len(samples) / SAMPLE_RATE, 'peaks': b''.join(level.tobytes() for level in levels)}
+
+
+@register_analyzer
+class WaveformIndex(TrackAnalyzer):
+    """存放在音樂庫索引中的波形峰值"""
+
+    name = "waveform"
+    table = "waveforms"
+    schema = """
+    CREATE TABLE IF NOT EXISTS waveforms (
+        track_id INTEGER PRIMARY KEY REFERENCES tracks(id) ON DELETE CASCADE,
+        file_size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        duration REAL,
+        peaks BLOB
+    );
+    """
+    result_column = "peaks"
+    analyze = staticmethod(compute_waveform)
+
+    def _columns(self, result) -> Dict[str, Any]:
+        if result is None:
+            return {'peaks': None, 'duration': None}
+        return {'peaks': result['peaks'], 'duration': result['duration']}
+
+    def get_peaks(self, track_id: int, width: int = 512) -> Optional['np.ndarray']:
+        """
+        取得適合顯示寬度的峰值，只從索引讀取該層級的位元組
+
+        Args:
+            track_id: 歌曲 ID
+            width: 顯示寬度（像素）
+
+        Returns:
+            形狀為 (區段數, 2) 的 int8 陣列，尚未計算或檔案已變動時返回 None
+        """
+        level = level_for_width(width)
+        with self.library.transaction() as conn:
+            row = conn.execute(
+                """
+                SELECT substr(w.peaks, ?, ?) AS level FROM waveforms w JOIN tracks t ON t.id = w.track_id
+                WHERE w.track_id = ? AND w.peaks IS NOT NULL AND w.file_size = t.file_size AND w.mtime = t.mtime
+                """,
+                (_level_offset(level) + 1, WAVEFORM_LEVELS[level] * _BYTES_PER_BUCKET, track_id),
+            ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row['level'], dtype=np.int8).reshape(-1, 2)
+
+
+def get_waveform_index(music_folder: str = "downloads") -> WaveformIndex:
+    """取得音樂資料夾對應的共用波形索引"""
+    return get_analyzer(WaveformIndex, music_folder)
+
+
+def peaks_for_file(file_path, music_folder: str = "downloads", width: int = 512) -> Optional['np.ndarray']:
+    """
+    取得音樂庫中某個檔案的峰值，尚未計算時排入背景計算並返回 None
+
+    Args:
+        file_path: 音訊檔案路徑
+        music_folder: 音樂資料夾
+        width: 顯示寬度（像素）
+    """
+    if not NUMPY_AVAILABLE:
+        return None
+    index = get_waveform_index(music_folder)
+    track = index.library.get_by_path(file_path)
+    if track is None:
+        return None
+    peaks = index.get_peaks(track['id'], width)
+    if peaks is None and index.available():
+        index.schedule([track['id']])
+    return peaks
+
+
+def waveform_player_html(audio_src: str, mime_type: str, peaks: Optional['np.ndarray'] = None,
+                         height: int = 64, gain: float = 1.0) -> str:
+    """
+    產生 HTML5 播放器，有峰值時顯示波形進度條（點擊波形即可跳轉）
+
+    Args:
+        audio_src: 音訊網址（可為 data URI）
+        mime_type: 音訊 MIME 類型
+        peaks: get_peaks() 返回的峰值，None 表示不顯示波形
+        height: 波形高度（像素）
+        gain: 播放增益（響度正規化），以 Web Audio 套用，iPhone 也有效
+
+    Returns:
+        交給 streamlit.components.v1.html 顯示的 HTML
+    """
+    peak_list = peaks.tolist() if peaks is not None else []
+    return f"""
+    <div style="width: 100%; max-width: 500px; font-family: sans-serif;">
+        <canvas id="waveform" height="{height}"
+                style="width: 100%; height: {height}px; cursor: pointer; display: {'block' if peak_list else 'none'};"></canvas>
+        <audio id="player" controls style="width: 100%;">
+            <source src="{audio_src}" type="{mime_type}">
+            您的瀏覽器不支援音訊播放。
+        </audio>
+    </div>
+    <script>
+    const peaks = {json.dumps(peak_list)};
+    const gain = {gain:.4f};
+    const canvas = document.getElementById("waveform");
+    const audio = document.getElementById("player");
+    function draw() {{
+        if (!peaks.length) return;
+        const width = canvas.width = canvas.clientWidth * (window.devicePixelRatio || 1);
+        const height = canvas.height = {height} * (window.devicePixelRatio || 1);
+        const ctx = canvas.getContext("2d");
+        const played = audio.duration ? audio.currentTime / audio.duration : 0;
+        const barWidth = width / peaks.length;
+        ctx.clearRect(0, 0, width, height);
+        peaks.forEach(([low, high], i) => {{
+            const top = height / 2 - (high / 127) * height / 2;
+            const bottom = height / 2 - (low / 127) * height / 2;
+            ctx.fillStyle = i / peaks.length < played ? "#ff4b4b" : "#c0c4cc";
+            ctx.fillRect(i * barWidth, top, Math.max(barWidth, 1), Math.max(bottom - top, 1));
+        }});
+    }}
+    canvas.addEventListener("click", (event) => {{
+        if (!audio.duration) return;
+        const rect = canvas.getBoundingClientRect();
+        audio.currentTime = (event.clientX - rect.left) / rect.width * audio.duration;
+    }});
+    // iPhone 的 audio.volume 是唯讀的，增益改以 Web Audio 的 GainNode 套用（第一次播放時建立）
+    let gainNode = null;
+    audio.addEventListener("play", () => {{
+        const AudioContext = window.AudioContext || window.webkitAudioContext;
+        if (gain >= 1 || gainNode) return;
+        if (!AudioContext) {{
+            audio.volume = gain;
+            return;
+        }}
+        const context = new AudioContext();
+        gainNode = context.createGain();
+        gainNode.gain.value = gain;
+        context.createMediaElementSource(audio).connect(gainNode).connect(context.destination);
+        context.resume();
+    }});
+    audio.addEventListener("timeupdate", draw);
+    audio.addEventListener("loadedmetadata", draw);
+    window.addEventListener("resize", draw);
+    draw();
+    </script>
+    """
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="預先計算音樂庫的波形峰值")
+    parser.add_argument('--folder', default='downloads', help="音樂資料夾")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="並行計算的行程數量")
+    args = parser.parse_args(argv)
+
+    if not NUMPY_AVAILABLE:
+        print("❌ 需要安裝 NumPy")
+        return 1
+    index = WaveformIndex(get_library(args.folder), max_workers=args.workers)
+    result = index.update()
+    if not result['success']:
+        print(f"❌ {result['error']}")
+        return 1
+    print(f"🌊 新計算 {result['analyzed']} 首歌曲的波形（{result['failed']} 首失敗）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
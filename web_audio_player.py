@@ -6,8 +6,14 @@
 """
 
 import streamlit as st
+import streamlit.components.v1 as components
 from pathlib import Path
 import os
+import base64
+
+from music_library import iter_audio_files
+from loudness import gain_for_file
+from waveform import waveform_player_html
 
 def main():
     st.set_page_config(
@@ -27,11 +33,8 @@ def main():
     
     # 尋找音樂檔案
     supported_extensions = {'.mp3', '.wav', '.ogg', '.flac', '.m4a'}
-    music_files = []
-    
-    for file_path in downloads_dir.rglob("*"):
-        if file_path.is_file() and file_path.suffix.lower() in supported_extensions:
-            music_files.append(file_path)
+    # 略過垃圾桶與下載暫存區等隱藏資料夾
+    music_files = list(iter_audio_files(downloads_dir, supported_extensions))
     
     if not music_files:
         st.warning("⚠️ 沒有找到音樂檔案")
@@ -72,7 +75,14 @@ def main():
         with open(selected_file, "rb") as f:
             audio_bytes = f.read()
         
-        st.audio(audio_bytes, format=f'audio/{selected_file.suffix[1:]}')
+        # 已分析響度的歌曲以 HTML5 播放器套用正規化增益
+        gain = gain_for_file(selected_file)
+        if gain < 1.0:
+            mime_type = f'audio/{selected_file.suffix[1:]}'
+            audio_src = f"data:{mime_type};base64,{base64.b64encode(audio_bytes).decode()}"
+            components.html(waveform_player_html(audio_src, mime_type, gain=gain), height=80)
+        else:
+            st.audio(audio_bytes, format=f'audio/{selected_file.suffix[1:]}')
         
         # 下載按鈕
         st.markdown("---")
@@ -8,11 +8,15 @@ YouTube 多格式下載器
 
 import yt_dlp
 from pathlib import Path
+from contextlib import contextmanager
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import time
 import random
 
+from cookie_manager import get_cookie_manager
+from bandwidth_manager import get_bandwidth_manager
+
 # 匯入雲端上傳模組
 try:
     from cloud_uploader import CloudUploadManager
@@ -21,6 +25,27 @@ except ImportError:
     CLOUD_UPLOAD_AVAILABLE = False
     logging.warning("雲端上傳模組無法載入，將無法使用自動上傳功能")
 
+# 匯入音樂庫索引模組
+try:
+    from music_library import get_library
+    LIBRARY_AVAILABLE = True
+except ImportError:
+    LIBRARY_AVAILABLE = False
+
+# 匯入重複檔案偵測模組（檢查新下載的檔案是否與已有的檔案相同）
+try:
+    from dedup import DuplicateFinder
+    DEDUP_AVAILABLE = True
+except ImportError:
+    DEDUP_AVAILABLE = False
+
+# 匯入音訊分析模組（指紋等在背景計算）
+try:
+    from audio_analysis import schedule_analysis
+    ANALYSIS_AVAILABLE = True
+except ImportError:
+    ANALYSIS_AVAILABLE = False
+
 # 設定日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -30,16 +55,24 @@ class YouTubeDownloader:
     提供獲取影片資訊、下載 MP4 和 MP3 的功能。
     """
     
-    def __init__(self, download_dir="downloads", auto_upload=False, mp3_folder_id=None, mp4_folder_id=None):
+    def __init__(self, download_dir="downloads", auto_upload=False, mp3_folder_id=None, mp4_folder_id=None, library=None):
         """
         初始化下載器。
         :param download_dir: 下載檔案的儲存目錄。
         :param auto_upload: 是否自動上傳到雲端硬碟。
         :param mp3_folder_id: Google Drive MP3 目標資料夾 ID。
         :param mp4_folder_id: Google Drive MP4 目標資料夾 ID。
+        :param library: 下載完成後登記的音樂庫索引，預設使用下載目錄的共用索引。
         """
         self.download_dir = Path(download_dir)
         self.download_dir.mkdir(exist_ok=True)
+        # 下載與後處理都在暫存目錄進行，完成後才移動到下載目錄
+        self.temp_dir = self.download_dir / ".tmp"
+        self.library = library if library is not None else (get_library(str(self.download_dir)) if LIBRARY_AVAILABLE else None)
+        # 所有下載器共用同一個 cookie jar，不必每次重新讀取 cookies.txt
+        self.cookie_manager = get_cookie_manager()
+        # 與其他下載／上傳共用全域頻寬上限
+        self.bandwidth = get_bandwidth_manager()
         self.progress_hooks = []
         self.auto_upload = auto_upload
         self.mp3_folder_id = mp3_folder_id
@@ -76,15 +109,30 @@ class YouTubeDownloader:
             'ignoreerrors': False,
             'no_check_certificate': True,
             'prefer_insecure': True,
+            # 未完成的檔案留在暫存目錄，後處理完成後才移到下載目錄
+            'paths': {'home': str(self.download_dir), 'temp': str(self.temp_dir)},
         }
         
-        # 如果存在 cookies 檔案，則使用它
-        cookies_file = Path("cookies.txt")
-        if cookies_file.exists():
-            opts['cookiefile'] = str(cookies_file)
-            logging.info("使用 cookies 檔案來避免 403 錯誤")
-        
         return opts
+
+    @contextmanager
+    def _open_ydl(self, ydl_opts, throttle=False):
+        """
+        建立使用共用 cookie jar 的 YoutubeDL，結束後寫回伺服器更新的 cookies。
+        :param throttle: 是否納入全域頻寬管理（實際下載檔案時使用）。
+        """
+        job = None
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                self.cookie_manager.attach(ydl)
+                if throttle:
+                    job = self.bandwidth.register_download(ydl.params)
+                    ydl.add_progress_hook(job.on_progress)
+                yield ydl
+        finally:
+            if job:
+                self.bandwidth.unregister_download(job)
+            self.cookie_manager.persist()
     
     def upload_to_cloud(self, file_path: str, file_type: str = "mp4") -> Dict[str, Any]:
         """
@@ -120,7 +168,7 @@ class YouTubeDownloader:
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                with self._open_ydl(ydl_opts) as ydl:
                     info = ydl.extract_info(url, download=False)
                     return {
                         'title': info.get('title', '未知標題'),
@@ -137,29 +185,69 @@ class YouTubeDownloader:
                     logging.error(f"獲取影片資訊最終失敗: {e}")
                     return None
 
-    def _download(self, url, ydl_opts):
+    def iter_playlist_entries(self, url):
+        """
+        逐筆列舉播放列表或頻道中的影片，不下載也不解析每支影片的詳細資訊。
+        使用 extract_flat 並關閉 process，yt-dlp 會在迭代時才逐頁抓取，
+        因此大型頻道可以邊列舉邊處理。
+        :param url: YouTube 播放列表或頻道網址。
+        :return: 產生 (播放列表資訊, 影片項目) 的產生器，影片項目包含 id、title、url。
+        """
+        ydl_opts = self._get_ydl_opts_base()
+        ydl_opts.update({
+            'extract_flat': 'in_playlist',
+            'skip_download': True,
+            'ignoreerrors': True,
+        })
+
+        with self._open_ydl(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False, process=False)
+            if not info:
+                return
+            playlist = {
+                'id': info.get('id'),
+                'title': info.get('title', '未知播放列表'),
+                'uploader': info.get('uploader'),
+            }
+            if 'entries' not in info:
+                # 單一影片網址，當成只有一筆的播放列表
+                yield playlist, {'id': info.get('id'), 'title': info.get('title'), 'url': url}
+                return
+            for entry in info['entries']:
+                if not entry or not entry.get('id'):
+                    continue
+                # 頻道首頁會巢狀包含「影片」「Shorts」等分頁播放列表
+                if entry.get('_type') == 'url' and entry.get('ie_key') == 'YoutubeTab':
+                    for _, sub_entry in self.iter_playlist_entries(entry['url']):
+                        yield playlist, sub_entry
+                    continue
+                yield playlist, {
+                    'id': entry['id'],
+                    'title': entry.get('title', '無標題'),
+                    'url': entry.get('url') or f"https://www.youtube.com/watch?v={entry['id']}",
+                }
+
+    def _download(self, url, ydl_opts) -> List[str]:
         """
         內部下載方法。
         :param url: YouTube 影片網址。
         :param ydl_opts: yt-dlp 的選項。
-        :return: 下載成功時返回檔案路徑，失敗時返回 None。
+        :return: 後處理鏈完成後的最終檔案路徑列表（播放列表會有多個）。
         """
         max_retries = 3
         for attempt in range(max_retries):
+            # post_hooks 會在所有後處理器與檔案移動完成後，以最終路徑呼叫
+            finished_paths = []
+            opts = dict(ydl_opts)
+            opts['post_hooks'] = list(ydl_opts.get('post_hooks', [])) + [finished_paths.append]
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                with self._open_ydl(opts, throttle=True) as ydl:
                     info = ydl.extract_info(url, download=True)
-                    # 確保我們能獲取到下載後的檔案路徑
-                    if info and '_filename' in info:
-                        return info['_filename']
-                    # 如果是播放列表，_filename 可能不存在於頂層
-                    elif info and 'entries' in info and info['entries']:
-                        return info['entries'][0]['_filename']
-                    else:
-                        # 作為備案，從 outtmpl 推斷檔名
-                        # 這部分比較複雜，暫時先假設成功時能拿到 _filename
-                        logging.warning("無法直接從返回資訊中確定檔名")
-                        return None
+                downloads = self._collect_final_paths(info, finished_paths)
+                if not downloads:
+                    logging.warning("下載完成但沒有產生任何檔案")
+                self._register_downloads(downloads)
+                return [path for path, _ in downloads]
             except Exception as e:
                 logging.warning(f"下載失敗 (嘗試 {attempt + 1}/{max_retries}): {e}")
                 if attempt < max_retries - 1:
@@ -168,6 +256,57 @@ class YouTubeDownloader:
                     logging.error(f"下載最終失敗: {e}")
                     raise e
 
+    @staticmethod
+    def _collect_final_paths(info, finished_paths):
+        """
+        從 yt-dlp 的回傳資訊整理出最終檔案路徑與影片 ID。
+        :param info: extract_info 回傳的資訊（單一影片或播放列表）。
+        :param finished_paths: post_hooks 收到的最終路徑。
+        :return: (檔案路徑, 影片 ID) 列表，依完成順序排列。
+        """
+        video_ids = {}
+        entries = (info.get('entries') or []) if info and 'entries' in info else [info]
+        for entry in entries:
+            if not entry:
+                continue
+            for requested in entry.get('requested_downloads') or []:
+                if requested.get('filepath'):
+                    video_ids[requested['filepath']] = entry.get('id')
+
+        ordered = list(dict.fromkeys(finished_paths)) or list(video_ids)
+        return [(path, video_ids.get(path)) for path in ordered]
+
+    def _register_downloads(self, downloads):
+        """將下載完成的檔案直接登記到音樂庫索引，省去重新掃描，並排入背景音訊分析"""
+        if not self.library:
+            return
+        track_ids = []
+        for path, video_id in downloads:
+            try:
+                track_ids.append(self.library.add_file(path, video_id=video_id))
+            except Exception as e:
+                logging.error(f"登記到音樂庫失敗 {path}: {e}")
+            self._warn_if_duplicate(path)
+        track_ids = [track_id for track_id in track_ids if track_id is not None]
+        if ANALYSIS_AVAILABLE and track_ids:
+            try:
+                schedule_analysis(str(self.library.music_folder), track_ids)
+            except Exception as e:
+                logging.error(f"排入音訊分析失敗: {e}")
+
+    def _warn_if_duplicate(self, path):
+        """新下載的檔案與資料夾中已有的檔案內容完全相同時提出警告（只比對索引中大小相同的檔案）"""
+        if not DEDUP_AVAILABLE:
+            return
+        try:
+            existing = DuplicateFinder(self.library).find_existing(path)
+        except Exception as e:
+            logging.debug(f"無法檢查重複檔案 {path}: {e}")
+            return
+        if existing:
+            logging.warning(f"{Path(path).name} 與已有的檔案 {existing.name} 內容相同，"
+                            f"可執行 python -m dedup --reclaim hardlink 釋放空間")
+
     def download_mp4(self, url):
         """
         下載高品質的 MP4 影片。
@@ -178,12 +317,13 @@ class YouTubeDownloader:
         ydl_opts = self._get_ydl_opts_base()
         ydl_opts.update({
             'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-            'outtmpl': str(self.download_dir / '%(title)s.%(ext)s'),
+            'outtmpl': '%(title)s.%(ext)s',
             'merge_output_format': 'mp4',
         })
         
-        file_path = self._download(url, ydl_opts)
-        result = {"file_path": file_path, "upload_result": None}
+        file_paths = self._download(url, ydl_opts)
+        file_path = file_paths[0] if file_paths else None
+        result = {"file_path": file_path, "file_paths": file_paths, "upload_result": None}
         
         # 如果下載成功且啟用自動上傳，則上傳到雲端
         if file_path and self.auto_upload:
@@ -199,13 +339,11 @@ class YouTubeDownloader:
         :return: 包含檔案路徑和上傳結果的字典。
         """
         logging.info(f"準備下載 MP3: {url}")
-        # 建立一個唯一的檔名模板，避免後處理器找不到檔案
-        output_template = self.download_dir / f"%(title)s_%(id)s.%(ext)s"
-        
         ydl_opts = self._get_ydl_opts_base()
         ydl_opts.update({
             'format': 'bestaudio/best',
-            'outtmpl': str(output_template),
+            # 建立一個唯一的檔名模板，避免後處理器找不到檔案
+            'outtmpl': '%(title)s_%(id)s.%(ext)s',
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
@@ -214,24 +352,20 @@ class YouTubeDownloader:
         })
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                original_filepath = ydl.prepare_filename(info)
-                # 後處理後，副檔名會改變
-                final_filepath = Path(original_filepath).with_suffix('.mp3')
-                if final_filepath.exists():
-                    file_path = str(final_filepath)
-                    result = {"file_path": file_path, "upload_result": None}
-                    
-                    # 如果啟用自動上傳，則上傳到雲端
-                    if self.auto_upload:
-                        logging.info("開始上傳到雲端硬碟（MP3 資料夾）...")
-                        result["upload_result"] = self.upload_to_cloud(file_path, file_type="mp3")
-                    
-                    return result
-                else:
-                    logging.error(f"MP3 轉換後找不到檔案: {final_filepath}")
-                    return {"file_path": None, "upload_result": None}
+            file_paths = self._download(url, ydl_opts)
         except Exception as e:
             logging.error(f"MP3 下載失敗: {e}")
-            raise e 
\ No newline at end of file
+            raise e
+
+        file_path = file_paths[0] if file_paths else None
+        result = {"file_path": file_path, "file_paths": file_paths, "upload_result": None}
+        if not file_path:
+            logging.error(f"MP3 轉換後沒有取得輸出檔案: {url}")
+            return result
+
+        # 如果啟用自動上傳，則上傳到雲端
+        if self.auto_upload:
+            logging.info("開始上傳到雲端硬碟（MP3 資料夾）...")
+            result["upload_result"] = self.upload_to_cloud(file_path, file_type="mp3")
+
+        return result
@@ -1,11 +1,16 @@
 from yt_dlp import YoutubeDL
 import re
+import logging
+
+from cookie_manager import get_cookie_manager
 
 class YtDlpSearcher:
     """用 yt-dlp 搜尋 YouTube 影片，不需 API 金鑰"""
     
     def __init__(self, max_results=5):
         self.max_results = max_results
+        # 與下載器共用同一個 cookie jar
+        self.cookie_manager = get_cookie_manager()
 
     def search(self, query, max_results=None):
         """
@@ -31,11 +36,12 @@ class YtDlpSearcher:
             }
             
             with YoutubeDL(ydl_opts) as ydl:
+                self.cookie_manager.attach(ydl)
                 search_url = f"ytsearch{max_results}:{query}"
                 result = ydl.extract_info(search_url, download=False)
                 
                 if not result or 'entries' not in result:
-                    print(f"搜尋失敗: 無法取得結果")
+                    logging.warning("搜尋失敗: 無法取得結果")
                     return []
                 
                 entries = result.get('entries', [])
@@ -77,11 +83,11 @@ class YtDlpSearcher:
                     }
                     processed.append(processed_video)
                 
-                print(f"成功搜尋到 {len(processed)} 個影片")
+                logging.info(f"成功搜尋到 {len(processed)} 個影片")
                 return processed
                 
         except Exception as e:
-            print(f"搜尋時發生錯誤: {e}")
+            logging.error(f"搜尋時發生錯誤: {e}")
             return []
     
     def _format_duration(self, seconds):